@@ -0,0 +1,102 @@
+"""
+Bulk Calculator operations against the per-row loop.
+
+Runs the same rows of operands through:
+    - per-row: Calculator.add/subtract/multiply/divide once per row, recording
+      each row in a memory-only history, with divide errors caught per row
+    - batch (array): calculator_batch.compute on array('d') columns without
+      NumPy, i.e. the pure-Python fallback
+    - batch (numpy): Calculator.calculate_batch on a 2-D ndarray, skipped if
+      NumPy isn't installed
+and reports rows per second for each operation. About 1% of divisors are zero.
+
+Usage:
+    python benchmarks/batch_benchmark.py [--rows N] [--operands N] [--output PATH]
+"""
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from unittest.mock import patch
+
+from bench_utils import REPO_DIR, write_results
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import calculator_batch  # noqa: E402
+from calculator import Calculator  # noqa: E402
+from calculator_history import ADD, DIVIDE, MULTIPLY, SUBTRACT, CalculationHistory  # noqa: E402
+
+OPERATIONS = {'add': ADD, 'subtract': SUBTRACT, 'multiply': MULTIPLY, 'divide': DIVIDE}
+
+
+def make_rows(count, operands, seed=0):
+    rng = random.Random(seed)
+    return [[0.0 if i and rng.random() < 0.01 else rng.uniform(-1000, 1000) for i in range(operands)]
+            for _ in range(count)]
+
+
+def per_row(name, rows):
+    calculator = Calculator(history=CalculationHistory(capacity=len(rows)))
+    method = getattr(calculator, name)
+    errors = 0
+    started = time.perf_counter()
+    for row in rows:
+        try:
+            method(row)
+        except ValueError:
+            errors += 1
+    return time.perf_counter() - started, errors
+
+
+def batch_array(op, columns):
+    with patch.object(calculator_batch, 'np', None):
+        started = time.perf_counter()
+        result = calculator_batch.compute(op, columns)
+        return time.perf_counter() - started, len(result.error_rows)
+
+
+def batch_numpy(op, matrix):
+    calculator = Calculator(history=CalculationHistory(capacity=1))
+    started = time.perf_counter()
+    result = calculator.calculate_batch(op, matrix)
+    return time.perf_counter() - started, len(result.error_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--operands', type=int, default=3)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/batch-<commit>.json)')
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.operands)
+    columns = [array('d', column) for column in zip(*rows)]
+    matrix = calculator_batch.np.array(rows) if calculator_batch.np is not None else None
+
+    results = {}
+    for name, op in OPERATIONS.items():
+        modes = {'per_row': per_row(name, rows), 'batch_array': batch_array(op, columns)}
+        if matrix is not None:
+            modes['batch_numpy'] = batch_numpy(op, matrix)
+        results[name] = {mode: {'rows_per_second': args.rows / seconds, 'errors': errors}
+                         for mode, (seconds, errors) in modes.items()}
+
+    modes = list(results['add'])
+    print(f"{args.rows} rows of {args.operands} operands, rows/s")
+    print("operation | " + " | ".join(modes))
+    for name, result in results.items():
+        print(f"{name} | " + " | ".join(f"{result[mode]['rows_per_second']:,.0f}" for mode in modes))
+    if 'batch_numpy' in modes:
+        speedups = [results[name]['batch_numpy']['rows_per_second'] / results[name]['per_row']['rows_per_second']
+                    for name in results]
+        print(f"numpy batch vs per-row: {min(speedups):.0f}x to {max(speedups):.0f}x")
+
+    print(f"\nResults written to {write_results('batch', vars(args), results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
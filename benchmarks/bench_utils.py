@@ -0,0 +1,127 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Importing this module puts lambda/ on sys.path so benchmarks can import the
+handler modules the same way the Lambda runtime does.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+
+def percentile(sorted_values, pct):
+    """
+    Linear-interpolated percentile of an already sorted list.
+
+    Args:
+        sorted_values (list): Values in ascending order
+        pct (float): Percentile between 0 and 100
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize_latencies(seconds):
+    """Summarise per-request latencies (in seconds) as milliseconds."""
+    values = sorted(s * 1000 for s in seconds)
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 50),
+        'p95_ms': percentile(values, 95),
+        'p99_ms': percentile(values, 99),
+        'max_ms': values[-1] if values else 0.0,
+    }
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name, config, metrics, path=None):
+    """
+    Write benchmark results as JSON so runs can be compared across commits.
+
+    Args:
+        name (str): Benchmark name, used in the default file name
+        config (dict): The settings the benchmark ran with
+        metrics (dict): The measured results
+        path (str): Output file, defaults to results/<name>-<commit>.json
+
+    Returns:
+        str: The path written
+    """
+    commit = git_commit()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{commit or 'unknown'}.json")
+
+    document = {
+        'benchmark': name,
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'config': config,
+        'metrics': metrics,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return path
+
+
+def flatten(metrics, prefix=''):
+    """Flatten nested metric dicts into dotted keys."""
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline_path, metrics):
+    """
+    Print each numeric metric next to the baseline run and the relative change.
+
+    Args:
+        baseline_path (str): A JSON file previously written by write_results
+        metrics (dict): The metrics of the current run
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    before = flatten(baseline['metrics'])
+    after = flatten(metrics)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    for name in sorted(after):
+        if name not in before:
+            continue
+        change = ((after[name] - before[name]) / before[name] * 100) if before[name] else 0.0
+        print(f"  {name:40} {before[name]:12.3f} -> {after[name]:12.3f}  ({change:+.1f}%)")
@@ -0,0 +1,103 @@
+"""
+Measure request coalescing under a classroom burst.
+
+A class of --students submits each of --problems homework problems at the same
+moment. The burst runs against fake_anthropic.py twice, with
+COALESCING_ENABLED on and off, and reports upstream API requests and latency
+for each run.
+
+Usage:
+    python benchmarks/classroom_burst.py [--students N] [--problems N]
+        [--first-token-ms MS] [--tokens-per-second N] [--stream] [--output PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from bench_utils import summarize_latencies, write_results
+from fake_anthropic import FakeAnthropicServer, FakeServerConfig, StubSession
+
+from client_cache import reset_client_cache
+from coalescing import reset_coalescer
+from lambda_function import lambda_handler, reset_validation_memo
+from response_cache import reset_response_cache
+
+
+def run_burst(server, problems, students, stream):
+    """Fire every student's request for every problem at once."""
+    reset_client_cache()
+    reset_response_cache()
+    reset_validation_memo()
+    reset_coalescer()
+    requests_before = server.stats()['requests']
+
+    events = [
+        {'body': json.dumps({'expression': problem, 'stream': stream})}
+        for problem in problems for _ in range(students)
+    ]
+    latencies = [None] * len(events)
+    barrier = threading.Barrier(len(events))
+
+    def invoke(index):
+        barrier.wait()
+        started = time.perf_counter()
+        lambda_handler(events[index], None)
+        latencies[index] = time.perf_counter() - started
+
+    threads = [threading.Thread(target=invoke, args=(index,)) for index in range(len(events))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = summarize_latencies(latencies)
+    summary['upstream_requests'] = server.stats()['requests'] - requests_before
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare upstream calls with and without request coalescing")
+    parser.add_argument('--students', type=int, default=30)
+    parser.add_argument('--problems', type=int, default=3)
+    parser.add_argument('--first-token-ms', type=float, default=300.0)
+    parser.add_argument('--tokens-per-second', type=float, default=150.0)
+    parser.add_argument('--stream', action='store_true', help='request server-sent events, like the UI')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/classroom-<commit>.json)')
+    args = parser.parse_args()
+
+    problems = [f"solve for x: {i + 2}x + {i + 3} = {5 * i + 11}" for i in range(args.problems)]
+    server = FakeAnthropicServer(FakeServerConfig(
+        first_token_ms=args.first_token_ms, tokens_per_second=args.tokens_per_second
+    )).start()
+    StubSession.configure(latency_ms=0)
+
+    results = {}
+    try:
+        with patch('boto3.session.Session', StubSession), \
+             patch.dict('os.environ', {'ANTHROPIC_BASE_URL': server.base_url, 'PARAMETER_NAME': 'benchmark-api-key'}), \
+             contextlib.redirect_stdout(io.StringIO()):
+            for enabled in ['true', 'false']:
+                with patch.dict('os.environ', {'COALESCING_ENABLED': enabled}):
+                    results['coalesced' if enabled == 'true' else 'independent'] = run_burst(
+                        server, problems, args.students, args.stream
+                    )
+    finally:
+        server.stop()
+        reset_coalescer()
+
+    print(f"{args.students} students x {len(problems)} problems")
+    for mode, summary in results.items():
+        print(f"{mode:12} {summary['upstream_requests']:5d} upstream requests, "
+              f"p50 {summary['p50_ms']:.0f} ms, p95 {summary['p95_ms']:.0f} ms")
+
+    path = write_results('classroom', vars(args), results, args.output)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare the two-call validation path with VALIDATION_MODE=combined.
+
+Replays the recorded responses for every expression with cold caches and
+reports Claude calls, estimated tokens and modelled API latency per request.
+
+Usage:
+    python benchmarks/combined_validation.py [--rounds N] [--time-scale F] [--output PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from bench_utils import write_results
+from recorded_client import RecordedClient
+
+from lambda_function import VALIDATION_MODE_COMBINED, VALIDATION_MODE_SEPARATE, reset_validation_memo, solve_expression
+from response_cache import LRUCache, ResponseCache, reset_response_cache
+
+# claude-3-haiku list prices, USD per million tokens
+INPUT_PRICE_PER_MTOK = 0.25
+OUTPUT_PRICE_PER_MTOK = 1.25
+
+
+def run_mode(mode, client, rounds):
+    os.environ['VALIDATION_MODE'] = mode
+    client.reset()
+    statuses = []
+    wall = 0.0
+    expressions = list(client.recording['responses'])
+    for _ in range(rounds):
+        for expression in expressions:
+            # Cold caches, so every round pays for the full pipeline
+            reset_validation_memo()
+            reset_response_cache(ResponseCache(LRUCache()))
+            # The handler logs with print; keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                status, _ = solve_expression(client, expression)
+                wall += time.perf_counter() - started
+            statuses.append(status)
+
+    requests = len(statuses)
+    cost = (client.input_tokens * INPUT_PRICE_PER_MTOK + client.output_tokens * OUTPUT_PRICE_PER_MTOK) / 1e6
+    return {
+        'mode': mode,
+        'requests': requests,
+        'calls_per_request': client.calls / requests,
+        'input_tokens_per_request': client.input_tokens / requests,
+        'output_tokens_per_request': client.output_tokens / requests,
+        'api_ms_per_request': client.simulated_ms / requests,
+        'wall_ms_per_request': wall * 1000 / requests,
+        'usd_per_1k_requests': cost * 1000 / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--time-scale', type=float, default=0.0,
+                        help='fraction of the modelled API latency to actually sleep')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/combined_validation-<commit>.json)')
+    args = parser.parse_args()
+
+    client = RecordedClient(time_scale=args.time_scale)
+    previous_mode = os.environ.get('VALIDATION_MODE')
+    try:
+        results = {mode: run_mode(mode, client, args.rounds) for mode in (VALIDATION_MODE_SEPARATE, VALIDATION_MODE_COMBINED)}
+    finally:
+        if previous_mode is None:
+            os.environ.pop('VALIDATION_MODE', None)
+        else:
+            os.environ['VALIDATION_MODE'] = previous_mode
+        reset_response_cache()
+
+    columns = ['mode', 'calls_per_request', 'input_tokens_per_request', 'output_tokens_per_request',
+               'api_ms_per_request', 'wall_ms_per_request', 'usd_per_1k_requests']
+    print(" | ".join(columns))
+    for result in results.values():
+        print(" | ".join(
+            f"{result[column]:.4f}" if isinstance(result[column], float) else str(result[column])
+            for column in columns
+        ))
+
+    print(f"\nResults written to {write_results('combined_validation', vars(args), results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare the output budgets of the requested detail levels.
+
+Replays fixtures/detail_responses.json (simple problems recorded with a
+standard, a brief and a detailed answer) through solve_expression with cold
+caches, once with no detail level (the routing table decides) and once per
+level. The RecordedClient serves the answer for the prompt variant each level
+sends, applies max_tokens and stop sequences, and models latency from the
+recorded time-to-first-token and per-output-token rate.
+
+Usage:
+    python benchmarks/detail_budget.py [--rounds N] [--time-scale F] [--output PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from bench_utils import BENCHMARKS_DIR, write_results
+from recorded_client import RecordedClient, load_recording
+
+from lambda_function import reset_validation_memo, solve_expression
+from response_cache import LRUCache, ResponseCache, reset_response_cache
+from routing import DETAIL_LEVELS, reset_detail, use_detail
+
+FIXTURE_PATH = os.path.join(BENCHMARKS_DIR, 'fixtures', 'detail_responses.json')
+
+# claude-3-haiku list prices, USD per million tokens
+INPUT_PRICE_PER_MTOK = 0.25
+OUTPUT_PRICE_PER_MTOK = 1.25
+
+
+def run_detail(detail, client, rounds):
+    client.reset()
+    wall = 0.0
+    requests = 0
+    explanation_chars = 0
+    expressions = list(client.recording['responses'])
+    token = use_detail(detail)
+    try:
+        for _ in range(rounds):
+            for expression in expressions:
+                reset_validation_memo()
+                reset_response_cache(ResponseCache(LRUCache()))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    status, body = solve_expression(client, expression)
+                    wall += time.perf_counter() - started
+                requests += 1
+                explanation_chars += len(body.get('explanation', ''))
+    finally:
+        reset_detail(token)
+
+    cost = (client.input_tokens * INPUT_PRICE_PER_MTOK + client.output_tokens * OUTPUT_PRICE_PER_MTOK) / 1e6
+    return {
+        'requests': requests,
+        'input_tokens_per_request': client.input_tokens / requests,
+        'output_tokens_per_request': client.output_tokens / requests,
+        'explanation_chars_per_request': explanation_chars / requests,
+        'api_ms_per_request': client.simulated_ms / requests,
+        'wall_ms_per_request': wall * 1000 / requests,
+        'usd_per_1k_requests': cost * 1000 / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--time-scale', type=float, default=0.0,
+                        help='fraction of the modelled API latency to actually sleep')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/detail_budget-<commit>.json)')
+    args = parser.parse_args()
+
+    client = RecordedClient(recording=load_recording(FIXTURE_PATH), time_scale=args.time_scale)
+    try:
+        results = {detail or 'auto': run_detail(detail, client, args.rounds) for detail in (None,) + DETAIL_LEVELS}
+    finally:
+        reset_response_cache()
+
+    columns = ['output_tokens_per_request', 'explanation_chars_per_request', 'api_ms_per_request',
+               'usd_per_1k_requests']
+    print("detail | " + " | ".join(columns))
+    for detail, result in results.items():
+        print(f"{detail} | " + " | ".join(f"{result[column]:.4f}" if column.startswith('usd') else
+                                         f"{result[column]:.1f}" for column in columns))
+
+    standard = results['standard']
+    for detail in ('brief', 'auto'):
+        saved_ms = standard['api_ms_per_request'] - results[detail]['api_ms_per_request']
+        saved_tokens = 1 - results[detail]['output_tokens_per_request'] / standard['output_tokens_per_request']
+        print(f"{detail} vs standard: {saved_ms:.0f} ms less API time per request, "
+              f"{saved_tokens:.0%} fewer output tokens")
+
+    print(f"\nResults written to {write_results('detail_budget', vars(args), results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
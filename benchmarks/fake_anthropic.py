@@ -0,0 +1,391 @@
+"""
+Local stand-in for the Anthropic Messages API and SSM, for offline benchmarks.
+
+FakeAnthropicServer answers POST /v1/messages the way the real API does,
+including server-sent events when the request sets "stream": true. Point the
+SDK at it with ANTHROPIC_BASE_URL. Its behaviour is controlled by
+FakeServerConfig:
+    - first_token_ms: delay before the first token
+    - tokens_per_second: generation rate after the first token
+    - error_rate: fraction of requests answered with 529 overloaded_error
+    - explanation_tokens: length of tutoring explanations
+    - requests_per_minute / tokens_per_minute: rate limits to enforce (0 for
+      none). Each is a bucket refilled evenly over limit_window_seconds, which
+      tests and benchmarks shorten from the API's minute. A request is charged
+      one request and its input plus output tokens. Requests over a limit get
+      429 rate_limit_error with retry-after, and every response carries the
+      anthropic-ratelimit-* headers
+
+Validation requests get a verdict based on whether the prompt contains a digit,
+so word problems are accepted and chit-chat is rejected.
+
+StubSession replaces boto3.session.Session and serves the API key parameter
+after ssm_latency_ms.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_utils import LAMBDA_DIR  # noqa: F401 (puts lambda/ on sys.path)
+from prompts import find_prompt, system_text
+
+CHARS_PER_TOKEN = 4
+
+
+class FakeServerConfig:
+    """Simulated API behaviour; see the module docstring."""
+
+    def __init__(self, first_token_ms=300.0, tokens_per_second=150.0, error_rate=0.0,
+                 explanation_tokens=400, seed=0, requests_per_minute=0, tokens_per_minute=0,
+                 limit_window_seconds=60.0):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.explanation_tokens = explanation_tokens
+        self.seed = seed
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.limit_window_seconds = limit_window_seconds
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class FakeLimit:
+    """One enforced rate limit: a bucket of limit units refilled evenly over the window."""
+
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.rate = limit / window_seconds
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.limit, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, amount):
+        """Seconds until amount is available (0 if it is now)."""
+        needed = min(amount, self.limit)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def headers(self, name):
+        reset_at = datetime.now(timezone.utc) + timedelta(seconds=(self.limit - self.level) / self.rate)
+        return {
+            f'anthropic-ratelimit-{name}-limit': str(self.limit),
+            f'anthropic-ratelimit-{name}-remaining': str(max(int(self.level), 0)),
+            f'anthropic-ratelimit-{name}-reset': reset_at.isoformat(),
+        }
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def make_explanation(tokens):
+    """Build an HTML explanation of roughly the requested number of tokens."""
+    paragraphs = ["<h3>Let's work through it</h3>"]
+    step = 1
+    while estimate_tokens("".join(paragraphs)) < tokens:
+        paragraphs.append(f"<p><strong>Step {step}:</strong> we simplify one more part of the problem.</p>")
+        step += 1
+    return "".join(paragraphs)
+
+
+def make_response_text(request, config):
+    """Pick the reply for a Messages API request based on its system prompt."""
+    template = find_prompt(request.get('system'))
+    prompt = request['messages'][0]['content']
+    if isinstance(prompt, list):
+        prompt = "".join(block.get('text', '') for block in prompt)
+    is_math = re.search(r'\d', prompt.split('Respond with')[0]) is not None
+    verdict = json.dumps({
+        'is_math_problem': is_math,
+        'is_solvable': is_math,
+        'error_message': '' if is_math else 'This is not a mathematical expression.'
+    })
+
+    if template is not None and template.name == 'validation':
+        return verdict
+    if template is not None and template.name == 'combined':
+        text = f"<verdict>{verdict}</verdict>"
+        if is_math:
+            text += f"\n<explanation>{make_explanation(config.explanation_tokens)}</explanation>"
+        return text
+    return make_explanation(config.explanation_tokens)
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_limit_headers(self):
+        for name, value in self.server.limit_headers().items():
+            self.send_header(name, value)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('request-id', f"req_fake_{self.server.next_id()}")
+        self.send_limit_headers()
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        config = self.server.config
+        self.server.record_request(request)
+
+        if not self.path.startswith('/v1/messages'):
+            self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+
+        text = make_response_text(request, config)
+        input_tokens = estimate_tokens(system_text(request.get('system')) + json.dumps(request['messages']))
+        output_tokens = min(estimate_tokens(text), request.get('max_tokens', 4096))
+        text = text[:output_tokens * CHARS_PER_TOKEN]
+
+        retry_after = self.server.admit(input_tokens + output_tokens)
+        if retry_after:
+            error = {'type': 'rate_limit_error', 'message': 'Rate limit exceeded'}
+            self.send_json(429, {'type': 'error', 'error': error}, {'retry-after': f"{retry_after:.3f}"})
+            return
+
+        if self.server.should_fail():
+            time.sleep(config.first_token_ms / 1000.0)
+            self.send_json(529, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}})
+            return
+
+        if request.get('stream'):
+            self.stream_message(request, text, input_tokens, output_tokens)
+            return
+
+        time.sleep((config.first_token_ms + output_tokens / config.tokens_per_second * 1000.0) / 1000.0)
+        self.send_json(200, self.message_payload(request, text, input_tokens, output_tokens))
+
+    def message_payload(self, request, text, input_tokens, output_tokens):
+        return {
+            'id': f"msg_fake_{self.server.next_id()}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': request.get('model'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens},
+        }
+
+    def stream_message(self, request, text, input_tokens, output_tokens):
+        config = self.server.config
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.send_limit_headers()
+        self.end_headers()
+        self.close_connection = True
+
+        def send_event(event, data):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        message = self.message_payload(request, '', input_tokens, 0)
+        message['content'] = []
+        message['stop_reason'] = None
+        time.sleep(config.first_token_ms / 1000.0)
+        send_event('message_start', {'type': 'message_start', 'message': message})
+        send_event('content_block_start', {
+            'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}
+        })
+        # Ten tokens per delta keeps the event count realistic without flooding the socket
+        chunk_chars = 10 * CHARS_PER_TOKEN
+        for start in range(0, len(text), chunk_chars):
+            chunk = text[start:start + chunk_chars]
+            time.sleep(estimate_tokens(chunk) / config.tokens_per_second)
+            send_event('content_block_delta', {
+                'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': chunk}
+            })
+        send_event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        send_event('message_delta', {
+            'type': 'message_delta',
+            'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+            'usage': {'output_tokens': output_tokens}
+        })
+        send_event('message_stop', {'type': 'message_stop'})
+
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    """Threaded fake Messages API that records what it was asked."""
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeAnthropicHandler)
+        self.config = config or FakeServerConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._ids = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        configured = {'requests': self.config.requests_per_minute, 'tokens': self.config.tokens_per_minute}
+        self.limits = {
+            name: FakeLimit(limit, self.config.limit_window_seconds) for name, limit in configured.items() if limit
+        }
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def record_request(self, request):
+        with self._lock:
+            self.requests += 1
+
+    def should_fail(self):
+        with self._lock:
+            failed = self._random.random() < self.config.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def admit(self, tokens):
+        """
+        Charge a request against the rate limits.
+
+        Returns:
+            float: 0 if the request may go ahead, otherwise the seconds to put in retry-after
+        """
+        with self._lock:
+            for limit in self.limits.values():
+                limit.refill()
+            charges = {'requests': 1, 'tokens': tokens}
+            wait = max([limit.shortfall(charges[name]) for name, limit in self.limits.items()], default=0.0)
+            if wait > 0:
+                self.throttled += 1
+                return wait
+            for name, limit in self.limits.items():
+                limit.level -= charges[name]
+            return 0.0
+
+    def limit_headers(self):
+        with self._lock:
+            headers = {}
+            for name, limit in self.limits.items():
+                limit.refill()
+                headers.update(limit.headers(name))
+            return headers
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors, 'throttled': self.throttled}
+
+    def start(self):
+        """Serve on a daemon thread and return self."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubSSMClient:
+    """Stands in for the boto3 SSM client, counting get_parameter calls."""
+
+    def __init__(self, api_key, latency_ms):
+        self.api_key = api_key
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def get_parameter(self, Name, WithDecryption=False):
+        time.sleep(self.latency_ms / 1000.0)
+        self.calls += 1
+        return {'Parameter': {'Name': Name, 'Value': self.api_key}}
+
+
+class StubSession:
+    """
+    Replacement for boto3.session.Session that hands out one shared StubSSMClient.
+
+    Configure it before patching, e.g.
+        StubSession.configure(latency_ms=30)
+        with patch('boto3.session.Session', StubSession): ...
+    """
+
+    ssm = StubSSMClient('sk-ant-fake-benchmark-key', latency_ms=30.0)
+
+    @classmethod
+    def configure(cls, api_key='sk-ant-fake-benchmark-key', latency_ms=30.0):
+        cls.ssm = StubSSMClient(api_key, latency_ms)
+        return cls.ssm
+
+    def client(self, service_name, *args, **kwargs):
+        if service_name != 'ssm':
+            raise ValueError(f"StubSession only provides ssm, not {service_name}")
+        return self.ssm
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake Anthropic Messages API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--first-token-ms', type=float, default=300.0)
+    parser.add_argument('--tokens-per-second', type=float, default=150.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--explanation-tokens', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests-per-minute', type=int, default=0)
+    parser.add_argument('--tokens-per-minute', type=int, default=0)
+    parser.add_argument('--limit-window-seconds', type=float, default=60.0)
+    args = parser.parse_args()
+
+    server = FakeAnthropicServer(FakeServerConfig(
+        first_token_ms=args.first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        explanation_tokens=args.explanation_tokens,
+        seed=args.seed,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        limit_window_seconds=args.limit_window_seconds
+    ), host=args.host, port=args.port)
+    # The first line of output is the base URL, for harnesses that start us as a subprocess
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Offline latency/throughput benchmark for lambda_handler.
+
+Starts fake_anthropic.py in a subprocess, points the SDK at it with
+ANTHROPIC_BASE_URL, replaces SSM with StubSession and then measures:
+    - import: time to import lambda_function in a fresh interpreter
+    - cold: first invocation after the container caches are reset (SSM fetch,
+      client construction, new connections)
+    - warm: p50/p95/p99 latency and requests/sec over a mixed workload
+    - allocations: tracemalloc peak and retained bytes per warm request
+
+Results are written as JSON (see bench_utils.write_results) and can be
+compared with an earlier run via --compare.
+
+Usage:
+    python benchmarks/handler_benchmark.py [--requests N] [--concurrency N]
+        [--first-token-ms MS] [--tokens-per-second N] [--error-rate F]
+        [--mix local=0.3,claude=0.6,invalid=0.1] [--repeat-ratio F]
+        [--stream] [--output PATH] [--compare PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from bench_utils import BENCHMARKS_DIR, LAMBDA_DIR, compare_results, summarize_latencies, write_results
+from fake_anthropic import StubSession
+
+import lambda_function
+from admission import get_admission_stats, reset_admission_stats
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+WORDS = ['cats', 'rivers', 'pirates', 'clouds', 'robots', 'gardens', 'trains', 'owls', 'castles', 'bikes']
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {'local', 'claude', 'invalid'}
+    if unknown:
+        raise ValueError(f"Unknown workload kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def build_workload(count, mix, repeat_ratio, seed):
+    """
+    Generate request expressions.
+
+    'local' expressions are plain arithmetic, 'claude' expressions need Claude
+    validation and 'invalid' ones are chit-chat rejected by the admission tiers. With probability
+    repeat_ratio an earlier expression is reused, so it can be served from cache.
+    """
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    expressions = []
+    for i in range(count):
+        if expressions and rng.random() < repeat_ratio:
+            expressions.append(rng.choice(expressions))
+            continue
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'local':
+            expressions.append(f"{i + 1} * ({rng.randint(1, 99)} + {rng.randint(1, 99)})")
+        elif kind == 'claude':
+            expressions.append(f"solve for x: {i + 2}x + {rng.randint(1, 99)} = {rng.randint(100, 999)}")
+        else:
+            # No math signal at all, so the admission classifier rejects these locally
+            expressions.append(f"tell me a story about {rng.choice(WORDS)} and {WORDS[i % len(WORDS)]}{'!' * (i % 7)}")
+    return expressions
+
+
+def make_event(expression, stream=False):
+    body = {'expression': expression}
+    if stream:
+        body['stream'] = True
+    return {'httpMethod': 'POST', 'body': json.dumps(body)}
+
+
+def reset_container():
+    """Put the module-level caches back into their cold-start state."""
+    reset_client_cache()
+    reset_response_cache()
+    lambda_function.reset_validation_memo()
+    reset_admission_stats()
+
+
+def invoke(event):
+    """Run the handler once, returning (seconds, status code)."""
+    started = time.perf_counter()
+    response = lambda_function.lambda_handler(event, None)
+    return time.perf_counter() - started, response['statusCode']
+
+
+def measure_import_ms(runs=3):
+    """Import lambda_function in fresh interpreters and keep the best time."""
+    code = (
+        "import time; started = time.perf_counter(); import lambda_function; "
+        "print((time.perf_counter() - started) * 1000)"
+    )
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=LAMBDA_DIR)
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return min(timings)
+
+
+def measure_cold(runs, stream):
+    latencies = []
+    for i in range(runs):
+        reset_container()
+        elapsed, _ = invoke(make_event(f"solve for x: {i + 2}x + 1 = {2 * i + 5}", stream))
+        latencies.append(elapsed)
+    return summarize_latencies(latencies)
+
+
+def measure_warm(expressions, concurrency, stream):
+    reset_container()
+    invoke(make_event("solve for x: 3x + 1 = 7", stream))
+    reset_admission_stats()
+
+    statuses = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda expression: invoke(make_event(expression, stream)), expressions))
+    wall = time.perf_counter() - started
+
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    summary = summarize_latencies([elapsed for elapsed, _ in results])
+    summary['requests_per_second'] = len(results) / wall if wall else 0.0
+    summary['statuses'] = statuses
+    summary['admission'] = get_admission_stats()
+    return summary
+
+
+def measure_allocations(expressions, stream):
+    """Run requests sequentially under tracemalloc and average per request."""
+    reset_container()
+    invoke(make_event("solve for x: 3x + 1 = 7", stream))
+
+    peaks = []
+    retained = []
+    tracemalloc.start()
+    try:
+        for expression in expressions:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            invoke(make_event(expression, stream))
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': len(expressions),
+        'peak_kib_per_request': sum(peaks) / len(peaks) / 1024 if peaks else 0.0,
+        'retained_kib_per_request': sum(retained) / len(retained) / 1024 if retained else 0.0,
+    }
+
+
+def start_fake_server(args):
+    command = [
+        sys.executable, os.path.join(BENCHMARKS_DIR, 'fake_anthropic.py'),
+        '--first-token-ms', str(args.first_token_ms),
+        '--tokens-per-second', str(args.tokens_per_second),
+        '--error-rate', str(args.error_rate),
+        '--explanation-tokens', str(args.explanation_tokens),
+        '--seed', str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise RuntimeError("Fake Anthropic server did not start")
+    return process, base_url
+
+
+def fetch_server_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lambda_handler against a fake Anthropic API")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--cold-runs', type=int, default=5)
+    parser.add_argument('--allocation-requests', type=int, default=50)
+    parser.add_argument('--first-token-ms', type=float, default=50.0)
+    parser.add_argument('--tokens-per-second', type=float, default=2000.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--explanation-tokens', type=int, default=400)
+    parser.add_argument('--ssm-latency-ms', type=float, default=30.0)
+    parser.add_argument('--mix', default='local=0.3,claude=0.6,invalid=0.1')
+    parser.add_argument('--repeat-ratio', type=float, default=0.2)
+    parser.add_argument('--stream', action='store_true', help='request server-sent events')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/handler-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    config = dict(vars(args))
+    config.pop('output')
+    config.pop('compare')
+    mix = parse_mix(args.mix)
+    expressions = build_workload(args.requests, mix, args.repeat_ratio, args.seed)
+    allocation_expressions = build_workload(args.allocation_requests, mix, args.repeat_ratio, args.seed + 1)
+
+    server, base_url = start_fake_server(args)
+    StubSession.configure(latency_ms=args.ssm_latency_ms)
+    try:
+        # The handler logs with print; redirect once for the whole run, since
+        # redirect_stdout swaps a process-wide stream and isn't thread-safe
+        with patch('boto3.session.Session', StubSession), \
+             patch.dict('os.environ', {'ANTHROPIC_BASE_URL': base_url, 'PARAMETER_NAME': 'benchmark-api-key'}), \
+             contextlib.redirect_stdout(io.StringIO()):
+            metrics = {
+                'import_ms': measure_import_ms(),
+                'cold': measure_cold(args.cold_runs, args.stream),
+                'warm': measure_warm(expressions, args.concurrency, args.stream),
+                'allocations': measure_allocations(allocation_expressions, args.stream),
+            }
+            metrics['fake_server'] = fetch_server_stats(base_url)
+    finally:
+        server.terminate()
+        server.wait()
+        reset_container()
+
+    warm = metrics['warm']
+    cold = metrics['cold']
+    print(f"import            {metrics['import_ms']:8.1f} ms")
+    print(f"cold start        {cold['p50_ms']:8.1f} ms p50 over {cold['count']} runs")
+    print(f"warm p50/p95/p99  {warm['p50_ms']:8.1f} / {warm['p95_ms']:.1f} / {warm['p99_ms']:.1f} ms")
+    print(f"throughput        {warm['requests_per_second']:8.1f} req/s at concurrency {args.concurrency}")
+    print(f"statuses          {warm['statuses']}")
+    print(f"allocations       {metrics['allocations']['peak_kib_per_request']:8.1f} KiB peak, "
+          f"{metrics['allocations']['retained_kib_per_request']:.1f} KiB retained per request")
+    print(f"fake API          {metrics['fake_server']}")
+    print(f"admission tiers   {warm['admission']}")
+
+    path = write_results('handler', config, metrics, args.output)
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare_results(args.compare, metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Memory and throughput of the Calculator's history store.
+
+Appends the same calculations to:
+    - legacy: the previous list of formatted strings
+    - records: a list of HistoryRecord objects (slots, packed operands)
+    - buffer: a HistoryBuffer ring buffer sized to hold every entry, with
+      operands inline in its arrays
+    - logged: a CalculationHistory with the default in-memory cap and the
+      SQLite log on a temporary file
+and reports memory per entry (tracemalloc), appends per second and, for the
+log, bytes on disk per entry and the latency of a random page query.
+
+Usage:
+    python benchmarks/history_benchmark.py [--entries N] [--queries N] [--output PATH]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_utils import REPO_DIR, write_results
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from calculator_history import (  # noqa: E402
+    ADD, DEFAULT_CAPACITY, CalculationHistory, HistoryBuffer, HistoryRecord, pack_operands
+)
+
+
+def calculations(count):
+    for i in range(count):
+        operands = [float(i), float(i % 97) + 0.5]
+        yield operands, operands[0] + operands[1]
+
+
+def fill_legacy(count):
+    history = []
+    for operands, result in calculations(count):
+        history.append(f"{' + '.join(map(str, operands))} = {result}")
+    return history
+
+
+def fill_records(count):
+    history = []
+    for seq, (operands, result) in enumerate(calculations(count), 1):
+        history.append(HistoryRecord(seq, ADD, pack_operands(operands), result))
+    return history
+
+
+def fill_buffer(count):
+    history = HistoryBuffer(capacity=count)
+    for operands, result in calculations(count):
+        history.append(ADD, operands, result)
+    return history
+
+
+def fill_logged(count, path):
+    history = CalculationHistory(capacity=DEFAULT_CAPACITY, path=path)
+    for operands, result in calculations(count):
+        history.append(ADD, operands, result)
+    history.flush()
+    return history
+
+
+def bytes_per_entry(fill, count):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        history = fill(count)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del history
+    return (after - before) / count
+
+
+def appends_per_second(fill, count):
+    started = time.perf_counter()
+    fill(count)
+    return count / (time.perf_counter() - started)
+
+
+def measure_log(count, queries):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.sqlite3')
+        started = time.perf_counter()
+        history = fill_logged(count, path)
+        rate = count / (time.perf_counter() - started)
+        history.close()
+
+        history = CalculationHistory(capacity=DEFAULT_CAPACITY, path=path)
+        rng = random.Random(0)
+        started = time.perf_counter()
+        for _ in range(queries):
+            page = history.page(before=rng.randint(2, count + 1))
+            # Format the page, as showing it would
+            [str(record) for record in page]
+        query_us = (time.perf_counter() - started) / queries * 1e6
+        history.close()
+        disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    return {'appends_per_second': rate, 'page_query_us': query_us, 'disk_bytes_per_entry': disk_bytes / count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=1000, help='random page queries against the log')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/history-<commit>.json)')
+    args = parser.parse_args()
+
+    results = {}
+    for name, fill in [('legacy', fill_legacy), ('records', fill_records), ('buffer', fill_buffer)]:
+        results[name] = {
+            'bytes_per_entry': bytes_per_entry(fill, args.entries),
+            'appends_per_second': appends_per_second(fill, args.entries),
+        }
+    results['logged'] = measure_log(args.entries, args.queries)
+
+    print(f"{args.entries} entries")
+    print("store | bytes/entry | appends/s")
+    for name in ('legacy', 'records', 'buffer'):
+        print(f"{name} | {results[name]['bytes_per_entry']:.1f} | {results[name]['appends_per_second']:,.0f}")
+    logged = results['logged']
+    print(f"logged (cap {DEFAULT_CAPACITY}) | {logged['disk_bytes_per_entry']:.1f} on disk | "
+          f"{logged['appends_per_second']:,.0f} | page query {logged['page_query_us']:.1f}us")
+
+    print(f"\nResults written to {write_results('history', vars(args), results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
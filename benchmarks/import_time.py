@@ -0,0 +1,136 @@
+"""
+Profile the handler's cold-start import cost with python -X importtime.
+
+Each run imports lambda_function in a fresh interpreter and parses the
+importtime report from stderr. Two configurations are compared:
+    - eager: EAGER_IMPORTS=true, which loads anthropic and boto3 at init the
+      way every cold start did before they were deferred
+    - lazy: the default, where they load on the first Anthropic call
+For the lazy configuration the deferred cost (what the first request that
+reaches the API pays) is measured too, in separate runs that preload the
+dependencies after the import.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [--top N] [--output PATH] [--compare PATH]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_utils import LAMBDA_DIR, compare_results, write_results
+
+HANDLER_MODULE = 'lambda_function'
+PRELOAD = "import client_cache; client_cache.preload_dependencies()"
+
+
+def parse_importtime(stderr):
+    """
+    Parse the -X importtime report.
+
+    Args:
+        stderr (str): The interpreter's stderr
+
+    Returns:
+        list: (self_us, cumulative_us, depth, module) tuples in report order
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return entries
+
+
+def run_once(code, env):
+    """Run code in a fresh interpreter and return its import report and wall time in ms."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=LAMBDA_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr), (time.perf_counter() - started) * 1000
+
+
+def handler_subtree(entries):
+    """Return the index of the handler's report line and of the first line of its subtree."""
+    handler_index = next(i for i, entry in enumerate(entries) if entry[3] == HANDLER_MODULE and entry[2] == 0)
+    # Children are reported before their parent, after the previous top-level import
+    start = max((i + 1 for i, entry in enumerate(entries[:handler_index]) if entry[2] == 0), default=0)
+    return handler_index, start
+
+
+def measure(runs, eager, preload=False):
+    """
+    Import the handler repeatedly and take the median of each measurement.
+
+    Args:
+        runs (int): Fresh interpreters to start
+        eager (bool): Whether to set EAGER_IMPORTS=true
+        preload (bool): Whether to also import what the first Anthropic call needs
+
+    Returns:
+        tuple: (summary dict, cumulative ms of each of the handler's direct imports)
+    """
+    env = dict(os.environ, EAGER_IMPORTS='true' if eager else 'false',
+               PARAMETER_NAME='import-time-benchmark')
+    env.pop('API_KEY_SOURCE', None)
+    code = f"import {HANDLER_MODULE}" + (f"; {PRELOAD}" if preload else "")
+
+    init_ms, deferred_ms, wall_ms, module_counts = [], [], [], []
+    modules = {}
+    for _ in range(runs):
+        entries, wall = run_once(code, env)
+        handler_index, start = handler_subtree(entries)
+        init_ms.append(entries[handler_index][1] / 1000)
+        # Top-level imports after the handler's are the ones the preload triggered
+        deferred_ms.append(sum(entry[1] for entry in entries[handler_index + 1:] if entry[2] == 0) / 1000)
+        wall_ms.append(wall)
+        module_counts.append(handler_index + 1 - start)
+        for self_us, cumulative_us, depth, name in entries[start:handler_index]:
+            if depth == 1:
+                modules.setdefault(name, []).append(cumulative_us / 1000)
+
+    summary = {'init_import_ms': statistics.median(init_ms), 'modules_imported': statistics.median(module_counts)}
+    if preload:
+        summary['deferred_import_ms'] = statistics.median(deferred_ms)
+    else:
+        summary['interpreter_wall_ms'] = statistics.median(wall_ms)
+    return summary, {name: statistics.median(values) for name, values in modules.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=10, help='direct imports to list per configuration')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/import_time-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    results = {}
+    for label, eager in [('eager', True), ('lazy', False)]:
+        summary, modules = measure(args.runs, eager)
+        results[label] = summary
+        print(f"{label}: {HANDLER_MODULE} imports in {summary['init_import_ms']:.1f} ms "
+              f"({summary['modules_imported']:.0f} modules, interpreter {summary['interpreter_wall_ms']:.1f} ms)")
+        for name, ms in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:24} {ms:8.1f} ms")
+
+    results['lazy']['deferred_import_ms'] = measure(args.runs, eager=False, preload=True)[0]['deferred_import_ms']
+    saved = results['eager']['init_import_ms'] - results['lazy']['init_import_ms']
+    print(f"\nCold start import saving: {saved:.1f} ms; "
+          f"deferred to the first Anthropic call: {results['lazy']['deferred_import_ms']:.1f} ms")
+
+    path = write_results('import_time', dict(vars(args), python=sys.version.split()[0]), results, args.output)
+    print(f"\nResults written to {path}")
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Measure the overhead of the tracing layer in metrics.py.
+
+Reports the cost of a single span and counter increment, both inside a traced
+request and as the no-op outside one. It then runs lambda_handler end to end
+against an instant fake client, with METRICS_ENABLED on and off.
+
+Usage:
+    python benchmarks/metrics_overhead.py [--iterations N] [--requests N]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from bench_utils import write_results
+from fake_anthropic import StubSession
+
+import metrics
+from client_cache import reset_client_cache
+from lambda_function import lambda_handler, reset_validation_memo
+from response_cache import reset_response_cache
+
+
+class InstantClient:
+    """Anthropic client stand-in that answers immediately."""
+
+    def __init__(self):
+        self.messages = self
+
+    def create(self, **kwargs):
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text='{"is_math_problem": true, "is_solvable": true}')],
+            usage=SimpleNamespace(input_tokens=100, output_tokens=50)
+        )
+
+
+def best_of(repeats, fn):
+    """Return the fastest of several timed runs of fn, in seconds."""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def span_costs(iterations, repeats):
+    def bare():
+        for _ in range(iterations):
+            pass
+
+    def spans():
+        for _ in range(iterations):
+            with metrics.span('stage'):
+                pass
+
+    def counters():
+        for _ in range(iterations):
+            metrics.increment('counter')
+
+    baseline = best_of(repeats, bare)
+    results = {'noop_span_ns': (best_of(repeats, spans) - baseline) / iterations * 1e9,
+               'noop_increment_ns': (best_of(repeats, counters) - baseline) / iterations * 1e9}
+
+    request_metrics = metrics.start_request()
+    try:
+        results['span_ns'] = (best_of(repeats, spans) - baseline) / iterations * 1e9
+        results['increment_ns'] = (best_of(repeats, counters) - baseline) / iterations * 1e9
+    finally:
+        metrics.finish_request(request_metrics, emit=False)
+    return results
+
+
+def handler_cost(requests, repeats, enabled):
+    # Word problems need Claude validation, so each request passes through every instrumented stage
+    events = [{'body': f'{{"expression": "solve for x: {i}x + 1 = 9"}}'} for i in range(requests)]
+
+    def run():
+        reset_response_cache()
+        reset_validation_memo()
+        for event in events:
+            lambda_handler(event, None)
+
+    with patch.dict('os.environ', {'METRICS_ENABLED': 'true' if enabled else 'false'}):
+        return best_of(repeats, run) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/metrics-<commit>.json)')
+    args = parser.parse_args()
+
+    costs = span_costs(args.iterations, args.repeats)
+
+    reset_client_cache()
+    StubSession.configure(latency_ms=0)
+    with patch('boto3.session.Session', StubSession), \
+         patch('anthropic.Anthropic', return_value=InstantClient()), \
+         patch.dict('os.environ', {'PARAMETER_NAME': 'benchmark-api-key'}), \
+         contextlib.redirect_stdout(io.StringIO()):
+        disabled_us = handler_cost(args.requests, args.repeats, enabled=False)
+        enabled_us = handler_cost(args.requests, args.repeats, enabled=True)
+    reset_client_cache()
+
+    metrics_result = dict(costs, handler_disabled_us=disabled_us, handler_enabled_us=enabled_us,
+                          handler_overhead_us=enabled_us - disabled_us)
+    print(f"span inside a request      {costs['span_ns']:8.0f} ns")
+    print(f"increment inside a request {costs['increment_ns']:8.0f} ns")
+    print(f"span outside a request     {costs['noop_span_ns']:8.0f} ns")
+    print(f"handler, metrics off       {disabled_us:8.1f} us/request")
+    print(f"handler, metrics on        {enabled_us:8.1f} us/request "
+          f"(+{enabled_us - disabled_us:.1f} us, including the EMF log line)")
+
+    config = {'iterations': args.iterations, 'requests': args.requests, 'repeats': args.repeats}
+    print(f"\nResults written to {write_results('metrics', config, metrics_result, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Measure what Anthropic prompt caching saves on the static prompt prefixes.
+
+Replays the recorded responses for every expression through solve_expression
+with cold response caches, against a RecordedClient that simulates cache
+pricing and prefill time. Three runs are compared:
+    - off: PROMPT_CACHING=false
+    - on: cache_control with the API's minimum prefix length per model
+    - on, no minimum: what the same prefixes would save if they were long
+      enough to be cached
+
+Usage:
+    python benchmarks/prompt_caching.py [--rounds N] [--ms-per-input-token MS]
+        [--mode separate|combined] [--output PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+
+from bench_utils import write_results
+from recorded_client import RecordedClient, estimate_tokens
+
+from lambda_function import reset_validation_memo, solve_expression
+from prompts import PROMPTS
+from response_cache import LRUCache, ResponseCache, reset_response_cache
+
+
+def run(client, rounds, caching):
+    os.environ['PROMPT_CACHING'] = 'true' if caching else 'false'
+    client.reset()
+    expressions = list(client.recording['responses'])
+    requests = 0
+    for _ in range(rounds):
+        for expression in expressions:
+            reset_validation_memo()
+            reset_response_cache(ResponseCache(LRUCache()))
+            with contextlib.redirect_stdout(io.StringIO()):
+                solve_expression(client, expression)
+            requests += 1
+
+    return {
+        'requests': requests,
+        'calls': client.calls,
+        'input_tokens_per_request': client.input_tokens / requests,
+        'cache_read_tokens_per_request': client.cache_read_tokens / requests,
+        'cache_write_tokens_per_request': client.cache_write_tokens / requests,
+        'billed_input_tokens_per_request': client.billed_input_tokens() / requests,
+        'api_ms_per_request': client.simulated_ms / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--ms-per-input-token', type=float, default=0.1,
+                        help='modelled prefill time per uncached input token')
+    parser.add_argument('--mode', choices=['separate', 'combined'], default='separate',
+                        help='VALIDATION_MODE to run the requests with')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/prompt_caching-<commit>.json)')
+    args = parser.parse_args()
+
+    previous = {name: os.environ.get(name) for name in ('PROMPT_CACHING', 'VALIDATION_MODE')}
+    os.environ['VALIDATION_MODE'] = args.mode
+    results = {}
+    try:
+        for label, caching, min_cacheable in [('off', False, None), ('on', True, None), ('on_no_minimum', True, 0)]:
+            client = RecordedClient(ms_per_input_token=args.ms_per_input_token, min_cacheable=min_cacheable)
+            results[label] = run(client, args.rounds, caching)
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        reset_response_cache()
+
+    prefixes = {name: estimate_tokens(template.system_text()) for name, template in PROMPTS.items()}
+    print("Static prefix tokens: " + ", ".join(f"{name} {tokens}" for name, tokens in prefixes.items()))
+    baseline = results['off']
+    columns = ['input_tokens_per_request', 'cache_read_tokens_per_request', 'cache_write_tokens_per_request',
+               'billed_input_tokens_per_request', 'api_ms_per_request']
+    print("run | " + " | ".join(columns) + " | billed saving")
+    for label, result in results.items():
+        saving = 1 - result['billed_input_tokens_per_request'] / baseline['billed_input_tokens_per_request']
+        print(f"{label} | " + " | ".join(f"{result[column]:.1f}" for column in columns) + f" | {saving:.1%}")
+
+    path = write_results('prompt_caching', dict(vars(args), prefix_tokens=prefixes), results, args.output)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Measure request bursts against a rate-limited API, with and without the client-side limiter.
+
+Two bursts run against fake_anthropic.py enforcing --requests-per-minute and
+--tokens-per-minute (over --limit-window-seconds, shortened from a minute so
+the run takes seconds):
+    - batch: --worksheets students each submit a batch of --problems word
+      problems at the same moment
+    - interactive: as many students each submit one word problem at the same moment
+
+Each burst runs once with RATE_LIMIT_ENABLED on and once off, and reports the
+429s the fake server sent, how many problems were explained, degraded or
+failed, and request latency.
+
+Usage:
+    python benchmarks/rate_limit_burst.py [--worksheets N] [--problems N]
+        [--requests-per-minute N] [--tokens-per-minute N] [--limit-window-seconds S] [--output PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from bench_utils import summarize_latencies, write_results
+from fake_anthropic import FakeAnthropicServer, FakeServerConfig, StubSession
+
+from client_cache import reset_client_cache
+from coalescing import reset_coalescer
+from lambda_function import lambda_handler, reset_validation_memo
+from rate_limit import reset_rate_limiter
+from resilience import reset_breaker
+from response_cache import reset_response_cache
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def outcome(status_code, body):
+    if status_code != 200:
+        return 'failed'
+    return 'degraded' if body.get('degraded') else 'explained'
+
+
+def run_burst(server, bodies):
+    """Submit every request body at once, returning outcome counts and latencies."""
+    reset_client_cache()
+    reset_response_cache()
+    reset_validation_memo()
+    reset_coalescer()
+    reset_breaker()
+    reset_rate_limiter()
+    throttled_before = server.stats()['throttled']
+
+    latencies = [None] * len(bodies)
+    responses = [None] * len(bodies)
+    barrier = threading.Barrier(len(bodies))
+
+    def invoke(index):
+        event = {'body': json.dumps(bodies[index])}
+        barrier.wait()
+        started = time.perf_counter()
+        responses[index] = lambda_handler(event, LambdaContext(remaining_ms=30000))
+        latencies[index] = time.perf_counter() - started
+
+    threads = [threading.Thread(target=invoke, args=(index,)) for index in range(len(bodies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    outcomes = {'explained': 0, 'degraded': 0, 'failed': 0}
+    for response in responses:
+        body = json.loads(response['body'])
+        if 'results' in body:
+            for item in body['results']:
+                outcomes[outcome(item['status'], item)] += 1
+        else:
+            outcomes[outcome(response['statusCode'], body)] += 1
+
+    summary = summarize_latencies(latencies)
+    summary.update(outcomes)
+    summary['throttled_429s'] = server.stats()['throttled'] - throttled_before
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--worksheets', type=int, default=4)
+    parser.add_argument('--problems', type=int, default=10)
+    parser.add_argument('--requests-per-minute', type=int, default=20)
+    parser.add_argument('--tokens-per-minute', type=int, default=20000)
+    parser.add_argument('--limit-window-seconds', type=float, default=2.0)
+    parser.add_argument('--first-token-ms', type=float, default=100.0)
+    parser.add_argument('--tokens-per-second', type=float, default=2000.0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/rate_limit-<commit>.json)')
+    args = parser.parse_args()
+
+    worksheets = [
+        [f"solve for x: {w + 2}x + {p + 3} = {(w + 2) * (p + 1) + p + 3}" for p in range(args.problems)]
+        for w in range(args.worksheets)
+    ]
+    bursts = {
+        'batch': [{'expressions': worksheet} for worksheet in worksheets],
+        'interactive': [{'expression': problem} for worksheet in worksheets for problem in worksheet],
+    }
+    server = FakeAnthropicServer(FakeServerConfig(
+        first_token_ms=args.first_token_ms, tokens_per_second=args.tokens_per_second,
+        requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute,
+        limit_window_seconds=args.limit_window_seconds
+    )).start()
+    StubSession.configure(latency_ms=0)
+
+    results = {}
+    try:
+        with patch('boto3.session.Session', StubSession), \
+             patch.dict('os.environ', {'ANTHROPIC_BASE_URL': server.base_url, 'PARAMETER_NAME': 'benchmark-api-key'}), \
+             contextlib.redirect_stdout(io.StringIO()):
+            for burst, bodies in bursts.items():
+                for enabled in ['true', 'false']:
+                    with patch.dict('os.environ', {'RATE_LIMIT_ENABLED': enabled}):
+                        mode = 'limiter' if enabled == 'true' else 'no_limiter'
+                        results[f"{burst}_{mode}"] = run_burst(server, bodies)
+    finally:
+        server.stop()
+        reset_rate_limiter()
+        reset_breaker()
+
+    print(f"{args.worksheets} worksheets x {args.problems} problems, "
+          f"{args.requests_per_minute} requests / {args.tokens_per_minute} tokens per {args.limit_window_seconds}s")
+    for mode, summary in results.items():
+        print(f"{mode:22} {summary['throttled_429s']:4d} 429s, {summary['explained']} explained, "
+              f"{summary['degraded']} degraded, {summary['failed']} failed, "
+              f"p50 {summary['p50_ms']:.0f} ms, p95 {summary['p95_ms']:.0f} ms")
+
+    path = write_results('rate_limit', vars(args), results, args.output)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == '__main__':
+    main()
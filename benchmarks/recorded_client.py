@@ -0,0 +1,202 @@
+"""
+Fake Anthropic client that replays recorded responses for benchmarks.
+
+Responses come from fixtures/recorded_responses.json, keyed by expression. The
+kind of call (validation, tutoring or combined) is recognised from the system
+prompt. Token usage is estimated from the request and response text at about
+4 characters per token. Latency follows the recorded time-to-first-token and
+per-output-token figures, plus ms_per_input_token for input that isn't read
+from the prompt cache.
+
+A recording can also hold "variants": explanations keyed by routing prompt
+variant (e.g. "brief"), served when that variant's instructions are in the
+prompt. max_tokens and stop_sequences cut the text the way the API does, with
+the matching stop_reason. Calls with the narration prompt get the
+recording's "narration" text when it has one.
+
+Prompt caching is simulated the way the API documents it: the system blocks up
+to the one marked with cache_control form the prefix. A prefix shorter than the
+model's minimum is never cached. Otherwise the first call writes it (billed at
+1.25x) and calls within CACHE_TTL_SECONDS read it (billed at 0.1x).
+"""
+
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from bench_utils import BENCHMARKS_DIR
+from prompts import find_prompt, system_text
+from routing import PROMPT_VARIANTS
+
+FIXTURE_PATH = os.path.join(BENCHMARKS_DIR, 'fixtures', 'recorded_responses.json')
+CHARS_PER_TOKEN = 4
+
+# Shortest cacheable prefix per model family, and the cache's lifetime
+MIN_CACHEABLE_TOKENS = {'claude-3-haiku': 2048, 'claude-3-5-haiku': 2048}
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+CACHE_TTL_SECONDS = 300
+CACHE_WRITE_PRICE = 1.25
+CACHE_READ_PRICE = 0.1
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def min_cacheable_tokens(model):
+    for prefix, tokens in MIN_CACHEABLE_TOKENS.items():
+        if model.startswith(prefix):
+            return tokens
+    return DEFAULT_MIN_CACHEABLE_TOKENS
+
+
+def cached_prefix(system):
+    """Return the system text covered by cache_control, or None if nothing is marked."""
+    if isinstance(system, str):
+        return None
+    for index in range(len(system) - 1, -1, -1):
+        if system[index].get('cache_control'):
+            return system_text(system[:index + 1])
+    return None
+
+
+def load_recording(path=FIXTURE_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class RecordedClient:
+    """
+    Replays recorded responses and accounts for tokens and simulated latency.
+
+    Attributes:
+        calls (int): Number of messages.create calls
+        input_tokens (int): Estimated input tokens across all calls, excluding cache reads and writes
+        output_tokens (int): Estimated output tokens across all calls
+        cache_read_tokens (int): Prefix tokens read from the prompt cache
+        cache_write_tokens (int): Prefix tokens written to the prompt cache
+        simulated_ms (float): Total modelled API latency across all calls
+    """
+
+    def __init__(self, recording=None, time_scale=0.0, ms_per_input_token=0.0, min_cacheable=None,
+                 clock=time.monotonic):
+        """
+        Args:
+            recording (dict): Parsed fixture, defaults to the bundled recording
+            time_scale (float): Fraction of the modelled latency to actually sleep
+            ms_per_input_token (float): Modelled prefill time per uncached input token
+            min_cacheable (int): Overrides the per-model minimum cacheable prefix
+            clock (callable): Time source for the cache lifetime
+        """
+        self.recording = recording or load_recording()
+        self.time_scale = time_scale
+        self.ms_per_input_token = ms_per_input_token
+        self.min_cacheable = min_cacheable
+        self.clock = clock
+        self.messages = self
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.simulated_ms = 0.0
+        self._prompt_cache = {}
+
+    def billed_input_tokens(self):
+        """Input tokens weighted by prompt cache pricing."""
+        return (self.input_tokens + self.cache_write_tokens * CACHE_WRITE_PRICE
+                + self.cache_read_tokens * CACHE_READ_PRICE)
+
+    def use_prompt_cache(self, model, system):
+        """Return (read_tokens, write_tokens) for a request's cache_control prefix."""
+        prefix = cached_prefix(system)
+        if prefix is None:
+            return (0, 0)
+        tokens = estimate_tokens(prefix)
+        minimum = self.min_cacheable if self.min_cacheable is not None else min_cacheable_tokens(model)
+        if tokens < minimum:
+            return (0, 0)
+        now = self.clock()
+        key = (model, prefix)
+        written = key in self._prompt_cache and now - self._prompt_cache[key] < CACHE_TTL_SECONDS
+        self._prompt_cache[key] = now
+        return (tokens, 0) if written else (0, tokens)
+
+    def find_expression(self, prompt):
+        for expression in self.recording['responses']:
+            if expression in prompt:
+                return expression
+        raise KeyError(f"No recorded response for prompt: {prompt[:80]}")
+
+    def explanation(self, recorded, prompt):
+        """Return the recorded explanation for the prompt variant the prompt asks for."""
+        for variant, text in recorded.get('variants', {}).items():
+            if PROMPT_VARIANTS.get(variant) and PROMPT_VARIANTS[variant] in prompt:
+                return text
+        return recorded['explanation']
+
+    def response_text(self, system, expression, prompt=''):
+        recorded = self.recording['responses'][expression]
+        verdict = json.dumps(recorded['verdict'])
+        template = find_prompt(system)
+        if template is not None and template.name == 'validation':
+            return verdict
+        if template is not None and template.name == 'narration' and 'narration' in recorded:
+            return recorded['narration']
+        explanation = self.explanation(recorded, prompt)
+        if template is not None and template.name == 'combined':
+            text = f"<verdict>{verdict}</verdict>"
+            if explanation:
+                text += f"\n<explanation>{explanation}</explanation>"
+            return text
+        return explanation
+
+    @staticmethod
+    def apply_limits(text, max_tokens, stop_sequences):
+        """Cut text at the first stop sequence or at max_tokens; return (text, stop_reason, stop_sequence)."""
+        matches = [(text.find(sequence), sequence) for sequence in stop_sequences or []]
+        matches = [match for match in matches if match[0] != -1]
+        if matches:
+            index, sequence = min(matches)
+            text = text[:index]
+        if estimate_tokens(text) > max_tokens:
+            return (text[:max_tokens * CHARS_PER_TOKEN], 'max_tokens', None)
+        if matches:
+            return (text, 'stop_sequence', sequence)
+        return (text, 'end_turn', None)
+
+    def create(self, **kwargs):
+        prompt = kwargs['messages'][0]['content']
+        system = kwargs.get('system', '')
+        text = self.response_text(system, self.find_expression(prompt), prompt)
+        text, stop_reason, stop_sequence = self.apply_limits(text, kwargs['max_tokens'], kwargs.get('stop_sequences'))
+
+        read_tokens, write_tokens = self.use_prompt_cache(kwargs['model'], system)
+        input_tokens = estimate_tokens(system_text(system) + prompt) - read_tokens - write_tokens
+        output_tokens = estimate_tokens(text)
+        latency = self.recording['latency']
+        latency_ms = (latency['first_token_ms'] + (input_tokens + write_tokens) * self.ms_per_input_token
+                      + output_tokens * latency['ms_per_output_token'])
+
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cache_read_tokens += read_tokens
+        self.cache_write_tokens += write_tokens
+        self.simulated_ms += latency_ms
+        if self.time_scale:
+            time.sleep(latency_ms / 1000.0 * self.time_scale)
+
+        return SimpleNamespace(
+            content=[SimpleNamespace(type='text', text=text)],
+            stop_reason=stop_reason,
+            stop_sequence=stop_sequence,
+            usage=SimpleNamespace(
+                input_tokens=input_tokens, output_tokens=output_tokens,
+                cache_read_input_tokens=read_tokens, cache_creation_input_tokens=write_tokens
+            )
+        )
@@ -0,0 +1,164 @@
+"""
+Microbenchmark of content extraction and response serialization for large explanations.
+
+Compares the previous extract_explanation and build_response (kept verbatim
+below) with the typed extractor, constant headers and orjson encoding, and
+reports gzip/br compression time and size. Handler logging goes to an
+in-memory buffer, as it would cost a CloudWatch write per line on Lambda.
+
+Usage:
+    python benchmarks/response_serialization.py [--sizes 2000,8000,32000] [--iterations N]
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import time
+from types import SimpleNamespace
+
+from bench_utils import write_results
+
+import responses
+from lambda_function import build_response, extract_explanation
+from responses import compress_response
+
+
+def legacy_extract_explanation(message):
+    """extract_explanation before the typed extractor (kept verbatim for comparison)."""
+    print(f"Response received from Anthropic API. Type: {type(message.content)}")
+    explanation = ""
+    if hasattr(message, 'content'):
+        content = message.content
+        if isinstance(content, list):
+            print(f"Content is a list with {len(content)} items")
+            text_parts = []
+            for item in content:
+                print(f"Item type: {type(item)}")
+                if hasattr(item, 'text'):
+                    text_parts.append(item.text)
+                elif hasattr(item, 'value'):
+                    text_parts.append(item.value)
+                elif isinstance(item, str):
+                    text_parts.append(item)
+                else:
+                    print(f"Unknown item format: {item}")
+            explanation = " ".join(text_parts)
+        elif isinstance(content, str):
+            explanation = content
+        elif hasattr(content, 'text'):
+            explanation = content.text
+        elif hasattr(content, 'value'):
+            explanation = content.value
+        else:
+            explanation = str(content)
+    else:
+        explanation = str(message)
+    print(f"Extracted explanation: {explanation[:100]}...")
+    return explanation
+
+
+def legacy_build_response(status_code, body):
+    """build_response before the constant headers (kept verbatim for comparison)."""
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'OPTIONS,POST',
+            'Access-Control-Allow-Headers': 'Content-Type'
+        },
+        'body': json.dumps(body)
+    }
+
+
+def make_message(size):
+    paragraph = "<p><strong>Step:</strong> carry the ten into the next column and add again.</p>"
+    html = (paragraph * (size // len(paragraph) + 1))[:size]
+    return SimpleNamespace(content=[SimpleNamespace(type='text', text=html)])
+
+
+def make_body(explanation):
+    return {
+        'explanation': explanation,
+        'success': True,
+        'formatted': True,
+        'cache': {'hits': 12, 'misses': 30, 'hit_rate': 0.29, 'hit': False, 'tier': None},
+        'result': '391'
+    }
+
+
+def per_call_us(iterations, repeats, fn):
+    """Return the fastest of several runs of fn, in microseconds per call."""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e6
+
+
+def measure(size, iterations, repeats):
+    message = make_message(size)
+
+    def legacy():
+        legacy_build_response(200, make_body(legacy_extract_explanation(message)))
+
+    def current():
+        build_response(200, make_body(extract_explanation(message)))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        legacy_us = per_call_us(iterations, repeats, legacy)
+        current_us = per_call_us(iterations, repeats, current)
+        saved_orjson, responses.orjson = responses.orjson, None
+        try:
+            stdlib_us = per_call_us(iterations, repeats, current)
+        finally:
+            responses.orjson = saved_orjson
+
+    response = build_response(200, make_body(message.content[0].text))
+    result = {
+        'legacy_us': legacy_us,
+        'current_us': current_us,
+        'current_stdlib_json_us': stdlib_us,
+        'body_bytes': len(response['body']),
+    }
+    gzip_us = per_call_us(max(iterations // 10, 1), repeats,
+                          lambda: compress_response(response, {'Accept-Encoding': 'gzip'}))
+    result['gzip_us'] = gzip_us
+    result['gzip_bytes'] = len(gzip.compress(response['body'].encode('utf-8'), compresslevel=responses.GZIP_LEVEL))
+    if responses.brotli is not None:
+        result['br_us'] = per_call_us(max(iterations // 10, 1), repeats,
+                                      lambda: compress_response(response, {'Accept-Encoding': 'br'}))
+        result['br_bytes'] = len(responses.brotli.compress(response['body'].encode('utf-8'),
+                                                           quality=responses.BROTLI_QUALITY))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='2000,8000,32000', help='explanation sizes in characters')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/serialization-<commit>.json)')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {str(size): measure(size, args.iterations, args.repeats) for size in sizes}
+
+    print(f"orjson {'available' if responses.orjson is not None else 'not installed'}, "
+          f"brotli {'available' if responses.brotli is not None else 'not installed'}")
+    print("chars | legacy us | current us | current (json) us | body bytes | gzip us | gzip bytes")
+    for size, result in results.items():
+        print(f"{size:>5} | {result['legacy_us']:9.1f} | {result['current_us']:10.1f} | "
+              f"{result['current_stdlib_json_us']:16.1f} | {result['body_bytes']:10d} | "
+              f"{result['gzip_us']:7.1f} | {result['gzip_bytes']:10d}")
+
+    config = dict(vars(args), orjson=responses.orjson is not None, brotli=responses.brotli is not None)
+    print(f"\nResults written to {write_results('serialization', config, results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare narrating local step traces with letting the tutor solve the expression.
+
+Replays fixtures/step_trace_responses.json (multi-step arithmetic recorded
+both as a full tutoring answer and as a narration of the precomputed steps)
+through solve_expression with cold caches, once with STEP_TRACE=false and
+once with step traces on. The RecordedClient serves the answer for the prompt
+each mode sends and models latency from the recorded time-to-first-token and
+per-output-token rate.
+
+Usage:
+    python benchmarks/step_trace.py [--rounds N] [--time-scale F] [--output PATH]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+from unittest.mock import patch
+
+from bench_utils import BENCHMARKS_DIR, write_results
+from recorded_client import RecordedClient, load_recording
+
+from lambda_function import reset_validation_memo, solve_expression
+from response_cache import LRUCache, ResponseCache, reset_response_cache
+
+FIXTURE_PATH = os.path.join(BENCHMARKS_DIR, 'fixtures', 'step_trace_responses.json')
+
+# claude-3-haiku list prices, USD per million tokens
+INPUT_PRICE_PER_MTOK = 0.25
+OUTPUT_PRICE_PER_MTOK = 1.25
+
+MODES = {'solve': 'false', 'narrate': 'true'}
+
+
+def run_mode(step_trace, client, rounds):
+    client.reset()
+    wall = 0.0
+    requests = 0
+    with patch.dict('os.environ', {'STEP_TRACE': step_trace}):
+        for _ in range(rounds):
+            for expression in client.recording['responses']:
+                reset_validation_memo()
+                reset_response_cache(ResponseCache(LRUCache()))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    started = time.perf_counter()
+                    solve_expression(client, expression)
+                    wall += time.perf_counter() - started
+                requests += 1
+
+    cost = (client.input_tokens * INPUT_PRICE_PER_MTOK + client.output_tokens * OUTPUT_PRICE_PER_MTOK) / 1e6
+    return {
+        'requests': requests,
+        'input_tokens_per_request': client.input_tokens / requests,
+        'output_tokens_per_request': client.output_tokens / requests,
+        'api_ms_per_request': client.simulated_ms / requests,
+        'wall_ms_per_request': wall * 1000 / requests,
+        'usd_per_1k_requests': cost * 1000 / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--time-scale', type=float, default=0.0,
+                        help='fraction of the modelled API latency to actually sleep')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/step_trace-<commit>.json)')
+    args = parser.parse_args()
+
+    client = RecordedClient(recording=load_recording(FIXTURE_PATH), time_scale=args.time_scale)
+    try:
+        results = {mode: run_mode(step_trace, client, args.rounds) for mode, step_trace in MODES.items()}
+    finally:
+        reset_response_cache()
+
+    columns = ['input_tokens_per_request', 'output_tokens_per_request', 'api_ms_per_request',
+               'wall_ms_per_request', 'usd_per_1k_requests']
+    print("mode | " + " | ".join(columns))
+    for mode, result in results.items():
+        print(f"{mode} | " + " | ".join(f"{result[column]:.4f}" if column.startswith('usd') else
+                                       f"{result[column]:.1f}" for column in columns))
+
+    solve, narrate = results['solve'], results['narrate']
+    print(f"narrate vs solve: {1 - narrate['output_tokens_per_request'] / solve['output_tokens_per_request']:.0%} "
+          f"fewer output tokens, {narrate['input_tokens_per_request'] - solve['input_tokens_per_request']:+.0f} "
+          f"input tokens, {solve['api_ms_per_request'] - narrate['api_ms_per_request']:.0f} ms less API time, "
+          f"{1 - narrate['usd_per_1k_requests'] / solve['usd_per_1k_requests']:.0%} lower cost per request")
+
+    print(f"\nResults written to {write_results('step_trace', vars(args), results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Throughput and memory of the streaming calculator (calculator_stream.py).
+
+Generates CSV inputs of increasing size and:
+    - runs the pipeline in-process under tracemalloc for each size, to show
+      that peak memory doesn't grow with the input
+    - runs the CLI on the largest input with each --workers count, timing
+      the whole command including process start-up
+
+About 4% of rows divide by zero, so the error path is exercised too.
+
+Usage:
+    python benchmarks/stream_benchmark.py [--rows N ...] [--workers N ...] [--output PATH]
+"""
+
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_utils import REPO_DIR, write_results
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import calculator_stream  # noqa: E402
+
+SCRIPT = os.path.join(REPO_DIR, 'calculator_stream.py')
+
+
+def write_input(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('op,a,b,c\n')
+        for _ in range(rows):
+            f.write(f"{rng.choice(['add', '-', '*', '/'])},{rng.uniform(-1e3, 1e3)},{rng.randint(0, 5)},"
+                    f"{rng.randint(1, 9)}\n")
+
+
+class NullWriter(io.TextIOBase):
+    """Discards output, so memory measurements only see the pipeline."""
+
+    def write(self, text):
+        return len(text)
+
+
+def measure_in_process(path):
+    calculator_stream.new_calculator()
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        records, errors = calculator_stream.process(calculator_stream.read_lines(path), NullWriter())
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'records': records, 'errors': errors, 'rows_per_second': records / seconds, 'peak_kib': peak / 1024}
+
+
+def measure_cli(path, output, workers):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT, path, '-o', output, '--workers', str(workers)],
+                   check=True, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument('--output', help='results file (default: benchmarks/results/stream-<commit>.json)')
+    args = parser.parse_args()
+
+    results = {'in_process': {}, 'cli': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            path = os.path.join(directory, f"input-{rows}.csv")
+            write_input(path, rows)
+            results['in_process'][rows] = measure_in_process(path)
+
+        largest = os.path.join(directory, f"input-{max(args.rows)}.csv")
+        output = os.path.join(directory, 'results.csv')
+        for workers in args.workers:
+            seconds = measure_cli(largest, output, workers)
+            results['cli'][workers] = {'seconds': seconds, 'rows_per_second': max(args.rows) / seconds}
+
+    print("rows | rows/s | tracemalloc peak")
+    for rows, result in results['in_process'].items():
+        print(f"{rows} | {result['rows_per_second']:,.0f} | {result['peak_kib']:,.0f} KiB")
+    print(f"\nCLI, {max(args.rows)} rows on {os.cpu_count()} CPU(s)")
+    print("workers | seconds | rows/s")
+    for workers, result in results['cli'].items():
+        print(f"{workers} | {result['seconds']:.2f} | {result['rows_per_second']:,.0f}")
+
+    print(f"\nResults written to {write_results('stream', vars(args), results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
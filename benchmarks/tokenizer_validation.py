@@ -0,0 +1,171 @@
+"""
+Compare basic_validation on the token stream with the previous regex version.
+
+Runs both over long (10k character) and adversarial inputs and reports
+throughput. It also times the canonicalisation work of a request, which
+computes the validation memo key and the response cache key from the same
+input.
+
+Usage:
+    python benchmarks/tokenizer_validation.py [--length N] [--repeats N]
+"""
+
+import argparse
+import re
+import time
+import unicodedata
+
+from bench_utils import write_results
+
+import math_engine
+from lambda_function import basic_validation
+from math_engine import canonicalize_expression
+
+
+def legacy_basic_validation(expression):
+    """basic_validation as it was before the tokenizer (kept verbatim for comparison)."""
+    # Check for presence of mathematical operators or functions
+    math_operators = r'[\+\-\*\/\^\(\)\[\]\{\}\=\<\>\%\√]'
+    math_functions = r'\b(sin|cos|tan|log|ln|sqrt|abs|exp|pow|round|floor|ceil)\b'
+    numbers = r'\d+'
+
+    # Check if the expression contains math operators, functions, or numbers
+    has_operators = bool(re.search(math_operators, expression))
+    has_functions = bool(re.search(math_functions, expression, re.IGNORECASE))
+    has_numbers = bool(re.search(numbers, expression))
+
+    # If the expression has math operators or functions and numbers, it's likely a math problem
+    is_math_problem = (has_operators or has_functions) and has_numbers
+
+    if not is_math_problem:
+        return (False, False, "The input does not appear to be a math problem.")
+
+    # Basic solvability checks
+    try:
+        # Count parentheses, brackets, and braces
+        open_parens = expression.count('(')
+        close_parens = expression.count(')')
+        open_brackets = expression.count('[')
+        close_brackets = expression.count(']')
+        open_braces = expression.count('{')
+        close_braces = expression.count('}')
+
+        # Check if parentheses, brackets, and braces are balanced
+        if open_parens != close_parens:
+            return (False, True, "Unbalanced parentheses in the expression.")
+        if open_brackets != close_brackets:
+            return (False, True, "Unbalanced brackets in the expression.")
+        if open_braces != close_braces:
+            return (False, True, "Unbalanced braces in the expression.")
+
+        # Check for division by zero (simple cases)
+        if re.search(r'\/\s*0(?![.\d])', expression):
+            return (False, True, "Expression contains division by zero.")
+
+        # Check for invalid syntax like consecutive operators
+        if re.search(r'[\+\-\*\/\^]\s*[\+\*\/\^]', expression):
+            return (False, True, "Expression contains consecutive operators.")
+
+        return (True, True, "")
+    except Exception as e:
+        return (False, True, f"Error validating expression: {str(e)}")
+
+
+LEGACY_UNICODE_OPERATORS = dict(math_engine.UNICODE_OPERATORS)
+LEGACY_SPACE_AROUND_SYMBOL = re.compile(r'\s*([\+\-\*\/\^\%\(\)\[\]\{\}\=\<\>,√])\s*')
+LEGACY_WHITESPACE = re.compile(r'\s+')
+
+
+def legacy_canonicalize_expression(expression):
+    """canonicalize_expression as it was before the tokenizer."""
+    text = unicodedata.normalize('NFKC', expression)
+    for symbol, ascii_symbol in LEGACY_UNICODE_OPERATORS.items():
+        text = text.replace(symbol, ascii_symbol)
+    text = text.replace('**', '^').lower()
+    text = LEGACY_WHITESPACE.sub(' ', text).strip()
+    return LEGACY_SPACE_AROUND_SYMBOL.sub(r'\1', text)
+
+
+def fit(pattern, length):
+    return (pattern * (length // len(pattern) + 1))[:length]
+
+
+def build_inputs(length):
+    half = length // 2
+    return {
+        'long_sum': fit("12 + 7 * (3 - 1) / 4 ", length),
+        'deep_nesting': "(" * (half - 1) + "1" + ")" * (half - 1),
+        'misordered_brackets': fit(")(1+", length),
+        'spaced_zero_divisor': "1 /" + " " * (length - 4) + "0",
+        'operator_run': "1" + fit("- ", length - 2) + "1",
+        'word_problem': fit("If Sam has 12 apples and gives away 5, how many are left? ", length),
+        'unicode_operators': fit("8 ÷ 2 × 3 − 1 ", length),
+    }
+
+
+def throughput(fn, text, repeats, min_seconds=0.2):
+    """Best-of-repeats calls per second for fn(text)."""
+    best = float('inf')
+    for _ in range(repeats):
+        calls = 0
+        started = time.perf_counter()
+        while True:
+            fn(text)
+            calls += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_seconds:
+                break
+        best = min(best, elapsed / calls)
+    return 1.0 / best
+
+
+def request_keys(canonicalize, text):
+    # A request canonicalises its input for the validation memo and again for the response
+    # cache key, then falls back to basic_validation; start each request with cold caches
+    math_engine._canonicalize_cached.cache_clear()
+    math_engine._scan_cached.cache_clear()
+    math_engine._signals_cached.cache_clear()
+    canonicalize(text)
+    canonicalize(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--length', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/tokenizer-<commit>.json)')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'input':22} {'legacy/s':>10} {'tokens/s':>10}  verdicts")
+    for name, text in build_inputs(args.length).items():
+        legacy = throughput(legacy_basic_validation, text, args.repeats)
+        current = throughput(basic_validation, text, args.repeats)
+        results[name] = {
+            'legacy_per_second': legacy,
+            'token_per_second': current,
+            'legacy_verdict': legacy_basic_validation(text)[2] or 'valid',
+            'token_verdict': basic_validation(text)[2] or 'valid',
+        }
+        print(f"{name:22} {legacy:10.0f} {current:10.0f}  "
+              f"{results[name]['legacy_verdict']!r} -> {results[name]['token_verdict']!r}")
+
+    # Typical request-sized input, where the token cache lets the second key reuse the first scan
+    text = "Solve for x:  2x + 3 = 7"
+    results['request_keys'] = {
+        'legacy_per_second': throughput(
+            lambda t: (request_keys(legacy_canonicalize_expression, t), legacy_basic_validation(t)), text, args.repeats
+        ),
+        'token_per_second': throughput(
+            lambda t: (request_keys(canonicalize_expression, t), basic_validation(t)), text, args.repeats
+        ),
+    }
+    print(f"{'request_keys':22} {results['request_keys']['legacy_per_second']:10.0f} "
+          f"{results['request_keys']['token_per_second']:10.0f}")
+
+    path = write_results('tokenizer', {'length': args.length, 'repeats': args.repeats}, results, args.output)
+    print(f"\nResults written to {path}")
+
+
+if __name__ == '__main__':
+    main()
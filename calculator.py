@@ -0,0 +1,88 @@
+"""
+The command-line Calculator: arithmetic over lists of numbers, with history.
+
+The interactive menu and the AI calculator are in test.py; bulk mode is
+calculator_batch.py and streaming file mode is calculator_stream.py.
+"""
+
+from collections import deque
+
+import calculator_batch
+import calculator_history
+from calculator_batch import BatchSummary
+from calculator_history import CalculationHistory
+
+
+class Calculator:
+    def __init__(self, history=None):
+        # Bounded in memory, and logged to disk if CALCULATOR_HISTORY_PATH is set; see calculator_history.py
+        self.history = history if history is not None else CalculationHistory.from_environment()
+        # One summary per bulk call, not per row
+        self.batch_history = deque(maxlen=calculator_batch.BATCH_HISTORY_SIZE)
+    
+    def add(self, numbers):
+        result = sum(numbers)
+        self.history.append(calculator_history.ADD, numbers, result)
+        return result
+    
+    def subtract(self, numbers):
+        result = numbers[0] - sum(numbers[1:])
+        self.history.append(calculator_history.SUBTRACT, numbers, result)
+        return result
+    
+    def multiply(self, numbers):
+        result = 1
+        for num in numbers:
+            result *= num
+        self.history.append(calculator_history.MULTIPLY, numbers, result)
+        return result
+    
+    def divide(self, numbers):
+        result = numbers[0]
+        for num in numbers[1:]:
+            if num == 0:
+                raise ValueError("Cannot divide by zero!")
+            result /= num
+        self.history.append(calculator_history.DIVIDE, numbers, result)
+        return result
+
+    def calculate_batch(self, op, rows):
+        """
+        Apply an operation to every row of a batch at once.
+
+        Args:
+            op (int): calculator_history.ADD, SUBTRACT, MULTIPLY or DIVIDE
+            rows: A 2-D array (one row of operands per calculation) or a
+                list of equal-length operand columns
+
+        Returns:
+            BatchResult: Row results, with NaN and an entry in error_rows for
+                each row with a zero divisor instead of raising
+        """
+        result = calculator_batch.compute(op, rows)
+        operands = rows.shape[1] if hasattr(rows, 'shape') else len(rows)
+        self.batch_history.append(BatchSummary.of(op, operands, result))
+        return result
+
+    def add_batch(self, rows):
+        return self.calculate_batch(calculator_history.ADD, rows)
+
+    def subtract_batch(self, rows):
+        return self.calculate_batch(calculator_history.SUBTRACT, rows)
+
+    def multiply_batch(self, rows):
+        return self.calculate_batch(calculator_history.MULTIPLY, rows)
+
+    def divide_batch(self, rows):
+        return self.calculate_batch(calculator_history.DIVIDE, rows)
+
+    def show_history(self, limit=calculator_history.DEFAULT_PAGE_SIZE):
+        print("\nCalculation History:")
+        # Only the entries shown are formatted, oldest first
+        for record in reversed(self.history.recent(limit)):
+            print(record)
+        total = len(self.history)
+        if total > limit:
+            print(f"(Showing the last {limit} of {total} calculations)")
+        for summary in self.batch_history:
+            print(summary)
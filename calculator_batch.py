@@ -0,0 +1,190 @@
+"""
+Bulk mode for the command-line Calculator in calculator.py.
+
+compute() applies one operation to many rows of operands at once, the way
+Calculator.add/subtract/multiply/divide do to a single list: a row is
+[a, b, c, ...] and the result is a + b + c, a - b - c, a * b * c or
+a / b / c. Rows come either as a 2-D array (one row per calculation) or as a
+list of operand columns of equal length, e.g. array.array('d') columns
+loaded from a file.
+
+With NumPy installed each operand column is combined with whole-array
+operations; without it the same API falls back to a row loop over
+array('d') columns. Either way a zero divisor doesn't stop the batch: its
+row's result is NaN and its index is reported in BatchResult.error_rows.
+
+History is kept per batch (BatchSummary) rather than per row.
+"""
+
+import math
+from array import array
+
+from calculator_history import ADD, DIVIDE, MULTIPLY, SUBTRACT, SYMBOLS
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised by TestPurePython instead
+    np = None
+
+# Batch summaries the Calculator keeps
+BATCH_HISTORY_SIZE = 100
+
+
+class BatchResult:
+    """
+    Results of one batch.
+
+    Attributes:
+        results: Row results, an ndarray with NumPy or an array('d') without;
+            NaN for rows with a zero divisor
+        error_rows: Indices of the rows with a zero divisor, in order
+    """
+
+    __slots__ = ('results', 'error_rows')
+
+    def __init__(self, results, error_rows):
+        self.results = results
+        self.error_rows = error_rows
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def ok(self):
+        return len(self.error_rows) == 0
+
+
+class BatchSummary:
+    """
+    History entry for a batch: its operation and shape, not its rows.
+
+    Attributes:
+        op (int): ADD, SUBTRACT, MULTIPLY or DIVIDE
+        rows (int): Calculations in the batch
+        operands (int): Operands per calculation
+        errors (int): Rows with a zero divisor
+        total (float): Sum of the results of the rows without errors
+    """
+
+    __slots__ = ('op', 'rows', 'operands', 'errors', 'total')
+
+    def __init__(self, op, rows, operands, errors, total):
+        self.op = op
+        self.rows = rows
+        self.operands = operands
+        self.errors = errors
+        self.total = total
+
+    @classmethod
+    def of(cls, op, operands, result):
+        """Summarize a BatchResult."""
+        if np is not None and isinstance(result.results, np.ndarray):
+            total = float(np.nansum(result.results))
+        else:
+            total = math.fsum(value for value in result.results if not math.isnan(value))
+        return cls(op, len(result), operands, len(result.error_rows), total)
+
+    def __str__(self):
+        errors = f", {self.errors} divide-by-zero row(s)" if self.errors else ""
+        return (f"[batch] {self.rows} rows of {self.operands} operands ({SYMBOLS[self.op]}), "
+                f"sum of results = {self.total}{errors}")
+
+
+def as_columns(rows):
+    """
+    Return the operand columns of a batch.
+
+    Args:
+        rows: A 2-D array (rows x operands), or a sequence of operand columns
+            of equal length
+
+    Returns:
+        list: The columns, as float64 ndarrays with NumPy, array('d') without
+
+    Raises:
+        ValueError: If there are fewer than two operands or the columns differ in length
+    """
+    if np is not None:
+        if isinstance(rows, np.ndarray):
+            if rows.ndim != 2:
+                raise ValueError("A batch must be a 2-D array of rows")
+            matrix = rows.astype(np.float64, copy=False)
+            columns = [matrix[:, i] for i in range(matrix.shape[1])]
+        else:
+            columns = [np.asarray(column, dtype=np.float64) for column in rows]
+    else:
+        columns = [column if isinstance(column, array) and column.typecode == 'd' else array('d', column)
+                   for column in rows]
+
+    if len(columns) < 2:
+        raise ValueError("Each row needs at least two numbers")
+    if len({len(column) for column in columns}) != 1:
+        raise ValueError("All operand columns must have the same length")
+    return columns
+
+
+def compute(op, rows):
+    """
+    Apply an operation row-wise to a batch.
+
+    Args:
+        op (int): ADD, SUBTRACT, MULTIPLY or DIVIDE
+        rows: A 2-D array or a list of operand columns (see as_columns)
+
+    Returns:
+        BatchResult: The row results and the rows with a zero divisor
+    """
+    columns = as_columns(rows)
+    if np is None:
+        return _compute_rows(op, columns)
+
+    first, rest = columns[0], columns[1:]
+    if op == DIVIDE:
+        zero = np.zeros(len(first), dtype=bool)
+        for column in rest:
+            zero |= column == 0
+        result = first.copy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for column in rest:
+                np.divide(result, column, out=result)
+        result[zero] = np.nan
+        return BatchResult(result, np.flatnonzero(zero))
+
+    result = first.copy()
+    for column in rest:
+        if op == ADD:
+            result += column
+        elif op == SUBTRACT:
+            result -= column
+        elif op == MULTIPLY:
+            result *= column
+        else:
+            raise ValueError(f"Unknown operation {op!r}")
+    return BatchResult(result, np.empty(0, dtype=np.intp))
+
+
+def _compute_rows(op, columns):
+    """Row loop used when NumPy isn't installed."""
+    if op not in (ADD, SUBTRACT, MULTIPLY, DIVIDE):
+        raise ValueError(f"Unknown operation {op!r}")
+    first, rest = columns[0], columns[1:]
+    results = array('d', first)
+    error_rows = []
+    for i in range(len(results)):
+        value = results[i]
+        for column in rest:
+            operand = column[i]
+            if op == ADD:
+                value += operand
+            elif op == SUBTRACT:
+                value -= operand
+            elif op == MULTIPLY:
+                value *= operand
+            elif operand == 0:
+                value = math.nan
+                error_rows.append(i)
+                break
+            else:
+                value /= operand
+        results[i] = value
+    return BatchResult(results, error_rows)
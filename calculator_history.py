@@ -0,0 +1,319 @@
+"""
+Bounded, persistent calculation history for the command-line Calculator in calculator.py.
+
+Calculations are kept as typed records (an operation code, the operands and
+the result) rather than formatted strings:
+    - HistoryBuffer: a fixed-capacity ring buffer backed by arrays, so memory
+      stays flat however long the calculator runs
+    - HistoryLog: an append-only SQLite log, written in batches, with keyset
+      pagination over its primary key
+    - CalculationHistory: the buffer for recent entries plus, optionally, the
+      log for everything, reloading the most recent entries on startup
+
+Operands and results are stored as doubles (get_numbers() reads floats
+anyway). The "1.0 + 2.0 = 3.0" text is only built when a record is shown.
+
+Environment:
+    CALCULATOR_HISTORY_LIMIT: entries kept in memory (default 1000)
+    CALCULATOR_HISTORY_PATH: SQLite file for the log, e.g.
+        ~/.calculator_history.sqlite3; unset or empty keeps the history in
+        memory only
+"""
+
+import os
+import sqlite3
+from array import array
+
+ADD, SUBTRACT, MULTIPLY, DIVIDE = range(4)
+SYMBOLS = ('+', '-', '*', '/')
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_PAGE_SIZE = 20
+# Appends are committed together; a crash loses at most this many entries
+DEFAULT_BATCH_SIZE = 100
+# Operands stored inline per ring buffer slot; longer calculations spill the rest
+INLINE_OPERANDS = 2
+
+
+def get_history_capacity():
+    """Read CALCULATOR_HISTORY_LIMIT, falling back to the default for missing or invalid values."""
+    try:
+        capacity = int(os.environ.get('CALCULATOR_HISTORY_LIMIT', DEFAULT_CAPACITY))
+    except ValueError:
+        return DEFAULT_CAPACITY
+    return capacity if capacity > 0 else DEFAULT_CAPACITY
+
+
+def get_history_path():
+    """Read CALCULATOR_HISTORY_PATH; None means no on-disk log, which is the default."""
+    path = os.environ.get('CALCULATOR_HISTORY_PATH')
+    return os.path.expanduser(path) if path else None
+
+
+def pack_operands(operands):
+    return array('d', operands).tobytes()
+
+
+def unpack_operands(packed):
+    values = array('d')
+    values.frombytes(packed)
+    return tuple(values)
+
+
+class HistoryRecord:
+    """
+    One calculation. Operands stay packed until they're read.
+
+    Attributes:
+        seq (int): Position in the history, starting at 1
+        op (int): ADD, SUBTRACT, MULTIPLY or DIVIDE
+        result (float): The calculation's result
+    """
+
+    __slots__ = ('seq', 'op', 'packed_operands', 'result')
+
+    def __init__(self, seq, op, packed_operands, result):
+        self.seq = seq
+        self.op = op
+        self.packed_operands = packed_operands
+        self.result = result
+
+    @property
+    def operands(self):
+        return unpack_operands(self.packed_operands)
+
+    def format(self):
+        """Return the calculation as the calculator prints it, e.g. '1.0 + 2.0 = 3.0'."""
+        return f"{f' {SYMBOLS[self.op]} '.join(map(str, self.operands))} = {self.result}"
+
+    __str__ = format
+
+    def __repr__(self):
+        return f"HistoryRecord({self.seq}, {self.format()!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, HistoryRecord):
+            return NotImplemented
+        return (self.seq, self.op, self.packed_operands, self.result) == \
+            (other.seq, other.op, other.packed_operands, other.result)
+
+
+class HistoryBuffer:
+    """
+    Ring buffer of the most recent calculations.
+
+    Operation codes, operand counts, results and the first INLINE_OPERANDS
+    operands live in preallocated arrays; only longer calculations keep their
+    extra operands in a dict. An entry costs about 30 bytes instead of a
+    formatted string, and the oldest entry is overwritten once the buffer is
+    full.
+
+    Attributes:
+        capacity (int): Entries kept
+        appended (int): Entries ever appended, which is also the last seq
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, start_seq=0):
+        """
+        Args:
+            capacity (int): Entries to keep; must be positive
+            start_seq (int): Seq of the last entry already recorded elsewhere,
+                so numbering continues across runs
+        """
+        if capacity <= 0:
+            raise ValueError("The history capacity must be positive")
+        self.capacity = capacity
+        self.appended = start_seq
+        self._first_seq = start_seq + 1
+        self._ops = array('B', bytes(capacity))
+        self._counts = array('I', bytes(4 * capacity))
+        self._results = array('d', bytes(8 * capacity))
+        self._inline = array('d', bytes(8 * INLINE_OPERANDS * capacity))
+        self._overflow = {}
+
+    def append(self, op, operands, result):
+        """
+        Store a calculation and return its seq.
+
+        Args:
+            op (int): ADD, SUBTRACT, MULTIPLY or DIVIDE
+            operands (list): The numbers, in order
+            result (float): The result
+
+        Returns:
+            int: The calculation's seq
+        """
+        slot = self.appended % self.capacity
+        self._ops[slot] = op
+        self._counts[slot] = len(operands)
+        self._results[slot] = result
+        start = slot * INLINE_OPERANDS
+        inline = operands[:INLINE_OPERANDS]
+        self._inline[start:start + len(inline)] = array('d', inline)
+        if len(operands) > INLINE_OPERANDS:
+            self._overflow[slot] = pack_operands(operands[INLINE_OPERANDS:])
+        else:
+            self._overflow.pop(slot, None)
+        self.appended += 1
+        return self.appended
+
+    def __len__(self):
+        return min(self.appended - self._first_seq + 1, self.capacity)
+
+    def oldest_seq(self):
+        return self.appended - len(self) + 1
+
+    def record(self, seq):
+        """Return the record with a seq still in the buffer."""
+        if not self.oldest_seq() <= seq <= self.appended:
+            raise IndexError(f"Entry {seq} is not in the buffer")
+        slot = (seq - 1) % self.capacity
+        start = slot * INLINE_OPERANDS
+        packed = self._inline[start:start + min(self._counts[slot], INLINE_OPERANDS)].tobytes()
+        return HistoryRecord(seq, self._ops[slot], packed + self._overflow.get(slot, b''), self._results[slot])
+
+    def __iter__(self):
+        """Yield the records oldest first."""
+        for seq in range(self.oldest_seq(), self.appended + 1):
+            yield self.record(seq)
+
+    def page(self, before=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Return up to limit records older than seq before, newest first.
+
+        Args:
+            before (int): Only return records with a smaller seq; None starts at the newest
+            limit (int): Page size
+
+        Returns:
+            list: HistoryRecord objects
+        """
+        newest = self.appended if before is None else min(before - 1, self.appended)
+        oldest = max(newest - limit + 1, self.oldest_seq())
+        return [self.record(seq) for seq in range(newest, oldest - 1, -1)]
+
+
+class HistoryLog:
+    """
+    Append-only SQLite log of every calculation.
+
+    Rows are keyed by seq, so a page is an index range scan whatever the log's
+    size. Appends are buffered and committed in batches; reads flush first.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pending = []
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS history '
+            '(seq INTEGER PRIMARY KEY, op INTEGER NOT NULL, operands BLOB NOT NULL, result REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def last_seq(self):
+        self.flush()
+        return self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM history').fetchone()[0]
+
+    def append(self, record):
+        self._pending.append((record.seq, record.op, record.packed_operands, record.result))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany('INSERT INTO history (seq, op, operands, result) VALUES (?, ?, ?, ?)',
+                                   self._pending)
+        self._pending = []
+
+    def __len__(self):
+        self.flush()
+        return self._conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+    def page(self, before=None, limit=DEFAULT_PAGE_SIZE):
+        """Return up to limit records older than seq before, newest first (see HistoryBuffer.page)."""
+        self.flush()
+        if before is None:
+            rows = self._conn.execute(
+                'SELECT seq, op, operands, result FROM history ORDER BY seq DESC LIMIT ?', (limit,)
+            )
+        else:
+            rows = self._conn.execute(
+                'SELECT seq, op, operands, result FROM history WHERE seq < ? ORDER BY seq DESC LIMIT ?',
+                (before, limit)
+            )
+        return [HistoryRecord(*row) for row in rows]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class CalculationHistory:
+    """
+    The calculator's history: recent entries in memory, everything in the log.
+
+    Without a log the history is the ring buffer alone. With one, numbering
+    continues from the log and the buffer starts with its most recent entries.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, path=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            capacity (int): Entries kept in memory
+            path (str): SQLite file for the log, or None for memory only
+            batch_size (int): Appends per log commit
+        """
+        self.log = HistoryLog(path, batch_size) if path else None
+        recent = self.log.page(limit=capacity) if self.log else []
+        start_seq = recent[-1].seq - 1 if recent else (self.log.last_seq() if self.log else 0)
+        self.buffer = HistoryBuffer(capacity, start_seq)
+        for record in reversed(recent):
+            self.buffer.append(record.op, record.operands, record.result)
+
+    @classmethod
+    def from_environment(cls):
+        """Build the history configured by CALCULATOR_HISTORY_LIMIT and CALCULATOR_HISTORY_PATH."""
+        return cls(get_history_capacity(), get_history_path())
+
+    def append(self, op, operands, result):
+        """
+        Record a calculation.
+
+        Args:
+            op (int): ADD, SUBTRACT, MULTIPLY or DIVIDE
+            operands (list): The numbers, in order
+            result (float): The result
+
+        Returns:
+            int: The calculation's seq
+        """
+        seq = self.buffer.append(op, operands, result)
+        if self.log is not None:
+            self.log.append(HistoryRecord(seq, op, pack_operands(operands), result))
+        return seq
+
+    def __len__(self):
+        return len(self.log) if self.log is not None else len(self.buffer)
+
+    def recent(self, limit=DEFAULT_PAGE_SIZE):
+        """Return the newest records from memory, newest first."""
+        return self.buffer.page(limit=limit)
+
+    def page(self, before=None, limit=DEFAULT_PAGE_SIZE):
+        """Return a page of records older than seq before, newest first, from the log if there is one."""
+        if self.log is not None:
+            return self.log.page(before, limit)
+        return self.buffer.page(before, limit)
+
+    def flush(self):
+        if self.log is not None:
+            self.log.flush()
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
@@ -0,0 +1,384 @@
+"""
+Streaming file mode for the command-line Calculator in calculator.py.
+
+Reads calculations from a file or stdin, one per line, and writes each result
+as soon as it's computed, so memory stays flat however big the input is. The
+stages are generators:
+
+    read_lines -> parse_csv / parse_jsonl -> evaluate -> write_csv / write_jsonl
+
+CSV input, an operation name or symbol and then the operands:
+    add,1,2,3
+    /,10,4
+    expr,"2 * (3 + 4)"      (with --expressions; evaluated by lambda/math_engine.py)
+A first line starting with "op" or "operation" is skipped as a header.
+
+JSON lines input:
+    {"op": "add", "numbers": [1, 2, 3]}
+    {"expression": "2 * (3 + 4)"}
+
+The output has one row per input record, in input order: its line number, the
+result, and an error for records that couldn't be evaluated. A bad record
+doesn't stop the stream.
+
+With --workers N (file input only), the file is split into N byte ranges at
+line boundaries. Each range runs in its own process into a temporary part
+file, and the parts are concatenated in order. Records must not span lines.
+
+Usage:
+    python calculator_stream.py [INPUT] [-o OUTPUT] [--format csv|jsonl]
+        [--output-format csv|jsonl] [--expressions] [--workers N]
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from fractions import Fraction
+
+from calculator import Calculator
+from calculator_history import ADD, DIVIDE, MULTIPLY, SUBTRACT, CalculationHistory
+
+# A parsed input record: op is None for expressions; error is set if it couldn't be parsed
+Job = namedtuple('Job', ['line', 'op', 'numbers', 'expression', 'error'])
+Outcome = namedtuple('Outcome', ['line', 'result', 'error'])
+
+OPERATIONS = {
+    'add': ADD, '+': ADD,
+    'subtract': SUBTRACT, '-': SUBTRACT,
+    'multiply': MULTIPLY, '*': MULTIPLY, 'x': MULTIPLY,
+    'divide': DIVIDE, '/': DIVIDE,
+}
+METHODS = {ADD: 'add', SUBTRACT: 'subtract', MULTIPLY: 'multiply', DIVIDE: 'divide'}
+EXPRESSION_OPERATIONS = frozenset(['expr', 'expression', '='])
+HEADER_FIELDS = frozenset(['op', 'operation'])
+FORMATS = ('csv', 'jsonl')
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson', '.json')
+CSV_HEADER = ('line', 'result', 'error')
+
+# Read size when counting the lines of a shard
+COUNT_CHUNK_SIZE = 1 << 20
+
+
+def new_calculator():
+    """Return a Calculator whose history stays in memory and bounded."""
+    return Calculator(history=CalculationHistory())
+
+
+def load_expression_engine():
+    """Import the Lambda's local expression engine (lambda/math_engine.py)."""
+    lambda_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda')
+    if lambda_dir not in sys.path:
+        sys.path.append(lambda_dir)
+    import math_engine
+    return math_engine
+
+
+def detect_format(path):
+    """Guess the input format from the file extension; stdin defaults to CSV."""
+    return 'jsonl' if path and path.lower().endswith(JSONL_EXTENSIONS) else 'csv'
+
+
+def read_lines(path, start=0, end=None):
+    """
+    Yield the text lines of a file, or of one byte range of it.
+
+    Args:
+        path (str): The file
+        start (int): Byte offset of the first line
+        end (int): Stop at the first line starting at or after this offset; None reads to the end
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for raw in f:
+            if end is not None and position >= end:
+                break
+            position += len(raw)
+            yield raw.decode('utf-8')
+
+
+def parse_csv(lines, first_line=1):
+    """
+    Turn CSV lines into Jobs.
+
+    Args:
+        lines (iterable): Text lines
+        first_line (int): Line number of the first line, for sharded input
+
+    Yields:
+        Job: One per non-blank line
+    """
+    reader = csv.reader(lines)
+    for fields in reader:
+        line = first_line + reader.line_num - 1
+        if not fields or not any(field.strip() for field in fields):
+            continue
+        name = fields[0].strip().lower()
+        if line == 1 and name in HEADER_FIELDS:
+            continue
+        if name in EXPRESSION_OPERATIONS:
+            yield Job(line, None, None, ','.join(fields[1:]).strip(), None)
+            continue
+        yield _job(line, name, fields[1:])
+
+
+def parse_jsonl(lines, first_line=1):
+    """
+    Turn JSON lines into Jobs.
+
+    Args:
+        lines (iterable): Text lines
+        first_line (int): Line number of the first line, for sharded input
+
+    Yields:
+        Job: One per non-blank line
+    """
+    for line, text in enumerate(lines, first_line):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            yield Job(line, None, None, None, "Invalid JSON")
+            continue
+        if not isinstance(record, dict):
+            yield Job(line, None, None, None, "Each line must be a JSON object")
+        elif 'expression' in record:
+            yield Job(line, None, None, str(record['expression']), None)
+        else:
+            numbers = record.get('numbers')
+            if not isinstance(numbers, list):
+                yield Job(line, None, None, None, "numbers must be a list")
+                continue
+            yield _job(line, str(record.get('op', '')).strip().lower(), numbers)
+
+
+def _job(line, name, operands):
+    op = OPERATIONS.get(name)
+    if op is None:
+        return Job(line, None, None, None, f"Unknown operation {name!r}")
+    try:
+        numbers = [float(operand) for operand in operands]
+    except (TypeError, ValueError):
+        return Job(line, None, None, None, "Operands must be numbers")
+    if len(numbers) < 2:
+        return Job(line, None, None, None, "Please enter at least two numbers!")
+    return Job(line, op, numbers, None, None)
+
+
+def evaluate(jobs, calculator, engine=None):
+    """
+    Evaluate Jobs with the Calculator, and expressions with the local engine.
+
+    Args:
+        jobs (iterable): Jobs from parse_csv or parse_jsonl
+        calculator (Calculator): Does the arithmetic and keeps the history
+        engine (module): math_engine, or None to report expressions as errors
+
+    Yields:
+        Outcome: One per Job, in order
+    """
+    methods = {op: getattr(calculator, name) for op, name in METHODS.items()}
+    for job in jobs:
+        if job.error is not None:
+            yield Outcome(job.line, None, job.error)
+        elif job.op is not None:
+            try:
+                yield Outcome(job.line, methods[job.op](job.numbers), None)
+            except (ValueError, OverflowError) as e:
+                yield Outcome(job.line, None, str(e))
+        elif engine is None:
+            yield Outcome(job.line, None, "Expressions need --expressions")
+        else:
+            try:
+                yield Outcome(job.line, _plain_number(engine.evaluate_expression(job.expression)), None)
+            except (engine.UnsupportedExpression, engine.LocalEvaluationError) as e:
+                yield Outcome(job.line, None, str(e))
+
+
+def _plain_number(value):
+    """Exact engine results become ints where whole, otherwise floats."""
+    if isinstance(value, Fraction):
+        return value.numerator if value.denominator == 1 else float(value)
+    return value
+
+
+def write_csv(outcomes, out):
+    """Write Outcomes as CSV rows as they arrive. Returns (records, errors)."""
+    writer = csv.writer(out, lineterminator='\n')
+    records = errors = 0
+    for outcome in outcomes:
+        writer.writerow((outcome.line, '' if outcome.result is None else outcome.result, outcome.error or ''))
+        records += 1
+        errors += outcome.error is not None
+    return (records, errors)
+
+
+def write_jsonl(outcomes, out):
+    """Write Outcomes as JSON lines as they arrive. Returns (records, errors)."""
+    records = errors = 0
+    for outcome in outcomes:
+        out.write(json.dumps(outcome._asdict()) + '\n')
+        records += 1
+        errors += outcome.error is not None
+    return (records, errors)
+
+
+PARSERS = {'csv': parse_csv, 'jsonl': parse_jsonl}
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def process(lines, out, input_format='csv', output_format='csv', expressions=False, first_line=1):
+    """
+    Run the whole pipeline over some lines.
+
+    Args:
+        lines (iterable): Text lines
+        out (file): Where results are written
+        input_format (str): 'csv' or 'jsonl'
+        output_format (str): 'csv' or 'jsonl'
+        expressions (bool): Evaluate expr records with the local engine
+        first_line (int): Line number of the first line
+
+    Returns:
+        tuple: (records, errors)
+    """
+    engine = load_expression_engine() if expressions else None
+    jobs = PARSERS[input_format](lines, first_line)
+    return WRITERS[output_format](evaluate(jobs, new_calculator(), engine), out)
+
+
+def shard_ranges(path, shards):
+    """
+    Split a file into up to shards byte ranges that start and end on line boundaries.
+
+    Returns:
+        list: (start, end) byte offsets, in file order
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, shards):
+            target = max(size * i // shards, bounds[-1])
+            if target <= 0 or target >= size:
+                continue
+            # Reading from one byte back lands on the first line starting at or after target
+            f.seek(target - 1)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def count_lines(task):
+    path, start, end = task
+    count = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(COUNT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            count += chunk.count(b'\n')
+            remaining -= len(chunk)
+    return count
+
+
+def _run_shard(task):
+    path, start, end, first_line, input_format, output_format, expressions, part_path = task
+    with open(part_path, 'w', newline='', encoding='utf-8') as out:
+        return process(read_lines(path, start, end), out, input_format, output_format, expressions, first_line)
+
+
+def process_sharded(path, out, workers, input_format='csv', output_format='csv', expressions=False,
+                    temp_dir=None):
+    """
+    Run the pipeline over a file in parallel processes, writing results in input order.
+
+    Args:
+        path (str): The input file
+        out (file): Where results are written
+        workers (int): Processes, and the most shards the file is split into
+        temp_dir (str): Where the part files go (default: the system temp directory)
+
+    Returns:
+        tuple: (records, errors)
+    """
+    ranges = shard_ranges(path, workers)
+    if expressions:
+        # Import the expression engine once here so forked workers inherit it
+        load_expression_engine()
+    with tempfile.TemporaryDirectory(prefix='calculator_stream', dir=temp_dir) as directory, \
+            multiprocessing.Pool(min(workers, len(ranges)) or 1) as pool:
+        # Line numbers of each shard's first line, so errors point at the right line
+        counts = pool.map(count_lines, [(path, start, end) for start, end in ranges])
+        first_lines = [1 + sum(counts[:i]) for i in range(len(ranges))]
+        parts = [os.path.join(directory, f"part-{i}") for i in range(len(ranges))]
+        tasks = [(path, start, end, first_line, input_format, output_format, expressions, part)
+                 for (start, end), first_line, part in zip(ranges, first_lines, parts)]
+
+        records = errors = 0
+        # imap hands results back in order, so each part can be copied as soon as it's done
+        for part, (part_records, part_errors) in zip(parts, pool.imap(_run_shard, tasks)):
+            with open(part, encoding='utf-8') as f:
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+            records += part_records
+            errors += part_errors
+    return (records, errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate calculations from a CSV or JSON lines file.")
+    parser.add_argument('input', nargs='?', default='-', help="input file, or - for stdin (default)")
+    parser.add_argument('-o', '--output', default='-', help="output file, or - for stdout (default)")
+    parser.add_argument('--format', choices=FORMATS, help="input format (default: from the extension, else csv)")
+    parser.add_argument('--output-format', choices=FORMATS, help="output format (default: the input format)")
+    parser.add_argument('--expressions', action='store_true',
+                        help="evaluate expr records with the local expression engine")
+    parser.add_argument('--workers', type=int, default=1, help="processes to shard a file input across")
+    args = parser.parse_args(argv)
+
+    from_stdin = args.input == '-'
+    if args.workers > 1 and from_stdin:
+        parser.error("--workers needs a file input")
+    input_format = args.format or detect_format(None if from_stdin else args.input)
+    output_format = args.output_format or input_format
+
+    started = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if args.output == '-':
+            out = sys.stdout
+        else:
+            out = stack.enter_context(open(args.output, 'w', newline='', encoding='utf-8'))
+        if output_format == 'csv':
+            csv.writer(out, lineterminator='\n').writerow(CSV_HEADER)
+
+        if args.workers > 1:
+            # Parts go next to the output file, which has room for them
+            temp_dir = None if args.output == '-' else os.path.dirname(os.path.abspath(args.output))
+            records, errors = process_sharded(args.input, out, args.workers, input_format, output_format,
+                                              args.expressions, temp_dir)
+        else:
+            lines = (io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if from_stdin
+                     else read_lines(args.input))
+            records, errors = process(lines, out, input_format, output_format, args.expressions)
+        out.flush()
+
+    print(f"Evaluated {records} records ({errors} errors) in {time.perf_counter() - started:.2f}s",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -33,12 +33,24 @@ export class CalculatorStack extends cdk.Stack {
             memorySize: 256,
             environment: {
                 PARAMETER_NAME: anthropicApiParam.parameterName,
+                API_KEY_SOURCE: 'extension',
             },
+            // Serves the API key from a local cache, so cold starts don't create
+            // a boto3 SSM client (client_cache.py falls back to SSM if it's not up)
+            paramsAndSecrets: lambda.ParamsAndSecretsLayerVersion.fromVersion(
+                lambda.ParamsAndSecretsVersions.V1_0_103,
+                {
+                    cacheEnabled: true,
+                    parameterStoreTtl: cdk.Duration.minutes(5),
+                    logLevel: lambda.ParamsAndSecretsLogLevel.WARN,
+                }
+            ),
             bundling: {
                 assetExcludes: [
                     'venv',
                     '__pycache__',
-                    '.pytest_cache'
+                    '.pytest_cache',
+                    'test_*.py'
                 ]
             }
         });
@@ -53,6 +65,9 @@ export class CalculatorStack extends cdk.Stack {
         // Create API Gateway with proper CORS settings
         const api = new apigateway.RestApi(this, 'CalculatorApi', {
             restApiName: 'Calculator Service',
+            // Lets the Lambda return gzip/br-compressed (base64) bodies; request
+            // bodies then arrive base64-encoded, which the handler decodes
+            binaryMediaTypes: ['*/*'],
         });
 
         // Create an API Gateway resource and method
@@ -69,6 +84,9 @@ export class CalculatorStack extends cdk.Stack {
                 },
             }],
             passthroughBehavior: apigateway.PassthroughBehavior.WHEN_NO_MATCH,
+            // binaryMediaTypes matches every request, so convert the preflight
+            // back to text or the mapping template below is never applied
+            contentHandling: apigateway.ContentHandling.CONVERT_TO_TEXT,
             requestTemplates: { "application/json": "{\"statusCode\": 200}" }
         }), {
             methodResponses: [{
@@ -0,0 +1,177 @@
+"""
+Background AI explanations for the command-line AICalculator in test.py.
+
+ExplanationWorker runs explanation calls on a small thread pool, so the menu
+comes back as soon as a result is printed. Explanations are handed back in the
+order the calculations were made: ready() returns the finished ones at the
+head of the queue, and a slow call holds back later ones until it finishes.
+
+- Concurrency: at most max_workers calls are in flight; the rest wait in the
+  pool's queue
+- Backlog: submit() waits for the oldest pending explanation once
+  max_pending are undelivered, so a long session can't pile up unbounded work
+- Memo: identical (operation, numbers, result) calculations share one call,
+  whether it's still running or finished; failed calls are forgotten so they
+  can be retried
+
+Environment:
+    AI_EXPLANATION_WORKERS: concurrent explanation calls (default 2)
+    AI_EXPLANATION_BACKLOG: undelivered explanations before submit() waits (default 8)
+"""
+
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+DEFAULT_MEMO_SIZE = 256
+
+
+def _positive_int(name, default):
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def get_max_workers():
+    """Read AI_EXPLANATION_WORKERS, falling back to the default for missing or invalid values."""
+    return _positive_int('AI_EXPLANATION_WORKERS', DEFAULT_MAX_WORKERS)
+
+
+def get_max_pending():
+    """Read AI_EXPLANATION_BACKLOG, falling back to the default for missing or invalid values."""
+    return _positive_int('AI_EXPLANATION_BACKLOG', DEFAULT_MAX_PENDING)
+
+
+def calculation_key(operation, numbers, result):
+    """Return the memo key for a calculation."""
+    return (operation, tuple(numbers), result)
+
+
+class Explanation:
+    """
+    A delivered explanation.
+
+    Attributes:
+        operation (str): The operation symbol, e.g. '+'
+        numbers (tuple): The operands
+        result (float): The calculation's result
+        text (str): The explanation, or None if the call failed
+        error (Exception): Why the call failed, or None
+        cached (bool): True if a memoized call answered it
+    """
+
+    __slots__ = ('operation', 'numbers', 'result', 'text', 'error', 'cached')
+
+    def __init__(self, key, text, error, cached):
+        self.operation, self.numbers, self.result = key
+        self.text = text
+        self.error = error
+        self.cached = cached
+
+    def calculation(self):
+        return f"{f' {self.operation} '.join(map(str, self.numbers))} = {self.result}"
+
+
+class ExplanationWorker:
+    """Runs explanation calls in the background and delivers them in order."""
+
+    def __init__(self, explain, max_workers=None, max_pending=None, memo_size=DEFAULT_MEMO_SIZE):
+        """
+        Args:
+            explain (callable): explain(operation, numbers, result) -> str, the
+                blocking call to run in the background
+            max_workers (int): Concurrent calls (default AI_EXPLANATION_WORKERS)
+            max_pending (int): Undelivered explanations before submit() waits
+                (default AI_EXPLANATION_BACKLOG)
+            memo_size (int): Calculations remembered for deduplication
+        """
+        self.explain = explain
+        self.max_pending = max_pending or get_max_pending()
+        self.memo_size = memo_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or get_max_workers(),
+                                            thread_name_prefix='explanation')
+        self._memo = OrderedDict()
+        self._pending = deque()
+        self.calls = 0
+        self.memo_hits = 0
+
+    def submit(self, operation, numbers, result):
+        """
+        Queue an explanation for a calculation and return without waiting for it.
+
+        If the backlog is full, this first waits for the oldest explanation, which
+        the next ready() call then delivers.
+
+        Args:
+            operation (str): The operation symbol
+            numbers (list): The operands
+            result (float): The result
+
+        Returns:
+            bool: True if a memoized call will answer it
+        """
+        key = calculation_key(operation, numbers, result)
+        future = self._memo.get(key)
+        cached = future is not None
+        if cached:
+            self._memo.move_to_end(key)
+            self.memo_hits += 1
+        else:
+            if len(self._pending) >= self.max_pending:
+                wait([self._pending[0][1]])
+            future = self._executor.submit(self.explain, operation, list(numbers), result)
+            self.calls += 1
+            self._memo[key] = future
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        self._pending.append((key, future, cached))
+        return cached
+
+    def pending(self):
+        """Return the number of explanations not yet delivered."""
+        return len(self._pending)
+
+    def ready(self):
+        """
+        Return the explanations that can be delivered now, oldest first.
+
+        Stops at the first one still running, so delivery keeps submission order.
+
+        Returns:
+            list: Explanation objects
+        """
+        delivered = []
+        while self._pending and self._pending[0][1].done():
+            key, future, cached = self._pending.popleft()
+            delivered.append(self._explanation(key, future, cached))
+        return delivered
+
+    def drain(self, timeout=None):
+        """
+        Wait for every pending explanation and return them in order.
+
+        Args:
+            timeout (float): Seconds to wait in total; None waits indefinitely
+
+        Returns:
+            list: The Explanation objects that finished in time
+        """
+        wait([future for _, future, _ in self._pending], timeout=timeout)
+        return self.ready()
+
+    def close(self):
+        """Stop the pool without waiting for calls still running."""
+        self._executor.shutdown(wait=False)
+
+    def _explanation(self, key, future, cached):
+        error = future.exception()
+        if error is not None:
+            # Forget the failure so the same calculation can be retried
+            if self._memo.get(key) is future:
+                del self._memo[key]
+            return Explanation(key, None, error, cached)
+        return Explanation(key, future.result(), None, cached)
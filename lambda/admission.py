@@ -0,0 +1,171 @@
+"""
+Tiered admission: cheap local checks that run before any network call.
+
+An expression passes through up to three tiers:
+    1. limit: a hard cap on length and a charset check (control and other
+       non-printing characters). Failures get a 400 before the API key is
+       even fetched.
+    2. classifier: a score from the math_engine signal scan, the share of
+       tokens that look like math (numbers, operators, brackets, relations
+       and math words). Clear non-math, scoring below ADMISSION_REJECT_BELOW,
+       is rejected without calling Claude. If ADMISSION_ACCEPT_ABOVE is set,
+       structurally complete math scoring at or above it is decided by
+       basic_validation instead of Claude.
+    3. escalated: everything in between is the uncertain band and goes to
+       Claude validation as before.
+
+Plain arithmetic the local engine evaluates never reaches the classifier and
+is counted as the local_engine tier.
+
+How many expressions each tier absorbed is kept for the life of the container
+(get_admission_stats) and added to the traced request as admission_<tier>
+counters.
+
+Environment:
+    ADMISSION_MAX_LENGTH: longest accepted expression in characters (default 1000)
+    ADMISSION_REJECT_BELOW: classifier score under which input is rejected
+        locally (default 0.05; 0 turns local rejection off)
+    ADMISSION_ACCEPT_ABOVE: classifier score at which math is accepted
+        locally (default unset, so every uncertain expression goes to Claude)
+"""
+
+import os
+import threading
+import unicodedata
+
+import metrics
+from math_engine import CONSTANTS, FUNCTIONS, scan_signals
+
+DEFAULT_MAX_LENGTH = 1000
+DEFAULT_REJECT_BELOW = 0.05
+
+TIER_LIMIT = 'limit'
+TIER_LOCAL_ENGINE = 'local_engine'
+TIER_REJECTED = 'classifier_rejected'
+TIER_ACCEPTED = 'classifier_accepted'
+TIER_ESCALATED = 'escalated'
+TIERS = (TIER_LIMIT, TIER_LOCAL_ENGINE, TIER_REJECTED, TIER_ACCEPTED, TIER_ESCALATED)
+
+# Whitespace control characters students legitimately paste
+ALLOWED_CONTROL_CHARACTERS = frozenset('\t\n\r')
+
+# Words that count as math for the classifier, besides function and constant names
+MATH_WORDS = frozenset([
+    'x', 'y', 'z', 'n',
+    'solve', 'equation', 'equals', 'equal', 'calculate', 'compute', 'evaluate', 'simplify',
+    'plus', 'minus', 'times', 'divided', 'over', 'multiply', 'multiplied', 'divide',
+    'add', 'subtract', 'sum', 'difference', 'product', 'quotient', 'remainder',
+    'square', 'squared', 'cube', 'cubed', 'root', 'power', 'exponent',
+    'percent', 'percentage', 'fraction', 'decimal', 'ratio', 'half', 'twice', 'double',
+    'derivative', 'integral', 'integrate', 'differentiate', 'limit', 'factor', 'factorial',
+    'area', 'perimeter', 'volume', 'angle', 'triangle', 'circle', 'radius', 'diameter',
+    'average', 'mean', 'median', 'probability',
+    'zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten',
+    'hundred', 'thousand', 'million',
+]) | frozenset(FUNCTIONS) | frozenset(CONSTANTS)
+
+_stats_lock = threading.Lock()
+_stats = dict.fromkeys(TIERS, 0)
+
+
+def get_max_length():
+    return int(os.environ.get('ADMISSION_MAX_LENGTH', DEFAULT_MAX_LENGTH))
+
+
+def get_reject_below():
+    return float(os.environ.get('ADMISSION_REJECT_BELOW', DEFAULT_REJECT_BELOW))
+
+
+def get_accept_above():
+    """Return the local acceptance threshold, or None if local acceptance is off."""
+    value = os.environ.get('ADMISSION_ACCEPT_ABOVE', '').strip()
+    return float(value) if value else None
+
+
+def record(tier):
+    """Count an expression absorbed by a tier, for the container and the current request."""
+    with _stats_lock:
+        _stats[tier] += 1
+    metrics.increment(f"admission_{tier}")
+
+
+def get_admission_stats():
+    """Return how many expressions each tier has absorbed on this container."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_admission_stats():
+    """Zero the tier counters (mainly for tests and benchmarks)."""
+    with _stats_lock:
+        for tier in TIERS:
+            _stats[tier] = 0
+
+
+def check_limits(expression):
+    """
+    Apply the hard length and charset limits, counting rejections.
+
+    Args:
+        expression (str): The expression as submitted
+
+    Returns:
+        str: The 400 error message, or None if the expression is within limits
+    """
+    max_length = get_max_length()
+    if len(expression) > max_length:
+        record(TIER_LIMIT)
+        return f'The expression is too long. Please keep it under {max_length} characters.'
+
+    for character in expression:
+        if unicodedata.category(character)[0] == 'C' and character not in ALLOWED_CONTROL_CHARACTERS:
+            record(TIER_LIMIT)
+            return 'The expression contains unsupported characters.'
+
+    return None
+
+
+def math_score(expression):
+    """
+    Score how much an expression looks like math.
+
+    Args:
+        expression (str): The expression as submitted
+
+    Returns:
+        float: The share of tokens that are numbers, operators, brackets,
+            relations or math words, from 0.0 to 1.0
+    """
+    signals = scan_signals(expression)
+    if not signals.tokens:
+        return 0.0
+    math_words = sum(1 for word in signals.words if word in MATH_WORDS)
+    math_tokens = signals.numbers + signals.operators + signals.brackets + signals.relations + math_words
+    return math_tokens / signals.tokens
+
+
+def classify(expression):
+    """
+    Decide which tier handles an expression the local engine couldn't evaluate.
+
+    This only classifies; callers record() the tier they act on.
+
+    Args:
+        expression (str): An expression within the hard limits
+
+    Returns:
+        str: TIER_REJECTED, TIER_ACCEPTED or TIER_ESCALATED
+    """
+    score = math_score(expression)
+    if score < get_reject_below():
+        return TIER_REJECTED
+
+    accept_above = get_accept_above()
+    if accept_above is not None and score >= accept_above:
+        # Only structurally complete math, the same test basic_validation applies
+        signals = scan_signals(expression)
+        has_operators = signals.operators or signals.brackets or signals.relations or signals.functions
+        if has_operators and signals.numbers:
+            return TIER_ACCEPTED
+
+    return TIER_ESCALATED
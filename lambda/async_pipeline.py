@@ -0,0 +1,262 @@
+"""
+Asyncio request pipeline, an alternative entry point to lambda_handler.
+
+Point the Lambda handler at async_pipeline.async_lambda_handler to use it.
+Instead of validating and then explaining, it starts the explanation call
+speculatively while Claude validation is still in flight, and cancels it if
+the expression is rejected. End-to-end latency for valid problems is then
+roughly max(validation, explanation) rather than their sum.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+
+import admission
+import metrics
+import resilience
+from client_cache import get_async_anthropic_client, invalidate_async_anthropic_client
+from lambda_function import (
+    basic_validation, build_explanation_body, build_response, build_tutoring_request,
+    build_validation_request, degraded_response, extract_explanation, label_request, lambda_handler, local_validation,
+    lookup_validation_memo, parse_detail, parse_validation_response, plan_tutoring_call, remember_validation,
+    screen_expression, tutoring_cache_key, verdict_error
+)
+from resilience import (
+    UpstreamUnavailable, call_anthropic_async, get_breaker, is_authentication_error, validation_timeout
+)
+from response_cache import get_response_cache
+from responses import INVALID_BODY_ERRORS, compress_response, event_body
+from routing import use_detail
+
+# One event loop per container, so the AsyncAnthropic connection pool (which is
+# bound to the loop it was created on) survives between warm invocations
+_event_loop = None
+
+
+def get_event_loop():
+    """Return the container-wide event loop, creating it on first use."""
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop
+
+
+def speculation_enabled():
+    """Speculative explanations trade some wasted tokens on invalid input for latency."""
+    return os.environ.get('SPECULATIVE_EXPLANATION', 'true').lower() != 'false'
+
+
+async def validate_with_claude_async(client, expression):
+    """
+    Async counterpart of validate_with_claude, sharing its prompt, memo and fallback.
+
+    Args:
+        client: The AsyncAnthropic client
+        expression (str): The input expression to validate
+
+    Returns:
+        tuple: (is_valid, is_math_problem, error_message)
+    """
+    verdict = lookup_validation_memo(expression)
+    if verdict is not None:
+        return verdict
+
+    try:
+        with metrics.span('validation'):
+            validation_message = await call_anthropic_async(
+                client.messages.create, build_validation_request(expression), validation_timeout()
+            )
+        metrics.record_usage(validation_message)
+        verdict = parse_validation_response(validation_message)
+        remember_validation(expression, verdict)
+        return verdict
+    except Exception as e:
+        # Fallback to basic validation if Claude validation fails
+        print(f"Claude validation failed: {str(e)}")
+        metrics.increment('basic_validation_fallbacks')
+        return basic_validation(expression)
+
+
+async def generate_explanation_async(client, expression, result=None, plan=None):
+    """
+    Async counterpart of generate_explanation.
+
+    Args:
+        client: The AsyncAnthropic client
+        expression (str): The math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        plan (TutoringPlan): The expression's tutoring plan, if already made
+
+    Returns:
+        str: The HTML-formatted explanation
+    """
+    print("Sending request to Anthropic API...")
+    with metrics.span('generation'):
+        message = await call_anthropic_async(client.messages.create, build_tutoring_request(expression, result, plan))
+    metrics.record_usage(message)
+    with metrics.span('extraction'):
+        return extract_explanation(message)
+
+
+async def cancel_task(task):
+    """Cancel a task and wait for it to unwind."""
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError, Exception):
+        await task
+
+
+async def solve_expression_async(client, expression):
+    """
+    Validate and explain an expression, overlapping the two Claude calls.
+
+    Args:
+        client: The AsyncAnthropic client
+        expression (str): The math expression submitted by the student
+
+    Returns:
+        tuple: (status_code, body) for the response
+    """
+    response_cache = get_response_cache()
+    plan = plan_tutoring_call(expression)
+    cache_key = tutoring_cache_key(expression, plan)
+
+    local_result = local_validation(expression)
+    if local_result is not None:
+        print("Expression evaluated locally, skipping Claude validation")
+        admission.record(admission.TIER_LOCAL_ENGINE)
+        is_valid, is_math_problem, error_message, result = local_result
+        explanation_task = None
+    else:
+        result = None
+        explanation_task = None
+        cached, cache_tier = response_cache.get(cache_key)
+        # Only valid expressions are ever cached, so a hit needs no validation
+        if cached is not None:
+            print(f"Explanation served from the {cache_tier} response cache")
+            return (200, build_explanation_body(cached['explanation'], None, response_cache, True, cache_tier))
+
+        # Input the classifier decides locally never starts a speculative call
+        verdict = screen_expression(expression)
+        if verdict is not None:
+            is_valid, is_math_problem, error_message = verdict
+        else:
+            # With the breaker open the explanation would fail anyway
+            if speculation_enabled() and not get_breaker().is_open():
+                explanation_task = asyncio.ensure_future(generate_explanation_async(client, expression, None, plan))
+            print("Validating expression with Claude...")
+            try:
+                is_valid, is_math_problem, error_message = await validate_with_claude_async(client, expression)
+            except BaseException:
+                if explanation_task is not None:
+                    await cancel_task(explanation_task)
+                raise
+
+    error = verdict_error(is_valid, is_math_problem, error_message)
+    if error:
+        if explanation_task is not None:
+            print("Validation rejected the expression, cancelling speculative explanation")
+            metrics.increment('speculations_cancelled')
+            await cancel_task(explanation_task)
+        return (400, {'error': error})
+
+    cached, cache_tier = (None, None)
+    if explanation_task is None:
+        cached, cache_tier = response_cache.get(cache_key)
+    if cached is not None:
+        print(f"Explanation served from the {cache_tier} response cache")
+        explanation = cached['explanation']
+    else:
+        if explanation_task is None:
+            explanation_task = asyncio.ensure_future(generate_explanation_async(client, expression, result, plan))
+        try:
+            explanation = await explanation_task
+        except UpstreamUnavailable as e:
+            return degraded_response(expression, result, response_cache, e)
+        response_cache.set(cache_key, {'explanation': explanation})
+
+    return (200, build_explanation_body(explanation, result, response_cache, cached is not None, cache_tier))
+
+
+async def handle_event_async(event, context):
+    """
+    Handle a single-expression API Gateway event on the async pipeline.
+
+    Returns:
+        dict: The API Gateway response, or None if the event should go to lambda_handler
+    """
+    if event.get('httpMethod') == 'OPTIONS':
+        return build_response(200, {})
+
+    try:
+        try:
+            body = json.loads(event_body(event))
+        except INVALID_BODY_ERRORS:
+            return build_response(400, {'error': 'Invalid JSON in request body'})
+        if not isinstance(body, dict):
+            return build_response(400, {'error': 'Request body must be a JSON object'})
+
+        return await handle_body_async(body)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return build_response(500, {'error': f'Internal server error: {str(e)}'})
+
+
+async def handle_body_async(body):
+    """
+    Answer a parsed request body on the async pipeline.
+
+    Returns:
+        dict: The API Gateway response, or None if the body should go to lambda_handler
+    """
+    # Batches and streams keep their synchronous implementations
+    if body.get('expressions') is not None or body.get('stream'):
+        return None
+    label_request(body)
+
+    detail, detail_error = parse_detail(body)
+    if detail_error:
+        return build_response(400, {'error': detail_error})
+    # The event loop runs this coroutine as a task with its own copy of the
+    # context, so the level never outlives the request
+    use_detail(detail)
+
+    expression = body.get('expression')
+    if not expression:
+        return build_response(400, {
+            'error': 'Missing required parameter. Please provide a math expression.'
+        })
+
+    limit_error = admission.check_limits(expression)
+    if limit_error:
+        return build_response(400, {'error': limit_error})
+
+    client = await get_async_anthropic_client()
+    try:
+        return build_response(*await solve_expression_async(client, expression))
+    except Exception as e:
+        if not is_authentication_error(e):
+            raise
+        print("Anthropic rejected the cached API key, refreshing from SSM")
+        invalidate_async_anthropic_client()
+        client = await get_async_anthropic_client()
+        return build_response(*await solve_expression_async(client, expression))
+
+
+def async_lambda_handler(event, context):
+    """Lambda entry point that runs the async pipeline on the container's event loop."""
+    request_metrics = metrics.start_request()
+    deadline = resilience.start_deadline(context)
+    try:
+        response = get_event_loop().run_until_complete(handle_event_async(event, context))
+    finally:
+        resilience.finish_deadline(deadline)
+    if response is None:
+        # lambda_handler traces the request itself
+        metrics.finish_request(request_metrics, emit=False)
+        return lambda_handler(event, context)
+    response = compress_response(response, event.get('headers'))
+    resilience.record_breaker_state()
+    metrics.finish_request(request_metrics, response.get('statusCode'))
+    return response
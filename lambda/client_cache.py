@@ -0,0 +1,334 @@
+"""
+Container-wide Anthropic client and API key caching.
+
+anthropic and boto3 are the slowest imports in the bundle, so they are imported
+on first use rather than at module load: requests answered without calling
+Anthropic (response cache hits, rejected input, CORS preflights) never pay for
+them. Set EAGER_IMPORTS=true to import them during init instead, which suits
+provisioned concurrency where init happens ahead of traffic.
+
+Environment:
+    API_KEY_SOURCE: where the API key comes from (default auto)
+        env: ANTHROPIC_API_KEY, with no SSM client at all
+        extension: the AWS Parameters and Secrets Lambda Extension's local
+            HTTP cache, falling back to SSM if the extension doesn't answer
+        ssm: boto3 get_parameter on PARAMETER_NAME
+        auto: extension when PARAMETER_NAME is set and the extension is
+            configured, ssm when only PARAMETER_NAME is set, env otherwise
+    API_KEY_CACHE_TTL_SECONDS: how long a fetched key is reused (default 300)
+"""
+
+import json
+import os
+import threading
+import time
+
+import metrics
+import rate_limit
+
+# How long a warm container may keep using the API key it fetched from SSM
+DEFAULT_API_KEY_TTL_SECONDS = 300
+
+API_KEY_SOURCES = ('auto', 'env', 'extension', 'ssm')
+
+# The extension listens here unless PARAMETERS_SECRETS_EXTENSION_HTTP_PORT says otherwise
+DEFAULT_EXTENSION_PORT = 2773
+EXTENSION_TIMEOUT_SECONDS = 2
+
+
+def get_api_key_ttl_seconds():
+    """Read the API key cache TTL from the environment, falling back to the default."""
+    try:
+        return float(os.environ.get('API_KEY_CACHE_TTL_SECONDS', DEFAULT_API_KEY_TTL_SECONDS))
+    except ValueError:
+        return DEFAULT_API_KEY_TTL_SECONDS
+
+
+def get_api_key_source():
+    """
+    Decide where the API key is read from.
+
+    Returns:
+        str: 'env', 'extension' or 'ssm'
+    """
+    source = os.environ.get('API_KEY_SOURCE', 'auto').strip().lower()
+    if source not in API_KEY_SOURCES:
+        print(f"Unknown API_KEY_SOURCE '{source}', using auto")
+        source = 'auto'
+    if source != 'auto':
+        return source
+    if not os.environ.get('PARAMETER_NAME'):
+        return 'env'
+    if os.environ.get('PARAMETERS_SECRETS_EXTENSION_HTTP_PORT'):
+        return 'extension'
+    return 'ssm'
+
+
+def eager_imports_enabled():
+    """Return True when EAGER_IMPORTS asks for anthropic and boto3 at init."""
+    return os.environ.get('EAGER_IMPORTS', 'false').lower() == 'true'
+
+
+def preload_dependencies():
+    """Import the modules that are otherwise deferred until the first Anthropic call."""
+    import anthropic  # noqa: F401
+    if get_api_key_source() != 'env':
+        import boto3  # noqa: F401
+
+
+def build_anthropic_client(api_key):
+    """Build a synchronous Anthropic client, importing the SDK on first use."""
+    import anthropic
+    # resilience.call_anthropic retries within the request deadline instead, and
+    # every response's rate-limit headers go to the rate limiter
+    return anthropic.Anthropic(
+        api_key=api_key, max_retries=0,
+        http_client=anthropic.DefaultHttpxClient(event_hooks={'response': [rate_limit.observe_response]})
+    )
+
+
+def build_async_anthropic_client(api_key):
+    """Build an AsyncAnthropic client, importing the SDK on first use."""
+    import anthropic
+    return anthropic.AsyncAnthropic(
+        api_key=api_key, max_retries=0,
+        http_client=anthropic.DefaultAsyncHttpxClient(event_hooks={'response': [rate_limit.observe_response_async]})
+    )
+
+
+def close_anthropic_client(client):
+    """Close a replaced client's connection pool."""
+    client.close()
+
+
+class ClientCache:
+    """
+    Container-wide cache for the Anthropic API key and client.
+
+    Lambda keeps module state alive between invocations on a warm container, so
+    the SSM client, the decrypted API key and the Anthropic client (with its
+    pooled HTTP connections) are built once and shared by every invocation. The
+    key is re-read when the TTL expires or the API rejects it, and the client is
+    only rebuilt if the key has changed.
+
+    Attributes:
+        ssm_fetches (int): Number of SSM get_parameter calls made so far
+        extension_fetches (int): Number of keys read from the Lambda extension
+        client_builds (int): Number of Anthropic clients constructed so far
+    """
+
+    def __init__(self, ttl_seconds=None, clock=time.monotonic, client_factory=None, client_closer=None):
+        """
+        Args:
+            ttl_seconds (float): Seconds before the key is re-read from SSM.
+                Defaults to API_KEY_CACHE_TTL_SECONDS. A value <= 0 disables caching.
+            clock (callable): Monotonic time source, injectable for tests
+            client_factory (callable): Builds a client from an API key.
+                Defaults to build_anthropic_client.
+            client_closer (callable): Releases a client replaced after the key
+                changed. Defaults to close_anthropic_client.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.client_factory = client_factory or build_anthropic_client
+        self.client_closer = client_closer or close_anthropic_client
+        self.ssm_fetches = 0
+        self.extension_fetches = 0
+        self.client_builds = 0
+        self._lock = threading.Lock()
+        self._ssm_client = None
+        self._client = None
+        self._api_key = None
+        self._fetched_at = None
+        self._key_rejected = False
+
+    def _ttl(self):
+        return self.ttl_seconds if self.ttl_seconds is not None else get_api_key_ttl_seconds()
+
+    def _is_fresh(self):
+        if self._client is None or self._fetched_at is None:
+            return False
+        ttl = self._ttl()
+        return ttl > 0 and (self.clock() - self._fetched_at) < ttl
+
+    def _fetch_api_key(self):
+        """Read the API key from the configured source."""
+        source = get_api_key_source()
+        if source == 'env':
+            return os.environ['ANTHROPIC_API_KEY']
+        if source == 'extension' and self._key_rejected:
+            # The extension caches the parameter too, so it would hand back the rejected key
+            print("Cached API key was rejected, reading it from SSM instead of the extension")
+        elif source == 'extension':
+            try:
+                return self._fetch_from_extension()
+            except (OSError, ValueError, KeyError) as e:
+                # The extension may not be ready yet; SSM is slower but always there
+                print(f"Parameters and Secrets extension unavailable ({e}), falling back to SSM")
+        return self._fetch_from_ssm()
+
+    def _fetch_from_extension(self):
+        """Read the decrypted API key from the Parameters and Secrets extension's local cache."""
+        import urllib.parse
+        import urllib.request
+        port = os.environ.get('PARAMETERS_SECRETS_EXTENSION_HTTP_PORT') or DEFAULT_EXTENSION_PORT
+        query = urllib.parse.urlencode({'name': os.environ['PARAMETER_NAME'], 'withDecryption': 'true'})
+        request = urllib.request.Request(
+            f"http://localhost:{port}/systemsmanager/parameters/get?{query}",
+            headers={'X-Aws-Parameters-Secrets-Token': os.environ.get('AWS_SESSION_TOKEN', '')}
+        )
+        with urllib.request.urlopen(request, timeout=EXTENSION_TIMEOUT_SECONDS) as response:
+            api_key = json.loads(response.read())['Parameter']['Value']
+        self.extension_fetches += 1
+        return api_key
+
+    def _fetch_from_ssm(self):
+        """Fetch and decrypt the API key from SSM Parameter Store."""
+        parameter_name = os.environ['PARAMETER_NAME']
+
+        if self._ssm_client is None:
+            import boto3
+            session = boto3.session.Session()
+            self._ssm_client = session.client('ssm')
+
+        print(f"Attempting to get parameter: {parameter_name}")
+        response = self._ssm_client.get_parameter(
+            Name=parameter_name,
+            WithDecryption=True
+        )
+        self.ssm_fetches += 1
+
+        api_key = response['Parameter']['Value']
+
+        # Log key details safely for debugging
+        key_length = len(api_key) if api_key else 0
+        key_prefix = api_key[:4] if key_length >= 4 else api_key
+        key_suffix = api_key[-4:] if key_length >= 8 else ""
+        print(f"API Key retrieved - Length: {key_length}, Prefix: {key_prefix}, Suffix: {key_suffix}")
+        print(f"API Key format check - Starts with 'sk-ant-': {api_key.startswith('sk-ant-') if api_key else False}")
+
+        return api_key
+
+    def get_client(self):
+        """
+        Return the cached Anthropic client, building it if missing or stale.
+
+        Returns:
+            Anthropic: A client that can be shared across invocations
+        """
+        replaced = None
+        with self._lock:
+            if not self._is_fresh():
+                # The stage keeps its 'ssm' name whichever source supplies the key
+                with metrics.span('ssm'):
+                    api_key = self._fetch_api_key()
+                self._key_rejected = False
+                if self._client is None or api_key != self._api_key:
+                    # An unchanged key keeps the client and its warm connections
+                    with metrics.span('client_init'):
+                        client = self.client_factory(api_key)
+                    replaced, self._client, self._api_key = self._client, client, api_key
+                    self.client_builds += 1
+                    print("Successfully initialized Anthropic client")
+                self._fetched_at = self.clock()
+            client = self._client
+        if replaced is not None:
+            self.client_closer(replaced)
+        return client
+
+    def cached_client(self):
+        """Return the cached client if it is still fresh, without fetching anything."""
+        with self._lock:
+            return self._client if self._is_fresh() else None
+
+    def invalidate(self):
+        """Mark the cached key stale so the next call re-reads SSM, bypassing the extension."""
+        with self._lock:
+            self._fetched_at = None
+            self._key_rejected = True
+
+    def reset(self):
+        """Forget everything, including the SSM client and counters (used by tests)."""
+        with self._lock:
+            self._ssm_client = None
+            self._client = None
+            self._api_key = None
+            self._fetched_at = None
+            self._key_rejected = False
+            self.ssm_fetches = 0
+            self.extension_fetches = 0
+            self.client_builds = 0
+
+
+class LazyClient:
+    """
+    Stand-in for the Anthropic client that resolves it on first attribute access.
+
+    Handlers take one of these instead of the client itself, so a request that
+    never reaches the API never imports the SDK or fetches the key.
+    """
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+# AsyncAnthropic.close is a coroutine, so replaced async clients wait here for
+# get_async_anthropic_client to close them on the event loop
+_replaced_async_clients = []
+
+# Module-level caches shared by every invocation on this container
+_client_cache = ClientCache()
+_async_client_cache = ClientCache(
+    client_factory=build_async_anthropic_client, client_closer=_replaced_async_clients.append
+)
+
+
+def get_anthropic_client():
+    """Return the container-wide Anthropic client."""
+    return _client_cache.get_client()
+
+
+def lazy_anthropic_client():
+    """Return a LazyClient backed by the container-wide cache."""
+    return LazyClient(get_anthropic_client)
+
+
+def invalidate_anthropic_client():
+    """Force the next get_anthropic_client() call to refresh the API key."""
+    _client_cache.invalidate()
+
+
+async def get_async_anthropic_client():
+    """
+    Return the container-wide AsyncAnthropic client.
+
+    The SSM fetch is a blocking boto3 call, so on a cold or stale cache it runs in
+    a worker thread to keep the event loop free.
+    """
+    client = _async_client_cache.cached_client()
+    if client is not None:
+        return client
+    import asyncio
+    client = await asyncio.to_thread(_async_client_cache.get_client)
+    while _replaced_async_clients:
+        await _replaced_async_clients.pop().close()
+    return client
+
+
+def invalidate_async_anthropic_client():
+    """Force the next get_async_anthropic_client() call to refresh the API key."""
+    _async_client_cache.invalidate()
+
+
+def reset_client_cache():
+    """Reset the container-wide caches to a cold state."""
+    _client_cache.reset()
+    _async_client_cache.reset()
+
+
+def get_client_cache():
+    """Return the container-wide ClientCache instance."""
+    return _client_cache
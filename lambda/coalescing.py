@@ -0,0 +1,338 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+When a class submits the same problem at once, one request per expression
+calls Claude and the rest wait for it and share its result.
+
+Within a process, the first request for a key becomes the leader and the
+others wait on its Call. Followers only share a successful result: if the
+leader fails, or takes longer than COALESCING_WAIT_SECONDS, they do the work
+themselves.
+
+Across containers, a lease backend decides which container generates an
+explanation. A container that loses the lease polls a lookup (the response
+cache, which needs a persistent tier for this to help) until the winner's
+explanation appears, and generates it itself if the lease is released
+without one or COALESCING_WAIT_SECONDS pass.
+
+Environment:
+    COALESCING_ENABLED: set to false to turn coalescing off (default true)
+    COALESCING_BACKEND: lease backend, 'none' (default, this process only),
+        'memory' or 'dynamodb'
+    COALESCING_TABLE: DynamoDB table for leases, with a string partition key
+        'lease_key' and TTL enabled on 'expires_at'
+    COALESCING_LEASE_SECONDS: how long a lease lasts if never released (default 30)
+    COALESCING_WAIT_SECONDS: how long a follower waits for a result (default 20)
+    COALESCING_POLL_SECONDS: how often a follower polls for a remote result (default 0.25)
+"""
+
+import contextlib
+import os
+import threading
+import time
+import uuid
+
+import metrics
+
+DEFAULT_LEASE_SECONDS = 30
+DEFAULT_WAIT_SECONDS = 20
+DEFAULT_POLL_SECONDS = 0.25
+
+
+def coalescing_enabled():
+    return os.environ.get('COALESCING_ENABLED', 'true').lower() != 'false'
+
+
+class Call:
+    """One in-flight piece of work that followers can wait on."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.value = None
+        self.ok = False
+
+    def resolve(self, value, ok):
+        self.value = value
+        self.ok = ok
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the leader to finish.
+
+        Returns:
+            tuple: (shared, value) where shared is False if the leader failed
+                or didn't finish in time
+        """
+        if not self._done.wait(timeout) or not self.ok:
+            return (False, None)
+        return (True, self.value)
+
+
+class InMemoryLeaseBackend:
+    """
+    Lease table in this process.
+
+    Only useful when several Coalescers share one instance, as in tests and
+    benchmarks that simulate containers; a real deployment uses DynamoDB.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, owner, lease_seconds):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] != owner and lease[1] > self.clock():
+                return False
+            self._leases[key] = (owner, self.clock() + lease_seconds)
+            return True
+
+    def release(self, key, owner):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] == owner:
+                del self._leases[key]
+
+
+class DynamoDBLeaseBackend:
+    """
+    Lease table in DynamoDB, shared by all containers.
+
+    A lease is a conditional put that only succeeds if no live lease exists,
+    so exactly one container wins. Expired leases can be taken over, which
+    covers containers that die mid-generation.
+    """
+
+    def __init__(self, table_name=None, table=None, clock=time.time):
+        self.clock = clock
+        if table is None:
+            import boto3
+            table = boto3.session.Session().resource('dynamodb').Table(table_name)
+        self.table = table
+
+    def acquire(self, key, owner, lease_seconds):
+        now = self.clock()
+        try:
+            self.table.put_item(
+                Item={'lease_key': key, 'owner': owner, 'expires_at': int(now + lease_seconds)},
+                ConditionExpression='attribute_not_exists(lease_key) OR expires_at < :now OR #owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':now': int(now), ':owner': owner}
+            )
+            return True
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def release(self, key, owner):
+        try:
+            self.table.delete_item(
+                Key={'lease_key': key},
+                ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':owner': owner}
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            # Someone took over an expired lease; it's theirs now
+            pass
+
+
+class Coalescer:
+    """
+    Deduplicates concurrent work by key, in-process and (with a lease backend)
+    across containers.
+
+    run() covers ordinary calls. Generators that stream their result use the
+    same pieces directly: join(), leased() and finish().
+    """
+
+    def __init__(self, lease_backend=None, lease_seconds=DEFAULT_LEASE_SECONDS, wait_seconds=DEFAULT_WAIT_SECONDS,
+                 poll_seconds=DEFAULT_POLL_SECONDS, clock=time.monotonic, sleep=time.sleep):
+        self.lease_backend = lease_backend
+        self.lease_seconds = lease_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.owner = uuid.uuid4().hex
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """
+        Join the in-flight call for key, starting one if there is none.
+
+        Returns:
+            tuple: (call, leader) where leader is True if this caller must do
+                the work and then finish() the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return (call, False)
+            call = Call()
+            self._calls[key] = call
+            return (call, True)
+
+    def finish(self, key, call, value=None, ok=True):
+        """Hand the leader's result to every follower and forget the call."""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.resolve(value, ok)
+
+    def wait(self, call):
+        """Wait as a follower; returns (shared, value) like Call.wait."""
+        shared, value = call.wait(self.wait_seconds)
+        if shared:
+            metrics.increment('coalesced_requests')
+        return (shared, value)
+
+    @contextlib.contextmanager
+    def leased(self, key, lookup=None):
+        """
+        Hold the cross-container lease for key while the work runs.
+
+        If another container holds it, poll lookup() until its result appears.
+        Without a lease backend or a lookup this does nothing.
+
+        Yields:
+            The other container's result, or None if the caller should do the work
+        """
+        if self.lease_backend is None or lookup is None:
+            yield None
+            return
+
+        acquired = self._acquire(key)
+        remote_value = None
+        if not acquired:
+            metrics.increment('lease_waits')
+            deadline = self.clock() + self.wait_seconds
+            while True:
+                remote_value = lookup()
+                if remote_value is not None:
+                    metrics.increment('coalesced_remote')
+                    break
+                # The holder finished without a result (or died): take over
+                acquired = self._acquire(key)
+                if acquired:
+                    break
+                if self.clock() >= deadline:
+                    print(f"Gave up waiting for another container to finish {key}")
+                    metrics.increment('lease_timeouts')
+                    break
+                self.sleep(self.poll_seconds)
+
+        try:
+            yield remote_value
+        finally:
+            if acquired:
+                self._release(key)
+
+    def run(self, key, fn, lookup=None):
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key (str): Identifies the work, e.g. a response cache key
+            fn (callable): Does the work and returns its result
+            lookup (callable): Returns another container's result or None;
+                enables the lease backend for this key
+
+        Returns:
+            tuple: (value, shared) where shared is True if the result came
+                from another request rather than this caller's own fn()
+        """
+        call, leader = self.join(key)
+        if not leader:
+            shared, value = self.wait(call)
+            if shared:
+                return (value, True)
+            return (fn(), False)
+
+        value = None
+        ok = False
+        try:
+            with self.leased(key, lookup) as remote_value:
+                if remote_value is not None:
+                    value, shared = remote_value, True
+                else:
+                    value, shared = fn(), False
+            ok = True
+            return (value, shared)
+        finally:
+            self.finish(key, call, value, ok)
+
+    def _acquire(self, key):
+        try:
+            return self.lease_backend.acquire(key, self.owner, self.lease_seconds)
+        except Exception as e:
+            # A broken lease table must never fail the request; just don't coalesce
+            print(f"Lease acquire failed: {str(e)}")
+            return True
+
+    def _release(self, key):
+        try:
+            self.lease_backend.release(key, self.owner)
+        except Exception as e:
+            print(f"Lease release failed: {str(e)}")
+
+
+class _NoCoalescing(Coalescer):
+    """Coalescer used when COALESCING_ENABLED is false: every caller leads."""
+
+    def join(self, key):
+        return (Call(), True)
+
+    def finish(self, key, call, value=None, ok=True):
+        pass
+
+
+def _env_number(name, default):
+    try:
+        return type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def build_coalescer_from_env():
+    """Build a Coalescer from the COALESCING_* environment variables."""
+    if not coalescing_enabled():
+        return _NoCoalescing()
+
+    backend = os.environ.get('COALESCING_BACKEND', 'none').lower()
+    lease_backend = None
+    if backend == 'memory':
+        lease_backend = InMemoryLeaseBackend()
+    elif backend == 'dynamodb':
+        lease_backend = DynamoDBLeaseBackend(os.environ['COALESCING_TABLE'])
+
+    return Coalescer(
+        lease_backend,
+        lease_seconds=_env_number('COALESCING_LEASE_SECONDS', DEFAULT_LEASE_SECONDS),
+        wait_seconds=_env_number('COALESCING_WAIT_SECONDS', float(DEFAULT_WAIT_SECONDS)),
+        poll_seconds=_env_number('COALESCING_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+    )
+
+
+# Module-level coalescer shared by every invocation on this container
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """Return the container-wide Coalescer, building it on first use."""
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = build_coalescer_from_env()
+        return _coalescer
+
+
+def reset_coalescer(coalescer=None):
+    """Replace the container-wide coalescer (None rebuilds it from the environment on next use)."""
+    global _coalescer
+    with _coalescer_lock:
+        _coalescer = coalescer
@@ -1,8 +1,158 @@
+import html
 import json
-import boto3
 import os
-from anthropic import Anthropic
+import time
+import contextvars
 import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import admission
+import metrics
+import rate_limit
+import resilience
+from client_cache import (
+    eager_imports_enabled, get_anthropic_client, invalidate_anthropic_client, lazy_anthropic_client,
+    preload_dependencies
+)
+from coalescing import get_coalescer
+from math_engine import (
+    canonicalize_expression, evaluate_expression, format_number, scan_signals, trace_expression,
+    LocalEvaluationError, UnsupportedExpression, MAX_TRACE_STEPS
+)
+from prompts import COMBINED, NARRATION, TUTORING, VALIDATION
+from responses import INVALID_BODY_ERRORS, compress_response, encode_json, event_body, json_response, stream_response
+from response_cache import LRUCache, get_response_cache, make_cache_key
+from resilience import UpstreamUnavailable, call_anthropic, is_authentication_error, open_stream, validation_timeout
+from routing import DETAIL_LEVELS, PROMPT_VARIANTS, choose_budget, choose_route, reset_detail, use_detail
+
+# anthropic and boto3 load on first use (see client_cache.py) unless EAGER_IMPORTS
+# asks for them during init, e.g. under provisioned concurrency
+if eager_imports_enabled():
+    preload_dependencies()
+
+# Validation call settings
+VALIDATION_MODEL = "claude-3-haiku-20240307"
+VALIDATION_MAX_TOKENS = 150
+
+# Tutoring call settings. The prompt text lives in prompts.py, and its version is
+# part of the response cache key; the model, max_tokens and prompt variant are
+# picked per expression by routing.py
+TUTORING_TEMPERATURE = 0.5
+
+# The system arguments sent with prompt caching on (the default), for telling calls apart
+VALIDATION_SYSTEM = VALIDATION.cached_system
+COMBINED_SYSTEM = COMBINED.cached_system
+
+# Names used in basic_validation's bracket error messages
+BRACKET_NAMES = {
+    '(': 'parentheses', ')': 'parentheses',
+    '[': 'brackets', ']': 'brackets',
+    '{': 'braces', '}': 'braces'
+}
+
+# VALIDATION_MODE=combined asks for the verdict and the explanation in a single call
+# instead of a validation call followed by a tutoring call
+VALIDATION_MODE_SEPARATE = "separate"
+VALIDATION_MODE_COMBINED = "combined"
+VERDICT_TAG = re.compile(r'<verdict>\s*(.*?)\s*</verdict>', re.DOTALL)
+BARE_JSON_OBJECT = re.compile(r'(\{.*?\})', re.DOTALL)
+EXPLANATION_TAG = re.compile(r'<explanation>(.*?)(?:</explanation>|$)', re.DOTALL)
+
+# Served when the Anthropic API is unavailable (see resilience.py): a 503 without
+# a local answer, or the local answer with this note in place of the explanation
+UNAVAILABLE_MESSAGE = "The tutor is temporarily unavailable. Please try again in a minute."
+DEGRADED_NOTE = "The step-by-step explanation is temporarily unavailable, so here is just the answer. Please try again in a minute."
+
+def get_validation_mode():
+    """Read VALIDATION_MODE from the environment; anything unrecognised means separate calls."""
+    mode = os.environ.get('VALIDATION_MODE', VALIDATION_MODE_SEPARATE).strip().lower()
+    return mode if mode == VALIDATION_MODE_COMBINED else VALIDATION_MODE_SEPARATE
+
+def step_traces_enabled():
+    """Read STEP_TRACE from the environment; anything but false narrates locally computed steps."""
+    return os.environ.get('STEP_TRACE', 'true').strip().lower() != 'false'
+
+# Validation runs at temperature 0, so its verdicts can be memoised per expression
+DEFAULT_VALIDATION_MEMO_MAX_ENTRIES = 4096
+DEFAULT_VALIDATION_MEMO_TTL_SECONDS = 24 * 60 * 60
+_validation_memo = None
+
+def get_validation_memo():
+    """Return the container-wide memo of Claude validation verdicts, building it on first use."""
+    global _validation_memo
+    if _validation_memo is None:
+        _validation_memo = LRUCache(
+            max_entries=int(os.environ.get('VALIDATION_MEMO_MAX_ENTRIES', DEFAULT_VALIDATION_MEMO_MAX_ENTRIES)),
+            ttl_seconds=float(os.environ.get('VALIDATION_MEMO_TTL_SECONDS', DEFAULT_VALIDATION_MEMO_TTL_SECONDS))
+        )
+    return _validation_memo
+
+# Batch requests ({"expressions": [...]}) are explained in parallel within a deadline
+# that leaves room to respond before the 30s Lambda timeout
+DEFAULT_BATCH_MAX_EXPRESSIONS = 50
+DEFAULT_BATCH_MAX_CONCURRENCY = 4
+DEFAULT_BATCH_DEADLINE_SECONDS = 25
+BATCH_DEADLINE_MARGIN_SECONDS = 2
+
+def reset_validation_memo():
+    """Forget all memoised verdicts (rebuilt from the environment on next use)."""
+    global _validation_memo
+    _validation_memo = None
+
+def build_validation_request(expression):
+    """
+    Build the messages.create arguments for the validation call.
+
+    Args:
+        expression (str): The input expression to validate
+
+    Returns:
+        dict: Keyword arguments for client.messages.create
+    """
+    return {
+        'model': VALIDATION_MODEL,
+        'max_tokens': VALIDATION_MAX_TOKENS,
+        'temperature': 0,
+        'system': VALIDATION.system(),
+        'messages': [
+            {"role": "user", "content": VALIDATION.render(expression=expression)}
+        ]
+    }
+
+def parse_validation_response(validation_message):
+    """
+    Turn Claude's validation JSON into a verdict.
+
+    Args:
+        validation_message: The message returned by the validation call
+
+    Returns:
+        tuple: (is_valid, is_math_problem, error_message)
+
+    Raises:
+        ValueError: If the response is not the requested JSON object
+    """
+    # Extract the JSON response
+    validation_text = extract_text(validation_message)
+    validation_result = json.loads(validation_text)
+    
+    is_math_problem = validation_result.get("is_math_problem", False)
+    is_solvable = validation_result.get("is_solvable", False)
+    error_message = validation_result.get("error_message", "")
+    
+    return (is_solvable, is_math_problem, error_message)
+
+def lookup_validation_memo(expression):
+    """Return the memoised verdict for an expression, or None."""
+    verdict = get_validation_memo().get(canonicalize_expression(expression))
+    if verdict is not None:
+        print("Validation verdict served from memo")
+        metrics.increment('validation_memo_hits')
+    return verdict
+
+def remember_validation(expression, verdict):
+    """Memoise a verdict returned by Claude."""
+    get_validation_memo().set(canonicalize_expression(expression), verdict)
 
 def validate_with_claude(client, expression):
     """
@@ -18,51 +168,52 @@ def validate_with_claude(client, expression):
             - is_math_problem (bool): True if the expression is a math problem
             - error_message (str): Error message if not valid, empty string otherwise
     """
-    validation_prompt = f"""You are a math validation assistant. Your only job is to determine if the following input is:
-    1. A mathematical problem/expression
-    2. Solvable using standard mathematical rules
-    
-    Input: {expression}
-    
-    Respond with ONLY a JSON object with the following structure:
-    {{
-        "is_math_problem": true/false,
-        "is_solvable": true/false,
-        "error_message": "Specific error message if not solvable or not a math problem"
-    }}
-    
-    Do not include any other text in your response, just the JSON object.
+    # Identical inputs always get the same verdict, so skip the round trip when we've seen one
+    verdict = lookup_validation_memo(expression)
+    if verdict is not None:
+        return verdict
+
+    # Concurrent requests for the same input share one validation call
+    verdict, _ = get_coalescer().run(
+        f"validation:{canonicalize_expression(expression)}", lambda: request_validation(client, expression)
+    )
+    return verdict
+
+def request_validation(client, expression):
+    """
+    Make the Claude validation call for validate_with_claude, falling back to basic_validation.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The input expression to validate
+
+    Returns:
+        tuple: (is_valid, is_math_problem, error_message)
     """
-    
     try:
         # Get response from Claude for validation
-        validation_message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=150,
-            temperature=0,
-            system="You are a math validation assistant. Respond only with the requested JSON format.",
-            messages=[
-                {"role": "user", "content": validation_prompt}
-            ]
-        )
-        
-        # Extract the JSON response
-        validation_text = validation_message.content[0].text
-        validation_result = json.loads(validation_text)
-        
-        is_math_problem = validation_result.get("is_math_problem", False)
-        is_solvable = validation_result.get("is_solvable", False)
-        error_message = validation_result.get("error_message", "")
+        with metrics.span('validation'):
+            validation_message = call_anthropic(
+                client.messages.create, build_validation_request(expression), validation_timeout()
+            )
+        metrics.record_usage(validation_message)
+        verdict = parse_validation_response(validation_message)
         
-        return (is_solvable, is_math_problem, error_message)
+        # Only Claude's verdicts are memoised; fallback verdicts are retried next time
+        remember_validation(expression, verdict)
+        return verdict
     except Exception as e:
         # Fallback to basic validation if Claude validation fails
         print(f"Claude validation failed: {str(e)}")
+        metrics.increment('basic_validation_fallbacks')
         return basic_validation(expression)
 
 def basic_validation(expression):
     """
-    Fallback basic validation using regex if Claude validation fails.
+    Fallback validation used when Claude validation fails.
+
+    Works from the math_engine signal scan (see scan_signals), a single pass
+    over the token stream that also feeds the admission classifier.
     
     Args:
         expression (str): The input expression to validate
@@ -70,193 +221,965 @@ def basic_validation(expression):
     Returns:
         tuple: (is_valid, is_math_problem, error_message)
     """
-    # Check for presence of mathematical operators or functions
-    math_operators = r'[\+\-\*\/\^\(\)\[\]\{\}\=\<\>\%\√]'
-    math_functions = r'\b(sin|cos|tan|log|ln|sqrt|abs|exp|pow|round|floor|ceil)\b'
-    numbers = r'\d+'
-    
-    # Check if the expression contains math operators, functions, or numbers
-    has_operators = bool(re.search(math_operators, expression))
-    has_functions = bool(re.search(math_functions, expression, re.IGNORECASE))
-    has_numbers = bool(re.search(numbers, expression))
-    
+    signals = scan_signals(expression)
+    has_operators = signals.operators or signals.brackets or signals.relations
+
     # If the expression has math operators or functions and numbers, it's likely a math problem
-    is_math_problem = (has_operators or has_functions) and has_numbers
-    
-    if not is_math_problem:
+    if not ((has_operators or signals.functions) and signals.numbers):
         return (False, False, "The input does not appear to be a math problem.")
+
+    if signals.bracket_error is not None:
+        return (False, True, f"Unbalanced {BRACKET_NAMES[signals.bracket_error]} in the expression.")
+
+    if signals.divides_by_zero:
+        return (False, True, "Expression contains division by zero.")
+
+    if signals.consecutive_operators:
+        return (False, True, "Expression contains consecutive operators.")
+
+    return (True, True, "")
+
+def local_validation(expression):
+    """
+    Validate and evaluate plain arithmetic locally so the Claude validation call can be skipped.
     
-    # Basic solvability checks
-    try:
-        # Count parentheses, brackets, and braces
-        open_parens = expression.count('(')
-        close_parens = expression.count(')')
-        open_brackets = expression.count('[')
-        close_brackets = expression.count(']')
-        open_braces = expression.count('{')
-        close_braces = expression.count('}')
-        
-        # Check if parentheses, brackets, and braces are balanced
-        if open_parens != close_parens:
-            return (False, True, "Unbalanced parentheses in the expression.")
-        if open_brackets != close_brackets:
-            return (False, True, "Unbalanced brackets in the expression.")
-        if open_braces != close_braces:
-            return (False, True, "Unbalanced braces in the expression.")
-        
-        # Check for division by zero (simple cases)
-        if re.search(r'\/\s*0(?![.\d])', expression):
-            return (False, True, "Expression contains division by zero.")
-        
-        # Check for invalid syntax like consecutive operators
-        if re.search(r'[\+\-\*\/\^]\s*[\+\*\/\^]', expression):
-            return (False, True, "Expression contains consecutive operators.")
+    Args:
+        expression (str): The input expression to validate
         
-        return (True, True, "")
+    Returns:
+        tuple or None: (is_valid, is_math_problem, error_message, result) when the
+            local engine can decide, where result is the formatted exact answer
+            (or None if invalid); None when the expression needs Claude
+    """
+    try:
+        with metrics.span('local_eval'):
+            value = evaluate_expression(expression)
+    except UnsupportedExpression:
+        return None
+    except LocalEvaluationError as e:
+        return (False, True, str(e), None)
+    
+    return (True, True, "", format_number(value))
+
+def screen_expression(expression):
+    """
+    Run the admission classifier on an expression the local engine couldn't decide.
+
+    Args:
+        expression (str): The input expression to validate
+
+    Returns:
+        tuple or None: (is_valid, is_math_problem, error_message) when the
+            classifier decided locally, None when the expression needs Claude
+    """
+    tier = admission.classify(expression)
+    admission.record(tier)
+    if tier == admission.TIER_REJECTED:
+        print("Admission classifier rejected the expression, skipping Claude validation")
+        return (False, False, "The input does not appear to be a math problem.")
+    if tier == admission.TIER_ACCEPTED:
+        print("Admission classifier accepted the expression, skipping Claude validation")
+        return basic_validation(expression)
+    return None
+
+def variant_instructions(prompt_variant):
+    """Return the extra prompt lines for a routing prompt variant ('' for the standard prompt)."""
+    instructions = PROMPT_VARIANTS.get(prompt_variant, "")
+    if not instructions:
+        return ""
+    return f"\n\n{instructions}"
+
+# What a tutoring call for an expression will be: its Route and complexity
+# score, its Budget, and the local step trace (None if there isn't one). Its
+# cache key and its request are both built from the same plan; see plan_tutoring_call
+TutoringPlan = namedtuple('TutoringPlan', ['route', 'score', 'budget', 'steps'])
+
+def plan_tutoring_call(expression):
+    """
+    Route, budget and trace an expression's tutoring call once, for both its cache key and its request.
+
+    Args:
+        expression (str): The validated math expression
+
+    Returns:
+        TutoringPlan: The chosen route, budget and step trace
+    """
+    route, score = choose_route(expression)
+    return TutoringPlan(route, score, choose_budget(route), local_trace(expression))
+
+def log_tutoring_route(route, score, budget):
+    """Log the route and budget of a tutoring call that is about to be made and count them."""
+    print(f"Tutoring route: {route.name} (complexity {score:.2f}, model {route.model}, "
+          f"max_tokens {budget.max_tokens}, prompt {budget.prompt}, detail {budget.detail or 'auto'})")
+    metrics.increment(f"route_{route.name}")
+    if budget.detail is not None:
+        metrics.increment(f"detail_{budget.detail}")
+
+def route_tutoring_call(expression):
+    """
+    Pick the routing table entry and output budget for an expression's tutoring call and log them.
+
+    Args:
+        expression (str): The validated math expression
+
+    Returns:
+        tuple: (route, budget), the chosen Route and Budget
+    """
+    route, score = choose_route(expression)
+    budget = choose_budget(route)
+    log_tutoring_route(route, score, budget)
+    return (route, budget)
+
+def apply_budget(request, budget, extra_tokens=0):
+    """Add the budget's max_tokens (plus extra_tokens) and stop sequences to a request."""
+    request['max_tokens'] = budget.max_tokens + extra_tokens
+    if budget.stop_sequences:
+        request['stop_sequences'] = list(budget.stop_sequences)
+    return request
+
+def build_tutoring_prompt(expression, result=None, prompt_variant='standard'):
+    """
+    Build the user prompt for the tutoring call.
+
+    Args:
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        prompt_variant (str): The routing prompt variant, see routing.PROMPT_VARIANTS
+
+    Returns:
+        str: The prompt text
+    """
+    # Give Claude the exact answer when we already know it
+    answer_hint = ""
+    if result is not None:
+        answer_hint = f"\nThe exact answer, already computed for you, is: {result}"
+
+    return TUTORING.render(
+        expression=expression, answer_hint=answer_hint, variant=variant_instructions(prompt_variant)
+    )
+
+def local_trace(expression):
+    """
+    Work out the steps of an expression locally so the tutor only has to narrate them.
+
+    Args:
+        expression (str): The validated math expression
+
+    Returns:
+        tuple or None: The math_engine Steps in order, or None when STEP_TRACE is
+            off, the local engine can't evaluate the expression or the trace is
+            longer than MAX_TRACE_STEPS
+    """
+    if not step_traces_enabled():
+        return None
+    try:
+        with metrics.span('step_trace'):
+            _, steps = trace_expression(expression)
+    except (UnsupportedExpression, LocalEvaluationError):
+        return None
+    if not steps or len(steps) > MAX_TRACE_STEPS:
+        return None
+    return steps
+
+def format_steps(steps):
+    """Number the steps of a trace, one per line: '1. 3 × 4 = 12'."""
+    return "\n".join(f"{number}. {step.expression} = {step.value}" for number, step in enumerate(steps, 1))
+
+def build_narration_prompt(expression, result, steps, prompt_variant='standard'):
+    """
+    Build the user prompt for a tutoring call that narrates precomputed steps.
+
+    Args:
+        expression (str): The validated math expression
+        result (str): The exact answer, computed locally
+        steps (tuple): The expression's step trace
+        prompt_variant (str): The routing prompt variant, see routing.PROMPT_VARIANTS
+
+    Returns:
+        str: The prompt text
+    """
+    return NARRATION.render(
+        expression=expression, steps=format_steps(steps), result=result,
+        variant=variant_instructions(prompt_variant)
+    )
+
+def build_tutoring_request(expression, result=None, plan=None):
+    """
+    Build the messages.create arguments for the tutoring call.
+
+    When the answer was computed locally, the local engine's step trace goes in
+    the prompt and the model is asked only to narrate it (unless STEP_TRACE is false).
+
+    Args:
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        plan (TutoringPlan): The plan the cache key was built from, planned here if None
+
+    Returns:
+        dict: Keyword arguments for client.messages.create or client.messages.stream
+    """
+    route, score, budget, steps = plan or plan_tutoring_call(expression)
+    log_tutoring_route(route, score, budget)
+    if result is None:
+        steps = None
+    if steps is not None:
+        metrics.increment('step_traces')
+        system = NARRATION.system()
+        prompt = build_narration_prompt(expression, result, steps, budget.prompt)
+    else:
+        system = TUTORING.system()
+        prompt = build_tutoring_prompt(expression, result, budget.prompt)
+    return apply_budget({
+        'model': route.model,
+        'temperature': TUTORING_TEMPERATURE,
+        'system': system,
+        'messages': [
+            {"role": "user", "content": prompt}
+        ]
+    }, budget)
+
+# Block-level tags an explanation cut off by max_tokens can safely end after
+BLOCK_END = re.compile(r'</(?:p|li|ol|ul|h3)>|<hr>')
+
+def extract_text(message):
+    """
+    Join the text blocks of a Messages API response.
+
+    Args:
+        message: The message returned by client.messages.create
+
+    Returns:
+        str: The response text
+    """
+    content = message.content
+    if isinstance(content, str):
+        return content
+    # Keep only text blocks, so block types added to the API later are skipped too
+    return "".join(block.text for block in content if getattr(block, 'type', None) == 'text')
+
+def extract_explanation(message):
+    """
+    Extract the explanation text from a tutoring response.
+
+    Args:
+        message: The message returned by client.messages.create
+
+    Returns:
+        str: The explanation text
+    """
+    explanation = extract_text(message)
+    if getattr(message, 'stop_reason', None) == 'max_tokens':
+        print("Explanation hit max_tokens, trimming it to the last complete block")
+        metrics.increment('truncated_explanations')
+        explanation = trim_truncated_html(explanation)
+    print(f"Extracted explanation ({len(explanation)} chars)")
+    return explanation
+
+def trim_truncated_html(text):
+    """
+    Cut an explanation that ran out of tokens back to its last complete block.
+
+    Args:
+        text (str): HTML that may end mid-sentence or mid-tag
+
+    Returns:
+        str: The text up to the last closing block tag, with open lists closed
+    """
+    ends = [match.end() for match in BLOCK_END.finditer(text)]
+    if not ends:
+        return text
+    trimmed = text[:ends[-1]]
+    for tag in ('ul', 'ol'):
+        trimmed += f"</{tag}>" * max(trimmed.count(f"<{tag}") - trimmed.count(f"</{tag}>"), 0)
+    return trimmed
+
+def generate_explanation(client, expression, result=None, plan=None):
+    """
+    Ask Claude for a step-by-step tutoring explanation of an expression.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        plan (TutoringPlan): The expression's tutoring plan, if already made
+
+    Returns:
+        str: The HTML-formatted explanation
+    """
+    # Get response from Claude
+    print("Sending request to Anthropic API...")
+    with metrics.span('generation'):
+        message = call_anthropic(client.messages.create, build_tutoring_request(expression, result, plan))
+    metrics.record_usage(message)
+
+    with metrics.span('extraction'):
+        return extract_explanation(message)
+
+def stream_explanation(client, expression, result=None, plan=None):
+    """
+    Stream the tutoring explanation from Claude as it is generated.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        plan (TutoringPlan): The expression's tutoring plan, if already made
+
+    Yields:
+        str: HTML text chunks in generation order
+    """
+    print("Streaming request to Anthropic API...")
+    request = build_tutoring_request(expression, result, plan)
+    with metrics.span('generation'), open_stream(client.messages.stream, request) as stream:
+        for text in stream.text_stream:
+            yield text
+        metrics.record_usage(stream.get_final_message())
+
+def build_combined_request(expression):
+    """
+    Build the messages.create arguments for a single call that both validates
+    and explains an expression (VALIDATION_MODE=combined).
+
+    Args:
+        expression (str): The input expression submitted by the student
+
+    Returns:
+        dict: Keyword arguments for client.messages.create
+    """
+    route, budget = route_tutoring_call(expression)
+    prompt = COMBINED.render(expression=expression, variant=variant_instructions(budget.prompt))
+
+    # The verdict comes on top of the routed explanation budget
+    return apply_budget({
+        'model': route.model,
+        'temperature': TUTORING_TEMPERATURE,
+        'system': COMBINED.system(),
+        'messages': [
+            {"role": "user", "content": prompt}
+        ]
+    }, budget, extra_tokens=VALIDATION_MAX_TOKENS)
+
+def parse_verdict_flag(value):
+    """Read a verdict flag that may come back as a JSON boolean or as text."""
+    if isinstance(value, str):
+        return value.strip().lower() == 'true'
+    return bool(value)
+
+def parse_combined_response(message):
+    """
+    Split a combined response into the verdict and the explanation.
+
+    The verdict is read from the <verdict> tags, or from the first JSON object
+    in the text if the tags are missing. The explanation may be cut short by
+    max_tokens, so a missing closing tag is tolerated.
+
+    Args:
+        message: The message returned by the combined call
+
+    Returns:
+        tuple: (verdict, explanation)
+            - verdict (tuple): (is_valid, is_math_problem, error_message)
+            - explanation (str): The HTML explanation, or None if there wasn't one
+
+    Raises:
+        ValueError: If no verdict can be parsed from the response
+    """
+    text = extract_explanation(message)
+
+    verdict_match = VERDICT_TAG.search(text)
+    if verdict_match is None:
+        verdict_match = BARE_JSON_OBJECT.search(text)
+    if verdict_match is None:
+        raise ValueError("Combined response has no verdict")
+
+    # json.JSONDecodeError is a ValueError
+    verdict_json = json.loads(verdict_match.group(1))
+    if not isinstance(verdict_json, dict):
+        raise ValueError("Combined response verdict is not a JSON object")
+
+    verdict = (
+        parse_verdict_flag(verdict_json.get("is_solvable", False)),
+        parse_verdict_flag(verdict_json.get("is_math_problem", False)),
+        str(verdict_json.get("error_message") or "")
+    )
+
+    explanation = None
+    explanation_match = EXPLANATION_TAG.search(text)
+    if explanation_match is not None and explanation_match.group(1).strip():
+        explanation = explanation_match.group(1).strip()
+
+    return (verdict, explanation)
+
+def verdict_error(is_valid, is_math_problem, error_message):
+    """Return the 400 error message for a rejected verdict, or None if it passed."""
+    # Return error if not a math problem
+    if not is_math_problem:
+        return 'The input does not appear to be a math problem. Please enter a valid mathematical expression.'
+
+    # Return error if not solvable
+    if not is_valid:
+        return f'The math problem appears to be invalid: {error_message}'
+
+    return None
+
+def check_expression(client, expression):
+    """
+    Decide whether an expression can be explained, locally when possible.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The math expression submitted by the student
+
+    Returns:
+        tuple: (error, result)
+            - error (str): Message for a 400 response, or None if the expression is valid
+            - result (str): The exact answer if it was computed locally, otherwise None
+    """
+    # Plain arithmetic is validated and solved locally without a Claude round trip
+    local_result = local_validation(expression)
+    if local_result is not None:
+        print("Expression evaluated locally, skipping Claude validation")
+        admission.record(admission.TIER_LOCAL_ENGINE)
+        is_valid, is_math_problem, error_message, result = local_result
+    else:
+        # Clear non-math is turned away before Claude sees it
+        verdict = screen_expression(expression)
+        if verdict is None:
+            # Validate the expression using Claude
+            print("Validating expression with Claude...")
+            verdict = validate_with_claude(client, expression)
+        is_valid, is_math_problem, error_message = verdict
+        result = None
+
+    error = verdict_error(is_valid, is_math_problem, error_message)
+    if error:
+        return (error, None)
+
+    return (None, result)
+
+def tutoring_cache_key(expression, plan=None):
+    """
+    Return the response cache key for the tutoring explanation of an expression.
+
+    Args:
+        expression (str): The validated math expression
+        plan (TutoringPlan): The plan the request will be built from, planned here if None
+
+    Returns:
+        str: The cache key
+    """
+    # Routes and detail levels differ in model, prompt and length, so each gets its own entries
+    route, _, budget, steps = plan or plan_tutoring_call(expression)
+    prompt = f"{TUTORING.version}-{budget.prompt}"
+    if steps is not None:
+        prompt = f"{NARRATION.name}-{NARRATION.version}-{budget.prompt}"
+    if budget.detail is not None:
+        prompt = f"{prompt}-{budget.detail}"
+    return make_cache_key(expression, route.model, prompt, TUTORING_TEMPERATURE)
+
+def solve_expression(client, expression):
+    """
+    Validate an expression and ask Claude for a tutoring explanation.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The math expression submitted by the student
+
+    Returns:
+        tuple: (status_code, body) for the response
+    """
+    # Expressions that need Claude validation can be validated and explained in one call
+    if get_validation_mode() == VALIDATION_MODE_COMBINED and local_validation(expression) is None:
+        return solve_expression_combined(client, expression)
+
+    error, result = check_expression(client, expression)
+    if error:
+        return (400, {'error': error})
+
+    # Serve repeated expressions from the response cache
+    response_cache = get_response_cache()
+    plan = plan_tutoring_call(expression)
+    cache_key = tutoring_cache_key(expression, plan)
+    cached, cache_tier = response_cache.get(cache_key)
+    if cached is not None:
+        print(f"Explanation served from the {cache_tier} response cache")
+        explanation = cached['explanation']
+    else:
+        try:
+            explanation, shared = generate_shared_explanation(
+                client, expression, result, cache_key, response_cache, plan
+            )
+        except UpstreamUnavailable as e:
+            return degraded_response(expression, result, response_cache, e)
+        if shared:
+            cached, cache_tier = ({'explanation': explanation}, 'coalesced')
+
+    return (200, build_explanation_body(explanation, result, response_cache, cached is not None, cache_tier))
+
+def fallback_explanation(expression, result):
+    """Build the explanation served with a locally computed answer while Claude is unavailable."""
+    return (f"<h3>Answer</h3><p>{html.escape(expression)} = <strong>{html.escape(result)}</strong></p>"
+            f"<p>{DEGRADED_NOTE}</p>")
+
+def degraded_response(expression, result, response_cache, error):
+    """
+    Answer without Claude after resilience.py gave up on the tutoring call.
+
+    Args:
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        response_cache (ResponseCache): Only used for the stats in the body; nothing is cached
+        error (UpstreamUnavailable): Why the call couldn't be made
+
+    Returns:
+        tuple: (status_code, body), a 200 with the local answer if there is one, otherwise a 503
+    """
+    print(f"Serving a degraded response: {str(error)}")
+    metrics.increment('degraded_responses')
+    if result is None:
+        return (503, {'error': UNAVAILABLE_MESSAGE})
+
+    response_body = build_explanation_body(fallback_explanation(expression, result), result, response_cache, False, None)
+    response_body['degraded'] = True
+    return (200, response_body)
+
+def cached_explanation(response_cache, cache_key):
+    """Return a cached explanation without counting the lookup, or None."""
+    cached = response_cache.peek(cache_key)
+    return cached['explanation'] if cached is not None else None
+
+def generate_shared_explanation(client, expression, result, cache_key, response_cache, plan=None):
+    """
+    Generate and cache an explanation, sharing one generation between
+    identical concurrent requests (see coalescing.py).
+
+    Args:
+        client: The Anthropic client
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        cache_key (str): The expression's response cache key
+        response_cache (ResponseCache): Where the explanation is stored
+        plan (TutoringPlan): The plan cache_key was built from
+
+    Returns:
+        tuple: (explanation, shared) where shared is True if another request generated it
+    """
+    def generate():
+        explanation = generate_explanation(client, expression, result, plan)
+        response_cache.set(cache_key, {'explanation': explanation})
+        return explanation
+
+    return get_coalescer().run(cache_key, generate, lambda: cached_explanation(response_cache, cache_key))
+
+def stream_shared_explanation(client, expression, result, cache_key, response_cache, plan=None):
+    """
+    Stream an explanation and cache it, sharing one generation between
+    identical concurrent requests.
+
+    A request that finds the same explanation already being generated (in this
+    process, or with a lease backend in another container) waits for it and
+    gets it as a single chunk.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The validated math expression
+        result (str): The exact answer if it was computed locally, otherwise None
+        cache_key (str): The expression's response cache key
+        response_cache (ResponseCache): Where the explanation is stored
+        plan (TutoringPlan): The plan cache_key was built from
+
+    Yields:
+        tuple: (text, shared) for each HTML chunk
+    """
+    coalescer = get_coalescer()
+    call, leader = coalescer.join(cache_key)
+    if not leader:
+        shared, explanation = coalescer.wait(call)
+        if shared:
+            yield (explanation, True)
+            return
+
+    # Leaders, and followers whose leader failed, generate it themselves
+    text_parts = []
+    ok = False
+    try:
+        with coalescer.leased(cache_key, lambda: cached_explanation(response_cache, cache_key)) as remote_explanation:
+            if remote_explanation is not None:
+                text_parts.append(remote_explanation)
+                yield (remote_explanation, True)
+            else:
+                for text in stream_explanation(client, expression, result, plan):
+                    text_parts.append(text)
+                    yield (text, False)
+                response_cache.set(cache_key, {'explanation': "".join(text_parts)})
+        ok = True
+    finally:
+        if leader:
+            coalescer.finish(cache_key, call, "".join(text_parts), ok)
+
+def solve_expression_combined(client, expression):
+    """
+    Validate and explain an expression with a single Claude call.
+
+    If the verdict can't be parsed (or the call fails) the expression is checked
+    with basic_validation instead, and if the response had no usable explanation
+    one is requested with the regular tutoring prompt.
+
+    Args:
+        client: The Anthropic client
+        expression (str): An expression the local engine couldn't decide
+
+    Returns:
+        tuple: (status_code, body) for the response
+    """
+    # Only valid expressions are ever cached, so a hit needs no validation
+    response_cache = get_response_cache()
+    plan = plan_tutoring_call(expression)
+    cache_key = tutoring_cache_key(expression, plan)
+    cached, cache_tier = response_cache.get(cache_key)
+    if cached is not None:
+        print(f"Explanation served from the {cache_tier} response cache")
+        return (200, build_explanation_body(cached['explanation'], None, response_cache, True, cache_tier))
+
+    explanation = None
+    shared = False
+    verdict = screen_expression(expression)
+    if verdict is None:
+        verdict = lookup_validation_memo(expression)
+    if verdict is None:
+        # Concurrent requests share one combined call; another container's
+        # cached explanation means its verdict passed
+        def lookup():
+            explanation = cached_explanation(response_cache, cache_key)
+            return ((True, True, ""), explanation) if explanation is not None else None
+
+        (verdict, explanation), shared = get_coalescer().run(
+            f"combined:{cache_key}",
+            lambda: request_combined(client, expression, cache_key, response_cache),
+            lookup
+        )
+
+    error = verdict_error(*verdict)
+    if error:
+        return (400, {'error': error})
+
+    if explanation is None:
+        try:
+            explanation, shared = generate_shared_explanation(client, expression, None, cache_key, response_cache, plan)
+        except UpstreamUnavailable as e:
+            return degraded_response(expression, None, response_cache, e)
+
+    return (200, build_explanation_body(
+        explanation, None, response_cache, shared, 'coalesced' if shared else None
+    ))
+
+def request_combined(client, expression, cache_key, response_cache):
+    """
+    Make the combined call for solve_expression_combined, caching a passing explanation.
+
+    Returns:
+        tuple: (verdict, explanation) as returned by parse_combined_response,
+            or basic_validation's verdict and None if the response was unusable
+    """
+    try:
+        print("Validating and explaining expression with a single Claude call...")
+        with metrics.span('combined'):
+            message = call_anthropic(client.messages.create, build_combined_request(expression))
+        metrics.record_usage(message)
+        with metrics.span('extraction'):
+            verdict, explanation = parse_combined_response(message)
+        # Not memoised: the verdict was sampled at the explanation's temperature
     except Exception as e:
-        return (False, True, f"Error validating expression: {str(e)}")
+        # Fallback to basic validation if the combined response is unusable
+        print(f"Combined validation failed: {str(e)}")
+        metrics.increment('basic_validation_fallbacks')
+        return (basic_validation(expression), None)
 
-def lambda_handler(event, context):
-    # CORS headers to include in all responses
-    cors_headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'OPTIONS,POST',
-        'Access-Control-Allow-Headers': 'Content-Type'
+    if explanation is not None and verdict_error(*verdict) is None:
+        response_cache.set(cache_key, {'explanation': explanation})
+    return (verdict, explanation)
+
+def build_explanation_body(explanation, result, response_cache, hit, cache_tier):
+    """
+    Build the JSON body returned for an explained expression.
+
+    Args:
+        explanation (str): The HTML explanation
+        result (str): The exact answer if it was computed locally, otherwise None
+        response_cache (ResponseCache): The cache the explanation was looked up in
+        hit (bool): Whether the explanation came from the cache
+        cache_tier (str): The tier that served the hit, otherwise None
+
+    Returns:
+        dict: The response body
+    """
+    response_body = {
+        'explanation': explanation,
+        'success': True,
+        'formatted': True,  # Flag to indicate the response contains HTML formatting
+        'cache': dict(response_cache.stats(), hit=hit, tier=cache_tier)
     }
-    
+    if result is not None:
+        response_body['result'] = result
+
+    return response_body
+
+def process_expression(client, expression):
+    """
+    Validate an expression and ask Claude for a tutoring explanation.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The math expression submitted by the student
+
+    Returns:
+        dict: The API Gateway response
+    """
+    return build_response(*solve_expression(client, expression))
+
+def get_batch_deadline_seconds(context):
+    """
+    Work out how long a batch may run, honouring both BATCH_DEADLINE_SECONDS and
+    the time the Lambda runtime says is left.
+
+    Args:
+        context: The Lambda context (anything without get_remaining_time_in_millis is ignored)
+
+    Returns:
+        float: Seconds available for explaining the batch
+    """
+    deadline = float(os.environ.get('BATCH_DEADLINE_SECONDS', DEFAULT_BATCH_DEADLINE_SECONDS))
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if callable(get_remaining):
+        deadline = min(deadline, get_remaining() / 1000.0 - BATCH_DEADLINE_MARGIN_SECONDS)
+    return max(deadline, 0)
+
+def solve_batch_item(client, expression):
+    """
+    Solve one batch item, turning unexpected failures into a per-item error.
+
+    The item's Anthropic calls queue for rate-limit capacity instead of falling
+    back after RATE_LIMIT_MAX_WAIT_SECONDS, since the batch has its own deadline.
+    """
+    try:
+        with rate_limit.queueing():
+            return solve_expression(client, expression)
+    except Exception as e:
+        print(f"Error solving batch item '{expression}': {str(e)}")
+        if is_authentication_error(e):
+            # Let the next request pick up a rotated key
+            invalidate_anthropic_client()
+        return (500, {'error': f'Internal server error: {str(e)}'})
+
+def solve_batch(client, expressions, context=None):
+    """
+    Solve a worksheet of expressions with bounded concurrency.
+
+    Items that need no network call (expressions rejected by the admission
+    tiers or the local engine, and explanations already in the in-process
+    cache) are resolved immediately;
+    the rest are validated and explained in parallel on up to
+    BATCH_MAX_CONCURRENCY threads, waiting for rate-limit capacity when the
+    API is busy (see rate_limit.py). Items still running when the deadline
+    passes are reported as timed out.
+
+    Args:
+        client: The Anthropic client
+        expressions (list): The expressions submitted by the student
+        context: The Lambda context, used to respect the function timeout
+
+    Returns:
+        list: One result per expression, in input order. Each result is the
+            single-expression response body plus 'expression' and 'status'.
+    """
+    deadline_at = time.monotonic() + get_batch_deadline_seconds(context)
+    response_cache = get_response_cache()
+    results = [None] * len(expressions)
+    pending = {}
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(int(os.environ.get('BATCH_MAX_CONCURRENCY', DEFAULT_BATCH_MAX_CONCURRENCY)), 1)
+    )
+    try:
+        for index, expression in enumerate(expressions):
+            if not isinstance(expression, str) or not expression.strip():
+                results[index] = (400, {'error': 'Each expression must be a non-empty string.'})
+                continue
+
+            limit_error = admission.check_limits(expression)
+            if limit_error:
+                results[index] = (400, {'error': limit_error})
+                continue
+
+            local_result = local_validation(expression)
+            if local_result is not None:
+                locally_rejected = not local_result[0]
+            else:
+                locally_rejected = admission.classify(expression) == admission.TIER_REJECTED
+            if locally_rejected or response_cache.memory.get(tutoring_cache_key(expression)) is not None:
+                results[index] = solve_batch_item(client, expression)
+            else:
+                # Run each item in a copy of this context so its spans land on the request
+                context_copy = contextvars.copy_context()
+                pending[executor.submit(context_copy.run, solve_batch_item, client, expression)] = index
+
+        if pending:
+            wait(pending, timeout=max(deadline_at - time.monotonic(), 0))
+        for future, index in pending.items():
+            if future.done():
+                results[index] = future.result()
+            else:
+                results[index] = (504, {'error': 'Timed out before this expression could be explained.'})
+    finally:
+        # Don't hold the response for work that missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return [
+        dict(body, expression=expression, status=status_code)
+        for expression, (status_code, body) in zip(expressions, results)
+    ]
+
+def process_batch(client, expressions, context=None):
+    """
+    Validate and explain a list of expressions.
+
+    Args:
+        client: The Anthropic client
+        expressions (list): The expressions submitted by the student
+        context: The Lambda context
+
+    Returns:
+        dict: The API Gateway response
+    """
+    max_expressions = int(os.environ.get('BATCH_MAX_EXPRESSIONS', DEFAULT_BATCH_MAX_EXPRESSIONS))
+    if len(expressions) > max_expressions:
+        return build_response(400, {
+            'error': f'Too many expressions. Please send at most {max_expressions} at a time.'
+        })
+
+    results = solve_batch(client, expressions, context)
+    return build_response(200, {
+        'success': True,
+        'results': results
+    })
+
+def format_sse_event(event, data):
+    """Frame one server-sent event carrying a JSON payload."""
+    return f"event: {event}\ndata: {encode_json(data)}\n\n"
+
+def iter_explanation_events(client, expression, result=None):
+    """
+    Produce the tutoring explanation as server-sent events.
+
+    Emits a 'chunk' event per generated HTML fragment followed by a single
+    'done' event carrying the metadata of the JSON contract. Cached
+    explanations are sent as one chunk.
+
+    Args:
+        client: The Anthropic client
+        expression (str): An expression that passed check_expression
+        result (str): The exact answer if it was computed locally, otherwise None
+
+    Yields:
+        str: SSE frames
+    """
+    response_cache = get_response_cache()
+    plan = plan_tutoring_call(expression)
+    cache_key = tutoring_cache_key(expression, plan)
+    degraded = False
+    cached, cache_tier = response_cache.get(cache_key)
+    if cached is not None:
+        print(f"Explanation served from the {cache_tier} response cache")
+        yield format_sse_event('chunk', {'html': cached['explanation']})
+    else:
+        try:
+            for text, shared in stream_shared_explanation(client, expression, result, cache_key, response_cache, plan):
+                if shared:
+                    cached, cache_tier = ({'explanation': text}, 'coalesced')
+                yield format_sse_event('chunk', {'html': text})
+        except UpstreamUnavailable as e:
+            # Raised before the first chunk, so the local answer can stand in for the stream
+            if result is None:
+                raise
+            print(f"Serving a degraded response: {str(e)}")
+            metrics.increment('degraded_responses')
+            degraded = True
+            yield format_sse_event('chunk', {'html': fallback_explanation(expression, result)})
+
+    done = {
+        'success': True,
+        'formatted': True,
+        'cache': dict(response_cache.stats(), hit=cached is not None, tier=cache_tier)
+    }
+    if degraded:
+        done['degraded'] = True
+    if result is not None:
+        done['result'] = result
+    timings = requested_timings()
+    if timings is not None:
+        done['timings'] = timings
+    yield format_sse_event('done', done)
+
+def process_stream(client, expression):
+    """
+    Validate an expression and return the explanation as an event stream.
+
+    Validation errors keep the JSON 400 contract. API Gateway buffers the
+    Lambda response, so here the events arrive together; stream_server.py
+    serves the same events incrementally.
+
+    Args:
+        client: The Anthropic client
+        expression (str): The math expression submitted by the student
+
+    Returns:
+        dict: The API Gateway response
+    """
+    error, result = check_expression(client, expression)
+    if error:
+        return build_response(400, {'error': error})
+
+    try:
+        return build_stream_response(200, "".join(iter_explanation_events(client, expression, result)))
+    except UpstreamUnavailable as e:
+        return build_response(*degraded_response(expression, None, get_response_cache(), e))
+
+def lambda_handler(event, context):
+    # Trace the request so every stage and counter is logged as one EMF line
+    request_metrics = metrics.start_request()
+    # Anthropic calls are retried only while this request's deadline allows
+    deadline = resilience.start_deadline(context)
+    try:
+        response = handle_event(event, context)
+    finally:
+        resilience.finish_deadline(deadline)
+    response = compress_response(response, event.get('headers'))
+    resilience.record_breaker_state()
+    metrics.finish_request(request_metrics, response.get('statusCode'))
+    return response
+
+def handle_event(event, context):
     # Handle preflight OPTIONS request
     if event.get('httpMethod') == 'OPTIONS':
         return build_response(200, {})
     
-    # Get the parameter name from environment variables
-    parameter_name = os.environ['PARAMETER_NAME']
-    
-    session = boto3.session.Session()
-    ssm_client = session.client('ssm')
-    
     try:
-        print(f"Attempting to get parameter: {parameter_name}")
-        response = ssm_client.get_parameter(
-            Name=parameter_name,
-            WithDecryption=True
-        )
-        
-        api_key = response['Parameter']['Value']
-        
-        # Log key details safely for debugging
-        key_length = len(api_key) if api_key else 0
-        key_prefix = api_key[:4] if key_length >= 4 else api_key
-        key_suffix = api_key[-4:] if key_length >= 8 else ""
-        print(f"API Key retrieved - Length: {key_length}, Prefix: {key_prefix}, Suffix: {key_suffix}")
-        print(f"API Key format check - Starts with 'sk-ant-': {api_key.startswith('sk-ant-') if api_key else False}")
-        
-        # Initialize Anthropic client
-        client = Anthropic(api_key=api_key)
-        print("Successfully initialized Anthropic client")
-
         # Parse the incoming event
         try:
-            body = json.loads(event.get('body', '{}'))
-            expression = body.get('expression')
-            
-            if not expression:
-                return build_response(400, {
-                    'error': 'Missing required parameter. Please provide a math expression.'
-                })
-            
-            # Validate the expression using Claude
-            print("Validating expression with Claude...")
-            is_valid, is_math_problem, error_message = validate_with_claude(client, expression)
-            
-            # Return error if not a math problem
-            if not is_math_problem:
-                return build_response(400, {
-                    'error': 'The input does not appear to be a math problem. Please enter a valid mathematical expression.'
-                })
-            
-            # Return error if not solvable
-            if not is_valid:
-                return build_response(400, {
-                    'error': f'The math problem appears to be invalid: {error_message}'
-                })
-
-            # Create the message for Claude
-            prompt = f"""You are Jake's Calculator Buddy, a friendly and patient math tutor for students.
-            
-            A student has asked you to solve this math expression: {expression}
-            
-            Please:
-            1. Solve the expression step-by-step using basic arithmetic rules
-            2. Explain each step in simple, easy-to-understand language as if talking to a student
-            3. Use a friendly, encouraging tone
-            4. Avoid complex mathematical terminology unless absolutely necessary
-            5. If there's a mistake or the expression is invalid, kindly explain what's wrong and how to fix it
-            6. Include a simple real-world example that relates to this math concept if possible
-            
-            Your goal is to help the student not just get the answer, but understand the math concepts behind it.
-            """
-            
-            # Get response from Claude
-            print(f"Sending request to Anthropic API with key prefix: {key_prefix}...")
-            message = client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                temperature=0.5,
-                system="You are Jake's Calculator Buddy, a helpful and friendly math tutor that explains math concepts in simple terms. Format your response with HTML tags for better readability: use <h3> for section titles, <p> for paragraphs, <ol> and <li> for numbered steps, <strong> for emphasis, and <hr> for section dividers.",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-
-            # Properly extract the content from the response
-            # Handle the TextBlock structure in the Anthropic API response
-            print(f"Response received from Anthropic API. Type: {type(message.content)}")
-            
-            # Extract text based on the response structure
-            explanation = ""
-            if hasattr(message, 'content'):
-                content = message.content
-                if isinstance(content, list):
-                    # If content is a list of blocks
-                    print(f"Content is a list with {len(content)} items")
-                    text_parts = []
-                    for item in content:
-                        print(f"Item type: {type(item)}")
-                        if hasattr(item, 'text'):
-                            text_parts.append(item.text)
-                        elif hasattr(item, 'value'):
-                            text_parts.append(item.value)
-                        elif isinstance(item, str):
-                            text_parts.append(item)
-                        else:
-                            print(f"Unknown item format: {item}")
-                    explanation = " ".join(text_parts)
-                elif isinstance(content, str):
-                    # If content is already a string
-                    explanation = content
-                elif hasattr(content, 'text'):
-                    # If content is a single TextBlock
-                    explanation = content.text
-                elif hasattr(content, 'value'):
-                    explanation = content.value
-                else:
-                    # Fallback: convert to string representation
-                    explanation = str(content)
-            else:
-                explanation = str(message)
-            
-            print(f"Extracted explanation: {explanation[:100]}...")  # Log first 100 chars
-
-            return build_response(200, {
-                'explanation': explanation,
-                'success': True,
-                'formatted': True  # Flag to indicate the response contains HTML formatting
-            })
-            
-        except json.JSONDecodeError:
+            body = json.loads(event_body(event))
+        except INVALID_BODY_ERRORS:
             return build_response(400, {'error': 'Invalid JSON in request body'})
-        
+
+        detail, detail_error = parse_detail(body)
+        if detail_error:
+            return build_response(400, {'error': detail_error})
+
+        detail_token = use_detail(detail)
+        try:
+            return handle_body(body, context)
+        finally:
+            reset_detail(detail_token)
+
     except Exception as e:
         print(f"Error: {str(e)}")
         print(f"Error type: {type(e)}")
@@ -264,15 +1187,90 @@ def lambda_handler(event, context):
         traceback.print_exc()
         return build_response(500, {'error': f'Internal server error: {str(e)}'})
 
+def parse_detail(body):
+    """
+    Read the optional detail level from a request body.
+
+    Args:
+        body (dict): The parsed request body
+
+    Returns:
+        tuple: (detail, error) where detail is one of DETAIL_LEVELS or None,
+            and error is a message for a 400 response or None
+    """
+    detail = body.get('detail')
+    if detail is None:
+        return (None, None)
+    if isinstance(detail, str) and detail.strip().lower() in DETAIL_LEVELS:
+        return (detail.strip().lower(), None)
+    return (None, f"The detail parameter must be one of: {', '.join(DETAIL_LEVELS)}.")
+
+def handle_body(body, context):
+    """Route a parsed request body to the batch, stream or single-expression handler."""
+    expressions = body.get('expressions')
+    label_request(body)
+    if expressions is not None:
+        if not isinstance(expressions, list) or not expressions:
+            return build_response(400, {
+                'error': 'The expressions parameter must be a non-empty list of math expressions.'
+            })
+        return process_batch(lazy_anthropic_client(), expressions, context)
+
+    expression = body.get('expression')
+    
+    if not expression:
+        return build_response(400, {
+            'error': 'Missing required parameter. Please provide a math expression.'
+        })
+
+    # Oversized or binary input is refused before any network call
+    limit_error = admission.check_limits(expression)
+    if limit_error:
+        return build_response(400, {'error': limit_error})
+
+    # Reuse the API key and client cached on this warm container; nothing is
+    # fetched (or imported) until the request actually needs the API
+    client = lazy_anthropic_client()
+
+    # Streaming is opt-in; the JSON contract stays the default
+    handle = process_stream if body.get('stream') else process_expression
+
+    try:
+        return handle(client, expression)
+    except Exception as e:
+        if not is_authentication_error(e):
+            raise
+        # The key may have been rotated since it was cached; refresh it once
+        print("Anthropic rejected the cached API key, refreshing from SSM")
+        invalidate_anthropic_client()
+        return handle(get_anthropic_client(), expression)
+
+def label_request(body):
+    """Record the route of the traced request and whether it asked for timings."""
+    request_metrics = metrics.current_request()
+    if request_metrics is None:
+        return
+    if body.get('expressions') is not None:
+        request_metrics.route = 'batch'
+    else:
+        request_metrics.route = 'stream' if body.get('stream') else 'single'
+    if body.get('timings') is True:
+        request_metrics.return_timings = True
+
+def requested_timings():
+    """Return the timings block for the current request if it should be sent, otherwise None."""
+    request_metrics = metrics.current_request()
+    if request_metrics is None or not request_metrics.return_timings:
+        return None
+    return request_metrics.timings()
+
 def build_response(status_code, body):
-    """Helper function to build CORS-compliant responses."""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'OPTIONS,POST',
-            'Access-Control-Allow-Headers': 'Content-Type'
-        },
-        'body': json.dumps(body)
-    }
+    """Helper function to build CORS-compliant responses (see responses.py)."""
+    timings = requested_timings()
+    if timings is not None:
+        body = dict(body, timings=timings)
+    return json_response(status_code, body)
+
+def build_stream_response(status_code, body):
+    """Helper function to build a CORS-compliant server-sent events response."""
+    return stream_response(status_code, body)
@@ -0,0 +1,556 @@
+import ast
+import functools
+import math
+import re
+import unicodedata
+from collections import namedtuple
+from fractions import Fraction
+
+IDENTIFIER = re.compile(r'[a-zA-Z_]+')
+SQUARE_ROOT_OF_NUMBER = re.compile(r'√\s*(\d+(?:\.\d+)?)')
+
+# Unicode operators students paste from documents, mapped to their ASCII form
+UNICODE_OPERATORS = {
+    '×': '*', '·': '*', '∗': '*', '÷': '/', '∕': '/',
+    '−': '-', '–': '-', '—': '-',
+}
+
+# Characters the local engine understands; anything else is left to Claude
+ARITHMETIC_CHARS = re.compile(
+    r'^[\d\s\.\+\-\*\/\^\%\(\)\[\]\{\}√,a-zA-Z' + re.escape(''.join(UNICODE_OPERATORS)) + r']*$'
+)
+
+# One alternation scanned left to right splits an expression into tokens in a
+# single pass; group 1 captures the whitespace before each token
+TOKEN_PATTERN = re.compile(r'''
+    (\s*)
+    (?:
+        (\d+(?:\.\d*)?|\.\d+)
+      | ([^\W\d_]+)
+      | ([-+*/^%])
+      | ([(\[{])
+      | ([)\]}])
+      | ([=<>,√])
+      | (\S)
+    )''', re.VERBOSE)
+TOKEN_KINDS = (None, None, 'number', 'word', 'op', 'open', 'close', 'symbol', 'other')
+
+# Whitespace next to these tokens is insignificant in the canonical form
+SYMBOLIC_KINDS = frozenset(['op', 'open', 'close', 'symbol'])
+
+# Bracket matching and operator adjacency rules for scan_signals
+OPENING_BRACKETS = {')': '(', ']': '[', '}': '{'}
+BINARY_ONLY_OPERATORS = frozenset(['+', '*', '/', '^'])
+
+# Token streams and canonical forms of short expressions are cached, so the
+# validation memo, the response cache and basic_validation share one scan of a
+# request's input
+TOKEN_CACHE_SIZE = 512
+TOKEN_CACHE_MAX_LENGTH = 2048
+
+# Guard rails so a short input like "9^9^9" can't pin the CPU
+MAX_EXPONENT = 1000
+MAX_RESULT_DIGITS = 1000
+
+# One operation of a step trace, written with the values it was applied to, e.g.
+# Step('3 × 4', '12'); see trace_expression
+Step = namedtuple('Step', ['expression', 'value'])
+
+# Longer traces aren't narrated; the tutor works through the expression itself
+MAX_TRACE_STEPS = 30
+
+# How each operator is written in a step
+STEP_OPERATORS = {ast.Add: '+', ast.Sub: '-', ast.Mult: '×', ast.Div: '÷', ast.Mod: 'mod', ast.Pow: '^'}
+
+
+class UnsupportedExpression(Exception):
+    """The expression is outside what the local engine can decide, so ask Claude."""
+
+
+class LocalEvaluationError(Exception):
+    """The expression is arithmetic but definitely not solvable (e.g. division by zero)."""
+
+
+def _sqrt(x):
+    if x < 0:
+        raise UnsupportedExpression("Square root of a negative number")
+    if isinstance(x, Fraction):
+        # Keep perfect squares exact: sqrt(16) -> 4, sqrt(9/4) -> 3/2
+        num, den = math.isqrt(x.numerator), math.isqrt(x.denominator)
+        if num * num == x.numerator and den * den == x.denominator:
+            return Fraction(num, den)
+    return math.sqrt(x)
+
+
+def _log(x, fn):
+    if x <= 0:
+        raise UnsupportedExpression("Logarithm of a non-positive number")
+    return fn(x)
+
+
+def _round(x, ndigits=0):
+    # Halves round away from zero as students are taught; Python's round sends them to the even neighbour
+    ndigits = int(ndigits)
+    if abs(ndigits) > MAX_RESULT_DIGITS:
+        raise UnsupportedExpression("Too many digits to round to locally")
+    scale = Fraction(10) ** ndigits
+    rounded = math.floor(abs(Fraction(x)) * scale + Fraction(1, 2)) / scale
+    return rounded if x >= 0 else -rounded
+
+
+def _angle(x):
+    # sin(30) usually means degrees to a student but radians to math.sin, so let Claude decide
+    raise UnsupportedExpression("Trigonometric functions could be in degrees or radians")
+
+
+FUNCTIONS = {
+    'sqrt': _sqrt,
+    'abs': abs,
+    'sin': _angle,
+    'cos': _angle,
+    'tan': _angle,
+    'log': lambda x: _log(x, math.log10),
+    'ln': lambda x: _log(x, math.log),
+    'exp': lambda x: math.exp(x),
+    'pow': lambda x, y: _power(x, y),
+    'round': _round,
+    'floor': lambda x: Fraction(math.floor(x)),
+    'ceil': lambda x: Fraction(math.ceil(x)),
+}
+
+CONSTANTS = {
+    'pi': math.pi,
+    'e': math.e,
+}
+
+
+def _is_exact(value):
+    return isinstance(value, Fraction)
+
+
+def _power(base, exponent):
+    if _is_exact(exponent) and exponent.denominator == 1:
+        if abs(exponent) > MAX_EXPONENT:
+            raise UnsupportedExpression("Exponent too large to evaluate locally")
+        if base == 0 and exponent < 0:
+            raise LocalEvaluationError("Division by zero is undefined.")
+        if _is_exact(base):
+            # Estimate the size first, so (10^999)^1000 isn't built just to be rejected by _check_size
+            largest = max(abs(base.numerator), base.denominator)
+            if largest > 1 and abs(exponent) * math.log10(largest) > MAX_RESULT_DIGITS:
+                raise UnsupportedExpression("Result too large to evaluate locally")
+            return base ** int(exponent)
+    if base < 0:
+        # Fractional powers of negative numbers are complex
+        raise UnsupportedExpression("Fractional power of a negative number")
+    try:
+        return float(base) ** float(exponent)
+    except OverflowError:
+        raise UnsupportedExpression("Result too large to evaluate locally")
+
+
+def _check_size(value):
+    if _is_exact(value):
+        if len(str(abs(value.numerator))) > MAX_RESULT_DIGITS or len(str(value.denominator)) > MAX_RESULT_DIGITS:
+            raise UnsupportedExpression("Result too large to evaluate locally")
+    elif math.isinf(value) or math.isnan(value):
+        raise UnsupportedExpression("Result is not a finite number")
+    return value
+
+
+def _normalise(expression):
+    text = unicodedata.normalize('NFKC', expression)
+    for symbol, ascii_symbol in UNICODE_OPERATORS.items():
+        # str.replace is much faster than str.translate on non-ASCII text
+        if symbol in text:
+            text = text.replace(symbol, ascii_symbol)
+    return text.replace('**', '^').lower()
+
+
+def _scan(expression):
+    text = _normalise(expression)
+    return tuple([
+        (TOKEN_KINDS[match.lastindex], match.group(match.lastindex), match.group(1) != '')
+        for match in TOKEN_PATTERN.finditer(text)
+    ])
+
+
+_scan_cached = functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(_scan)
+
+
+def tokenize(expression):
+    """
+    Split an expression into tokens in one linear scan.
+
+    The text is NFKC-normalised, Unicode operators are mapped to ASCII, '**'
+    is written as '^' and letters are lowercased first, so the tokens of
+    "2 × 3" and "2*3" agree.
+
+    Args:
+        expression (str): The expression as typed by the student
+
+    Returns:
+        tuple: (kind, text, spaced) tuples, where kind is 'number', 'word',
+            'op', 'open', 'close', 'symbol' or 'other', and spaced says whether
+            whitespace preceded the token
+    """
+    if len(expression) <= TOKEN_CACHE_MAX_LENGTH:
+        return _scan_cached(expression)
+    return _scan(expression)
+
+
+def is_zero_number(text):
+    """Return True for number text whose value is zero, such as 0, 00 or 0.0."""
+    return not text.strip('0.')
+
+
+ExpressionSignals = namedtuple('ExpressionSignals', [
+    'tokens', 'numbers', 'operators', 'brackets', 'relations', 'functions', 'words',
+    'max_depth', 'bracket_error', 'divides_by_zero', 'consecutive_operators'
+])
+ExpressionSignals.__doc__ = """
+Structural facts about an expression, read off its tokens by scan_signals.
+
+Attributes:
+    tokens (int): Number of tokens
+    numbers (int): Number literals
+    operators (int): Arithmetic operators (+ - * / ^ %)
+    brackets (int): Opening and closing brackets
+    relations (int): '=', '<', '>' and '√'
+    functions (int): Words naming a function the local engine knows, like sin
+    words (tuple): The lowercased words, in order
+    max_depth (int): Deepest bracket nesting
+    bracket_error (str): The first unmatched bracket, or None
+    divides_by_zero (bool): Whether a '/' is followed by a zero literal
+    consecutive_operators (bool): Whether a binary operator follows another operator
+"""
+
+
+def _signals(expression):
+    numbers = operators = brackets = relations = functions = max_depth = 0
+    words = []
+    stack = []
+    bracket_error = None
+    divides_by_zero = False
+    consecutive_operators = False
+    previous_kind = None
+    previous_text = None
+
+    tokens = tokenize(expression)
+    for kind, text, _ in tokens:
+        if kind == 'number':
+            numbers += 1
+            if previous_text == '/' and is_zero_number(text):
+                divides_by_zero = True
+        elif kind == 'op':
+            operators += 1
+            # A binary operator straight after another operator; unary minus is fine
+            if previous_kind == 'op' and previous_text != '%' and text in BINARY_ONLY_OPERATORS:
+                consecutive_operators = True
+        elif kind == 'open':
+            brackets += 1
+            stack.append(text)
+            max_depth = max(max_depth, len(stack))
+        elif kind == 'close':
+            brackets += 1
+            if stack and stack[-1] == OPENING_BRACKETS[text]:
+                stack.pop()
+            elif bracket_error is None:
+                bracket_error = text
+        elif kind == 'word':
+            words.append(text)
+            if text in FUNCTIONS:
+                functions += 1
+        elif kind == 'symbol' and text != ',':
+            relations += 1
+        previous_kind = kind
+        previous_text = text
+
+    if bracket_error is None and stack:
+        bracket_error = stack[-1]
+
+    return ExpressionSignals(
+        len(tokens), numbers, operators, brackets, relations, functions, tuple(words),
+        max_depth, bracket_error, divides_by_zero, consecutive_operators
+    )
+
+
+_signals_cached = functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(_signals)
+
+
+def scan_signals(expression):
+    """
+    Read the structural signals of an expression in one pass over its tokens.
+
+    Brackets are matched with a stack, so misordered brackets like ")(" are
+    caught, and operator adjacency and zero divisors are read off
+    neighbouring tokens.
+
+    Args:
+        expression (str): The expression as typed by the student
+
+    Returns:
+        ExpressionSignals: The counts and flags described on ExpressionSignals
+    """
+    if len(expression) <= TOKEN_CACHE_MAX_LENGTH:
+        return _signals_cached(expression)
+    return _signals(expression)
+
+
+def _canonicalize(expression):
+    parts = []
+    previous_symbolic = True
+    for kind, text, spaced in tokenize(expression):
+        # Keep one space between words and numbers, none around operators and brackets
+        symbolic = kind in SYMBOLIC_KINDS
+        if spaced and not symbolic and not previous_symbolic:
+            parts.append(' ')
+        parts.append(text)
+        previous_symbolic = symbolic
+    return ''.join(parts)
+
+
+_canonicalize_cached = functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(_canonicalize)
+
+
+def canonicalize_expression(expression):
+    """
+    Normalise an expression so trivially different spellings share cache entries.
+
+    Applies Unicode NFKC normalisation, maps Unicode operators to ASCII, writes
+    powers as '^', lowercases, and removes insignificant whitespace, so
+    "2 × 3" and "2*3" canonicalise to the same string.
+
+    Args:
+        expression (str): The expression as typed by the student
+
+    Returns:
+        str: The canonical form of the expression
+    """
+    if len(expression) <= TOKEN_CACHE_MAX_LENGTH:
+        return _canonicalize_cached(expression)
+    return _canonicalize(expression)
+
+
+def to_python_syntax(expression):
+    """
+    Rewrite calculator notation into a Python expression the ast module can parse.
+
+    Args:
+        expression (str): The expression as typed by the student
+
+    Returns:
+        str: The equivalent Python expression source
+
+    Raises:
+        UnsupportedExpression: If the expression uses anything beyond plain arithmetic
+    """
+    if not ARITHMETIC_CHARS.match(expression):
+        raise UnsupportedExpression("Expression contains characters the local engine does not handle")
+
+    for name in IDENTIFIER.findall(expression):
+        if name.lower() not in FUNCTIONS and name.lower() not in CONSTANTS:
+            raise UnsupportedExpression(f"Unknown name '{name}'")
+
+    source = SQUARE_ROOT_OF_NUMBER.sub(r'sqrt(\1)', expression)
+    source = source.replace('√', 'sqrt')
+    for symbol, ascii_symbol in UNICODE_OPERATORS.items():
+        source = source.replace(symbol, ascii_symbol)
+    source = source.replace('^', '**')
+    source = source.replace('[', '(').replace(']', ')').replace('{', '(').replace('}', ')')
+    return source.lower()
+
+
+def _evaluate_node(node, steps=None):
+    if isinstance(node, ast.Expression):
+        return _evaluate_node(node.body, steps)
+
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        if isinstance(node.value, float) and not math.isfinite(node.value):
+            # A literal like 1e400 overflows to inf when Python parses it
+            raise UnsupportedExpression("Number too large to evaluate locally")
+        # Parse the literal as a decimal so 0.1 + 0.2 is exactly 3/10
+        return Fraction(repr(node.value)) if isinstance(node.value, float) else Fraction(node.value)
+
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _evaluate_node(node.operand, steps)
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        if steps is not None and not isinstance(node.operand, ast.Constant):
+            steps.append(Step(f"-({_step_number(operand)})", _step_number(-operand)))
+        return -operand
+
+    if isinstance(node, ast.BinOp):
+        left = _evaluate_node(node.left, steps)
+        right = _evaluate_node(node.right, steps)
+        value = _binary_operation(node.op, left, right)
+        if steps is not None:
+            steps.append(Step(
+                f"{_step_operand(left)} {STEP_OPERATORS[type(node.op)]} {_step_operand(right)}", _step_number(value)
+            ))
+        return value
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords:
+        args = [_evaluate_node(arg, steps) for arg in node.args]
+        try:
+            result = FUNCTIONS[node.func.id](*args)
+        except TypeError:
+            raise LocalEvaluationError(f"Wrong number of arguments for {node.func.id}().")
+        except (OverflowError, ValueError):
+            raise UnsupportedExpression(f"{node.func.id}() is out of range for local evaluation")
+        result = _check_size(result)
+        if steps is not None:
+            steps.append(Step(f"{node.func.id}({', '.join(_step_number(arg) for arg in args)})", _step_number(result)))
+        return result
+
+    raise UnsupportedExpression(f"Unsupported syntax: {type(node).__name__}")
+
+
+def _binary_operation(op, left, right):
+    if isinstance(op, ast.Add):
+        return _check_size(left + right)
+    if isinstance(op, ast.Sub):
+        return _check_size(left - right)
+    if isinstance(op, ast.Mult):
+        return _check_size(left * right)
+    if isinstance(op, (ast.Div, ast.Mod)):
+        if right == 0:
+            raise LocalEvaluationError("Division by zero is undefined.")
+        if isinstance(op, ast.Div):
+            return _check_size(left / right)
+        return _check_size(left % right)
+    if isinstance(op, ast.Pow):
+        return _check_size(_power(left, right))
+    raise UnsupportedExpression(f"Unsupported operator: {type(op).__name__}")
+
+
+def evaluate_expression(expression):
+    """
+    Safely evaluate a plain arithmetic expression without eval().
+
+    Rational arithmetic (+ - * / % and integer powers) is exact; functions such
+    as sqrt or log fall back to floating point. log is base 10 and ln is the
+    natural logarithm. sin, cos and tan are left to Claude, since the unit of
+    the angle is ambiguous.
+
+    Args:
+        expression (str): The expression to evaluate
+
+    Returns:
+        Fraction or float: The value of the expression
+
+    Raises:
+        UnsupportedExpression: If the expression is not plain arithmetic
+        LocalEvaluationError: If the expression is arithmetic but invalid
+    """
+    return _evaluate(_parse(expression))
+
+
+def trace_expression(expression):
+    """
+    Evaluate an expression like evaluate_expression, recording every step.
+
+    The parse tree is walked in order of operations (brackets, then powers,
+    then multiplication and division, then addition and subtraction, left to
+    right), and each operation is recorded with the exact values it was
+    applied to and its result, e.g. "2 + 3 * 4" gives the steps "3 × 4 = 12"
+    and "2 + 12 = 14". Traces of expressions up to TOKEN_CACHE_MAX_LENGTH
+    characters are cached.
+
+    Args:
+        expression (str): The expression to evaluate
+
+    Returns:
+        tuple: (value, steps) where steps is a tuple of Step in the order they're done
+
+    Raises:
+        UnsupportedExpression: If the expression is not plain arithmetic
+        LocalEvaluationError: If the expression is arithmetic but invalid
+    """
+    if len(expression) <= TOKEN_CACHE_MAX_LENGTH:
+        return _trace_cached(expression)
+    return _trace(expression)
+
+
+def _trace(expression):
+    steps = []
+    value = _evaluate(_parse(expression), steps)
+    return (value, tuple(steps))
+
+
+_trace_cached = functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(_trace)
+
+
+def _parse(expression):
+    source = to_python_syntax(expression)
+    if scan_signals(expression).consecutive_operators:
+        # Python reads "5 + + 3" as a unary plus; basic_validation rejects it, so do the same
+        raise LocalEvaluationError("Expression contains consecutive operators.")
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError:
+        # Notation Python can't parse, like "50%" or "sin 30", may still mean something to a student
+        raise UnsupportedExpression("Expression uses notation the local engine can't parse")
+    except (RecursionError, MemoryError, ValueError):
+        raise UnsupportedExpression("Expression is too deeply nested to parse locally")
+    if isinstance(tree.body, (ast.Constant, ast.Name)):
+        # A bare number isn't a problem to solve; let Claude decide what was meant
+        raise UnsupportedExpression("Expression has no operations to perform")
+    return tree
+
+
+def _evaluate(tree, steps=None):
+    try:
+        return _evaluate_node(tree, steps)
+    except RecursionError:
+        raise UnsupportedExpression("Expression is too deeply nested to evaluate locally")
+    except (OverflowError, ValueError):
+        # e.g. a huge exact value mixed with a float like pi
+        raise UnsupportedExpression("Expression is out of range for local evaluation")
+
+
+def _step_number(value):
+    """Write a value for a step: like format_number, but without the decimal approximation."""
+    return format_number(value).split(' (about ', 1)[0]
+
+
+def _step_operand(value):
+    text = _step_number(value)
+    # Bracket negative numbers and fractions so "2 - (-3)" and "(1/3) × 3" read unambiguously
+    return f"({text})" if value < 0 or '/' in text else text
+
+
+def format_number(value):
+    """
+    Format an evaluation result for display in the tutoring prompt.
+
+    Args:
+        value (Fraction or float): A value returned by evaluate_expression
+
+    Returns:
+        str: "4", "2.5", "1/3 (about 0.333333333333)" or a float rendering
+    """
+    if _is_exact(value):
+        if value.denominator == 1:
+            return str(value.numerator)
+        # Terminating decimals (denominator only has factors 2 and 5) print exactly
+        denominator = value.denominator
+        places = 0
+        for factor in (2, 5):
+            count = 0
+            while denominator % factor == 0:
+                denominator //= factor
+                count += 1
+            places = max(places, count)
+        if denominator == 1:
+            scaled = abs(value.numerator) * 10 ** places // value.denominator
+            whole, fraction = divmod(scaled, 10 ** places)
+            sign = '-' if value < 0 else ''
+            return f"{sign}{whole}.{str(fraction).zfill(places)}"
+        return f"{value.numerator}/{value.denominator} (about {float(value):.12g})"
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.12g}"
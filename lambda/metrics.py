@@ -0,0 +1,220 @@
+"""
+Lightweight per-request tracing: stage spans, counters and CloudWatch EMF logs.
+
+lambda_handler starts a RequestMetrics for each invocation. Code further down
+the stack records into whichever request is current through the module-level
+span(), increment() and record_usage() helpers, which do nothing outside a
+request. When the request finishes, one JSON log line in CloudWatch Embedded
+Metric Format is printed, so every stage and counter becomes a metric without
+any API calls.
+
+Environment:
+    METRICS_ENABLED: set to false to turn tracing off entirely (default true)
+    METRICS_NAMESPACE: CloudWatch namespace (default CalculatorBuddy)
+    RETURN_TIMINGS: add a timings block to every response (default false;
+        a request can also ask for one with "timings": true)
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+
+DEFAULT_NAMESPACE = "CalculatorBuddy"
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def metrics_enabled():
+    return os.environ.get('METRICS_ENABLED', 'true').lower() != 'false'
+
+
+class _Span:
+    """Context manager adding its elapsed time to a stage of a RequestMetrics."""
+
+    __slots__ = ('request_metrics', 'name', 'started')
+
+    def __init__(self, request_metrics, name):
+        self.request_metrics = request_metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = self.request_metrics.clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.request_metrics.add_time(self.name, self.request_metrics.clock() - self.started)
+        return False
+
+
+class _NullSpan:
+    """Span used when no request is being traced."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class RequestMetrics:
+    """
+    Stage timings and counters for one request.
+
+    Stage times accumulate, so a stage entered several times (or from several
+    batch threads at once) reports its total time.
+
+    Attributes:
+        stages (dict): Stage name -> accumulated seconds
+        counters (dict): Counter name -> value
+        route (str): How the request was handled, used as the EMF dimension
+        return_timings (bool): Whether responses should carry a timings block
+    """
+
+    def __init__(self, route="unknown", clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.stages = {}
+        self.counters = {}
+        self.route = route
+        self.return_timings = os.environ.get('RETURN_TIMINGS', 'false').lower() == 'true'
+        self._lock = threading.Lock()
+        self._token = None
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def elapsed_ms(self):
+        return (self.clock() - self.started) * 1000
+
+    def timings(self):
+        """Return the timings block included in responses."""
+        with self._lock:
+            return {
+                'total_ms': round(self.elapsed_ms(), 3),
+                'stages': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+                'counters': dict(self.counters)
+            }
+
+    def to_emf(self, status_code=None, namespace=None, timestamp=None):
+        """
+        Build the CloudWatch Embedded Metric Format document for this request.
+
+        Args:
+            status_code (int): The response status, logged as a property
+            namespace (str): CloudWatch namespace, defaults to METRICS_NAMESPACE
+            timestamp (float): Epoch seconds, defaults to now
+
+        Returns:
+            dict: The EMF log document
+        """
+        timings = self.timings()
+        values = {'total_ms': timings['total_ms']}
+        definitions = [{'Name': 'total_ms', 'Unit': 'Milliseconds'}]
+        for name, ms in timings['stages'].items():
+            values[f"{name}_ms"] = ms
+            definitions.append({'Name': f"{name}_ms", 'Unit': 'Milliseconds'})
+        for name, count in timings['counters'].items():
+            values[name] = count
+            definitions.append({'Name': name, 'Unit': 'Count'})
+
+        document = {
+            '_aws': {
+                'Timestamp': int((timestamp if timestamp is not None else time.time()) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace or os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE),
+                    'Dimensions': [['Route']],
+                    'Metrics': definitions
+                }]
+            },
+            'Route': self.route,
+        }
+        if status_code is not None:
+            document['StatusCode'] = status_code
+        document.update(values)
+        return document
+
+
+def start_request(route="unknown"):
+    """
+    Begin tracing a request in the current context.
+
+    Returns:
+        RequestMetrics: The new request, or None if METRICS_ENABLED is false
+    """
+    if not metrics_enabled():
+        return None
+    request_metrics = RequestMetrics(route)
+    request_metrics._token = _current.set(request_metrics)
+    return request_metrics
+
+
+def finish_request(request_metrics, status_code=None, emit=True):
+    """
+    Stop tracing a request, emitting its EMF log line.
+
+    Args:
+        request_metrics (RequestMetrics): The request returned by start_request
+        status_code (int): The response status, logged as a property
+        emit (bool): False to drop the request without logging it
+    """
+    if request_metrics is None:
+        return
+    if emit:
+        print(json.dumps(request_metrics.to_emf(status_code)))
+    if request_metrics._token is not None:
+        try:
+            _current.reset(request_metrics._token)
+        except ValueError:
+            # Finished from a different context than it was started in
+            _current.set(None)
+        request_metrics._token = None
+
+
+def current_request():
+    """Return the RequestMetrics being recorded in this context, or None."""
+    return _current.get()
+
+
+def span(name):
+    """Time a stage of the current request (a no-op outside a request)."""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return _NULL_SPAN
+    return _Span(request_metrics, name)
+
+
+def increment(name, value=1):
+    """Add to a counter of the current request (a no-op outside a request)."""
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.increment(name, value)
+
+
+def record_usage(message):
+    """Count an Anthropic call and the tokens it reports in message.usage, including prompt cache reads and writes."""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return
+    request_metrics.increment('anthropic_calls')
+    usage = getattr(message, 'usage', None)
+    for field, counter in (('input_tokens', 'tokens_in'), ('output_tokens', 'tokens_out'),
+                           ('cache_read_input_tokens', 'tokens_cache_read'),
+                           ('cache_creation_input_tokens', 'tokens_cache_write')):
+        value = getattr(usage, field, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            request_metrics.increment(counter, value)
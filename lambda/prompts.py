@@ -0,0 +1,191 @@
+"""
+Registry of the prompts sent to Claude.
+
+Each prompt is a PromptTemplate, built once at import:
+    - persona: the one-line system prompt
+    - instructions: the long static instructions, identical for every request
+    - user: a str.format template holding only the per-request fields
+
+Only the user message changes between requests, so the system argument (the
+persona and instructions as two text blocks) can be built ahead of time. The
+instructions block is marked with cache_control, so Anthropic prompt caching
+serves the static prefix from its cache instead of billing it at the full
+input price. Anthropic only caches prefixes above a minimum length (1024
+tokens on Sonnet, 2048 on Haiku); shorter ones are silently billed as normal
+input, so the marker costs nothing there.
+
+Bump a template's version whenever its text changes. The versions feed the
+response cache keys (see prompt_versions), so explanations generated from an
+old prompt are no longer served.
+
+Environment:
+    PROMPT_CACHING: set to false to send the system prompt without
+        cache_control (default true)
+"""
+
+import os
+
+CACHE_CONTROL = {'type': 'ephemeral'}
+
+
+def prompt_caching_enabled():
+    return os.environ.get('PROMPT_CACHING', 'true').lower() != 'false'
+
+
+class PromptTemplate:
+    """
+    A versioned prompt with its static prefix precomputed.
+
+    Attributes:
+        name (str): Registry name, e.g. 'tutoring'
+        version (str): Changes whenever the prompt text changes
+        cached_system (list): The system argument with cache_control on the instructions
+        plain_system (list): The same blocks without cache_control
+    """
+
+    def __init__(self, name, version, persona, instructions, user):
+        self.name = name
+        self.version = version
+        self.persona = persona
+        self.instructions = instructions
+        self.user = user
+        self.plain_system = [
+            {'type': 'text', 'text': persona},
+            {'type': 'text', 'text': instructions},
+        ]
+        self.cached_system = [
+            {'type': 'text', 'text': persona},
+            {'type': 'text', 'text': instructions, 'cache_control': CACHE_CONTROL},
+        ]
+
+    def system(self):
+        """Return the system argument, marked for prompt caching unless PROMPT_CACHING is false."""
+        return self.cached_system if prompt_caching_enabled() else self.plain_system
+
+    def render(self, **fields):
+        """Fill in the per-request user message."""
+        return self.user.format(**fields)
+
+    def system_text(self):
+        return system_text(self.plain_system)
+
+
+VALIDATION = PromptTemplate(
+    name='validation',
+    version='v2',
+    persona="You are a math validation assistant. Respond only with the requested JSON format.",
+    instructions="""Your only job is to determine if the input you are given is:
+1. A mathematical problem/expression
+2. Solvable using standard mathematical rules
+
+Respond with ONLY a JSON object with the following structure:
+{
+    "is_math_problem": true/false,
+    "is_solvable": true/false,
+    "error_message": "Specific error message if not solvable or not a math problem"
+}
+
+Do not include any other text in your response, just the JSON object.""",
+    user="Input: {expression}"
+)
+
+TUTORING_PERSONA = "You are Jake's Calculator Buddy, a helpful and friendly math tutor that explains math concepts in simple terms. Format your response with HTML tags for better readability: use <h3> for section titles, <p> for paragraphs, <ol> and <li> for numbered steps, <strong> for emphasis, and <hr> for section dividers."
+
+TUTORING = PromptTemplate(
+    name='tutoring',
+    version='v2',
+    persona=TUTORING_PERSONA,
+    instructions="""You are Jake's Calculator Buddy, a friendly and patient math tutor for students.
+
+When a student asks you to solve a math expression, please:
+1. Solve the expression step-by-step using basic arithmetic rules
+2. Explain each step in simple, easy-to-understand language as if talking to a student
+3. Use a friendly, encouraging tone
+4. Avoid complex mathematical terminology unless absolutely necessary
+5. If there's a mistake or the expression is invalid, kindly explain what's wrong and how to fix it
+6. Include a simple real-world example that relates to this math concept if possible
+
+If you are given the exact answer, make sure your explanation arrives at exactly that answer.
+
+Your goal is to help the student not just get the answer, but understand the math concepts behind it.""",
+    user="A student has asked you to solve this math expression: {expression}{answer_hint}{variant}"
+)
+
+# Used instead of TUTORING when the local engine has already worked out every step
+# (see math_engine.trace_expression), so the model only explains them
+NARRATION = PromptTemplate(
+    name='narration',
+    version='v1',
+    persona=TUTORING_PERSONA,
+    instructions="""You are Jake's Calculator Buddy, a friendly and patient math tutor for students.
+
+When a student asks you to solve a math expression, you are given the steps to solve it, already worked out in the order of operations, each with its exact value. Please:
+1. Explain the steps in the order given, one numbered step for each
+2. Use exactly the numbers given; don't redo or change any of the arithmetic
+3. Say briefly why each step comes next, e.g. multiplication before addition
+4. Explain each step in simple, easy-to-understand language, with a friendly, encouraging tone
+5. Include a simple real-world example that relates to this math concept if possible
+
+Finish with the exact answer you are given.
+
+Your goal is to help the student not just get the answer, but understand the math concepts behind it.""",
+    user="A student has asked you to solve this math expression: {expression}\n\n"
+         "The steps, worked out in order:\n{steps}\nThe exact answer, already computed for you, is: {result}{variant}"
+)
+
+COMBINED = PromptTemplate(
+    name='combined',
+    version='v2',
+    persona=TUTORING_PERSONA + " Always start with the verdict in the requested format.",
+    instructions="""You are Jake's Calculator Buddy, a friendly and patient math tutor for students.
+
+For each input a student submits, first decide whether the input is:
+1. A mathematical problem/expression
+2. Solvable using standard mathematical rules
+
+Write your verdict as a JSON object inside <verdict> tags, exactly like this:
+<verdict>{"is_math_problem": true/false, "is_solvable": true/false, "error_message": "Specific error message if not solvable or not a math problem"}</verdict>
+
+If the input is not a solvable math problem, stop after the verdict.
+
+Otherwise, write your explanation inside <explanation> tags. Please:
+1. Solve the expression step-by-step using basic arithmetic rules
+2. Explain each step in simple, easy-to-understand language as if talking to a student
+3. Use a friendly, encouraging tone
+4. Avoid complex mathematical terminology unless absolutely necessary
+5. Include a simple real-world example that relates to this math concept if possible
+
+Your goal is to help the student not just get the answer, but understand the math concepts behind it.""",
+    user="A student has submitted this input: {expression}{variant}"
+)
+
+PROMPTS = {template.name: template for template in (VALIDATION, TUTORING, NARRATION, COMBINED)}
+
+
+def prompt_versions():
+    """Return {name: version} for every registered prompt."""
+    return {name: template.version for name, template in PROMPTS.items()}
+
+
+def system_text(system):
+    """Flatten a system argument (a string or a list of text blocks) to plain text."""
+    if isinstance(system, str):
+        return system
+    return "\n\n".join(block.get('text', '') for block in system or [])
+
+
+def find_prompt(system):
+    """
+    Recognise which registered prompt a request was built from.
+
+    Args:
+        system: The request's system argument
+
+    Returns:
+        PromptTemplate or None
+    """
+    text = system_text(system)
+    for template in PROMPTS.values():
+        if template.system_text() == text:
+            return template
+    return None
@@ -0,0 +1,514 @@
+"""
+Client-side rate limiting for Anthropic calls.
+
+Anthropic limits each organisation's requests and tokens per minute, and
+answers 429 rate_limit_error once either runs out. Every response, errors
+included, carries anthropic-ratelimit-* headers saying how much of each limit
+is left and when it will be full again. The clients built in client_cache.py
+pass every response's headers to the container-wide RateLimiter, which uses
+them to slow down before the API starts refusing calls:
+    - two token buckets, one for requests and one for tokens. Each call
+      reserves one request, plus an estimate of its tokens (the prompt's
+      length plus max_tokens). When the call finishes, message.usage gives
+      back what it didn't use. The headers correct both buckets, so capacity
+      used by other containers is accounted for too
+    - an AIMD concurrency limit. Each successful call raises it by 1/limit,
+      about one more concurrent call per round of calls. A 429 or 529 halves
+      it, at most once per round
+    - a retry-after header holds back every call on the container until
+      the time the API asked for
+
+Until the first response arrives, the buckets are unlimited unless
+RATE_LIMIT_REQUESTS_PER_MINUTE or RATE_LIMIT_TOKENS_PER_MINUTE set them.
+
+A call that finds no capacity waits for it. An interactive request waits at
+most RATE_LIMIT_MAX_WAIT_SECONDS. After that, resilience.call_anthropic raises
+RateLimited, and the request takes the local fallback as for any other
+outage. Work that can wait, such as batch items, runs inside queueing(). It
+waits as long as the request's deadline allows, and 429s don't use up its
+retries.
+
+Environment:
+    RATE_LIMIT_ENABLED: set to false to turn the limiter off (default true)
+    RATE_LIMIT_REQUESTS_PER_MINUTE / RATE_LIMIT_TOKENS_PER_MINUTE: limits to
+        use until headers arrive (default 0, learnt from the headers)
+    RATE_LIMIT_MAX_WAIT_SECONDS: longest an interactive call waits for capacity (default 2)
+    RATE_LIMIT_INITIAL_CONCURRENCY: starting concurrency limit (default 8)
+    RATE_LIMIT_MAX_CONCURRENCY: ceiling for the additive increase (default 32)
+"""
+
+import contextlib
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from prompts import system_text
+
+DEFAULT_MAX_WAIT_SECONDS = 2
+DEFAULT_INITIAL_CONCURRENCY = 8
+DEFAULT_MAX_CONCURRENCY = 32
+
+# Anthropic's limits are per minute; used until a reset header gives the real refill rate
+LIMIT_WINDOW_SECONDS = 60
+
+# Rough prompt size estimate, good enough to reserve tokens before the call
+CHARS_PER_TOKEN = 4
+
+# Status codes telling us to send less: rate_limit_error and overloaded_error
+THROTTLE_STATUS_CODES = frozenset([429, 529])
+
+# How often acquire_async checks for a free concurrency slot
+ASYNC_POLL_SECONDS = 0.05
+
+HEADER_PREFIX = 'anthropic-ratelimit-'
+
+# What a response's headers say about one limit; reset_in is seconds until it is full again
+Limit = namedtuple('Limit', ['limit', 'remaining', 'reset_in'])
+
+_queueing = contextvars.ContextVar('rate_limit_queueing', default=False)
+
+
+def rate_limit_enabled():
+    return os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'false'
+
+
+def _env_number(name, default):
+    try:
+        return type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_max_wait_seconds():
+    """Return how long an interactive call may wait for rate-limit capacity."""
+    return _env_number('RATE_LIMIT_MAX_WAIT_SECONDS', float(DEFAULT_MAX_WAIT_SECONDS))
+
+
+@contextlib.contextmanager
+def queueing():
+    """Let Anthropic calls made inside the block wait for capacity up to the request's deadline."""
+    token = _queueing.set(True)
+    try:
+        yield
+    finally:
+        _queueing.reset(token)
+
+
+def is_queueing():
+    return _queueing.get()
+
+
+def _parse_reset(value, now):
+    """Convert an RFC 3339 reset timestamp to seconds from now."""
+    try:
+        reset_at = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max(reset_at.timestamp() - now, 0.0)
+
+
+def parse_rate_limit_headers(headers, now=None):
+    """
+    Read the rate-limit headers of an Anthropic response.
+
+    Args:
+        headers: The response headers (any mapping with lower-case get)
+        now (float): Wall-clock time the reset timestamps are measured from
+
+    Returns:
+        dict: 'requests' and 'tokens' map to a Limit, and 'retry_after' to
+            seconds. Missing or malformed entries are left out.
+    """
+    now = time.time() if now is None else now
+    parsed = {}
+    for name in ('requests', 'tokens'):
+        try:
+            limit = int(headers.get(f"{HEADER_PREFIX}{name}-limit"))
+            remaining = int(headers.get(f"{HEADER_PREFIX}{name}-remaining"))
+        except (TypeError, ValueError):
+            continue
+        reset = headers.get(f"{HEADER_PREFIX}{name}-reset")
+        parsed[name] = Limit(limit, remaining, _parse_reset(reset, now) if reset else None)
+
+    retry_after = headers.get('retry-after')
+    if retry_after is not None:
+        try:
+            parsed['retry_after'] = max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return parsed
+
+
+def estimate_tokens(request):
+    """
+    Estimate the tokens a Messages API request will count against the limit.
+
+    Args:
+        request (dict): Keyword arguments for client.messages.create
+
+    Returns:
+        int: Prompt tokens (from its length) plus max_tokens
+    """
+    characters = len(system_text(request.get('system')))
+    for message in request.get('messages') or []:
+        content = message.get('content', '')
+        if isinstance(content, list):
+            content = "".join(block.get('text', '') for block in content)
+        characters += len(content)
+    return characters // CHARS_PER_TOKEN + request.get('max_tokens', 0)
+
+
+def usage_tokens(usage):
+    """
+    Count the tokens a call used against the limit, or None if its usage is unknown.
+
+    Prompt cache reads are left out, since they don't count towards input token limits.
+    """
+    total = None
+    for field in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens'):
+        value = getattr(usage, field, None)
+        if isinstance(value, int) and not isinstance(value, bool):
+            total = (total or 0) + value
+    return total
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously up to its capacity.
+
+    A bucket without a capacity is unlimited until configure() gives it one,
+    from the environment or from the first rate-limit headers.
+
+    Attributes:
+        capacity (float): Most the bucket holds, or None for unlimited
+        refill_per_second (float): Refill rate
+        level (float): Tokens available now; negative after an oversized reservation
+    """
+
+    def __init__(self, capacity=None, clock=time.monotonic):
+        self.clock = clock
+        self.capacity = None
+        self.refill_per_second = None
+        self.level = None
+        self._updated = clock()
+        if capacity:
+            self.configure(capacity, capacity)
+
+    def configure(self, capacity, remaining, reset_in=None):
+        """
+        Set the capacity and level, e.g. from rate-limit headers.
+
+        The level only ever goes down here, since calls still in flight have
+        reserved tokens that the API hasn't counted yet.
+
+        Args:
+            capacity (int): The limit
+            remaining (int): What the API says is left
+            reset_in (float): Seconds until the bucket is full again, giving the refill rate
+        """
+        self._refill()
+        self.capacity = float(capacity)
+        self.level = min(self.level if self.level is not None else capacity, remaining, capacity)
+        if reset_in and remaining < capacity:
+            self.refill_per_second = (capacity - remaining) / reset_in
+        elif self.refill_per_second is None:
+            self.refill_per_second = capacity / LIMIT_WINDOW_SECONDS
+
+    def _refill(self):
+        now = self.clock()
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Return the seconds until amount can be taken (0 if it can be now)."""
+        self._refill()
+        if self.capacity is None:
+            return 0.0
+        # Something larger than the whole bucket goes once the bucket is full
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        if not self.refill_per_second:
+            return math.inf
+        return (needed - self.level) / self.refill_per_second
+
+    def take(self, amount):
+        self._refill()
+        if self.capacity is not None:
+            self.level -= amount
+
+    def give_back(self, amount):
+        self._refill()
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class Permit:
+    """
+    One call's reservation, returned by RateLimiter.acquire.
+
+    Attributes:
+        tokens (int): Tokens reserved for the call
+        round (int): The limiter's AIMD round when the call started
+        waited (float): Seconds spent waiting for capacity
+    """
+
+    __slots__ = ('tokens', 'round', 'waited')
+
+    def __init__(self, tokens, round, waited):
+        self.tokens = tokens
+        self.round = round
+        self.waited = waited
+
+
+class RateLimiter:
+    """
+    Request and token buckets plus an AIMD concurrency limit; see the module docstring.
+
+    Attributes:
+        concurrency_limit (float): Calls allowed in flight at once (the integer part counts)
+        in_flight (int): Calls holding a permit
+        waits (int): Calls that had to wait for capacity
+        rejections (int): Calls that gave up waiting
+        throttles (int): 429 and 529 responses seen
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0,
+                 initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, clock=time.monotonic):
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.concurrency_limit = float(min(max(initial_concurrency, 1), self.max_concurrency))
+        self.in_flight = 0
+        self.waits = 0
+        self.rejections = 0
+        self.throttles = 0
+        self._round = 0
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+
+    def _try_acquire(self, tokens):
+        """
+        Take a permit if there is capacity, otherwise say how long to wait.
+
+        Returns:
+            tuple: (granted, delay). delay is None when only a concurrency
+                slot is missing, since that frees up when a call finishes.
+        """
+        delay = max(self._blocked_until - self.clock(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if delay > 0:
+            return (False, delay)
+        if self.in_flight >= int(self.concurrency_limit):
+            return (False, None)
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        return (True, 0.0)
+
+    def _permit(self, tokens, started, waited):
+        if waited:
+            self.waits += 1
+        return Permit(tokens, self._round, self.clock() - started if waited else 0.0)
+
+    def acquire(self, tokens, max_wait=None):
+        """
+        Wait for capacity for one call.
+
+        Args:
+            tokens (int): Tokens to reserve, e.g. from estimate_tokens
+            max_wait (float): Longest to wait in seconds, or None to wait indefinitely
+
+        Returns:
+            Permit, or None if there won't be capacity within max_wait
+        """
+        with self._condition:
+            started = self.clock()
+            give_up_at = math.inf if max_wait is None else started + max(max_wait, 0.0)
+            waited = False
+            while True:
+                granted, delay = self._try_acquire(tokens)
+                if granted:
+                    return self._permit(tokens, started, waited)
+                left = give_up_at - self.clock()
+                if left <= 0 or (delay is not None and delay > left):
+                    # Waiting can't help, so don't hold the caller for nothing
+                    self.rejections += 1
+                    return None
+                timeout = min(delay if delay is not None else left, left)
+                # Without a max_wait, a call waiting for a slot sleeps until one is released
+                self._condition.wait(timeout if timeout != math.inf else None)
+                waited = True
+
+    async def acquire_async(self, tokens, max_wait=None):
+        """Counterpart of acquire that sleeps on the event loop instead of blocking it."""
+        # Already loaded by the running event loop; kept out of module scope for the sync handler
+        import asyncio
+
+        started = self.clock()
+        give_up_at = math.inf if max_wait is None else started + max(max_wait, 0.0)
+        waited = False
+        while True:
+            with self._condition:
+                granted, delay = self._try_acquire(tokens)
+                if granted:
+                    return self._permit(tokens, started, waited)
+                left = give_up_at - self.clock()
+                if left <= 0 or (delay is not None and delay > left):
+                    self.rejections += 1
+                    return None
+            await asyncio.sleep(min(delay if delay is not None else ASYNC_POLL_SECONDS, left))
+            waited = True
+
+    def observe(self, headers):
+        """Update the buckets from a response's rate-limit and retry-after headers."""
+        parsed = parse_rate_limit_headers(headers)
+        if not parsed:
+            return
+        with self._condition:
+            for name, bucket in (('requests', self.requests), ('tokens', self.tokens)):
+                if name in parsed:
+                    bucket.configure(*parsed[name])
+            if 'retry_after' in parsed:
+                self._blocked_until = max(self._blocked_until, self.clock() + parsed['retry_after'])
+            self._condition.notify_all()
+
+    def _release(self):
+        self.in_flight = max(self.in_flight - 1, 0)
+        self._condition.notify_all()
+
+    def finish(self, permit, usage=None):
+        """
+        Release a successful call's permit and raise the concurrency limit.
+
+        Args:
+            permit (Permit): From acquire
+            usage: The response's usage, so unused reserved tokens are given back
+        """
+        with self._condition:
+            used = usage_tokens(usage)
+            if used is not None and used < permit.tokens:
+                self.tokens.give_back(permit.tokens - used)
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            self._release()
+
+    def throttled(self, permit, retry_after=None):
+        """
+        Release the permit of a call answered with 429 or 529, halving the concurrency limit.
+
+        Only the first throttle of a round halves the limit; calls that started
+        before that halving were sent at the old limit.
+        """
+        with self._condition:
+            self.throttles += 1
+            if permit.round == self._round:
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                self._round += 1
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, self.clock() + retry_after)
+            self._release()
+
+    def failed(self, permit):
+        """Release the permit of a call that failed for any other reason."""
+        with self._condition:
+            self._release()
+
+    def cancel(self, permit):
+        """Release a permit whose call was never sent, giving back what it reserved."""
+        with self._condition:
+            self.requests.give_back(1)
+            self.tokens.give_back(permit.tokens)
+            self._release()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'concurrency_limit': self.concurrency_limit,
+                'in_flight': self.in_flight,
+                'requests_level': self.requests.level,
+                'tokens_level': self.tokens.level,
+                'waits': self.waits,
+                'rejections': self.rejections,
+                'throttles': self.throttles,
+            }
+
+
+class _NoRateLimit:
+    """Stands in for the RateLimiter when RATE_LIMIT_ENABLED is false."""
+
+    _permit = Permit(0, 0, 0.0)
+
+    def acquire(self, tokens, max_wait=None):
+        return self._permit
+
+    async def acquire_async(self, tokens, max_wait=None):
+        return self._permit
+
+    def observe(self, headers):
+        pass
+
+    def finish(self, permit, usage=None):
+        pass
+
+    def throttled(self, permit, retry_after=None):
+        pass
+
+    def failed(self, permit):
+        pass
+
+    def cancel(self, permit):
+        pass
+
+    def stats(self):
+        return {}
+
+
+def build_rate_limiter_from_env():
+    """Build a RateLimiter from the RATE_LIMIT_* environment variables."""
+    if not rate_limit_enabled():
+        return _NoRateLimit()
+    return RateLimiter(
+        requests_per_minute=_env_number('RATE_LIMIT_REQUESTS_PER_MINUTE', 0),
+        tokens_per_minute=_env_number('RATE_LIMIT_TOKENS_PER_MINUTE', 0),
+        initial_concurrency=_env_number('RATE_LIMIT_INITIAL_CONCURRENCY', DEFAULT_INITIAL_CONCURRENCY),
+        max_concurrency=_env_number('RATE_LIMIT_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)
+    )
+
+
+# Module-level limiter shared by every invocation on this container
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the container-wide RateLimiter, building it on first use."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = build_rate_limiter_from_env()
+        return _rate_limiter
+
+
+def reset_rate_limiter(limiter=None):
+    """Replace the container-wide limiter (None rebuilds it from the environment on next use)."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
+
+
+def observe_response(response):
+    """httpx response hook passing every Anthropic response's headers to the limiter."""
+    get_rate_limiter().observe(response.headers)
+
+
+async def observe_response_async(response):
+    """Async httpx response hook for the AsyncAnthropic client."""
+    get_rate_limiter().observe(response.headers)
@@ -0,0 +1,486 @@
+"""
+Deadlines, retries and a circuit breaker around Anthropic calls.
+
+lambda_handler starts a deadline for each request from the Lambda context's
+remaining time. call_anthropic() then:
+    - gives each call a timeout that fits inside that deadline (and under a
+      per-call cap, e.g. VALIDATION_TIMEOUT_SECONDS for validation)
+    - retries 429, 5xx and connection errors with full-jitter exponential
+      backoff, honouring retry-after, as long as the deadline allows
+    - counts failures in a container-wide circuit breaker. After
+      BREAKER_FAILURE_THRESHOLD consecutive failures the breaker opens and
+      calls fail immediately with CircuitOpenError, so the handler can go
+      straight to the local path. After BREAKER_RESET_SECONDS one trial
+      call is let through, and its success closes the breaker again.
+    - waits for capacity from the container-wide RateLimiter before each
+      attempt (see rate_limit.py), and tells it how the attempt went. A 429
+      means the API is up but asked us to slow down, so it goes to the
+      limiter rather than counting towards the breaker.
+
+When a call can't succeed (retries exhausted, deadline passed, breaker open
+or no rate-limit capacity in time) it raises an UpstreamUnavailable error. The client's own retries are
+turned off in client_cache.py, since they don't know about the deadline.
+
+Environment:
+    REQUEST_DEADLINE_SECONDS: deadline when no Lambda context says otherwise (default 25)
+    VALIDATION_TIMEOUT_SECONDS: cap on a single validation attempt (default 8)
+    ANTHROPIC_MAX_RETRIES: retries after the first attempt (default 2)
+    RETRY_BASE_DELAY_SECONDS / RETRY_MAX_DELAY_SECONDS: backoff range (default 0.5 / 4)
+    BREAKER_FAILURE_THRESHOLD: consecutive failures that open the breaker (default 5)
+    BREAKER_RESET_SECONDS: how long the breaker stays open (default 30)
+"""
+
+import contextlib
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+
+import metrics
+import rate_limit
+
+DEFAULT_DEADLINE_SECONDS = 25
+DEADLINE_MARGIN_SECONDS = 2
+DEFAULT_VALIDATION_TIMEOUT_SECONDS = 8
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BASE_DELAY_SECONDS = 0.5
+DEFAULT_RETRY_MAX_DELAY_SECONDS = 4
+DEFAULT_BREAKER_FAILURE_THRESHOLD = 5
+DEFAULT_BREAKER_RESET_SECONDS = 30
+
+# Don't start an attempt with less time than this left
+MIN_ATTEMPT_SECONDS = 0.5
+
+RETRYABLE_STATUS_CODES = frozenset([408, 409, 429])
+
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """The Anthropic API couldn't answer in time; use the local path instead."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """The circuit breaker is open, so the call wasn't attempted."""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """Not enough of the request's deadline is left for another attempt."""
+
+
+class RateLimited(UpstreamUnavailable):
+    """The rate limiter had no capacity for the call in time."""
+
+
+def _env_number(name, default):
+    try:
+        return type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker shared by every request on a container.
+
+    Attributes:
+        state (str): 'closed', 'open' or 'half_open'
+        opened (int): How many times the breaker has opened
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=DEFAULT_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and self.clock() - self._opened_at >= self.reset_seconds:
+                print("Circuit breaker half-open, letting one trial call through")
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print("Circuit breaker closed")
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                print(f"Circuit breaker opened after {self.failures} consecutive failures")
+                self.state = 'open'
+                self.opened += 1
+                self._opened_at = self.clock()
+
+    def release_trial(self):
+        """Free the half-open trial slot of a call that ended without a result, e.g. by being cancelled."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def is_open(self):
+        with self._lock:
+            return self.state != 'closed'
+
+
+def build_breaker_from_env():
+    return CircuitBreaker(
+        failure_threshold=_env_number('BREAKER_FAILURE_THRESHOLD', DEFAULT_BREAKER_FAILURE_THRESHOLD),
+        reset_seconds=_env_number('BREAKER_RESET_SECONDS', float(DEFAULT_BREAKER_RESET_SECONDS))
+    )
+
+
+# Module-level breaker shared by every invocation on this container
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker():
+    """Return the container-wide CircuitBreaker, building it on first use."""
+    global _breaker
+    with _breaker_lock:
+        if _breaker is None:
+            _breaker = build_breaker_from_env()
+        return _breaker
+
+
+def reset_breaker(breaker=None):
+    """Replace the container-wide breaker (None rebuilds it from the environment on next use)."""
+    global _breaker
+    with _breaker_lock:
+        _breaker = breaker
+
+
+def start_deadline(context=None, clock=time.monotonic):
+    """
+    Start the deadline for the current request.
+
+    Args:
+        context: The Lambda context (anything without get_remaining_time_in_millis is ignored)
+
+    Returns:
+        Token: Pass to finish_deadline
+    """
+    seconds = _env_number('REQUEST_DEADLINE_SECONDS', float(DEFAULT_DEADLINE_SECONDS))
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if callable(get_remaining):
+        seconds = min(seconds, get_remaining() / 1000.0 - DEADLINE_MARGIN_SECONDS)
+    return _deadline.set(clock() + max(seconds, 0))
+
+
+def finish_deadline(token):
+    try:
+        _deadline.reset(token)
+    except ValueError:
+        # Finished from a different context than it was started in
+        _deadline.set(None)
+
+
+def remaining_seconds(clock=time.monotonic):
+    """Return the seconds left before the current request's deadline (None outside a request)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - clock()
+
+
+def validation_timeout():
+    """Return the cap on a single validation attempt, so a slow verdict leaves time for the explanation."""
+    return _env_number('VALIDATION_TIMEOUT_SECONDS', float(DEFAULT_VALIDATION_TIMEOUT_SECONDS))
+
+
+def record_breaker_state():
+    """Add the breaker state to the current request's metrics."""
+    metrics.increment('breaker_open', 1 if get_breaker().is_open() else 0)
+
+
+def _loaded_anthropic():
+    """
+    Return the anthropic module if something has imported it, else None.
+
+    The SDK is imported lazily (see client_cache.py), and no error can come
+    from it before it has been imported, so classifying errors never needs to
+    import it.
+    """
+    return sys.modules.get('anthropic')
+
+
+def is_retryable(error):
+    """Return True for errors worth retrying: 408, 409, 429, 5xx and connection failures."""
+    anthropic = _loaded_anthropic()
+    if anthropic is None:
+        return False
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def status_code(error):
+    """Return the HTTP status of an Anthropic API error, or None for anything else."""
+    anthropic = _loaded_anthropic()
+    if anthropic is not None and isinstance(error, anthropic.APIStatusError):
+        return error.status_code
+    return None
+
+
+def is_rate_limited(error):
+    """Return True for a 429 rate_limit_error."""
+    return status_code(error) == 429
+
+
+def is_authentication_error(error):
+    """Return True if Anthropic rejected the API key."""
+    anthropic = _loaded_anthropic()
+    return anthropic is not None and isinstance(error, anthropic.AuthenticationError)
+
+
+def retry_delay(attempt, error=None):
+    """
+    Pick the wait before the next attempt.
+
+    Args:
+        attempt (int): Attempts made so far, starting at 1
+        error: The failure, whose retry-after header is honoured
+
+    Returns:
+        float: Seconds to wait
+    """
+    response = getattr(error, 'response', None)
+    retry_after = getattr(response, 'headers', {}).get('retry-after') if response is not None else None
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    base = _env_number('RETRY_BASE_DELAY_SECONDS', DEFAULT_RETRY_BASE_DELAY_SECONDS)
+    cap = _env_number('RETRY_MAX_DELAY_SECONDS', float(DEFAULT_RETRY_MAX_DELAY_SECONDS))
+    # Full jitter spreads out retries from many containers hitting the same outage
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _retry_after(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) if response is not None else None
+    return rate_limit.parse_rate_limit_headers(headers).get('retry_after') if headers is not None else None
+
+
+def _rate_limit_wait():
+    """Return how long this call may wait for rate-limit capacity."""
+    remaining = remaining_seconds()
+    if remaining is not None:
+        remaining -= MIN_ATTEMPT_SECONDS
+    if rate_limit.is_queueing():
+        return remaining
+    max_wait = rate_limit.get_max_wait_seconds()
+    return max_wait if remaining is None else min(max_wait, remaining)
+
+
+def _check_permit(permit):
+    """Record how acquiring capacity went, raising RateLimited if it didn't come in time."""
+    if permit is None:
+        metrics.increment('rate_limit_rejections')
+        raise RateLimited("No Anthropic rate-limit capacity in time")
+    if permit.waited:
+        metrics.increment('rate_limit_waits')
+    return permit
+
+
+def _release_failed(limiter, permit, error):
+    """Tell the limiter about a failed attempt."""
+    if status_code(error) in rate_limit.THROTTLE_STATUS_CODES:
+        limiter.throttled(permit, _retry_after(error))
+    else:
+        limiter.failed(permit)
+
+
+def _attempt_timeout(max_timeout):
+    remaining = remaining_seconds()
+    timeouts = [value for value in (remaining, max_timeout) if value is not None]
+    return min(timeouts) if timeouts else None
+
+
+def _before_attempt(breaker, max_timeout):
+    """Check the deadline and breaker, returning the timeout for the next attempt."""
+    timeout = _attempt_timeout(max_timeout)
+    if timeout is not None and timeout < MIN_ATTEMPT_SECONDS:
+        raise DeadlineExceeded("Not enough time left for another Anthropic call")
+    if not breaker.allow():
+        metrics.increment('breaker_rejections')
+        raise CircuitOpenError("The Anthropic circuit breaker is open")
+    return timeout
+
+
+def _after_failure(breaker, error, attempt):
+    """
+    Record a failed attempt, returning the wait before retrying or raising if it's over.
+
+    Returns:
+        tuple: (delay, counted) where counted is False for a 429 retried by
+            queued work, which doesn't use up the retries
+    """
+    if not is_retryable(error):
+        # The API answered; the request itself was bad, so the breaker stays as it is
+        breaker.record_success()
+        raise error
+    rate_limited = is_rate_limited(error)
+    if rate_limited:
+        # The API is up and asked us to slow down, which the rate limiter takes care of
+        breaker.record_success()
+        metrics.increment('rate_limited')
+    else:
+        breaker.record_failure()
+        metrics.increment('upstream_failures')
+    print(f"Anthropic call failed (attempt {attempt}): {str(error)}")
+
+    delay = retry_delay(attempt, error)
+    remaining = remaining_seconds()
+    out_of_time = remaining is not None and delay + MIN_ATTEMPT_SECONDS > remaining
+    counted = not (rate_limited and rate_limit.is_queueing())
+    if (counted and attempt > _env_number('ANTHROPIC_MAX_RETRIES', DEFAULT_MAX_RETRIES)) or out_of_time:
+        raise UpstreamUnavailable(f"Anthropic API unavailable: {str(error)}") from error
+    metrics.increment('anthropic_retries')
+    return (delay, counted)
+
+
+def _call(method, request, max_timeout):
+    """
+    Make the call for call_anthropic, leaving its rate-limit permit held.
+
+    Returns:
+        tuple: (result, permit)
+    """
+    breaker = get_breaker()
+    limiter = rate_limit.get_rate_limiter()
+    tokens = rate_limit.estimate_tokens(request)
+    attempt = 1
+    while True:
+        with metrics.span('rate_limit_wait'):
+            permit = _check_permit(limiter.acquire(tokens, _rate_limit_wait()))
+        try:
+            timeout = _before_attempt(breaker, max_timeout)
+        except UpstreamUnavailable:
+            limiter.cancel(permit)
+            raise
+        try:
+            result = method(**request, timeout=timeout) if timeout is not None else method(**request)
+        except Exception as e:
+            _release_failed(limiter, permit, e)
+            delay, counted = _after_failure(breaker, e, attempt)
+            time.sleep(delay)
+            attempt += 1 if counted else 0
+            continue
+        breaker.record_success()
+        return (result, permit)
+
+
+def call_anthropic(method, request, max_timeout=None):
+    """
+    Call a client.messages method with a deadline-bound timeout, retries and the breaker.
+
+    Args:
+        method (callable): e.g. client.messages.create or client.messages.stream
+        request (dict): Keyword arguments for the method
+        max_timeout (float): Cap on each attempt's timeout, or None for the request deadline
+
+    Returns:
+        The method's result
+
+    Raises:
+        UpstreamUnavailable: If the call can't succeed in time, the breaker is
+            open or there's no rate-limit capacity in time
+    """
+    result, permit = _call(method, request, max_timeout)
+    rate_limit.get_rate_limiter().finish(permit, getattr(result, 'usage', None))
+    return result
+
+
+def _stream_usage(stream):
+    """Return the usage of a finished stream, or None if it didn't finish."""
+    try:
+        return stream.current_message_snapshot.usage
+    except (AssertionError, AttributeError):
+        return None
+
+
+@contextlib.contextmanager
+def open_stream(method, request, max_timeout=None):
+    """
+    Open a client.messages.stream with the same protection as call_anthropic.
+
+    Only opening the stream (the request and its response headers) is retried;
+    once text has been sent to the student a failure can't be undone. The
+    stream keeps its rate-limit permit until it is closed.
+
+    Yields:
+        The MessageStream
+    """
+    def enter(**kwargs):
+        manager = method(**kwargs)
+        return (manager, manager.__enter__())
+
+    (manager, stream), permit = _call(enter, request, max_timeout)
+    try:
+        yield stream
+    finally:
+        manager.__exit__(None, None, None)
+        rate_limit.get_rate_limiter().finish(permit, _stream_usage(stream))
+
+
+async def call_anthropic_async(method, request, max_timeout=None):
+    """Async counterpart of call_anthropic for AsyncAnthropic methods."""
+    # Already loaded by the running event loop; kept out of module scope for the sync handler
+    import asyncio
+
+    breaker = get_breaker()
+    limiter = rate_limit.get_rate_limiter()
+    tokens = rate_limit.estimate_tokens(request)
+    attempt = 1
+    while True:
+        with metrics.span('rate_limit_wait'):
+            permit = _check_permit(await limiter.acquire_async(tokens, _rate_limit_wait()))
+        try:
+            timeout = _before_attempt(breaker, max_timeout)
+        except UpstreamUnavailable:
+            limiter.cancel(permit)
+            raise
+        try:
+            if timeout is not None:
+                result = await method(**request, timeout=timeout)
+            else:
+                result = await method(**request)
+        except asyncio.CancelledError:
+            # Cancelled speculation says nothing about the API's health, so record neither outcome
+            breaker.release_trial()
+            limiter.failed(permit)
+            raise
+        except Exception as e:
+            _release_failed(limiter, permit, e)
+            delay, counted = _after_failure(breaker, e, attempt)
+            await asyncio.sleep(delay)
+            attempt += 1 if counted else 0
+            continue
+        breaker.record_success()
+        limiter.finish(permit, getattr(result, 'usage', None))
+        return result
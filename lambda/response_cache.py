@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from math_engine import canonicalize_expression
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_SQLITE_PATH = '/tmp/response_cache.sqlite3'
+
+
+def make_cache_key(expression, model, prompt_version, temperature):
+    """
+    Build a content-addressed cache key for a tutoring explanation.
+
+    Args:
+        expression (str): The expression as submitted by the student
+        model (str): The model used to generate the explanation
+        prompt_version (str): Version of the tutoring prompt
+        temperature (float): Sampling temperature of the tutoring call
+
+    Returns:
+        str: A hex SHA-256 digest identifying the explanation
+    """
+    material = json.dumps({
+        'expression': canonicalize_expression(expression),
+        'model': model,
+        'prompt_version': prompt_version,
+        'temperature': temperature,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL.
+
+    Entries live in the Lambda container and survive between warm invocations.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entry when full."""
+        if self.max_entries <= 0:
+            return
+        expires_at = self.clock() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    Persistent cache tier backed by a local SQLite file.
+
+    Used for tests and local runs; on Lambda the file lives in /tmp and is only
+    shared by invocations on the same container.
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS response_cache '
+            '(cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM response_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and self.clock() >= expires_at:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        expires_at = self.clock() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO response_cache (cache_key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.commit()
+
+
+class DynamoDBCacheBackend:
+    """
+    Persistent cache tier backed by a DynamoDB table shared by all containers.
+
+    The table needs a string partition key named 'cache_key'. Enable DynamoDB TTL
+    on the 'expires_at' attribute so expired explanations are deleted for free.
+    """
+
+    def __init__(self, table_name=None, table=None, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        if table is None:
+            import boto3
+            table = boto3.session.Session().resource('dynamodb').Table(table_name)
+        self.table = table
+
+    def get(self, key):
+        item = self.table.get_item(Key={'cache_key': key}).get('Item')
+        if item is None:
+            return None
+        # DynamoDB TTL deletion is lazy, so double check the expiry ourselves
+        expires_at = item.get('expires_at')
+        if expires_at is not None and self.clock() >= float(expires_at):
+            return None
+        return json.loads(item['value'])
+
+    def set(self, key, value):
+        item = {'cache_key': key, 'value': json.dumps(value)}
+        if self.ttl_seconds:
+            item['expires_at'] = int(self.clock() + self.ttl_seconds)
+        self.table.put_item(Item=item)
+
+
+class ResponseCache:
+    """
+    Two-tier cache for tutoring explanations: an in-process LRU in front of an
+    optional persistent backend.
+
+    Attributes:
+        hits (int): Lookups answered by either tier
+        misses (int): Lookups that had to call Claude
+    """
+
+    def __init__(self, memory=None, persistent=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        # Batch threads look up concurrently; the tiers lock themselves
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.increment('response_cache_hits' if hit else 'response_cache_misses')
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Returns:
+            tuple: (value, tier) where tier is 'memory', 'persistent' or None on a miss
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(True)
+            return (value, 'memory')
+
+        if self.persistent is not None:
+            try:
+                with metrics.span('cache_persistent'):
+                    value = self.persistent.get(key)
+            except Exception as e:
+                # A broken persistent tier must never fail the request
+                print(f"Persistent cache lookup failed: {str(e)}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                self._count(True)
+                return (value, 'persistent')
+
+        self._count(False)
+        return (None, None)
+
+    def peek(self, key):
+        """Look up a cached value without touching the hit/miss counters (for polling)."""
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception as e:
+                print(f"Persistent cache lookup failed: {str(e)}")
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, value)
+            except Exception as e:
+                print(f"Persistent cache write failed: {str(e)}")
+
+    def stats(self):
+        """Return the hit/miss counters for the response metadata."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def _env_number(name, default):
+    try:
+        return type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def build_response_cache_from_env():
+    """
+    Build a ResponseCache from the RESPONSE_CACHE_* environment variables.
+
+    RESPONSE_CACHE_MAX_ENTRIES and RESPONSE_CACHE_TTL_SECONDS size the LRU tier.
+    RESPONSE_CACHE_BACKEND selects the persistent tier: 'none' (default),
+    'sqlite' (RESPONSE_CACHE_PATH) or 'dynamodb' (RESPONSE_CACHE_TABLE).
+    """
+    ttl_seconds = _env_number('RESPONSE_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)
+    memory = LRUCache(
+        max_entries=_env_number('RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+        ttl_seconds=ttl_seconds
+    )
+
+    backend = os.environ.get('RESPONSE_CACHE_BACKEND', 'none').lower()
+    persistent = None
+    if backend == 'sqlite':
+        persistent = SQLiteCacheBackend(os.environ.get('RESPONSE_CACHE_PATH', DEFAULT_SQLITE_PATH), ttl_seconds)
+    elif backend == 'dynamodb':
+        persistent = DynamoDBCacheBackend(os.environ['RESPONSE_CACHE_TABLE'], ttl_seconds=ttl_seconds)
+
+    return ResponseCache(memory, persistent)
+
+
+# Module-level cache shared by every invocation on this container
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the container-wide ResponseCache, building it on first use."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = build_response_cache_from_env()
+        return _response_cache
+
+
+def reset_response_cache(cache=None):
+    """Replace the container-wide cache (None rebuilds it from the environment on next use)."""
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = cache
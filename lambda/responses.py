@@ -0,0 +1,163 @@
+"""
+API Gateway response building.
+
+Headers are constants built once at import and shared by every response.
+JSON is encoded with orjson when it's installed (it's in requirements.txt) and
+with the standard json module otherwise. compress_response() gzip-encodes (or
+br-encodes, if the optional brotli package is installed) large bodies for
+clients that send Accept-Encoding. API Gateway passes compressed bodies
+through as binary because the stack sets binaryMediaTypes to */*.
+
+Environment:
+    COMPRESSION_MIN_BYTES: smallest body worth compressing (default 1024);
+        0 turns compression off
+"""
+
+import base64
+import binascii
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'OPTIONS,POST',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+# Shared by every response, so never modify them in place
+JSON_HEADERS = dict(CORS_HEADERS, **{'Content-Type': 'application/json'})
+SSE_HEADERS = dict(CORS_HEADERS, **{'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+
+
+def encode_json(value):
+    """Encode a JSON-compatible value as a str, with orjson when it's available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except TypeError:
+            # orjson is stricter (e.g. about non-string keys); let json decide
+            pass
+    return json.dumps(value)
+
+
+def json_response(status_code, body):
+    """Build a CORS-compliant JSON response."""
+    return {
+        'statusCode': status_code,
+        'headers': JSON_HEADERS,
+        'body': encode_json(body)
+    }
+
+
+def stream_response(status_code, body):
+    """Build a CORS-compliant server-sent events response."""
+    return {
+        'statusCode': status_code,
+        'headers': SSE_HEADERS,
+        'body': body
+    }
+
+
+def header_value(headers, name):
+    """Look up a request header case-insensitively (API Gateway keeps the client's casing)."""
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is not None:
+        return value
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def accepted_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): The header value, or None
+
+    Returns:
+        str or None: 'br', 'gzip', or None for an uncompressed response
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().lower().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, request_headers):
+    """
+    Compress a response body if it's large and the client accepts it.
+
+    Args:
+        response (dict): An API Gateway response with a str body
+        request_headers (dict): The event's headers, or None
+
+    Returns:
+        dict: The response, compressed and base64-encoded where worthwhile
+    """
+    body = response.get('body')
+    min_bytes = int(os.environ.get('COMPRESSION_MIN_BYTES', DEFAULT_COMPRESSION_MIN_BYTES))
+    if not isinstance(body, str) or min_bytes <= 0 or len(body) < min_bytes:
+        return response
+
+    encoding = accepted_encoding(header_value(request_headers, 'Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        compressed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    return dict(
+        response,
+        headers=dict(response.get('headers') or {}, **{'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}),
+        body=base64.b64encode(compressed).decode('ascii'),
+        isBase64Encoded=True
+    )
+
+
+# Raised by event_body and json.loads for a body that isn't valid (base64-encoded) JSON
+INVALID_BODY_ERRORS = (binascii.Error, UnicodeDecodeError, json.JSONDecodeError)
+
+
+def event_body(event):
+    """
+    Return the request body as text, decoding it if API Gateway base64-encoded it.
+
+    Raises:
+        binascii.Error, UnicodeDecodeError: If a base64-encoded body doesn't decode
+    """
+    body = event.get('body')
+    if body is None:
+        return '{}'
+    if event.get('isBase64Encoded'):
+        return base64.b64decode(body).decode('utf-8')
+    return body
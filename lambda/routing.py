@@ -0,0 +1,220 @@
+"""
+Complexity-based routing for the tutoring call.
+
+complexity_score() rates an expression from its math_engine signal scan
+(operators, bracket nesting, functions, relations, advanced words like
+"integral" and overall length). choose_route() then picks the first route in
+the routing table whose max_score the expression stays within, so a trivial
+sum gets a short, cheap response and only hard problems pay for long
+generations on a bigger model.
+
+Each route is a dict with:
+    name: label used in logs and the route_<name> metric
+    max_score: highest complexity the route takes (null for "everything else")
+    model: model for the tutoring call
+    max_tokens: max_tokens for the tutoring call
+    prompt: prompt variant, one of PROMPT_VARIANTS
+
+A client can also ask for a level of detail ("brief", "standard" or "full")
+with the request. The level's budget then replaces the route's max_tokens and
+prompt variant and adds stop sequences, while the model still comes from the
+route. The level is set per request with use_detail() and read back by
+choose_budget(), so batch items and async tasks inherit it like the metrics.
+
+Environment:
+    ROUTING_TABLE: JSON list of routes replacing DEFAULT_ROUTING_TABLE, in
+        ascending max_score order (an unusable table is logged and ignored)
+"""
+
+import contextvars
+import functools
+import json
+import os
+from collections import namedtuple
+
+from math_engine import scan_signals
+
+Route = namedtuple('Route', ['name', 'max_score', 'model', 'max_tokens', 'prompt'])
+
+# What a tutoring call may spend: detail is None when the route decided
+Budget = namedtuple('Budget', ['detail', 'max_tokens', 'prompt', 'stop_sequences'])
+
+# Extra instructions appended to the tutoring prompt for each variant
+PROMPT_VARIANTS = {
+    'brief': "Keep it short: a few numbered steps with one sentence each, and skip the real-world example.",
+    'standard': "",
+    'detailed': (
+        "This is a harder problem: show every intermediate step, say which rule or technique "
+        "each step uses and why, and check the answer at the end."
+    ),
+}
+
+DEFAULT_ROUTING_TABLE = [
+    {'name': 'trivial', 'max_score': 5, 'model': 'claude-3-haiku-20240307', 'max_tokens': 400, 'prompt': 'brief'},
+    {'name': 'standard', 'max_score': 15, 'model': 'claude-3-haiku-20240307', 'max_tokens': 1000,
+     'prompt': 'standard'},
+    # Kept well inside the 30 second Lambda timeout at the larger model's generation speed
+    {'name': 'complex', 'max_score': None, 'model': 'claude-3-5-sonnet-20241022', 'max_tokens': 1500,
+     'prompt': 'detailed'},
+]
+
+DETAIL_LEVELS = ('brief', 'standard', 'full')
+
+# Budget per requested detail level. A brief answer is a single section, so the
+# first section divider ends it even if the model starts on an example anyway
+DETAIL_BUDGETS = {
+    'brief': Budget('brief', 300, 'brief', ('<hr>',)),
+    'standard': Budget('standard', 1000, 'standard', ()),
+    'full': Budget('full', 1500, 'detailed', ()),
+}
+
+_detail = contextvars.ContextVar('requested_detail', default=None)
+
+# Weights of each signal in the complexity score
+OPERATOR_WEIGHT = 1
+DEPTH_WEIGHT = 1
+FUNCTION_WEIGHT = 3
+RELATION_WEIGHT = 3
+ADVANCED_WORD_WEIGHT = 8
+TOKENS_PER_POINT = 4
+
+# Words that signal topics beyond arithmetic and simple equations
+ADVANCED_WORDS = frozenset([
+    'derivative', 'differentiate', 'integral', 'integrate', 'limit', 'matrix', 'determinant',
+    'eigenvalue', 'vector', 'series', 'converge', 'converges', 'prove', 'proof', 'induction',
+    'logarithm', 'trigonometric', 'polynomial', 'quadratic', 'inequality', 'probability',
+    'permutation', 'combination', 'factorial', 'complex', 'imaginary',
+])
+
+
+def complexity_score(expression):
+    """
+    Score how hard an expression is to explain.
+
+    Args:
+        expression (str): The expression as submitted
+
+    Returns:
+        float: The complexity score; 0 for empty input, a few points for a short sum
+    """
+    signals = scan_signals(expression)
+    advanced_words = sum(1 for word in signals.words if word in ADVANCED_WORDS)
+    return (
+        OPERATOR_WEIGHT * signals.operators
+        + DEPTH_WEIGHT * signals.max_depth
+        + FUNCTION_WEIGHT * signals.functions
+        + RELATION_WEIGHT * signals.relations
+        + ADVANCED_WORD_WEIGHT * advanced_words
+        + signals.tokens / TOKENS_PER_POINT
+    )
+
+
+def parse_routing_table(routes):
+    """
+    Turn a list of route dicts into Route tuples, checking every field.
+
+    Args:
+        routes (list): Route dicts as described in the module docstring
+
+    Returns:
+        tuple: The Route tuples, in table order
+
+    Raises:
+        ValueError: If the table is empty or a route is malformed
+    """
+    if not isinstance(routes, list) or not routes:
+        raise ValueError("The routing table must be a non-empty list")
+
+    parsed = []
+    for route in routes:
+        if not isinstance(route, dict):
+            raise ValueError(f"Route {route!r} is not an object")
+        prompt = route.get('prompt', 'standard')
+        if prompt not in PROMPT_VARIANTS:
+            raise ValueError(f"Unknown prompt variant {prompt!r}")
+        max_score = route.get('max_score')
+        max_tokens = route.get('max_tokens')
+        if not isinstance(max_tokens, int) or max_tokens <= 0:
+            raise ValueError(f"Route {route.get('name')!r} needs a positive integer max_tokens")
+        if not route.get('model') or not route.get('name'):
+            raise ValueError("Every route needs a name and a model")
+        parsed.append(Route(
+            str(route['name']), None if max_score is None else float(max_score),
+            str(route['model']), max_tokens, prompt
+        ))
+    return tuple(parsed)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_routing_table(raw):
+    if raw:
+        try:
+            return parse_routing_table(json.loads(raw))
+        except ValueError as e:
+            # json.JSONDecodeError is a ValueError
+            print(f"Ignoring invalid ROUTING_TABLE: {str(e)}")
+    return parse_routing_table(DEFAULT_ROUTING_TABLE)
+
+
+def get_routing_table():
+    """Return the routing table from ROUTING_TABLE, or the default table."""
+    return _load_routing_table(os.environ.get('ROUTING_TABLE', '').strip())
+
+
+def choose_route(expression):
+    """
+    Pick the route for an expression's tutoring call.
+
+    Args:
+        expression (str): The expression as submitted
+
+    Returns:
+        tuple: (route, score) where route is the first Route whose max_score
+            covers the score (the last route if none does)
+    """
+    score = complexity_score(expression)
+    table = get_routing_table()
+    for route in table:
+        if route.max_score is None or score <= route.max_score:
+            return (route, score)
+    return (table[-1], score)
+
+
+def use_detail(detail):
+    """
+    Set the detail level requested for the current request.
+
+    Args:
+        detail (str): One of DETAIL_LEVELS, or None to let the route decide
+
+    Returns:
+        Token: Pass to reset_detail() when the request is done
+    """
+    return _detail.set(detail)
+
+
+def reset_detail(token):
+    """Restore the detail level that was in effect before use_detail()."""
+    _detail.reset(token)
+
+
+def requested_detail():
+    """Return the current request's detail level, or None."""
+    return _detail.get()
+
+
+def choose_budget(route):
+    """
+    Pick the output budget for a tutoring call.
+
+    Args:
+        route (Route): The route chosen for the expression
+
+    Returns:
+        Budget: The requested detail level's budget, or the route's own
+            max_tokens and prompt variant if no level was requested
+    """
+    detail = _detail.get()
+    if detail is None:
+        return Budget(None, route.max_tokens, route.prompt, ())
+    return DETAIL_BUDGETS[detail]
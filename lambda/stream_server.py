@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Incremental streaming front end for the calculator.
+
+API Gateway REST integrations buffer the whole Lambda response, so the
+'stream' flag on lambda_handler only changes the framing. This server sends
+the same server-sent events with chunked transfer encoding as Claude generates
+them. Run it locally, or behind the AWS Lambda Web Adapter on a function URL
+configured with the RESPONSE_STREAM invoke mode.
+
+Usage:
+    PARAMETER_NAME=/calculator/anthropic-api-key python stream_server.py
+    PORT=8080 python stream_server.py
+"""
+
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from admission import check_limits
+from client_cache import get_anthropic_client
+from lambda_function import check_expression, format_sse_event, iter_explanation_events, parse_detail, UNAVAILABLE_MESSAGE
+import resilience
+from resilience import UpstreamUnavailable
+from responses import CORS_HEADERS
+from routing import reset_detail, use_detail
+
+
+class StreamingCalculatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send_headers(self, status_code, content_type, extra_headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        for name, value in dict(CORS_HEADERS, **(extra_headers or {})).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send_json(self, status_code, body):
+        payload = json.dumps(body).encode('utf-8')
+        self._send_headers(status_code, 'application/json', {'Content-Length': str(len(payload))})
+        self.wfile.write(payload)
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_OPTIONS(self):
+        self._send_headers(200, 'application/json', {'Content-Length': '0'})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            return self._send_json(400, {'error': 'Invalid JSON in request body'})
+
+        expression = body.get('expression')
+        if not expression:
+            return self._send_json(400, {'error': 'Missing required parameter. Please provide a math expression.'})
+
+        limit_error = check_limits(expression)
+        if limit_error:
+            return self._send_json(400, {'error': limit_error})
+
+        detail, detail_error = parse_detail(body)
+        if detail_error:
+            return self._send_json(400, {'error': detail_error})
+
+        # Keep-alive connections reuse the thread, so the level is reset afterwards
+        detail_token = use_detail(detail)
+        # Anthropic calls are retried only while this request's deadline allows
+        deadline = resilience.start_deadline()
+        try:
+            self._stream_explanation(expression)
+        finally:
+            resilience.finish_deadline(deadline)
+            reset_detail(detail_token)
+
+    def _stream_explanation(self, expression):
+        try:
+            client = get_anthropic_client()
+            error, result = check_expression(client, expression)
+        except Exception as e:
+            return self._send_json(500, {'error': f'Internal server error: {str(e)}'})
+        if error:
+            return self._send_json(400, {'error': error})
+
+        self._send_headers(200, 'text/event-stream', {
+            'Cache-Control': 'no-cache',
+            'Transfer-Encoding': 'chunked'
+        })
+        try:
+            for frame in iter_explanation_events(client, expression, result):
+                self._write_chunk(frame)
+        except UpstreamUnavailable as e:
+            print(f"Anthropic API unavailable while streaming: {str(e)}")
+            self._write_chunk(format_sse_event('error', {'error': UNAVAILABLE_MESSAGE}))
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            print(f"Error while streaming: {str(e)}")
+            self._write_chunk(format_sse_event('error', {'error': f'Internal server error: {str(e)}'}))
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def create_server(port=None, host='0.0.0.0'):
+    """Create (but don't start) the streaming server; port 0 picks a free port."""
+    if port is None:
+        port = int(os.environ.get('PORT', 8080))
+    return ThreadingHTTPServer((host, port), StreamingCalculatorHandler)
+
+
+if __name__ == "__main__":
+    server = create_server()
+    print(f"Streaming calculator listening on port {server.server_address[1]}")
+    server.serve_forever()
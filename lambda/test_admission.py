@@ -0,0 +1,133 @@
+import unittest
+import json
+from unittest.mock import patch, MagicMock
+import admission
+from admission import check_limits, classify, get_admission_stats, math_score, reset_admission_stats
+from lambda_function import lambda_handler, reset_validation_memo
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+
+class TestAdmissionTiers(unittest.TestCase):
+
+    def setUp(self):
+        reset_admission_stats()
+
+    def test_length_limit(self):
+        """Test that over-long input is refused and counted"""
+        self.assertIsNone(check_limits("1 + " * 200 + "1"))
+        with patch.dict('os.environ', {'ADMISSION_MAX_LENGTH': '10'}):
+            self.assertIn('under 10 characters', check_limits("1 + 2 + 3 + 4"))
+        self.assertEqual(1, get_admission_stats()[admission.TIER_LIMIT])
+
+    def test_charset_limit(self):
+        """Test that control characters are refused but pasted line breaks are fine"""
+        self.assertIsNone(check_limits("solve for x:\n\t2x + 3 = 7\r\n"))
+        self.assertIsNone(check_limits("√16 × π"))
+        self.assertIn('unsupported characters', check_limits("2 + 2\x00"))
+        self.assertIn('unsupported characters', check_limits("2 +\u200b 2"))
+
+    def test_classifier_rejects_clear_non_math(self):
+        """Test that chit-chat scores zero and is rejected"""
+        for text in ["tell me a joke", "hello world", "What's the capital of France?", "!!!"]:
+            self.assertEqual(0.0, math_score(text), text)
+            self.assertEqual(admission.TIER_REJECTED, classify(text), text)
+
+    def test_classifier_escalates_the_uncertain_band(self):
+        """Test that word problems and anything with some math signal go to Claude"""
+        for text in [
+            "what is the derivative of x squared",
+            "what is two plus two",
+            "tell me a joke about 7 dwarfs",
+            "If John has 5 apples and gives away 2, how many does he have left?",
+            "solve for x: 2x + 3 = 7",
+        ]:
+            self.assertEqual(admission.TIER_ESCALATED, classify(text), text)
+
+    def test_thresholds_are_configurable(self):
+        """Test the reject and accept thresholds"""
+        with patch.dict('os.environ', {'ADMISSION_REJECT_BELOW': '0'}):
+            self.assertEqual(admission.TIER_ESCALATED, classify("tell me a joke"))
+        with patch.dict('os.environ', {'ADMISSION_REJECT_BELOW': '0.5'}):
+            self.assertEqual(admission.TIER_REJECTED, classify("tell me a joke about 7 dwarfs"))
+        with patch.dict('os.environ', {'ADMISSION_ACCEPT_ABOVE': '0.7'}):
+            self.assertEqual(admission.TIER_ACCEPTED, classify("2x + 3 = 7"))
+            # Math words alone aren't enough to skip Claude
+            self.assertEqual(admission.TIER_ESCALATED, classify("derivative of x squared"))
+
+
+class TestAdmissionInHandler(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+        reset_admission_stats()
+
+    def run_handler(self, body, mock_client, env=None):
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', dict({'PARAMETER_NAME': 'test-param'}, **(env or {}))):
+            mock_ssm = mock_session.return_value.client.return_value
+            mock_ssm.get_parameter.return_value = {'Parameter': {'Value': 'mock-api-key'}}
+            response = lambda_handler({'body': json.dumps(body)}, {})
+            return response, mock_ssm
+
+    def test_oversized_input_never_fetches_the_key(self):
+        """Test that the hard limit answers before SSM or the API are touched"""
+        mock_client = MagicMock()
+
+        response, mock_ssm = self.run_handler({'expression': "1 + " * 400 + "1"}, mock_client)
+
+        self.assertEqual(400, response['statusCode'])
+        self.assertIn('too long', json.loads(response['body'])['error'])
+        mock_ssm.get_parameter.assert_not_called()
+        mock_client.messages.create.assert_not_called()
+
+    def test_clear_non_math_makes_no_call(self):
+        """Test that rejected chit-chat costs no Claude call in either validation mode"""
+        for mode in ['separate', 'combined']:
+            mock_client = MagicMock()
+            response, _ = self.run_handler(
+                {'expression': 'tell me a joke', 'timings': True}, mock_client, env={'VALIDATION_MODE': mode}
+            )
+
+            self.assertEqual(400, response['statusCode'])
+            body = json.loads(response['body'])
+            self.assertIn('does not appear to be a math problem', body['error'])
+            self.assertEqual(1, body['timings']['counters']['admission_classifier_rejected'])
+            mock_client.messages.create.assert_not_called()
+
+    def test_local_acceptance_skips_validation_call(self):
+        """Test that with ADMISSION_ACCEPT_ABOVE set, clear math only makes the explanation call"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value.content = [MagicMock(type='text', text="<p>x = 2</p>")]
+
+        response, _ = self.run_handler(
+            {'expression': '2x + 3 = 7'}, mock_client, env={'ADMISSION_ACCEPT_ABOVE': '0.7'}
+        )
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual(1, mock_client.messages.create.call_count)
+
+    def test_batch_counts_each_tier(self):
+        """Test that a batch reports how many items each tier absorbed"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value.content = [MagicMock(type='text', text="<p>done</p>")]
+
+        with patch('lambda_function.validate_with_claude', return_value=(True, True, "")):
+            response, _ = self.run_handler(
+                {'expressions': ["2 + 2", "hello there", "solve 2x = 4", "9" * 2000]}, mock_client
+            )
+
+        results = json.loads(response['body'])['results']
+        self.assertEqual([200, 400, 200, 400], [item['status'] for item in results])
+        stats = get_admission_stats()
+        self.assertEqual(1, stats[admission.TIER_LIMIT])
+        self.assertEqual(1, stats[admission.TIER_LOCAL_ENGINE])
+        self.assertEqual(1, stats[admission.TIER_REJECTED])
+        self.assertEqual(1, stats[admission.TIER_ESCALATED])
+        self.assertEqual(0, stats[admission.TIER_ACCEPTED])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+import asyncio
+import json
+from unittest.mock import patch, MagicMock
+from async_pipeline import async_lambda_handler, get_event_loop, solve_expression_async
+from client_cache import reset_client_cache
+from lambda_function import VALIDATION_SYSTEM, reset_validation_memo
+from response_cache import reset_response_cache
+
+
+class FakeAsyncMessages:
+    """
+    Fake AsyncAnthropic messages resource that logs call ordering and cancellation.
+
+    A call named in waits_for doesn't finish until the other call has logged the
+    given entry, so overlap is tested by ordering rather than by wall-clock time.
+    """
+
+    def __init__(self, verdict, waits_for=None):
+        self.verdict = verdict
+        self.waits_for = waits_for or {}
+        self.log = []
+
+    async def wait_for_log(self, entry):
+        # Only yields to the event loop, so it takes no real time
+        for _ in range(10000):
+            if entry in self.log:
+                return
+            await asyncio.sleep(0)
+        raise AssertionError(f"'{entry}' never happened; log: {self.log}")
+
+    async def create(self, **kwargs):
+        kind = 'validation' if kwargs['system'] == VALIDATION_SYSTEM else 'explanation'
+        self.log.append(f'{kind}-start')
+        try:
+            if kind in self.waits_for:
+                await self.wait_for_log(self.waits_for[kind])
+            else:
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.log.append(f'{kind}-cancelled')
+            raise
+        self.log.append(f'{kind}-end')
+
+        message = MagicMock()
+        if kind == 'validation':
+            message.content = [MagicMock(type='text', text=json.dumps(self.verdict))]
+        else:
+            message.content = [MagicMock(type='text', text="<p>Here is how to solve it</p>")]
+        return message
+
+
+class FakeAsyncClient:
+    def __init__(self, verdict, waits_for=None):
+        self.messages = FakeAsyncMessages(verdict, waits_for)
+
+
+VALID = {"is_math_problem": True, "is_solvable": True, "error_message": ""}
+NOT_MATH = {"is_math_problem": False, "is_solvable": False, "error_message": "Not math"}
+
+
+class TestAsyncPipeline(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def solve(self, client, expression):
+        return get_event_loop().run_until_complete(solve_expression_async(client, expression))
+
+    def test_explanation_overlaps_validation(self):
+        """Test that the explanation starts before validation finishes and is used once validation passes"""
+        # Validation can't finish until the explanation is running, and the explanation
+        # can't finish until validation has, which only works if the calls overlap
+        client = FakeAsyncClient(VALID, waits_for={'validation': 'explanation-start', 'explanation': 'validation-end'})
+
+        status, body = self.solve(client, "solve for x: 2x + 3 = 7")
+
+        self.assertEqual(200, status)
+        self.assertEqual("<p>Here is how to solve it</p>", body['explanation'])
+        log = client.messages.log
+        self.assertLess(log.index('explanation-start'), log.index('validation-end'))
+        self.assertEqual('explanation-end', log[-1])
+
+    def test_rejected_input_cancels_speculative_explanation(self):
+        """Test that the speculative explanation is cancelled when validation rejects"""
+        # The explanation would only finish after a validation-end that comes too late
+        client = FakeAsyncClient(NOT_MATH, waits_for={'validation': 'explanation-start', 'explanation': 'never'})
+
+        status, body = self.solve(client, "tell me a joke about 7 dwarfs")
+
+        self.assertEqual(400, status)
+        self.assertIn('does not appear to be a math problem', body['error'])
+        log = client.messages.log
+        self.assertLess(log.index('explanation-start'), log.index('validation-end'))
+        self.assertEqual('explanation-cancelled', log[-1])
+        self.assertNotIn('explanation-end', log)
+
+    def test_speculation_can_be_disabled(self):
+        """Test that SPECULATIVE_EXPLANATION=false runs the calls sequentially"""
+        client = FakeAsyncClient(VALID)
+
+        with patch.dict('os.environ', {'SPECULATIVE_EXPLANATION': 'false'}):
+            status, _ = self.solve(client, "solve for x: 2x + 3 = 7")
+
+        self.assertEqual(200, status)
+        self.assertEqual(
+            ['validation-start', 'validation-end', 'explanation-start', 'explanation-end'],
+            client.messages.log
+        )
+
+    def test_local_arithmetic_makes_one_call(self):
+        """Test that locally evaluated arithmetic only makes the explanation call"""
+        client = FakeAsyncClient(VALID)
+
+        status, body = self.solve(client, "5 * (3 + 2)")
+
+        self.assertEqual(200, status)
+        self.assertEqual("25", body['result'])
+        self.assertEqual(['explanation-start', 'explanation-end'], client.messages.log)
+
+    def test_memoised_verdict_and_cached_explanation(self):
+        """Test that repeats are answered from the caches without any call"""
+        client = FakeAsyncClient(VALID)
+        self.solve(client, "solve for x: 2x + 3 = 7")
+        client.messages.log.clear()
+
+        status, body = self.solve(client, "solve for x:  2x+3=7")
+
+        self.assertEqual(200, status)
+        self.assertTrue(body['cache']['hit'])
+        self.assertEqual([], client.messages.log)
+
+    def test_async_handler_reuses_client_across_invocations(self):
+        """Test the Lambda entry point builds the async client once per container"""
+        client = FakeAsyncClient(VALID)
+
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.AsyncAnthropic', return_value=client) as mock_async_anthropic, \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_ssm = mock_session.return_value.client.return_value
+            mock_ssm.get_parameter.return_value = {'Parameter': {'Value': 'mock-api-key'}}
+
+            for expression in ["x + 1 = 2", "x + 2 = 3", "x + 3 = 4"]:
+                response = async_lambda_handler({'body': json.dumps({'expression': expression})}, {})
+                self.assertEqual(200, response['statusCode'])
+
+        self.assertEqual(1, mock_async_anthropic.call_count)
+        self.assertEqual(1, mock_ssm.get_parameter.call_count)
+
+    def test_async_handler_rejects_bodies_that_are_not_objects(self):
+        """Test that a JSON body that isn't an object is a client error, like invalid JSON"""
+        for body in ['[1, 2]', '"2 + 2"', '7', 'null', '{not json']:
+            response = async_lambda_handler({'body': body}, {})
+            self.assertEqual(400, response['statusCode'], f"for {body}")
+
+    @patch('async_pipeline.label_request', side_effect=RuntimeError('boom'))
+    def test_async_handler_turns_unexpected_errors_into_500(self, mock_label):
+        """Test that an error outside the Claude calls is returned as a 500 rather than raised"""
+        response = async_lambda_handler({'body': json.dumps({'expression': 'x + 1 = 2'})}, {})
+
+        self.assertEqual(500, response['statusCode'])
+        self.assertIn('boom', json.loads(response['body'])['error'])
+
+    @patch('async_pipeline.lambda_handler', return_value={'statusCode': 200})
+    def test_batches_and_streams_use_sync_handler(self, mock_handler):
+        """Test that batch and streaming requests are delegated to lambda_handler"""
+        async_lambda_handler({'body': json.dumps({'expressions': ['2 + 2']})}, {})
+        async_lambda_handler({'body': json.dumps({'expression': '2 + 2', 'stream': True})}, {})
+        self.assertEqual(2, mock_handler.call_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import json
+import threading
+import time
+from unittest.mock import patch, MagicMock
+from lambda_function import lambda_handler, get_batch_deadline_seconds, reset_validation_memo, tutoring_cache_key
+from client_cache import reset_client_cache
+from coalescing import reset_coalescer
+from response_cache import reset_response_cache, get_response_cache
+
+
+class FakeContext:
+    def __init__(self, remaining_millis):
+        self.remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_millis
+
+
+class ConcurrencyTrackingClient:
+    """Fake Anthropic client that records how many tutoring calls overlap."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.messages = self
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        message = MagicMock()
+        message.content = [MagicMock(type='text', text=f"<p>{kwargs['messages'][0]['content'][:60]}</p>")]
+        return message
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+        reset_coalescer()
+
+    def run_handler(self, body, client, context=None, env=None):
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=client), \
+             patch.dict('os.environ', dict({'PARAMETER_NAME': 'test-param'}, **(env or {}))):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            return lambda_handler({'body': json.dumps(body)}, context or {})
+
+    @patch('lambda_function.validate_with_claude')
+    def test_results_in_input_order(self, mock_validate):
+        """Test that mixed successes and errors come back in input order"""
+        mock_validate.side_effect = lambda client, expr: (
+            (False, False, "Not math") if expr == "tell me a joke" else (True, True, "")
+        )
+        client = ConcurrencyTrackingClient()
+        expressions = ["2 + 2", "5 / 0", "tell me a joke", "solve 2x = 4", "", "3 * 3"]
+
+        response = self.run_handler({'expressions': expressions}, client)
+
+        self.assertEqual(200, response['statusCode'])
+        results = json.loads(response['body'])['results']
+        self.assertEqual(expressions, [item['expression'] for item in results])
+        self.assertEqual([200, 400, 400, 200, 400, 200], [item['status'] for item in results])
+        self.assertIn('Division by zero', results[1]['error'])
+        self.assertIn('does not appear to be a math problem', results[2]['error'])
+        self.assertEqual("4", results[0]['result'])
+        self.assertEqual("9", results[5]['result'])
+        self.assertEqual(3, client.calls)
+
+    @patch('lambda_function.validate_with_claude', return_value=(True, True, ""))
+    def test_overflowing_literal_does_not_fail_the_batch(self, mock_validate):
+        """Test that one literal too large for a float is escalated and the rest of the worksheet is answered"""
+        client = ConcurrencyTrackingClient(delay=0)
+
+        response = self.run_handler({'expressions': ["1e400 + 1", "2 + 2"]}, client)
+
+        self.assertEqual(200, response['statusCode'])
+        results = json.loads(response['body'])['results']
+        self.assertEqual([200, 200], [item['status'] for item in results])
+        self.assertEqual("4", results[1]['result'])
+
+    @patch('lambda_function.validate_with_claude', return_value=(True, True, ""))
+    def test_concurrency_cap(self, mock_validate):
+        """Test that no more than BATCH_MAX_CONCURRENCY calls run at once"""
+        client = ConcurrencyTrackingClient(delay=0.05)
+        expressions = [f"{i} + 1" for i in range(12)]
+
+        response = self.run_handler({'expressions': expressions}, client, env={'BATCH_MAX_CONCURRENCY': '3'})
+
+        results = json.loads(response['body'])['results']
+        self.assertTrue(all(item['status'] == 200 for item in results))
+        self.assertEqual(12, client.calls)
+        self.assertLessEqual(client.max_active, 3)
+        self.assertGreater(client.max_active, 1)
+
+    @patch('lambda_function.validate_with_claude', return_value=(True, True, ""))
+    def test_deadline_reports_timeouts(self, mock_validate):
+        """Test that items still running at the deadline are reported as timed out"""
+        client = ConcurrencyTrackingClient(delay=1.0)
+        expressions = ["2 + 2", "5 / 0", "3 + 3"]
+
+        started = time.monotonic()
+        response = self.run_handler({'expressions': expressions}, client, env={'BATCH_DEADLINE_SECONDS': '0.2'})
+        elapsed = time.monotonic() - started
+
+        results = json.loads(response['body'])['results']
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual([504, 400, 504], [item['status'] for item in results])
+        self.assertIn('Timed out', results[0]['error'])
+
+    @patch('lambda_function.validate_with_claude', return_value=(True, True, ""))
+    def test_cached_items_skip_the_pool(self, mock_validate):
+        """Test that cache hits are resolved without any Claude call"""
+        get_response_cache().set(tutoring_cache_key("2 + 2"), {'explanation': '<p>4</p>'})
+        client = ConcurrencyTrackingClient()
+
+        response = self.run_handler({'expressions': ["2+2", "2 + 2"]}, client)
+
+        results = json.loads(response['body'])['results']
+        self.assertEqual(['<p>4</p>', '<p>4</p>'], [item['explanation'] for item in results])
+        self.assertTrue(all(item['cache']['hit'] for item in results))
+        self.assertEqual(0, client.calls)
+
+    def test_deadline_respects_lambda_remaining_time(self):
+        """Test that the batch deadline never runs past the Lambda timeout"""
+        self.assertEqual(25, get_batch_deadline_seconds({}))
+        self.assertEqual(8, get_batch_deadline_seconds(FakeContext(10000)))
+        self.assertEqual(0, get_batch_deadline_seconds(FakeContext(500)))
+        with patch.dict('os.environ', {'BATCH_DEADLINE_SECONDS': '5'}):
+            self.assertEqual(5, get_batch_deadline_seconds(FakeContext(30000)))
+
+    def test_rejects_invalid_batches(self):
+        """Test that malformed or oversized batches are rejected up front"""
+        client = ConcurrencyTrackingClient()
+
+        response = self.run_handler({'expressions': []}, client)
+        self.assertEqual(400, response['statusCode'])
+
+        response = self.run_handler({'expressions': "2 + 2"}, client)
+        self.assertEqual(400, response['statusCode'])
+
+        response = self.run_handler({'expressions': ["1 + 1"] * 3}, client, env={'BATCH_MAX_EXPRESSIONS': '2'})
+        self.assertEqual(400, response['statusCode'])
+        self.assertIn('at most 2', json.loads(response['body'])['error'])
+        self.assertEqual(0, client.calls)
+
+if __name__ == '__main__':
+    unittest.main()
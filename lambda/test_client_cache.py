@@ -0,0 +1,351 @@
+import unittest
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import httpx
+import anthropic
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch, AsyncMock, MagicMock
+from client_cache import (
+    ClientCache, LazyClient, get_api_key_source, get_async_anthropic_client, get_client_cache,
+    invalidate_async_anthropic_client, reset_client_cache
+)
+from lambda_function import lambda_handler
+from response_cache import reset_response_cache
+
+
+def make_event(expression):
+    return {'body': json.dumps({'expression': expression})}
+
+
+def make_message(text):
+    message = MagicMock()
+    content = MagicMock()
+    content.type = 'text'
+    content.text = text
+    message.content = [content]
+    return message
+
+
+def make_auth_error():
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(401, request=request)
+    return anthropic.AuthenticationError('invalid x-api-key', response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestClientCache(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        self.env = patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'})
+        self.env.start()
+        self.session_patch = patch('boto3.session.Session')
+        self.anthropic_patch = patch('anthropic.Anthropic')
+        self.mock_session = self.session_patch.start()
+        self.mock_anthropic = self.anthropic_patch.start()
+
+        self.mock_ssm = MagicMock()
+        self.mock_session.return_value.client.return_value = self.mock_ssm
+        self.mock_ssm.get_parameter.return_value = {
+            'Parameter': {'Value': 'sk-ant-mock-api-key'}
+        }
+
+    def tearDown(self):
+        self.anthropic_patch.stop()
+        self.session_patch.stop()
+        self.env.stop()
+        reset_client_cache()
+
+    def test_warm_invocations_reuse_key_and_client(self):
+        """Test that many invocations on one container hit SSM and build the client once"""
+        mock_client = MagicMock()
+        self.mock_anthropic.return_value = mock_client
+        mock_client.messages.create.return_value = make_message("The answer is 4")
+
+        with patch('lambda_function.validate_with_claude', return_value=(True, True, "")):
+            for i in range(50):
+                response = lambda_handler(make_event(f'{i} + 2'), {})
+                self.assertEqual(200, response['statusCode'])
+
+        cache = get_client_cache()
+        self.assertEqual(1, self.mock_ssm.get_parameter.call_count)
+        self.assertEqual(1, self.mock_session.call_count)
+        self.assertEqual(1, self.mock_anthropic.call_count)
+        self.assertEqual(1, cache.ssm_fetches)
+        self.assertEqual(1, cache.client_builds)
+        self.assertEqual(50, mock_client.messages.create.call_count)
+
+    def test_ttl_expiry_refreshes_key(self):
+        """Test that the key is re-read from SSM once the TTL has elapsed"""
+        clock = FakeClock()
+        cache = ClientCache(ttl_seconds=60, clock=clock)
+        first_client, rotated_client = MagicMock(), MagicMock()
+        self.mock_anthropic.side_effect = [first_client, rotated_client]
+
+        for _ in range(10):
+            cache.get_client()
+        clock.now = 59
+        cache.get_client()
+        self.assertEqual(1, self.mock_ssm.get_parameter.call_count)
+
+        # An unchanged key keeps the client and its connections
+        clock.now = 61
+        for _ in range(10):
+            self.assertIs(first_client, cache.get_client())
+        self.assertEqual(2, self.mock_ssm.get_parameter.call_count)
+        self.assertEqual(1, self.mock_anthropic.call_count)
+        first_client.close.assert_not_called()
+
+        # A rotated key gets a new client, and the old one's connections are closed
+        self.mock_ssm.get_parameter.return_value = {'Parameter': {'Value': 'sk-ant-rotated-key'}}
+        clock.now = 122
+        self.assertIs(rotated_client, cache.get_client())
+        self.assertEqual(3, self.mock_ssm.get_parameter.call_count)
+        self.assertEqual(2, self.mock_anthropic.call_count)
+        first_client.close.assert_called_once_with()
+        # The SSM client itself is kept for the lifetime of the container
+        self.assertEqual(1, self.mock_session.call_count)
+
+    def test_replaced_async_client_is_closed_on_the_event_loop(self):
+        """Test that an async client replaced after a key change is closed by the async accessor"""
+        old_client, new_client = MagicMock(), MagicMock()
+        old_client.close = AsyncMock()
+        with patch('anthropic.AsyncAnthropic', side_effect=[old_client, new_client]):
+            self.assertIs(old_client, asyncio.run(get_async_anthropic_client()))
+            self.mock_ssm.get_parameter.return_value = {'Parameter': {'Value': 'sk-ant-rotated-key'}}
+            invalidate_async_anthropic_client()
+            self.assertIs(new_client, asyncio.run(get_async_anthropic_client()))
+
+        old_client.close.assert_awaited_once_with()
+
+    def test_ttl_from_environment(self):
+        """Test that API_KEY_CACHE_TTL_SECONDS configures the refresh interval"""
+        clock = FakeClock()
+        cache = ClientCache(clock=clock)
+
+        with patch.dict('os.environ', {'API_KEY_CACHE_TTL_SECONDS': '0'}):
+            for _ in range(3):
+                cache.get_client()
+        self.assertEqual(3, cache.ssm_fetches)
+
+        with patch.dict('os.environ', {'API_KEY_CACHE_TTL_SECONDS': '3600'}):
+            for _ in range(3):
+                cache.get_client()
+        # The last key fetched with TTL 0 is still fresh under the longer TTL
+        self.assertEqual(3, cache.ssm_fetches)
+
+    def test_authentication_failure_refreshes_key(self):
+        """Test that a rejected key is refreshed from SSM and the request retried once"""
+        stale_client = MagicMock()
+        stale_client.messages.create.side_effect = make_auth_error()
+        fresh_client = MagicMock()
+        fresh_client.messages.create.return_value = make_message("The answer is 4")
+        self.mock_anthropic.side_effect = [stale_client, fresh_client]
+        self.mock_ssm.get_parameter.side_effect = [
+            {'Parameter': {'Value': 'sk-ant-mock-api-key'}},
+            {'Parameter': {'Value': 'sk-ant-rotated-key'}},
+        ]
+
+        with patch('lambda_function.validate_with_claude', return_value=(True, True, "")):
+            response = lambda_handler(make_event('2 + 2'), {})
+            self.assertEqual(200, response['statusCode'])
+
+            # Subsequent invocations keep using the refreshed client
+            for i in range(5):
+                lambda_handler(make_event(f'{i} * 3'), {})
+
+        self.assertEqual(2, self.mock_ssm.get_parameter.call_count)
+        self.assertEqual(2, self.mock_anthropic.call_count)
+        self.assertEqual(1, stale_client.messages.create.call_count)
+        self.assertEqual(6, fresh_client.messages.create.call_count)
+
+    def test_repeated_authentication_failure_returns_error(self):
+        """Test that the handler only retries once when the refreshed key is also rejected"""
+        bad_client = MagicMock()
+        bad_client.messages.create.side_effect = make_auth_error()
+        self.mock_anthropic.return_value = bad_client
+
+        with patch('lambda_function.validate_with_claude', return_value=(True, True, "")):
+            response = lambda_handler(make_event('2 + 2'), {})
+
+        self.assertEqual(500, response['statusCode'])
+        self.assertEqual(2, self.mock_ssm.get_parameter.call_count)
+
+    def test_cache_hits_skip_the_key_fetch(self):
+        """Test that a request answered from the response cache never fetches the key"""
+        mock_client = MagicMock()
+        self.mock_anthropic.return_value = mock_client
+        mock_client.messages.create.return_value = make_message("The answer is 4")
+
+        with patch('lambda_function.validate_with_claude', return_value=(True, True, "")):
+            lambda_handler(make_event('2 + 2'), {})
+            reset_client_cache()
+            response = lambda_handler(make_event('2 + 2'), {})
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual(1, self.mock_ssm.get_parameter.call_count)
+        self.assertEqual(0, get_client_cache().client_builds)
+
+    def test_lazy_client_resolves_on_use(self):
+        """Test that LazyClient only builds the client when an attribute is used"""
+        resolve = MagicMock()
+        client = LazyClient(resolve)
+        resolve.assert_not_called()
+
+        client.messages.create(model='m')
+        resolve.return_value.messages.create.assert_called_once_with(model='m')
+
+
+class ExtensionHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Parameters and Secrets extension's HTTP endpoint."""
+    requests = []
+
+    def do_GET(self):
+        ExtensionHandler.requests.append((self.path, self.headers.get('X-Aws-Parameters-Secrets-Token')))
+        body = json.dumps({'Parameter': {'Value': 'sk-ant-from-extension'}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestApiKeySources(unittest.TestCase):
+
+    def setUp(self):
+        ExtensionHandler.requests = []
+        self.factory = MagicMock()
+        self.cache = ClientCache(client_factory=self.factory)
+
+    def test_source_selection(self):
+        """Test how API_KEY_SOURCE=auto picks a source from the environment"""
+        cases = [
+            ({}, 'env'),
+            ({'PARAMETER_NAME': 'p'}, 'ssm'),
+            ({'PARAMETER_NAME': 'p', 'PARAMETERS_SECRETS_EXTENSION_HTTP_PORT': '2773'}, 'extension'),
+            ({'PARAMETER_NAME': 'p', 'API_KEY_SOURCE': 'env'}, 'env'),
+            ({'PARAMETER_NAME': 'p', 'API_KEY_SOURCE': 'bogus'}, 'ssm'),
+        ]
+        for env, expected in cases:
+            with patch.dict('os.environ', env, clear=True):
+                self.assertEqual(expected, get_api_key_source(), env)
+
+    def test_environment_key_skips_ssm(self):
+        """Test that a key in the environment is used without creating an SSM client"""
+        with patch.dict('os.environ', {'API_KEY_SOURCE': 'env', 'ANTHROPIC_API_KEY': 'sk-ant-env'}), \
+             patch('boto3.session.Session') as mock_session:
+            self.cache.get_client()
+
+        mock_session.assert_not_called()
+        self.factory.assert_called_once_with('sk-ant-env')
+        self.assertEqual(0, self.cache.ssm_fetches)
+
+    def test_extension_key(self):
+        """Test that the key is read from the extension with the session token"""
+        server = HTTPServer(('localhost', 0), ExtensionHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        env = {
+            'PARAMETER_NAME': '/calculator/anthropic-api-key',
+            'PARAMETERS_SECRETS_EXTENSION_HTTP_PORT': str(server.server_address[1]),
+            'AWS_SESSION_TOKEN': 'session-token'
+        }
+        try:
+            with patch.dict('os.environ', env), patch('boto3.session.Session') as mock_session:
+                self.cache.get_client()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        mock_session.assert_not_called()
+        self.factory.assert_called_once_with('sk-ant-from-extension')
+        self.assertEqual(1, self.cache.extension_fetches)
+        path, token = ExtensionHandler.requests[0]
+        self.assertIn('name=%2Fcalculator%2Fanthropic-api-key', path)
+        self.assertEqual('session-token', token)
+
+    def test_extension_failure_falls_back_to_ssm(self):
+        """Test that SSM is used when nothing is listening on the extension port"""
+        server = HTTPServer(('localhost', 0), ExtensionHandler)
+        port = server.server_address[1]
+        server.server_close()
+        env = {'PARAMETER_NAME': 'test-param', 'PARAMETERS_SECRETS_EXTENSION_HTTP_PORT': str(port)}
+        with patch.dict('os.environ', env), patch('boto3.session.Session') as mock_session:
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'sk-ant-from-ssm'}
+            }
+            self.cache.get_client()
+
+        self.factory.assert_called_once_with('sk-ant-from-ssm')
+        self.assertEqual(1, self.cache.ssm_fetches)
+
+    def test_rejected_key_is_refreshed_from_ssm(self):
+        """Test that a key rejected with a 401 is re-read from SSM, since the extension still caches it"""
+        server = HTTPServer(('localhost', 0), ExtensionHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        stale_client = MagicMock()
+        stale_client.messages.create.side_effect = make_auth_error()
+        fresh_client = MagicMock()
+        fresh_client.messages.create.return_value = make_message("The answer is 4")
+        clients = {'sk-ant-from-extension': stale_client, 'sk-ant-rotated': fresh_client}
+        env = {
+            'PARAMETER_NAME': 'test-param',
+            'API_KEY_SOURCE': 'extension',
+            'PARAMETERS_SECRETS_EXTENSION_HTTP_PORT': str(server.server_address[1])
+        }
+        reset_client_cache()
+        reset_response_cache()
+        try:
+            with patch.dict('os.environ', env), \
+                 patch('boto3.session.Session') as mock_session, \
+                 patch('anthropic.Anthropic', side_effect=lambda api_key, **kwargs: clients[api_key]):
+                mock_session.return_value.client.return_value.get_parameter.return_value = {
+                    'Parameter': {'Value': 'sk-ant-rotated'}
+                }
+                response = lambda_handler(make_event('2 + 2'), {})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual(1, len(ExtensionHandler.requests))
+        self.assertEqual(1, get_client_cache().extension_fetches)
+        self.assertEqual(1, get_client_cache().ssm_fetches)
+        self.assertEqual(1, fresh_client.messages.create.call_count)
+        reset_client_cache()
+
+
+class TestColdStart(unittest.TestCase):
+
+    def run_python(self, code, **env):
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, **env), capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+
+    def test_heavy_modules_are_not_imported_at_load(self):
+        """Test that importing the handler loads neither anthropic nor boto3"""
+        code = "import sys, lambda_function; print(sorted(m for m in ('anthropic', 'boto3') if m in sys.modules))"
+        self.assertEqual("[]", self.run_python(code, EAGER_IMPORTS='false'))
+        self.assertEqual("['anthropic', 'boto3']", self.run_python(code, EAGER_IMPORTS='true',
+                                                                    PARAMETER_NAME='test-param'))
+
+if __name__ == '__main__':
+    unittest.main()
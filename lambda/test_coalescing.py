@@ -0,0 +1,252 @@
+import unittest
+import json
+import threading
+import time
+from unittest.mock import patch, MagicMock
+from coalescing import Coalescer, DynamoDBLeaseBackend, InMemoryLeaseBackend, reset_coalescer
+from lambda_function import COMBINED_SYSTEM, VALIDATION_SYSTEM, lambda_handler, reset_validation_memo
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+VALID_VERDICT = '{"is_math_problem": true, "is_solvable": true, "error_message": ""}'
+
+
+class SlowClient:
+    """Fake Anthropic client whose calls take a while, counted per kind."""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = {'validation': 0, 'combined': 0, 'explanation': 0, 'stream': 0}
+        self.lock = threading.Lock()
+        self.messages = self
+
+    def count(self, kind):
+        with self.lock:
+            self.calls[kind] += 1
+
+    def create(self, **kwargs):
+        if kwargs['system'] == VALIDATION_SYSTEM:
+            kind, text = 'validation', VALID_VERDICT
+        elif kwargs['system'] == COMBINED_SYSTEM:
+            kind, text = 'combined', f"<verdict>{VALID_VERDICT}</verdict><explanation><p>x = 2</p></explanation>"
+        else:
+            kind, text = 'explanation', "<p>x = 2</p>"
+        self.count(kind)
+        time.sleep(self.delay)
+        message = MagicMock()
+        message.content = [MagicMock(type='text', text=text)]
+        return message
+
+    def stream(self, **kwargs):
+        self.count('stream')
+        time.sleep(self.delay)
+        stream = MagicMock()
+        stream.__enter__.return_value.text_stream = iter(["<p>x = </p>", "<p>2</p>"])
+        return stream
+
+    def total(self):
+        return sum(self.calls.values())
+
+
+class TestInProcessCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+        reset_coalescer()
+
+    def fire(self, body, client, count=8, env=None):
+        """Send count identical requests at once and return the parsed responses."""
+        responses = [None] * count
+        barrier = threading.Barrier(count)
+
+        def invoke(index):
+            barrier.wait()
+            responses[index] = lambda_handler({'body': json.dumps(body)}, {})
+
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=client), \
+             patch.dict('os.environ', dict({'PARAMETER_NAME': 'test-param'}, **(env or {}))):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            threads = [threading.Thread(target=invoke, args=(index,)) for index in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return responses
+
+    def test_identical_requests_make_one_upstream_call(self):
+        """Test that N concurrent identical requests share one tutoring call"""
+        client = SlowClient()
+
+        responses = self.fire({'expression': '17 * 23'}, client)
+
+        self.assertEqual(1, client.total())
+        bodies = [json.loads(response['body']) for response in responses]
+        self.assertTrue(all(response['statusCode'] == 200 for response in responses))
+        self.assertEqual({"<p>x = 2</p>"}, {body['explanation'] for body in bodies})
+        self.assertEqual(7, sum(body['cache']['tier'] == 'coalesced' for body in bodies))
+
+    def test_validation_and_explanation_are_both_shared(self):
+        """Test that a problem needing Claude validation costs one call of each kind"""
+        client = SlowClient()
+
+        responses = self.fire({'expression': 'solve for x: 2x + 3 = 7'}, client)
+
+        self.assertTrue(all(response['statusCode'] == 200 for response in responses))
+        self.assertEqual(1, client.calls['validation'])
+        self.assertEqual(1, client.calls['explanation'])
+
+    def test_combined_mode_makes_one_upstream_call(self):
+        """Test that concurrent combined requests share the single call"""
+        client = SlowClient()
+
+        responses = self.fire({'expression': 'solve for x: 2x + 3 = 7'}, client, env={'VALIDATION_MODE': 'combined'})
+
+        self.assertTrue(all(response['statusCode'] == 200 for response in responses))
+        self.assertEqual(1, client.total())
+
+    def test_streams_share_one_generation(self):
+        """Test that concurrent streams wait for the first one and get its text"""
+        client = SlowClient()
+
+        responses = self.fire({'expression': '17 * 23', 'stream': True}, client)
+
+        self.assertEqual(1, client.calls['stream'])
+        for response in responses:
+            self.assertEqual(200, response['statusCode'])
+            self.assertIn('x = ', response['body'])
+
+    def test_coalescing_can_be_disabled(self):
+        """Test that COALESCING_ENABLED=false lets every request call upstream"""
+        client = SlowClient()
+
+        self.fire({'expression': '17 * 23'}, client, count=3, env={'COALESCING_ENABLED': 'false'})
+
+        self.assertEqual(3, client.calls['explanation'])
+
+
+class TestCoalescer(unittest.TestCase):
+
+    def run_concurrently(self, *functions):
+        results = [None] * len(functions)
+
+        def run(index):
+            results[index] = functions[index]()
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(functions))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_failed_leader_is_not_shared(self):
+        """Test that followers do the work themselves if the leader fails"""
+        coalescer = Coalescer()
+
+        def fail():
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+
+        def leader():
+            try:
+                coalescer.run('key', fail)
+            except RuntimeError:
+                return 'failed'
+
+        results = self.run_concurrently(leader, lambda: coalescer.run('key', lambda: 'own'))
+
+        self.assertEqual(['failed', ('own', False)], results)
+
+    def test_lease_shares_results_across_containers(self):
+        """Test that a container that loses the lease waits for the winner's result"""
+        leases = InMemoryLeaseBackend()
+        shared_store = {}
+        first = Coalescer(leases, poll_seconds=0.01)
+        second = Coalescer(leases, poll_seconds=0.01)
+        upstream_calls = []
+
+        def generate():
+            upstream_calls.append(1)
+            time.sleep(0.2)
+            shared_store['key'] = 'explanation'
+            return 'explanation'
+
+        results = self.run_concurrently(
+            lambda: first.run('key', generate, lambda: shared_store.get('key')),
+            lambda: second.run('key', generate, lambda: shared_store.get('key')),
+        )
+
+        self.assertEqual([('explanation', False), ('explanation', True)], results)
+        self.assertEqual(1, len(upstream_calls))
+
+    def test_released_lease_without_result_is_taken_over(self):
+        """Test that a follower stops waiting once the holder gives up the lease"""
+        leases = InMemoryLeaseBackend()
+        first = Coalescer(leases, poll_seconds=0.01)
+        second = Coalescer(leases, poll_seconds=0.01, wait_seconds=5)
+
+        def rejected():
+            time.sleep(0.1)
+            return None
+
+        started = time.monotonic()
+        results = self.run_concurrently(
+            lambda: first.run('key', rejected, lambda: None),
+            lambda: second.run('key', lambda: 'own', lambda: None),
+        )
+
+        self.assertEqual([(None, False), ('own', False)], results)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+
+class FakeLeaseTable:
+    """Stand-in for a DynamoDB Table that evaluates the lease condition."""
+
+    def __init__(self):
+        self.items = {}
+        self.meta = MagicMock()
+        self.meta.client.exceptions.ConditionalCheckFailedException = ConditionalCheckFailedException
+
+    def put_item(self, Item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        current = self.items.get(Item['lease_key'])
+        if current is not None and current['expires_at'] >= ExpressionAttributeValues[':now'] \
+                and current['owner'] != ExpressionAttributeValues[':owner']:
+            raise ConditionalCheckFailedException()
+        self.items[Item['lease_key']] = Item
+
+    def delete_item(self, Key, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        current = self.items.get(Key['lease_key'])
+        if current is None or current['owner'] != ExpressionAttributeValues[':owner']:
+            raise ConditionalCheckFailedException()
+        del self.items[Key['lease_key']]
+
+
+class TestDynamoDBLeaseBackend(unittest.TestCase):
+
+    def test_one_owner_at_a_time(self):
+        """Test that leases exclude other owners until released or expired"""
+        now = [1000.0]
+        backend = DynamoDBLeaseBackend(table=FakeLeaseTable(), clock=lambda: now[0])
+
+        self.assertTrue(backend.acquire('key', 'a', 30))
+        self.assertFalse(backend.acquire('key', 'b', 30))
+        backend.release('key', 'b')
+        self.assertFalse(backend.acquire('key', 'b', 30))
+        backend.release('key', 'a')
+        self.assertTrue(backend.acquire('key', 'b', 30))
+
+        now[0] += 60
+        self.assertTrue(backend.acquire('key', 'a', 30))
+
+if __name__ == '__main__':
+    unittest.main()
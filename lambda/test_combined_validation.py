@@ -0,0 +1,142 @@
+import unittest
+import json
+from unittest.mock import patch, MagicMock
+from lambda_function import (
+    lambda_handler, lookup_validation_memo, parse_combined_response, reset_validation_memo, COMBINED_SYSTEM
+)
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+
+def make_message(text):
+    message = MagicMock()
+    message.content = [MagicMock(type='text', text=text)]
+    return message
+
+
+VALID_RESPONSE = (
+    '<verdict>{"is_math_problem": true, "is_solvable": true, "error_message": ""}</verdict>\n'
+    '<explanation><h3>Solving 2x + 3 = 7</h3><p>x = 2</p></explanation>'
+)
+
+
+class TestParseCombinedResponse(unittest.TestCase):
+
+    def test_tagged_response(self):
+        """Test that the verdict and explanation are read from their tags"""
+        verdict, explanation = parse_combined_response(make_message(VALID_RESPONSE))
+        self.assertEqual((True, True, ""), verdict)
+        self.assertEqual("<h3>Solving 2x + 3 = 7</h3><p>x = 2</p>", explanation)
+
+    def test_rejection_has_no_explanation(self):
+        """Test that a rejected input yields no explanation"""
+        verdict, explanation = parse_combined_response(make_message(
+            '<verdict>{"is_math_problem": false, "is_solvable": false, "error_message": "Not math"}</verdict>'
+        ))
+        self.assertEqual((False, False, "Not math"), verdict)
+        self.assertIsNone(explanation)
+
+    def test_tolerates_untagged_verdict_and_truncation(self):
+        """Test bare JSON verdicts, string flags and an explanation cut off by max_tokens"""
+        verdict, explanation = parse_combined_response(make_message(
+            'Here you go: {"is_math_problem": "true", "is_solvable": "true"}\n<explanation><p>Step 1'
+        ))
+        self.assertEqual((True, True, ""), verdict)
+        self.assertEqual("<p>Step 1", explanation)
+
+    def test_unparseable_verdict_raises(self):
+        """Test that responses without a JSON verdict are rejected"""
+        for text in ["I think this is math!", "<verdict>{not json}</verdict>", "<verdict>[true]</verdict>"]:
+            with self.assertRaises(ValueError):
+                parse_combined_response(make_message(text))
+
+
+class TestCombinedMode(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def run_handler(self, expression, mock_client, mode='combined'):
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param', 'VALIDATION_MODE': mode}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            return lambda_handler({'body': json.dumps({'expression': expression})}, {})
+
+    def test_single_call_for_valid_problem(self):
+        """Test that a valid problem is validated and explained in one call"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = make_message(VALID_RESPONSE)
+
+        response = self.run_handler("solve for x: 2x + 3 = 7", mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        body = json.loads(response['body'])
+        self.assertEqual("<h3>Solving 2x + 3 = 7</h3><p>x = 2</p>", body['explanation'])
+        self.assertEqual(1, mock_client.messages.create.call_count)
+        self.assertEqual(COMBINED_SYSTEM, mock_client.messages.create.call_args[1]['system'])
+
+        # The explanation is cached like a two-call explanation
+        response = self.run_handler("Solve for x:  2x+3=7", mock_client)
+        self.assertTrue(json.loads(response['body'])['cache']['hit'])
+        self.assertEqual(1, mock_client.messages.create.call_count)
+
+    def test_rejected_input(self):
+        """Test that a rejection in the combined response is returned as a 400"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = make_message(
+            '<verdict>{"is_math_problem": false, "is_solvable": false, "error_message": "Not math"}</verdict>'
+        )
+
+        response = self.run_handler("tell me a joke about 7 dwarfs", mock_client)
+
+        self.assertEqual(400, response['statusCode'])
+        self.assertIn('does not appear to be a math problem', json.loads(response['body'])['error'])
+        self.assertEqual(1, mock_client.messages.create.call_count)
+        # The verdict wasn't sampled at temperature 0, so the validation memo doesn't keep it
+        self.assertIsNone(lookup_validation_memo("tell me a joke about 7 dwarfs"))
+
+    def test_unparseable_response_falls_back_to_basic_validation(self):
+        """Test that garbage falls back to basic_validation and the tutoring prompt"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [
+            make_message("Sure! x is 2."),
+            make_message("<p>x = 2</p>")
+        ]
+
+        response = self.run_handler("2x + 3 = 7", mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual("<p>x = 2</p>", json.loads(response['body'])['explanation'])
+        self.assertEqual(2, mock_client.messages.create.call_count)
+        self.assertNotEqual(COMBINED_SYSTEM, mock_client.messages.create.call_args[1]['system'])
+
+    def test_local_arithmetic_keeps_tutoring_prompt(self):
+        """Test that locally evaluated expressions still use the tutoring prompt"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = make_message("<p>4</p>")
+
+        response = self.run_handler("2 + 2", mock_client)
+
+        self.assertEqual("4", json.loads(response['body'])['result'])
+        self.assertNotEqual(COMBINED_SYSTEM, mock_client.messages.create.call_args[1]['system'])
+
+    def test_separate_mode_is_default(self):
+        """Test that unknown modes keep the two-call path"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [
+            make_message('{"is_math_problem": true, "is_solvable": true, "error_message": ""}'),
+            make_message("<p>x = 2</p>")
+        ]
+
+        response = self.run_handler("2x + 3 = 7", mock_client, mode='bogus')
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual(2, mock_client.messages.create.call_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,17 @@
 import unittest
 import json
 from unittest.mock import patch, MagicMock
-from lambda_function import validate_with_claude, basic_validation, lambda_handler
+from lambda_function import validate_with_claude, basic_validation, lambda_handler, reset_validation_memo
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
 
 class TestMathValidation(unittest.TestCase):
+
+    def setUp(self):
+        # Each test patches its own SSM/Anthropic mocks, so start from a cold container
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
     
     def test_basic_validation_valid_math(self):
         """Test basic validation with valid math expressions"""
@@ -58,6 +66,22 @@ class TestMathValidation(unittest.TestCase):
             self.assertFalse(is_valid, f"Expression '{expr}' should be invalid")
             self.assertIn(expected_error, error_msg.lower(), f"Error message for '{expr}' should contain '{expected_error}'")
     
+    def test_basic_validation_structure(self):
+        """Test bracket ordering, zero divisors and operators read from tokens"""
+        test_cases = [
+            ("2 + 3) * (4", "Unbalanced parentheses in the expression."),
+            ("[2 + (3 * 4])", "Unbalanced brackets in the expression."),
+            ("10 / 0.0", "Expression contains division by zero."),
+            ("10 ÷ 0", "Expression contains division by zero."),
+            ("7 * / 2", "Expression contains consecutive operators."),
+        ]
+
+        for expr, expected_error in test_cases:
+            self.assertEqual((False, True, expected_error), basic_validation(expr), expr)
+
+        for expr in ["2 ** 3", "10 / 0.5", "10 / 05", "-3 * -2", "{[(1 + 2) * 3] - 4}", "sin30 + 1"]:
+            self.assertEqual((True, True, ""), basic_validation(expr), expr)
+
     @patch('anthropic.Anthropic')
     def test_claude_validation_success(self, mock_anthropic):
         """Test Claude validation with successful API response"""
@@ -65,6 +89,7 @@ class TestMathValidation(unittest.TestCase):
         mock_client = MagicMock()
         mock_message = MagicMock()
         mock_content = MagicMock()
+        mock_content.type = 'text'
         
         # Set up the mock response
         mock_content.text = json.dumps({
@@ -97,6 +122,7 @@ class TestMathValidation(unittest.TestCase):
         mock_client = MagicMock()
         mock_message = MagicMock()
         mock_content = MagicMock()
+        mock_content.type = 'text'
         
         # Set up the mock response for non-math input
         mock_content.text = json.dumps({
@@ -122,6 +148,7 @@ class TestMathValidation(unittest.TestCase):
         mock_client = MagicMock()
         mock_message = MagicMock()
         mock_content = MagicMock()
+        mock_content.type = 'text'
         
         # Set up the mock response for unsolvable math
         mock_content.text = json.dumps({
@@ -167,6 +194,7 @@ class TestMathValidation(unittest.TestCase):
             mock_anthropic.return_value = mock_client
             mock_message = MagicMock()
             mock_content = MagicMock()
+            mock_content.type = 'text'
             mock_content.text = "The answer is 4"
             mock_message.content = [mock_content]
             mock_client.messages.create.return_value = mock_message
@@ -248,5 +276,85 @@ class TestMathValidation(unittest.TestCase):
                 self.assertIn('invalid', body['error'])
                 self.assertIn('Division by zero', body['error'])
 
+class TestValidationMemo(unittest.TestCase):
+
+    def setUp(self):
+        reset_validation_memo()
+
+    def make_client(self, verdict):
+        mock_client = MagicMock()
+        mock_content = MagicMock()
+        mock_content.type = 'text'
+        mock_content.text = json.dumps(verdict)
+        mock_client.messages.create.return_value.content = [mock_content]
+        return mock_client
+
+    def test_repeated_inputs_make_zero_client_calls(self):
+        """Test that repeated and equivalently spelled inputs reuse the memoised verdict"""
+        mock_client = self.make_client({
+            "is_math_problem": True,
+            "is_solvable": True,
+            "error_message": ""
+        })
+
+        first = validate_with_claude(mock_client, "solve for x: 2x + 3 = 7")
+        self.assertEqual(1, mock_client.messages.create.call_count)
+
+        for expr in ["solve for x: 2x + 3 = 7", "Solve for x:  2x+3=7", "SOLVE FOR X: 2x + 3 = 7"]:
+            self.assertEqual(first, validate_with_claude(mock_client, expr))
+        self.assertEqual(1, mock_client.messages.create.call_count)
+
+    def test_unicode_operators_share_verdict(self):
+        """Test that Unicode operators are canonicalised before the memo lookup"""
+        mock_client = self.make_client({
+            "is_math_problem": True,
+            "is_solvable": True,
+            "error_message": ""
+        })
+
+        validate_with_claude(mock_client, "x × 3 = 12")
+        validate_with_claude(mock_client, "x*3=12")
+        validate_with_claude(mock_client, "x ∗ 3 = 12")
+        self.assertEqual(1, mock_client.messages.create.call_count)
+
+    def test_negative_verdicts_are_memoised(self):
+        """Test that non-math verdicts are cached too"""
+        mock_client = self.make_client({
+            "is_math_problem": False,
+            "is_solvable": False,
+            "error_message": "This is not a mathematical expression."
+        })
+
+        for _ in range(10):
+            is_valid, is_math, error_msg = validate_with_claude(mock_client, "tell me a joke")
+            self.assertFalse(is_math)
+            self.assertEqual("This is not a mathematical expression.", error_msg)
+        self.assertEqual(1, mock_client.messages.create.call_count)
+
+    def test_fallback_verdicts_are_not_memoised(self):
+        """Test that a failed Claude call is retried instead of memoising basic_validation"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = Exception("overloaded")
+
+        validate_with_claude(mock_client, "2x + 3 = 7")
+        validate_with_claude(mock_client, "2x + 3 = 7")
+        self.assertEqual(2, mock_client.messages.create.call_count)
+
+    def test_memo_is_bounded_with_ttl(self):
+        """Test that VALIDATION_MEMO_* variables bound the memo"""
+        with patch.dict('os.environ', {'VALIDATION_MEMO_MAX_ENTRIES': '2', 'VALIDATION_MEMO_TTL_SECONDS': '60'}):
+            reset_validation_memo()
+            mock_client = self.make_client({
+                "is_math_problem": True,
+                "is_solvable": True,
+                "error_message": ""
+            })
+            for expr in ["x + 1 = 2", "x + 2 = 3", "x + 3 = 4", "x + 1 = 2"]:
+                validate_with_claude(mock_client, expr)
+
+        # The first expression was evicted by the third, so it was validated twice
+        self.assertEqual(4, mock_client.messages.create.call_count)
+        reset_validation_memo()
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,245 @@
+import unittest
+import json
+from fractions import Fraction
+from unittest.mock import patch, MagicMock
+from math_engine import (
+    canonicalize_expression, evaluate_expression, format_number, scan_signals, tokenize, trace_expression,
+    LocalEvaluationError, UnsupportedExpression
+)
+from lambda_function import lambda_handler, local_validation
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+
+class TestMathEngine(unittest.TestCase):
+
+    def test_evaluates_basic_validation_examples(self):
+        """Test that the arithmetic examples accepted by basic_validation evaluate locally"""
+        test_cases = [
+            ("2 + 2", "4"),
+            ("5 * (3 + 2)", "25"),
+            ("10 / 2", "5"),
+            ("sqrt(16)", "4"),
+            ("2^3", "8"),
+            ("5 % 2", "1"),
+            ("log(100)", "2"),
+            ("abs(-5)", "5"),
+            ("3.14159 * 2", "6.28318"),
+            ("[2 + 3] * {4}", "20"),
+            ("√16 + 1", "5"),
+            ("8 ÷ 2 × 3 − 1", "11"),
+            ("3 · 4 – 2", "10"),
+        ]
+
+        for expr, expected in test_cases:
+            self.assertEqual(expected, format_number(evaluate_expression(expr)), f"Wrong result for '{expr}'")
+
+    def test_rational_arithmetic_is_exact(self):
+        """Test that decimals and fractions do not pick up floating point error"""
+        self.assertEqual(Fraction(3, 10), evaluate_expression("0.1 + 0.2"))
+        self.assertEqual(Fraction(1, 3), evaluate_expression("1 / 3"))
+        self.assertEqual("0.3", format_number(evaluate_expression("0.1 + 0.2")))
+        self.assertEqual("-1.75", format_number(evaluate_expression("-7 / 4")))
+        self.assertTrue(format_number(evaluate_expression("1 / 3")).startswith("1/3"))
+
+    def test_round_halves_away_from_zero(self):
+        """Test that round() gives the answer students expect, not banker's rounding"""
+        self.assertEqual(Fraction(3), evaluate_expression("round(2.5)"))
+        self.assertEqual(Fraction(-3), evaluate_expression("round(-2.5)"))
+        self.assertEqual(Fraction(1), evaluate_expression("round(0.5)"))
+        self.assertEqual("2.68", format_number(evaluate_expression("round(2.675, 2)")))
+        self.assertEqual(Fraction(1200), evaluate_expression("round(1250, -2) - 100"))
+
+    def test_division_by_zero(self):
+        """Test that division by zero is detected exactly, including computed divisors"""
+        for expr in ["5 / 0", "5/0.0", "5 / (3 - 3)", "7 % 0", "0 ^ -1"]:
+            with self.assertRaises(LocalEvaluationError, msg=f"'{expr}' should be rejected"):
+                evaluate_expression(expr)
+
+        # A divisor that merely starts with zero is fine
+        self.assertEqual(Fraction(10), evaluate_expression("5 / 0.5"))
+
+    def test_invalid_syntax(self):
+        """Test that only provably invalid input is rejected, and other unparseable notation goes to Claude"""
+        with self.assertRaises(LocalEvaluationError):
+            evaluate_expression("sqrt()")
+        for expr in ["5 + + 3", "5 + * 3", "2 ^ / 4"]:
+            with self.assertRaises(LocalEvaluationError, msg=f"'{expr}' should be rejected like basic_validation"):
+                evaluate_expression(expr)
+        # A unary minus after an operator is still fine
+        self.assertEqual(Fraction(-15), evaluate_expression("5 * -3"))
+        for expr in ["50%", "sin 30", "2√16", "1 000", "(2 + 3", "2 +"]:
+            with self.assertRaises(UnsupportedExpression, msg=f"'{expr}' should be left to Claude"):
+                evaluate_expression(expr)
+
+    def test_unsupported_input_is_left_to_claude(self):
+        """Test that anything beyond plain arithmetic raises UnsupportedExpression"""
+        test_cases = [
+            "tell me a joke",
+            "solve for x: 2x + 3 = 7",
+            "derivative of x^2",
+            "42",
+            "sqrt(-4)",
+            "sin(30)",
+            "2 * cos(pi)",
+            "9^9^9",
+            "__import__('os')",
+            "(1).__class__",
+            "1e400 + 1",
+            "10^400 * pi",
+            "(10^999)^1000",
+        ]
+
+        for expr in test_cases:
+            with self.assertRaises(UnsupportedExpression, msg=f"'{expr}' should not be evaluated locally"):
+                evaluate_expression(expr)
+
+        # The size estimate only rejects powers that really are too large
+        self.assertEqual(Fraction(9) ** 1000, evaluate_expression("9^1000"))
+
+
+class TestStepTrace(unittest.TestCase):
+
+    def trace(self, expression):
+        return [f"{step.expression} = {step.value}" for step in trace_expression(expression)[1]]
+
+    def test_order_of_operations(self):
+        """Test that steps follow brackets, powers, then multiplication before addition, left to right"""
+        self.assertEqual(["3 × 4 = 12", "2 + 12 = 14"], self.trace("2 + 3 * 4"))
+        self.assertEqual(["2 + 3 = 5", "5 × 4 = 20"], self.trace("(2 + 3) * 4"))
+        self.assertEqual(["2 ^ 3 = 8", "8 × 2 = 16", "10 - 16 = -6"], self.trace("10 - 2^3 * 2"))
+        self.assertEqual(["sqrt(16) = 4", "4 + 1 = 5"], self.trace("√16 + 1"))
+
+    def test_exact_values(self):
+        """Test that every step carries the exact value, with negatives and fractions bracketed"""
+        self.assertEqual(["1 ÷ 3 = 1/3", "(1/3) × 3 = 1"], self.trace("1/3 * 3"))
+        self.assertEqual(["0.1 + 0.2 = 0.3"], self.trace("0.1 + 0.2"))
+        self.assertEqual(["2 + 3 = 5", "-(5) = -5", "(-5) mod 3 = 1"], self.trace("-(2 + 3) % 3"))
+
+    def test_trace_matches_evaluation(self):
+        """Test that the traced value is the evaluated value and errors are the same"""
+        for expression in ["5 * (3 + 2)", "2^10 / 4 - 7", "abs(-5) + log(100)"]:
+            value, steps = trace_expression(expression)
+            self.assertEqual(evaluate_expression(expression), value)
+            self.assertEqual(format_number(value), steps[-1].value)
+        with self.assertRaises(LocalEvaluationError):
+            trace_expression("5 / (2 - 2)")
+        with self.assertRaises(UnsupportedExpression):
+            trace_expression("x + 1")
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_token_kinds(self):
+        """Test that a single scan classifies every token"""
+        tokens = tokenize("Solve: 2x ** 3 <= [√16, 0.5]")
+        self.assertEqual(
+            [('word', 'solve'), ('other', ':'), ('number', '2'), ('word', 'x'), ('op', '^'), ('number', '3'),
+             ('symbol', '<'), ('symbol', '='), ('open', '['), ('symbol', '√'), ('number', '16'),
+             ('symbol', ','), ('number', '0.5'), ('close', ']')],
+            [(kind, text) for kind, text, _ in tokens]
+        )
+        self.assertEqual([False, False, True, False, True, True], [spaced for _, _, spaced in tokens[:6]])
+
+    def test_unicode_operators_are_normalised(self):
+        """Test that pasted Unicode operators tokenize like their ASCII forms"""
+        self.assertEqual(
+            [text for _, text, _ in tokenize("8 ÷ 2 × 3 − 1")],
+            [text for _, text, _ in tokenize("8/2*3-1")]
+        )
+
+    def test_canonical_form(self):
+        """Test that insignificant whitespace and spelling differences disappear"""
+        self.assertEqual("solve for x: 2x+3=7", canonicalize_expression("  Solve  for x:  2x + 3 = 7 "))
+        self.assertEqual("2^3*(4-1)", canonicalize_expression("2 ** 3 × ( 4 − 1 )"))
+        self.assertEqual("what is 12 plus 3", canonicalize_expression("What\tis 12\nplus 3"))
+
+    def test_token_streams_are_reused(self):
+        """Test that short inputs are scanned once and long inputs are not cached"""
+        self.assertIs(tokenize("7 * 6 + 1"), tokenize("7 * 6 + 1"))
+        long_expression = "1 + " * 1000 + "1"
+        self.assertIsNot(tokenize(long_expression), tokenize(long_expression))
+        self.assertEqual(2001, len(tokenize(long_expression)))
+
+    def test_signals(self):
+        """Test that one scan reports counts, nesting and structural errors"""
+        signals = scan_signals("Solve: sqrt((2x + 3)) / 0 = y")
+        self.assertEqual(3, signals.numbers)
+        self.assertEqual(2, signals.operators)
+        self.assertEqual(4, signals.brackets)
+        self.assertEqual(1, signals.relations)
+        self.assertEqual(1, signals.functions)
+        self.assertEqual(('solve', 'sqrt', 'x', 'y'), signals.words)
+        self.assertEqual(2, signals.max_depth)
+        self.assertTrue(signals.divides_by_zero)
+        self.assertFalse(signals.consecutive_operators)
+        self.assertIsNone(signals.bracket_error)
+        self.assertEqual(')', scan_signals("2 + 3)(").bracket_error)
+        self.assertTrue(scan_signals("2 + * 3").consecutive_operators)
+
+
+class TestLocalShortCircuit(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+
+    def run_handler(self, expression, mock_client):
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            return lambda_handler({'body': json.dumps({'expression': expression})}, {})
+
+    def test_local_validation_tuple(self):
+        """Test the verdicts returned by local_validation"""
+        self.assertEqual((True, True, "", "25"), local_validation("5 * (3 + 2)"))
+        self.assertEqual((False, True, "Division by zero is undefined.", None), local_validation("5 / 0"))
+        self.assertEqual((True, True, "", "1"), local_validation("2 − 1"))
+        self.assertIsNone(local_validation("tell me a joke"))
+
+    @patch('lambda_function.validate_with_claude')
+    def test_arithmetic_skips_claude_validation(self, mock_validate):
+        """Test that plain arithmetic makes one Claude call and passes the exact answer"""
+        mock_client = MagicMock()
+        mock_content = MagicMock()
+        mock_content.type = 'text'
+        mock_content.text = "<p>The answer is 25</p>"
+        mock_client.messages.create.return_value.content = [mock_content]
+
+        response = self.run_handler("5 * (3 + 2)", mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual("25", json.loads(response['body'])['result'])
+        mock_validate.assert_not_called()
+        mock_client.messages.create.assert_called_once()
+        prompt = mock_client.messages.create.call_args[1]["messages"][0]["content"]
+        self.assertIn("The exact answer, already computed for you, is: 25", prompt)
+
+    @patch('lambda_function.validate_with_claude', return_value=(True, True, ""))
+    def test_overflowing_literal_goes_to_claude(self, mock_validate):
+        """Test that a literal too large for a float is escalated rather than failing the request"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value.content = [MagicMock(type='text', text="<p>That's a big number</p>")]
+
+        response = self.run_handler("1e400 + 1", mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        mock_validate.assert_called_once()
+
+    @patch('lambda_function.validate_with_claude')
+    def test_division_by_zero_makes_no_claude_calls(self, mock_validate):
+        """Test that a locally detected error is returned without any Claude call"""
+        mock_client = MagicMock()
+
+        response = self.run_handler("5 / (2 - 2)", mock_client)
+
+        self.assertEqual(400, response['statusCode'])
+        self.assertIn('Division by zero', json.loads(response['body'])['error'])
+        mock_validate.assert_not_called()
+        mock_client.messages.create.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import io
+import json
+import contextlib
+from unittest.mock import patch, MagicMock
+import metrics
+from lambda_function import lambda_handler, reset_validation_memo
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_message(text, input_tokens, output_tokens):
+    message = MagicMock()
+    message.content = [MagicMock(type='text', text=text)]
+    message.usage.input_tokens = input_tokens
+    message.usage.output_tokens = output_tokens
+    return message
+
+
+class TestRequestMetrics(unittest.TestCase):
+
+    def test_spans_and_counters_accumulate(self):
+        """Test that repeated stages add up and counters sum"""
+        clock = FakeClock()
+        request_metrics = metrics.RequestMetrics('single', clock=clock)
+        for _ in range(2):
+            with request_metrics.span('validation'):
+                clock.now += 0.25
+        request_metrics.increment('tokens_in', 100)
+        request_metrics.increment('tokens_in', 20)
+
+        timings = request_metrics.timings()
+        self.assertEqual(500.0, timings['stages']['validation'])
+        self.assertEqual(500.0, timings['total_ms'])
+        self.assertEqual({'tokens_in': 120}, timings['counters'])
+
+    def test_emf_document(self):
+        """Test that every stage and counter is declared as an EMF metric"""
+        clock = FakeClock()
+        request_metrics = metrics.RequestMetrics('batch', clock=clock)
+        with request_metrics.span('generation'):
+            clock.now += 0.1
+        request_metrics.increment('response_cache_hits')
+
+        document = request_metrics.to_emf(200, namespace='Test', timestamp=1.5)
+
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(1500, document['_aws']['Timestamp'])
+        self.assertEqual('Test', directive['Namespace'])
+        self.assertEqual([['Route']], directive['Dimensions'])
+        self.assertEqual('batch', document['Route'])
+        self.assertEqual(200, document['StatusCode'])
+        for definition in directive['Metrics']:
+            self.assertIn(definition['Name'], document)
+        self.assertEqual(100.0, document['generation_ms'])
+        self.assertEqual(1, document['response_cache_hits'])
+
+    def test_helpers_are_noops_outside_a_request(self):
+        """Test that module helpers do nothing when no request is traced"""
+        self.assertIsNone(metrics.current_request())
+        with metrics.span('validation'):
+            metrics.increment('tokens_in', 5)
+            metrics.record_usage(make_message("", 1, 1))
+        self.assertIsNone(metrics.current_request())
+
+
+class TestHandlerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def run_handler(self, body, mock_client, env=None):
+        output = io.StringIO()
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', dict({'PARAMETER_NAME': 'test-param'}, **(env or {}))), \
+             contextlib.redirect_stdout(output):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            response = lambda_handler({'body': json.dumps(body)}, {})
+
+        emf_lines = [json.loads(line) for line in output.getvalue().splitlines() if line.startswith('{"_aws"')]
+        return response, emf_lines
+
+    def test_stages_and_tokens_are_logged(self):
+        """Test that one EMF line reports each stage, token counts and the route"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [
+            make_message('{"is_math_problem": true, "is_solvable": true, "error_message": ""}', 120, 20),
+            make_message("<p>x = 2</p>", 300, 150)
+        ]
+
+        response, emf_lines = self.run_handler({'expression': 'solve for x: 2x + 3 = 7'}, mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertNotIn('timings', json.loads(response['body']))
+        self.assertEqual(1, len(emf_lines))
+        document = emf_lines[0]
+        self.assertEqual('single', document['Route'])
+        self.assertEqual(200, document['StatusCode'])
+        for stage in ['ssm', 'client_init', 'local_eval', 'validation', 'generation', 'extraction']:
+            self.assertIn(f"{stage}_ms", document)
+        self.assertEqual(2, document['anthropic_calls'])
+        self.assertEqual(420, document['tokens_in'])
+        self.assertEqual(170, document['tokens_out'])
+        self.assertEqual(1, document['response_cache_misses'])
+        self.assertIsNone(metrics.current_request())
+
+    def test_fallback_and_timings_block(self):
+        """Test the basic_validation fallback counter and the opt-in timings block"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = [Exception("overloaded"), make_message("<p>x = 2</p>", 10, 5)]
+
+        response, emf_lines = self.run_handler({'expression': '2x + 3 = 7', 'timings': True}, mock_client)
+
+        timings = json.loads(response['body'])['timings']
+        self.assertEqual(1, timings['counters']['basic_validation_fallbacks'])
+        self.assertIn('generation', timings['stages'])
+        self.assertEqual(1, emf_lines[0]['basic_validation_fallbacks'])
+
+    def test_batch_threads_record_on_the_request(self):
+        """Test that spans from batch worker threads are attributed to the batch"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = make_message("<p>done</p>", 10, 5)
+
+        response, emf_lines = self.run_handler(
+            {'expressions': ['2 + 2', '3 + 3', '4 + 4']}, mock_client, env={'RETURN_TIMINGS': 'true'}
+        )
+
+        body = json.loads(response['body'])
+        self.assertEqual(3, body['timings']['counters']['anthropic_calls'])
+        self.assertEqual('batch', emf_lines[0]['Route'])
+        self.assertEqual(15, emf_lines[0]['tokens_out'])
+
+    def test_metrics_can_be_disabled(self):
+        """Test that METRICS_ENABLED=false emits nothing"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = make_message("<p>4</p>", 10, 5)
+
+        response, emf_lines = self.run_handler(
+            {'expression': '2 + 2', 'timings': True}, mock_client, env={'METRICS_ENABLED': 'false'}
+        )
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual([], emf_lines)
+        self.assertNotIn('timings', json.loads(response['body']))
+
+if __name__ == '__main__':
+    unittest.main()
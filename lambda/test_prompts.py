@@ -0,0 +1,112 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+import lambda_function
+import metrics
+import prompts
+from prompts import COMBINED, NARRATION, TUTORING, VALIDATION, find_prompt, prompt_versions
+from lambda_function import (
+    build_combined_request, build_tutoring_request, build_validation_request, solve_expression, tutoring_cache_key
+)
+from response_cache import reset_response_cache
+
+
+class TestPromptRegistry(unittest.TestCase):
+
+    def test_static_prefix_is_marked_for_caching(self):
+        """Test that the instructions go in a cache_control block and the expression doesn't"""
+        for request in [build_validation_request("2x + 3 = 7"), build_tutoring_request("2x + 3 = 7"),
+                        build_combined_request("2x + 3 = 7")]:
+            persona, instructions = request['system']
+            self.assertNotIn('cache_control', persona)
+            self.assertEqual({'type': 'ephemeral'}, instructions['cache_control'])
+            self.assertNotIn("2x + 3 = 7", instructions['text'])
+            self.assertIn("2x + 3 = 7", request['messages'][0]['content'])
+
+    def test_prefix_is_identical_across_requests(self):
+        """Test that different expressions share the same system argument"""
+        self.assertEqual(build_validation_request("1 + 1")['system'], build_validation_request("x^2 = 9")['system'])
+        self.assertEqual(build_tutoring_request("1 + 1")['system'], build_tutoring_request("x^2 = 9")['system'])
+
+    def test_caching_can_be_disabled(self):
+        """Test that PROMPT_CACHING=false drops cache_control but keeps the text"""
+        with patch.dict('os.environ', {'PROMPT_CACHING': 'false'}):
+            system = build_validation_request("1 + 1")['system']
+        self.assertFalse(any('cache_control' in block for block in system))
+        self.assertEqual(VALIDATION, find_prompt(system))
+
+    def test_user_message_fields(self):
+        """Test that the answer hint and prompt variant land in the user message"""
+        prompt = build_tutoring_request("2 + 2", "4")['messages'][0]['content']
+        self.assertIn("The exact answer, already computed for you, is: 4", prompt)
+        self.assertIn("Keep it short", prompt)
+        self.assertNotIn("{", prompt)
+
+    def test_versions_key_the_response_cache(self):
+        """Test that bumping the tutoring prompt version changes cache keys"""
+        self.assertEqual({'validation', 'tutoring', 'narration', 'combined'}, set(prompt_versions()))
+        key = tutoring_cache_key("x^2 = 9")
+        with patch.object(prompts.TUTORING, 'version', 'v-next'):
+            self.assertNotEqual(key, tutoring_cache_key("x^2 = 9"))
+        # Locally solved expressions are narrated, so the narration prompt keys them
+        key = tutoring_cache_key("2 + 2")
+        with patch.object(prompts.NARRATION, 'version', 'v-next'):
+            self.assertNotEqual(key, tutoring_cache_key("2 + 2"))
+
+    def test_find_prompt(self):
+        """Test that requests are recognised by their system prompt"""
+        self.assertEqual(TUTORING, find_prompt(build_tutoring_request("2 + 2")['system']))
+        self.assertEqual(NARRATION, find_prompt(build_tutoring_request("2 + 2", "4")['system']))
+        self.assertEqual(COMBINED, find_prompt(COMBINED.plain_system))
+        self.assertIsNone(find_prompt("You are a pirate."))
+
+    def test_locally_solved_expressions_are_narrated(self):
+        """Test that a locally computed answer sends its step trace with the narration prompt"""
+        request = build_tutoring_request("2 + 3 * 4", "14")
+        prompt = request['messages'][0]['content']
+        self.assertEqual(NARRATION, find_prompt(request['system']))
+        self.assertIn("1. 3 × 4 = 12\n2. 2 + 12 = 14", prompt)
+        self.assertIn("The exact answer, already computed for you, is: 14", prompt)
+
+        # Expressions without a local answer are solved by the tutor as before
+        self.assertEqual(TUTORING, find_prompt(build_tutoring_request("x^2 = 9")['system']))
+
+    def test_step_traces_can_be_disabled(self):
+        """Test STEP_TRACE=false and the cache keys of narrated explanations"""
+        narrated_key = tutoring_cache_key("2 + 3 * 4")
+        with patch.dict('os.environ', {'STEP_TRACE': 'false'}):
+            request = build_tutoring_request("2 + 3 * 4", "14")
+            self.assertEqual(TUTORING, find_prompt(request['system']))
+            self.assertNotIn("3 × 4 = 12", request['messages'][0]['content'])
+            self.assertNotEqual(narrated_key, tutoring_cache_key("2 + 3 * 4"))
+
+    def test_explanation_is_traced_and_routed_once(self):
+        """Test that the cache key and the request of one explanation share a single trace and route"""
+        reset_response_cache()
+        client = MagicMock()
+        client.messages.create.return_value.content = [MagicMock(type='text', text="<p>14</p>")]
+
+        with patch('lambda_function.local_trace', wraps=lambda_function.local_trace) as mock_trace, \
+             patch('lambda_function.choose_route', wraps=lambda_function.choose_route) as mock_route:
+            status, _ = solve_expression(client, "2 + 3 * 4")
+
+        self.assertEqual(200, status)
+        self.assertEqual(1, mock_trace.call_count)
+        self.assertEqual(1, mock_route.call_count)
+        self.assertEqual(NARRATION, find_prompt(client.messages.create.call_args[1]['system']))
+        reset_response_cache()
+
+    def test_cache_usage_is_counted(self):
+        """Test that prompt cache reads and writes are recorded as metrics"""
+        usage = SimpleNamespace(input_tokens=20, output_tokens=5, cache_read_input_tokens=300,
+                                cache_creation_input_tokens=0)
+        request_metrics = metrics.start_request()
+        metrics.record_usage(SimpleNamespace(usage=usage))
+        counters = request_metrics.timings()['counters']
+        metrics.finish_request(request_metrics, emit=False)
+
+        self.assertEqual(300, counters['tokens_cache_read'])
+        self.assertEqual(0, counters['tokens_cache_write'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+import unittest
+import contextlib
+import io
+import os
+import sys
+import threading
+import httpx
+import anthropic
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+import metrics
+import rate_limit
+from rate_limit import Limit, RateLimiter, TokenBucket, estimate_tokens, parse_rate_limit_headers, reset_rate_limiter
+from resilience import call_anthropic, reset_breaker, CircuitBreaker, RateLimited, UpstreamUnavailable
+from client_cache import build_anthropic_client
+from lambda_function import build_validation_request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from fake_anthropic import FakeAnthropicServer, FakeServerConfig  # noqa: E402
+
+NO_BACKOFF = {'RETRY_BASE_DELAY_SECONDS': '0'}
+
+
+def make_status_error(status_code, headers=None):
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(status_code, request=request, headers=headers)
+    return anthropic.APIStatusError(f'status {status_code}', response=response, body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHeaders(unittest.TestCase):
+
+    def test_parses_limits_and_retry_after(self):
+        """Test that limits, remaining, reset times and retry-after are read"""
+        now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        headers = httpx.Headers({
+            'anthropic-ratelimit-requests-limit': '50',
+            'anthropic-ratelimit-requests-remaining': '49',
+            'anthropic-ratelimit-requests-reset': (now + timedelta(seconds=1.2)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'anthropic-ratelimit-tokens-limit': '40000',
+            'anthropic-ratelimit-tokens-remaining': 'lots',
+            'retry-after': '7',
+        })
+        parsed = parse_rate_limit_headers(headers, now=now.timestamp())
+
+        self.assertEqual(50, parsed['requests'].limit)
+        self.assertEqual(49, parsed['requests'].remaining)
+        self.assertAlmostEqual(1.2, parsed['requests'].reset_in)
+        self.assertNotIn('tokens', parsed)
+        self.assertEqual(7.0, parsed['retry_after'])
+        self.assertEqual({}, parse_rate_limit_headers({}))
+
+    def test_estimate_tokens(self):
+        """Test that the reservation covers the prompt and max_tokens"""
+        request = build_validation_request("2x + 3 = 7")
+        self.assertGreater(estimate_tokens(request), request['max_tokens'])
+        self.assertEqual(10 + 2, estimate_tokens({'max_tokens': 10, 'messages': [{'content': 'abcdefgh'}]}))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_unlimited_until_configured(self):
+        """Test that a bucket without a capacity never waits"""
+        bucket = TokenBucket(clock=FakeClock())
+        bucket.take(10 ** 6)
+        self.assertEqual(0, bucket.wait_time(10 ** 6))
+
+    def test_headers_set_level_and_refill_rate(self):
+        """Test that the reset time gives the refill rate and the level only goes down"""
+        clock = FakeClock()
+        bucket = TokenBucket(clock=clock)
+        bucket.configure(*Limit(100, 40, 3.0))
+        self.assertEqual(40, bucket.level)
+        self.assertEqual(20, bucket.refill_per_second)
+        self.assertAlmostEqual(1.0, bucket.wait_time(60))
+
+        bucket.take(40)
+        bucket.configure(100, 90)
+        self.assertEqual(0, bucket.level)
+
+        clock.now += 10
+        self.assertEqual(0, bucket.wait_time(100))
+        self.assertEqual(100, bucket.level)
+        # More than the whole bucket goes once it's full
+        self.assertEqual(0, bucket.wait_time(500))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_aimd(self):
+        """Test additive increase on success and one halving per round of throttles"""
+        limiter = RateLimiter(initial_concurrency=8)
+        permits = [limiter.acquire(1) for _ in range(3)]
+        limiter.throttled(permits[0])
+        limiter.throttled(permits[1])
+        self.assertEqual(4, limiter.concurrency_limit)
+
+        limiter.finish(permits[2])
+        self.assertEqual(4.25, limiter.concurrency_limit)
+        limiter.throttled(limiter.acquire(1))
+        self.assertEqual(2.125, limiter.concurrency_limit)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_usage_gives_back_unused_tokens(self):
+        """Test that a call's usage replaces its reservation"""
+        limiter = RateLimiter(tokens_per_minute=1000)
+        permit = limiter.acquire(600)
+        limiter.finish(permit, SimpleNamespace(input_tokens=100, output_tokens=50, cache_read_input_tokens=900))
+        self.assertAlmostEqual(850, limiter.tokens.level, delta=1)
+
+        permit = limiter.acquire(600)
+        limiter.cancel(permit)
+        self.assertAlmostEqual(850, limiter.tokens.level, delta=1)
+
+    def test_gives_up_when_capacity_is_too_far_off(self):
+        """Test that acquire returns None at once when waiting can't help"""
+        limiter = RateLimiter(requests_per_minute=1)
+        self.assertIsNotNone(limiter.acquire(1))
+        self.assertIsNone(limiter.acquire(1, max_wait=5))
+        self.assertEqual(1, limiter.rejections)
+
+        limiter = RateLimiter()
+        limiter.observe({'retry-after': '30'})
+        self.assertIsNone(limiter.acquire(1, max_wait=5))
+
+    def test_waits_for_a_concurrency_slot(self):
+        """Test that a call over the concurrency limit runs when another finishes"""
+        limiter = RateLimiter(initial_concurrency=1)
+        first = limiter.acquire(1)
+        self.assertIsNone(limiter.acquire(1, max_wait=0.05))
+        granted = []
+        waiter = threading.Thread(target=lambda: granted.append(limiter.acquire(1, max_wait=5)))
+        waiter.start()
+        limiter.finish(first)
+        waiter.join(5)
+
+        self.assertGreater(granted[0].waited, 0)
+        self.assertEqual(1, limiter.waits)
+        self.assertEqual(1, limiter.in_flight)
+
+
+class TestCallAnthropicLimits(unittest.TestCase):
+
+    def setUp(self):
+        reset_breaker(CircuitBreaker(failure_threshold=1))
+        reset_rate_limiter(RateLimiter())
+
+    def tearDown(self):
+        reset_breaker()
+        reset_rate_limiter()
+
+    def test_429_slows_down_without_opening_the_breaker(self):
+        """Test that a rate-limited call is retried and left to the limiter"""
+        method = MagicMock(side_effect=[make_status_error(429), 'message'])
+
+        request_metrics = metrics.start_request()
+        with patch.dict('os.environ', NO_BACKOFF), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual('message', call_anthropic(method, {'max_tokens': 10}))
+        counters = request_metrics.timings()['counters']
+        metrics.finish_request(request_metrics, emit=False)
+
+        self.assertEqual(1, counters['rate_limited'])
+        self.assertNotIn('upstream_failures', counters)
+        self.assertFalse(rate_limit.get_rate_limiter().in_flight)
+        self.assertEqual(4.25, rate_limit.get_rate_limiter().concurrency_limit)
+
+    def test_interactive_calls_fall_back_when_there_is_no_capacity(self):
+        """Test that RateLimited is raised instead of waiting past RATE_LIMIT_MAX_WAIT_SECONDS"""
+        limiter = RateLimiter(requests_per_minute=1)
+        reset_rate_limiter(limiter)
+        method = MagicMock(return_value='message')
+        call_anthropic(method, {})
+
+        with self.assertRaises(RateLimited):
+            call_anthropic(method, {})
+        self.assertEqual(1, method.call_count)
+
+    def test_queued_calls_outlast_the_retry_budget(self):
+        """Test that 429s don't use up the retries of queued work"""
+        method = MagicMock(side_effect=[make_status_error(429)] * 4 + ['message'])
+
+        with patch.dict('os.environ', dict(NO_BACKOFF, ANTHROPIC_MAX_RETRIES='1')), \
+             contextlib.redirect_stdout(io.StringIO()):
+            with rate_limit.queueing():
+                self.assertEqual('message', call_anthropic(method, {}))
+            method.side_effect = [make_status_error(429)] * 4
+            with self.assertRaises(UpstreamUnavailable):
+                call_anthropic(method, {})
+
+
+class TestAgainstFakeServer(unittest.TestCase):
+    """A burst of validations against fake_anthropic.py enforcing 5 requests per 0.5s."""
+
+    def setUp(self):
+        self.server = FakeAnthropicServer(FakeServerConfig(
+            first_token_ms=0, tokens_per_second=1e6, requests_per_minute=5, limit_window_seconds=0.5
+        )).start()
+        self.addCleanup(self.server.stop)
+        reset_breaker()
+        self.addCleanup(reset_breaker)
+        self.addCleanup(reset_rate_limiter)
+
+    def run_burst(self, calls):
+        results = []
+
+        def validate(index):
+            with rate_limit.queueing():
+                message = call_anthropic(client.messages.create, build_validation_request(f"{index} + 1"))
+            results.append(message.content[0].text)
+
+        with patch.dict('os.environ', {'ANTHROPIC_BASE_URL': self.server.base_url}), \
+             contextlib.redirect_stdout(io.StringIO()):
+            client = build_anthropic_client('sk-ant-test')
+            threads = [threading.Thread(target=validate, args=(index,)) for index in range(calls)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(30)
+        return results
+
+    def test_burst_queues_instead_of_failing(self):
+        """Test that every call succeeds and the limiter learns the limit, with fewer 429s than without it"""
+        reset_rate_limiter(RateLimiter())
+        self.assertEqual(12, len(self.run_burst(12)))
+        limited = self.server.stats()['throttled']
+        limiter = rate_limit.get_rate_limiter()
+        self.assertEqual(5, limiter.requests.capacity)
+        self.assertEqual(0, limiter.in_flight)
+
+        with patch.dict('os.environ', {'RATE_LIMIT_ENABLED': 'false'}):
+            reset_rate_limiter()
+            self.assertEqual(12, len(self.run_burst(12)))
+        self.assertLess(limited, self.server.stats()['throttled'] - limited)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,255 @@
+import unittest
+import asyncio
+import contextlib
+import io
+import json
+import httpx
+import anthropic
+from unittest.mock import patch, MagicMock
+import metrics
+from resilience import (
+    call_anthropic, call_anthropic_async, finish_deadline, retry_delay, reset_breaker, start_deadline, CircuitBreaker,
+    CircuitOpenError, DeadlineExceeded, UpstreamUnavailable
+)
+from lambda_function import lambda_handler, reset_validation_memo
+from client_cache import reset_client_cache
+from coalescing import reset_coalescer
+from response_cache import reset_response_cache
+
+NO_BACKOFF = {'RETRY_BASE_DELAY_SECONDS': '0'}
+
+
+def make_status_error(status_code, headers=None):
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(status_code, request=request, headers=headers)
+    return anthropic.APIStatusError(f'status {status_code}', response=response, body=None)
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCallAnthropic(unittest.TestCase):
+
+    def setUp(self):
+        reset_breaker()
+
+    def tearDown(self):
+        reset_breaker()
+
+    def test_retries_overloaded_then_succeeds(self):
+        """Test that a 529 is retried and the retry is counted"""
+        method = MagicMock(side_effect=[make_status_error(529), 'message'])
+
+        request_metrics = metrics.start_request()
+        with patch.dict('os.environ', NO_BACKOFF):
+            self.assertEqual('message', call_anthropic(method, {'model': 'm'}))
+        counters = request_metrics.timings()['counters']
+        metrics.finish_request(request_metrics, emit=False)
+
+        self.assertEqual(2, method.call_count)
+        self.assertEqual(1, counters['anthropic_retries'])
+        self.assertEqual(1, counters['upstream_failures'])
+
+    def test_client_errors_are_not_retried(self):
+        """Test that a 400 is raised straight away"""
+        method = MagicMock(side_effect=make_status_error(400))
+
+        with self.assertRaises(anthropic.APIStatusError):
+            call_anthropic(method, {})
+        self.assertEqual(1, method.call_count)
+
+    def test_gives_up_after_max_retries(self):
+        """Test that exhausted retries raise UpstreamUnavailable"""
+        method = MagicMock(side_effect=make_status_error(503))
+
+        with patch.dict('os.environ', dict(NO_BACKOFF, ANTHROPIC_MAX_RETRIES='1')):
+            with self.assertRaises(UpstreamUnavailable):
+                call_anthropic(method, {})
+        self.assertEqual(2, method.call_count)
+
+    def test_retry_after_is_honoured(self):
+        """Test that retry-after replaces the jittered backoff"""
+        self.assertEqual(3.0, retry_delay(1, make_status_error(429, {'retry-after': '3'})))
+        for attempt in range(1, 6):
+            self.assertLessEqual(retry_delay(attempt, make_status_error(529)), 4)
+
+    def test_timeout_fits_the_deadline(self):
+        """Test that each attempt's timeout is capped by the Lambda's remaining time"""
+        method = MagicMock(return_value='message')
+
+        token = start_deadline(LambdaContext(remaining_ms=5000))
+        try:
+            call_anthropic(method, {}, max_timeout=8)
+        finally:
+            finish_deadline(token)
+        self.assertLessEqual(method.call_args[1]['timeout'], 3)
+
+        token = start_deadline(LambdaContext(remaining_ms=2100))
+        try:
+            with self.assertRaises(DeadlineExceeded):
+                call_anthropic(method, {})
+        finally:
+            finish_deadline(token)
+        self.assertEqual(1, method.call_count)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def tearDown(self):
+        reset_breaker()
+
+    def test_opens_and_recovers(self):
+        """Test that consecutive failures open the breaker until a trial call succeeds"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=clock)
+        reset_breaker(breaker)
+        failing = MagicMock(side_effect=make_status_error(500))
+
+        with patch.dict('os.environ', dict(NO_BACKOFF, ANTHROPIC_MAX_RETRIES='0')):
+            for _ in range(2):
+                with self.assertRaises(UpstreamUnavailable):
+                    call_anthropic(failing, {})
+            self.assertEqual('open', breaker.state)
+
+            with self.assertRaises(CircuitOpenError):
+                call_anthropic(failing, {})
+            self.assertEqual(2, failing.call_count)
+
+            clock.now += 30
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+            self.assertEqual('message', call_anthropic(MagicMock(return_value='message'), {}))
+            self.assertEqual('closed', breaker.state)
+
+    def test_failed_trial_reopens(self):
+        """Test that a failed half-open trial opens the breaker again"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, clock=clock)
+
+        breaker.record_failure()
+        clock.now += 30
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertEqual('open', breaker.state)
+        self.assertFalse(breaker.allow())
+
+    def test_cancelled_trial_frees_the_slot(self):
+        """Test that cancelling the half-open trial neither closes nor reopens the breaker"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, clock=clock)
+        reset_breaker(breaker)
+        breaker.record_failure()
+        clock.now += 30
+
+        async def hang(**request):
+            await asyncio.Event().wait()
+
+        async def cancel_trial():
+            task = asyncio.ensure_future(call_anthropic_async(hang, {}))
+            while not breaker._trial_in_flight:
+                await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+
+        self.assertEqual('half_open', breaker.state)
+        self.assertTrue(breaker.allow())
+
+
+class TestDegradedResponses(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+        reset_coalescer()
+        reset_breaker(CircuitBreaker(failure_threshold=1))
+
+    def tearDown(self):
+        reset_breaker()
+
+    def run_handler(self, body, mock_client, output=None):
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', dict(NO_BACKOFF, PARAMETER_NAME='test-param')), \
+             contextlib.redirect_stdout(output or io.StringIO()):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            return lambda_handler({'body': json.dumps(body)}, LambdaContext(remaining_ms=30000))
+
+    def test_local_answer_when_claude_is_down(self):
+        """Test that a locally evaluated expression still gets its answer"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = make_status_error(529)
+
+        output = io.StringIO()
+        response = self.run_handler({'expression': '17 * 23'}, mock_client, output)
+
+        self.assertEqual(200, response['statusCode'])
+        body = json.loads(response['body'])
+        self.assertTrue(body['degraded'])
+        self.assertEqual('391', body['result'])
+        self.assertIn('391', body['explanation'])
+        emf = [json.loads(line) for line in output.getvalue().splitlines() if line.startswith('{"_aws"')][0]
+        self.assertEqual(1, emf['breaker_open'])
+        self.assertEqual(1, emf['degraded_responses'])
+
+    def test_open_breaker_skips_claude(self):
+        """Test that with the breaker open, validation falls back and the tutor reports 503"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = make_status_error(529)
+        self.run_handler({'expression': '2 + 2'}, mock_client)
+        mock_client.messages.create.reset_mock()
+
+        response = self.run_handler({'expression': 'solve for x: 2x + 3 = 7'}, mock_client)
+
+        self.assertEqual(503, response['statusCode'])
+        self.assertIn('temporarily unavailable', json.loads(response['body'])['error'])
+        mock_client.messages.create.assert_not_called()
+
+    def test_stream_falls_back_to_local_answer(self):
+        """Test that a stream that can't be opened sends the local answer instead"""
+        mock_client = MagicMock()
+        mock_client.messages.stream.return_value.__enter__.side_effect = make_status_error(503)
+
+        response = self.run_handler({'expression': '6 * 7', 'stream': True}, mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertIn('<strong>42</strong>', response['body'])
+        done = json.loads(response['body'].strip().split('\n')[-1][len('data: '):])
+        self.assertTrue(done['degraded'])
+
+    def test_explanations_are_not_cached_while_degraded(self):
+        """Test that the fallback answer isn't served once Claude is back"""
+        mock_client = MagicMock()
+        mock_client.messages.create.side_effect = make_status_error(529)
+        self.run_handler({'expression': '17 * 23'}, mock_client)
+
+        reset_breaker()
+        mock_client.messages.create.side_effect = None
+        mock_client.messages.create.return_value.content = [MagicMock(type='text', text="<p>391</p>")]
+        body = json.loads(self.run_handler({'expression': '17 * 23'}, mock_client)['body'])
+
+        self.assertEqual("<p>391</p>", body['explanation'])
+        self.assertNotIn('degraded', body)
+
+if __name__ == '__main__':
+    unittest.main()
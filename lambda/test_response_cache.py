@@ -0,0 +1,187 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+from unittest.mock import patch, MagicMock
+from response_cache import (
+    LRUCache, SQLiteCacheBackend, DynamoDBCacheBackend, ResponseCache,
+    make_cache_key, reset_response_cache, build_response_cache_from_env
+)
+from client_cache import reset_client_cache
+from lambda_function import lambda_handler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDynamoTable:
+    """In-memory stand-in for a boto3 DynamoDB Table resource."""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key['cache_key'])
+        return {'Item': item} if item is not None else {}
+
+    def put_item(self, Item):
+        self.items[Item['cache_key']] = Item
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_cache_key_canonicalises_expression(self):
+        """Test that equivalent spellings share a key while settings do not"""
+        key = make_cache_key("2 + 2", "claude-3-haiku-20240307", "v1", 0.5)
+        self.assertEqual(key, make_cache_key(" 2+2 ", "claude-3-haiku-20240307", "v1", 0.5))
+        self.assertEqual(
+            make_cache_key("2 × 3", "m", "v1", 0.5),
+            make_cache_key("2*3", "m", "v1", 0.5)
+        )
+        self.assertNotEqual(key, make_cache_key("2 + 3", "claude-3-haiku-20240307", "v1", 0.5))
+        self.assertNotEqual(key, make_cache_key("2 + 2", "claude-3-opus-20240229", "v1", 0.5))
+        self.assertNotEqual(key, make_cache_key("2 + 2", "claude-3-haiku-20240307", "v2", 0.5))
+        self.assertNotEqual(key, make_cache_key("2 + 2", "claude-3-haiku-20240307", "v1", 0))
+
+    def test_lru_evicts_least_recently_used(self):
+        """Test that the LRU tier is bounded by max_entries"""
+        cache = LRUCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+
+    def test_lru_ttl_expiry(self):
+        """Test that LRU entries expire after the TTL"""
+        clock = FakeClock()
+        cache = LRUCache(max_entries=10, ttl_seconds=60, clock=clock)
+        cache.set('a', 1)
+        clock.now += 59
+        self.assertEqual(1, cache.get('a'))
+        clock.now += 2
+        self.assertIsNone(cache.get('a'))
+
+    def test_sqlite_tier_survives_a_new_container(self):
+        """Test that a fresh in-process tier is refilled from the SQLite tier"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite3')
+            first = ResponseCache(LRUCache(), SQLiteCacheBackend(path))
+            first.set('key', {'explanation': '<p>4</p>'})
+
+            second = ResponseCache(LRUCache(), SQLiteCacheBackend(path))
+            self.assertEqual(({'explanation': '<p>4</p>'}, 'persistent'), second.get('key'))
+            self.assertEqual(({'explanation': '<p>4</p>'}, 'memory'), second.get('key'))
+            self.assertEqual({'hits': 2, 'misses': 0}, second.stats())
+
+    def test_sqlite_ttl_expiry(self):
+        """Test that expired rows in the SQLite tier are ignored"""
+        clock = FakeClock()
+        backend = SQLiteCacheBackend(':memory:', ttl_seconds=60, clock=clock)
+        backend.set('key', {'explanation': 'x'})
+        self.assertEqual({'explanation': 'x'}, backend.get('key'))
+        clock.now += 61
+        self.assertIsNone(backend.get('key'))
+
+    def test_dynamodb_backend(self):
+        """Test the DynamoDB-shaped tier against a fake table"""
+        clock = FakeClock()
+        table = FakeDynamoTable()
+        backend = DynamoDBCacheBackend(table=table, ttl_seconds=60, clock=clock)
+        backend.set('key', {'explanation': 'x'})
+
+        self.assertEqual(int(clock.now + 60), table.items['key']['expires_at'])
+        self.assertEqual({'explanation': 'x'}, backend.get('key'))
+        self.assertIsNone(backend.get('other'))
+        clock.now += 61
+        self.assertIsNone(backend.get('key'))
+
+    def test_broken_persistent_tier_is_a_miss(self):
+        """Test that persistent tier failures degrade to a cache miss"""
+        persistent = MagicMock()
+        persistent.get.side_effect = Exception("throttled")
+        persistent.set.side_effect = Exception("throttled")
+        cache = ResponseCache(LRUCache(), persistent)
+
+        self.assertEqual((None, None), cache.get('key'))
+        cache.set('key', {'explanation': 'x'})
+        self.assertEqual(({'explanation': 'x'}, 'memory'), cache.get('key'))
+
+    def test_counters_are_exact_under_concurrent_lookups(self):
+        """Test that batch threads looking up at once don't lose hit or miss counts"""
+        cache = ResponseCache(LRUCache())
+        cache.set('cached', {'explanation': 'x'})
+
+        def look_up():
+            for _ in range(2000):
+                cache.get('cached')
+                cache.get('missing')
+
+        threads = [threading.Thread(target=look_up) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({'hits': 16000, 'misses': 16000}, cache.stats())
+
+    def test_build_from_env(self):
+        """Test that RESPONSE_CACHE_* variables configure the tiers"""
+        with patch.dict('os.environ', {
+            'RESPONSE_CACHE_MAX_ENTRIES': '5',
+            'RESPONSE_CACHE_TTL_SECONDS': '30',
+            'RESPONSE_CACHE_BACKEND': 'sqlite',
+            'RESPONSE_CACHE_PATH': ':memory:',
+        }):
+            cache = build_response_cache_from_env()
+        self.assertEqual(5, cache.memory.max_entries)
+        self.assertEqual(30, cache.memory.ttl_seconds)
+        self.assertIsInstance(cache.persistent, SQLiteCacheBackend)
+
+
+class TestHandlerResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache(ResponseCache(LRUCache()))
+
+    def tearDown(self):
+        reset_response_cache()
+
+    @patch('lambda_function.validate_with_claude', return_value=(True, True, ""))
+    def test_repeated_expression_is_served_from_cache(self, mock_validate):
+        """Test that repeated expressions make one tutoring call and report hits"""
+        mock_client = MagicMock()
+        mock_content = MagicMock()
+        mock_content.type = 'text'
+        mock_content.text = "<p>The answer is 4</p>"
+        mock_client.messages.create.return_value.content = [mock_content]
+
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            bodies = [
+                json.loads(lambda_handler({'body': json.dumps({'expression': expr})}, {})['body'])
+                for expr in ["2 + 2", "2+2", " 2 + 2 "]
+            ]
+
+        mock_client.messages.create.assert_called_once()
+        self.assertEqual({'hits': 0, 'misses': 1, 'hit': False, 'tier': None}, bodies[0]['cache'])
+        self.assertEqual({'hits': 2, 'misses': 1, 'hit': True, 'tier': 'memory'}, bodies[2]['cache'])
+        self.assertEqual(bodies[0]['explanation'], bodies[2]['explanation'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import base64
+import gzip
+import json
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+import responses
+from responses import JSON_HEADERS, accepted_encoding, compress_response, encode_json, json_response
+from async_pipeline import async_lambda_handler
+from lambda_function import extract_text, lambda_handler, reset_validation_memo
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+LONG_EXPLANATION = "<p>" + "Add the ones, then carry the ten. " * 200 + "</p>"
+
+
+class TestResponses(unittest.TestCase):
+
+    def test_json_response(self):
+        """Test that bodies round-trip and the constant headers are shared"""
+        body = {'explanation': LONG_EXPLANATION, 'success': True, 'result': '4', 'cache': {'hit': False}}
+        first = json_response(200, body)
+        second = json_response(400, {'error': 'Bad input'})
+
+        self.assertEqual(body, json.loads(first['body']))
+        self.assertIs(JSON_HEADERS, first['headers'])
+        self.assertIs(first['headers'], second['headers'])
+        self.assertEqual('*', first['headers']['Access-Control-Allow-Origin'])
+
+    def test_stdlib_fallback(self):
+        """Test that the json module is used without orjson and for values orjson refuses"""
+        with patch.object(responses, 'orjson', None):
+            self.assertEqual({'a': [1, 2]}, json.loads(encode_json({'a': [1, 2]})))
+        self.assertEqual({'1': 'x'}, json.loads(encode_json({1: 'x'})))
+
+    def test_accepted_encoding(self):
+        """Test Accept-Encoding parsing, including q=0 refusals"""
+        self.assertEqual('gzip', accepted_encoding('gzip, deflate'))
+        self.assertEqual('gzip', accepted_encoding('*'))
+        self.assertIsNone(accepted_encoding('gzip;q=0, identity'))
+        self.assertIsNone(accepted_encoding('deflate'))
+        self.assertIsNone(accepted_encoding(None))
+        with patch.object(responses, 'brotli', None):
+            self.assertEqual('gzip', accepted_encoding('br, gzip'))
+
+    def test_large_bodies_are_compressed(self):
+        """Test that large bodies are gzipped and base64-encoded for clients that accept it"""
+        response = json_response(200, {'explanation': LONG_EXPLANATION})
+
+        compressed = compress_response(response, {'accept-encoding': 'gzip, deflate, br'})
+
+        self.assertTrue(compressed['isBase64Encoded'])
+        self.assertIn(compressed['headers']['Content-Encoding'], ('gzip', 'br'))
+        self.assertNotIn('Content-Encoding', JSON_HEADERS)
+        if compressed['headers']['Content-Encoding'] == 'gzip':
+            raw = gzip.decompress(base64.b64decode(compressed['body'])).decode('utf-8')
+            self.assertEqual(response['body'], raw)
+        self.assertLess(len(compressed['body']), len(response['body']) / 4)
+
+    def test_small_or_unaccepted_bodies_are_untouched(self):
+        """Test that small bodies and clients without Accept-Encoding get plain JSON"""
+        small = json_response(400, {'error': 'Bad input'})
+        large = json_response(200, {'explanation': LONG_EXPLANATION})
+
+        self.assertIs(small, compress_response(small, {'Accept-Encoding': 'gzip'}))
+        self.assertIs(large, compress_response(large, {}))
+        self.assertIs(large, compress_response(large, None))
+        with patch.dict('os.environ', {'COMPRESSION_MIN_BYTES': '0'}):
+            self.assertIs(large, compress_response(large, {'Accept-Encoding': 'gzip'}))
+
+    def test_extract_text(self):
+        """Test that text blocks are joined and every other block type, known or not, is skipped"""
+        message = SimpleNamespace(content=[
+            SimpleNamespace(type='thinking', thinking='hmm'),
+            SimpleNamespace(type='text', text='<p>x = </p>'),
+            SimpleNamespace(type='text', text='<p>2</p>'),
+            SimpleNamespace(type='server_tool_use', text='not part of the answer'),
+        ])
+        self.assertEqual('<p>x = </p><p>2</p>', extract_text(message))
+        self.assertEqual('plain', extract_text(SimpleNamespace(content='plain')))
+
+
+class TestHandlerResponses(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def run_handler(self, event):
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value.content = [MagicMock(type='text', text=LONG_EXPLANATION)]
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            return lambda_handler(event, {})
+
+    def test_binary_request_and_compressed_response(self):
+        """Test a base64 request body from API Gateway and a gzipped explanation"""
+        event = {
+            'body': base64.b64encode(json.dumps({'expression': '2 + 2'}).encode('utf-8')).decode('ascii'),
+            'isBase64Encoded': True,
+            'headers': {'Accept-Encoding': 'gzip'}
+        }
+
+        with patch.object(responses, 'brotli', None):
+            response = self.run_handler(event)
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual('gzip', response['headers']['Content-Encoding'])
+        body = json.loads(gzip.decompress(base64.b64decode(response['body'])))
+        self.assertEqual(LONG_EXPLANATION, body['explanation'])
+
+    def test_undecodable_base64_body_is_a_client_error(self):
+        """Test that a base64-flagged body that doesn't decode gets the invalid JSON 400 on both pipelines"""
+        for body in ['not base64!', base64.b64encode(b'\xff\xfe{}').decode('ascii')]:
+            event = {'body': body, 'isBase64Encoded': True}
+            for handler in (self.run_handler, lambda event: async_lambda_handler(event, {})):
+                response = handler(event)
+                self.assertEqual(400, response['statusCode'], f"for {body!r}")
+                self.assertEqual('Invalid JSON in request body', json.loads(response['body'])['error'])
+
+    def test_plain_request_keeps_plain_response(self):
+        """Test that clients without Accept-Encoding keep the JSON contract"""
+        response = self.run_handler({'body': json.dumps({'expression': '2 + 2'})})
+
+        self.assertNotIn('isBase64Encoded', response)
+        self.assertEqual(LONG_EXPLANATION, json.loads(response['body'])['explanation'])
+
+if __name__ == '__main__':
+    unittest.main()
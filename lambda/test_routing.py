@@ -0,0 +1,188 @@
+import unittest
+import json
+from unittest.mock import patch, MagicMock
+from routing import choose_route, complexity_score, parse_routing_table, reset_detail, use_detail, DEFAULT_ROUTING_TABLE
+from lambda_function import (
+    build_combined_request, build_tutoring_request, lambda_handler, reset_validation_memo, trim_truncated_html,
+    tutoring_cache_key, VALIDATION_MAX_TOKENS
+)
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+
+
+class TestRouting(unittest.TestCase):
+
+    def test_complexity_orders_problems(self):
+        """Test that nesting, functions, relations and advanced topics raise the score"""
+        scores = [complexity_score(expression) for expression in [
+            "2 + 2",
+            "5 * (3 + 2)",
+            "solve x^2 - 5x + 6 = 0",
+            "log(100) * (sin(pi/2) + cos(0))^2",
+        ]]
+        self.assertEqual(sorted(scores), scores)
+        self.assertGreater(complexity_score("the integral of x"), complexity_score("the value of x"))
+
+    def test_default_table(self):
+        """Test that sums, equations and calculus land on different routes"""
+        self.assertEqual('trivial', choose_route("2 + 2")[0].name)
+        self.assertEqual('standard', choose_route("solve for x: 2x + 3 = 7")[0].name)
+        self.assertEqual('complex', choose_route("integrate sin(x)^2 from 0 to pi")[0].name)
+
+    def test_table_from_environment(self):
+        """Test that ROUTING_TABLE replaces the default and bad tables are ignored"""
+        table = [
+            {'name': 'cheap', 'max_score': 3, 'model': 'model-a', 'max_tokens': 100, 'prompt': 'brief'},
+            {'name': 'rest', 'max_score': None, 'model': 'model-b', 'max_tokens': 900},
+        ]
+        with patch.dict('os.environ', {'ROUTING_TABLE': json.dumps(table)}):
+            route = choose_route("1 + 1")[0]
+            self.assertEqual(('cheap', 'model-a', 100), (route.name, route.model, route.max_tokens))
+            route = choose_route("5 * (3 + 2)")[0]
+            self.assertEqual(('rest', 'standard'), (route.name, route.prompt))
+
+        with patch.dict('os.environ', {'ROUTING_TABLE': '[{"name": "x"}]'}):
+            self.assertEqual('trivial', choose_route("2 + 2")[0].name)
+
+    def test_table_validation(self):
+        """Test that malformed routes are rejected"""
+        for table in [[], {}, [{'name': 'a', 'model': 'm', 'max_tokens': 0}],
+                      [{'name': 'a', 'model': 'm', 'max_tokens': 10, 'prompt': 'poem'}]]:
+            with self.assertRaises(ValueError):
+                parse_routing_table(table)
+        self.assertEqual(3, len(parse_routing_table(DEFAULT_ROUTING_TABLE)))
+
+
+class TestRoutedRequests(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def test_requests_follow_the_route(self):
+        """Test that model, max_tokens and prompt variant come from the route"""
+        trivial = build_tutoring_request("2 + 2", "4")
+        self.assertEqual(400, trivial['max_tokens'])
+        self.assertIn("Keep it short", trivial['messages'][0]['content'])
+
+        complex_request = build_tutoring_request("integrate sin(x)^2 from 0 to pi")
+        self.assertEqual('claude-3-5-sonnet-20241022', complex_request['model'])
+        self.assertIn("show every intermediate step", complex_request['messages'][0]['content'])
+
+        combined = build_combined_request("solve for x: 2x + 3 = 7")
+        self.assertEqual(1000 + VALIDATION_MAX_TOKENS, combined['max_tokens'])
+        self.assertNotIn("Keep it short", combined['messages'][0]['content'])
+
+    def test_routes_have_separate_cache_entries(self):
+        """Test that the cache key changes with the route"""
+        table = [{'name': 'only', 'max_score': None, 'model': 'claude-3-haiku-20240307', 'max_tokens': 400,
+                  'prompt': 'detailed'}]
+        key = tutoring_cache_key("2 + 2")
+        with patch.dict('os.environ', {'ROUTING_TABLE': json.dumps(table)}):
+            self.assertNotEqual(key, tutoring_cache_key("2 + 2"))
+
+    def test_route_is_logged_per_request(self):
+        """Test that the chosen route is counted on the request"""
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value.content = [MagicMock(type='text', text="<p>4</p>")]
+
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            response = lambda_handler({'body': json.dumps({'expression': '2 + 2', 'timings': True})}, {})
+
+        self.assertEqual(1, json.loads(response['body'])['timings']['counters']['route_trivial'])
+        self.assertEqual(400, mock_client.messages.create.call_args[1]['max_tokens'])
+
+
+class TestDetailBudgets(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def build_with_detail(self, detail, expression, result=None):
+        token = use_detail(detail)
+        try:
+            return build_tutoring_request(expression, result), tutoring_cache_key(expression)
+        finally:
+            reset_detail(token)
+
+    def run_handler(self, body, message=None):
+        mock_client = MagicMock()
+        mock_client.messages.create.return_value = message or MagicMock(content=[MagicMock(type='text', text="<p>4</p>")])
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            response = lambda_handler({'body': json.dumps(dict(body, timings=True))}, {})
+        return response, mock_client
+
+    def test_detail_replaces_the_route_budget(self):
+        """Test that a requested detail level sets max_tokens, prompt and stop sequences"""
+        brief, _ = self.build_with_detail('brief', "solve for x: 2x + 3 = 7")
+        self.assertEqual(300, brief['max_tokens'])
+        self.assertEqual(['<hr>'], brief['stop_sequences'])
+        self.assertIn("Keep it short", brief['messages'][0]['content'])
+        self.assertEqual('claude-3-haiku-20240307', brief['model'])
+
+        full, _ = self.build_with_detail('full', "2 + 2", "4")
+        self.assertEqual(1500, full['max_tokens'])
+        self.assertNotIn('stop_sequences', full)
+        self.assertIn("show every intermediate step", full['messages'][0]['content'])
+
+        default, _ = self.build_with_detail(None, "2 + 2", "4")
+        self.assertEqual(400, default['max_tokens'])
+        self.assertNotIn('stop_sequences', default)
+
+    def test_detail_levels_have_separate_cache_entries(self):
+        """Test that each detail level gets its own cache key"""
+        keys = {self.build_with_detail(detail, "2 + 2", "4")[1] for detail in [None, 'brief', 'standard', 'full']}
+        self.assertEqual(4, len(keys))
+
+    def test_handler_applies_requested_detail(self):
+        """Test that the request's detail reaches the tutoring call and is counted"""
+        response, mock_client = self.run_handler({'expression': '2 + 2', 'detail': 'Brief'})
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual(['<hr>'], mock_client.messages.create.call_args[1]['stop_sequences'])
+        self.assertEqual(1, json.loads(response['body'])['timings']['counters']['detail_brief'])
+
+    def test_batch_items_inherit_detail(self):
+        """Test that batch items running on worker threads use the batch's detail level"""
+        response, mock_client = self.run_handler({'expressions': ['2 + 2', '3 * 3'], 'detail': 'full'})
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual(2, mock_client.messages.create.call_count)
+        for call in mock_client.messages.create.call_args_list:
+            self.assertEqual(1500, call[1]['max_tokens'])
+
+    def test_unknown_detail_is_rejected(self):
+        """Test that an unsupported detail level is a 400"""
+        response, mock_client = self.run_handler({'expression': '2 + 2', 'detail': 'essay'})
+
+        self.assertEqual(400, response['statusCode'])
+        self.assertIn('brief, standard, full', json.loads(response['body'])['error'])
+        mock_client.messages.create.assert_not_called()
+
+    def test_truncated_explanation_is_trimmed(self):
+        """Test that an explanation cut off by max_tokens ends on a complete block"""
+        self.assertEqual("<h3>Steps</h3><ol><li>Add 2</li></ol>",
+                         trim_truncated_html("<h3>Steps</h3><ol><li>Add 2</li><li>Then car"))
+        self.assertEqual("no tags at all", trim_truncated_html("no tags at all"))
+
+        message = MagicMock(content=[MagicMock(type='text', text="<p>2 + 2 = 4</p><p>Imagine two app")], stop_reason='max_tokens')
+        response, _ = self.run_handler({'expression': '2 + 2'}, message)
+        body = json.loads(response['body'])
+        self.assertEqual("<p>2 + 2 = 4</p>", body['explanation'])
+        self.assertEqual(1, body['timings']['counters']['truncated_explanations'])
+
+if __name__ == '__main__':
+    unittest.main()
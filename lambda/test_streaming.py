@@ -0,0 +1,152 @@
+import unittest
+import json
+import threading
+import http.client
+from unittest.mock import patch, MagicMock
+from lambda_function import lambda_handler, iter_explanation_events, reset_validation_memo
+from client_cache import reset_client_cache
+from response_cache import reset_response_cache
+import resilience
+import stream_server
+
+
+def make_streaming_client(chunks):
+    mock_client = MagicMock()
+    stream = mock_client.messages.stream.return_value.__enter__.return_value
+    stream.text_stream = iter(chunks)
+    return mock_client
+
+
+def parse_sse(body):
+    """Split an SSE body into (event, data) pairs."""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        reset_client_cache()
+        reset_response_cache()
+        reset_validation_memo()
+
+    def run_handler(self, body, mock_client):
+        with patch('boto3.session.Session') as mock_session, \
+             patch('anthropic.Anthropic', return_value=mock_client), \
+             patch.dict('os.environ', {'PARAMETER_NAME': 'test-param'}):
+            mock_session.return_value.client.return_value.get_parameter.return_value = {
+                'Parameter': {'Value': 'mock-api-key'}
+            }
+            return lambda_handler({'body': json.dumps(body)}, {})
+
+    def test_events_follow_generation_order(self):
+        """Test that each generated fragment becomes a chunk event followed by done"""
+        mock_client = make_streaming_client(["<h3>Step 1</h3>", "<p>2 + 2</p>", "<p>= 4</p>"])
+
+        events = parse_sse("".join(iter_explanation_events(mock_client, "2 + 2", "4")))
+
+        self.assertEqual(['chunk', 'chunk', 'chunk', 'done'], [event for event, _ in events])
+        self.assertEqual("<h3>Step 1</h3>", events[0][1]['html'])
+        self.assertEqual("4", events[-1][1]['result'])
+        self.assertFalse(events[-1][1]['cache']['hit'])
+        call_args = mock_client.messages.stream.call_args[1]
+        self.assertEqual("claude-3-haiku-20240307", call_args["model"])
+
+    def test_stream_flag_returns_event_stream(self):
+        """Test that the handler only streams when the request asks for it"""
+        mock_client = make_streaming_client(["<p>The answer ", "is 4</p>"])
+
+        response = self.run_handler({'expression': '2 + 2', 'stream': True}, mock_client)
+
+        self.assertEqual(200, response['statusCode'])
+        self.assertEqual('text/event-stream', response['headers']['Content-Type'])
+        html = "".join(data['html'] for event, data in parse_sse(response['body']) if event == 'chunk')
+        self.assertEqual("<p>The answer is 4</p>", html)
+        mock_client.messages.create.assert_not_called()
+
+    def test_streamed_explanation_fills_the_cache(self):
+        """Test that a streamed explanation is cached for the JSON contract"""
+        mock_client = make_streaming_client(["<p>The answer ", "is 4</p>"])
+        self.run_handler({'expression': '2 + 2', 'stream': True}, mock_client)
+
+        response = self.run_handler({'expression': '2 + 2'}, mock_client)
+
+        self.assertEqual('application/json', response['headers']['Content-Type'])
+        body = json.loads(response['body'])
+        self.assertEqual("<p>The answer is 4</p>", body['explanation'])
+        self.assertTrue(body['cache']['hit'])
+        mock_client.messages.create.assert_not_called()
+
+    def test_validation_errors_keep_json_contract(self):
+        """Test that invalid expressions return the usual JSON 400 in streaming mode"""
+        mock_client = make_streaming_client([])
+
+        response = self.run_handler({'expression': '5 / 0', 'stream': True}, mock_client)
+
+        self.assertEqual(400, response['statusCode'])
+        self.assertIn('Division by zero', json.loads(response['body'])['error'])
+        mock_client.messages.stream.assert_not_called()
+
+
+class TestStreamServer(unittest.TestCase):
+
+    def setUp(self):
+        reset_response_cache()
+        self.server = stream_server.create_server(port=0, host='127.0.0.1')
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, body):
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=5)
+        conn.request('POST', '/calculate', json.dumps(body), {'Content-Type': 'application/json'})
+        return conn.getresponse()
+
+    def test_server_streams_chunked_events(self):
+        """Test that the server sends the events with chunked transfer encoding"""
+        mock_client = make_streaming_client(["<p>Two plus two</p>", "<p>is 4</p>"])
+
+        with patch('stream_server.get_anthropic_client', return_value=mock_client):
+            response = self.post({'expression': '2 + 2'})
+            body = response.read().decode('utf-8')
+
+        self.assertEqual(200, response.status)
+        self.assertEqual('chunked', response.getheader('Transfer-Encoding'))
+        self.assertEqual('text/event-stream', response.getheader('Content-Type'))
+        events = parse_sse(body)
+        self.assertEqual(['chunk', 'chunk', 'done'], [event for event, _ in events])
+
+    def test_server_rejects_invalid_expression(self):
+        """Test that validation errors are returned as JSON before streaming starts"""
+        with patch('stream_server.get_anthropic_client', return_value=make_streaming_client([])):
+            response = self.post({'expression': '(2 + 3'})
+            body = json.loads(response.read())
+
+        self.assertEqual(400, response.status)
+        self.assertIn('invalid', body['error'])
+
+    def test_server_streams_under_a_deadline(self):
+        """Test that the explanation runs under a request deadline that is cleared afterwards"""
+        seen = []
+
+        def stream_explanation(handler, expression):
+            seen.append(resilience.remaining_seconds())
+            handler._send_json(200, {})
+
+        with patch.object(stream_server.StreamingCalculatorHandler, '_stream_explanation', stream_explanation):
+            response = self.post({'expression': '2 + 2'})
+            response.read()
+
+        self.assertEqual(200, response.status)
+        self.assertEqual('*', response.getheader('Access-Control-Allow-Origin'))
+        self.assertIsNotNone(seen[0])
+        self.assertGreater(seen[0], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,40 +5,7 @@ def add(a, b):
 
 print(add(1, 2))
 
-class Calculator:
-    def __init__(self):
-        self.history = []
-    
-    def add(self, numbers):
-        result = sum(numbers)
-        self.history.append(f"{' + '.join(map(str, numbers))} = {result}")
-        return result
-    
-    def subtract(self, numbers):
-        result = numbers[0] - sum(numbers[1:])
-        self.history.append(f"{' - '.join(map(str, numbers))} = {result}")
-        return result
-    
-    def multiply(self, numbers):
-        result = 1
-        for num in numbers:
-            result *= num
-        self.history.append(f"{' * '.join(map(str, numbers))} = {result}")
-        return result
-    
-    def divide(self, numbers):
-        result = numbers[0]
-        for num in numbers[1:]:
-            if num == 0:
-                raise ValueError("Cannot divide by zero!")
-            result /= num
-        self.history.append(f"{' / '.join(map(str, numbers))} = {result}")
-        return result
-
-    def show_history(self):
-        print("\nCalculation History:")
-        for calculation in self.history:
-            print(calculation)
+from calculator import Calculator
 
 def get_numbers():
     numbers = []
@@ -56,19 +23,29 @@ import anthropic
 import os
 from typing import List
 
+from explanation_worker import ExplanationWorker
+
+# Explaining a single operation doesn't need the largest model; AI_CALCULATOR_MODEL overrides it
+EXPLANATION_MODEL = os.getenv('AI_CALCULATOR_MODEL', 'claude-3-haiku-20240307')
+EXPLANATION_MAX_TOKENS = 300
+# How long Exit waits for explanations still on their way
+EXPLANATION_DRAIN_SECONDS = 30
+
 class AICalculator(Calculator):
     def __init__(self):
         super().__init__()
         self.client = anthropic.Anthropic(
             api_key=os.getenv('ANTHROPIC_API_KEY')
         )
+        # Explanations run in the background so the menu comes straight back
+        self.explanations = ExplanationWorker(self.explain_calculation)
 
     def explain_calculation(self, operation: str, numbers: List[float], result: float):
         prompt = f"Explain this calculation step by step: {' '.join(map(str, numbers))} {operation} = {result}"
         
         message = self.client.messages.create(
-            model="claude-3-opus-20240229",
-            max_tokens=300,
+            model=EXPLANATION_MODEL,
+            max_tokens=EXPLANATION_MAX_TOKENS,
             system="You are a helpful math tutor. Explain calculations step by step.",
             messages=[{
                 "role": "user",
@@ -77,14 +54,31 @@ class AICalculator(Calculator):
         )
         
         # Access the content correctly from the message object
-        explanation = message.content[0].text
-        
-        print("\n=== AI Explanation ===")
-        print("--------------------")
-        print(explanation)
-        print("--------------------\n")
-        
-        return explanation
+        return message.content[0].text
+
+    def request_explanation(self, operation: str, numbers: List[float], result: float):
+        """Queue an explanation; it's printed by show_explanations() once ready."""
+        self.explanations.submit(operation, numbers, result)
+
+    def show_explanations(self, wait: bool = False):
+        """Print the explanations that are ready, in calculation order."""
+        if wait and self.explanations.pending():
+            print(f"\nWaiting for {self.explanations.pending()} explanation(s)...")
+            delivered = self.explanations.drain(timeout=EXPLANATION_DRAIN_SECONDS)
+        else:
+            delivered = self.explanations.ready()
+        for explanation in delivered:
+            print(f"\n=== AI Explanation: {explanation.calculation()} ===")
+            print("--------------------")
+            if explanation.error is not None:
+                print(f"Couldn't get an explanation: {explanation.error}")
+            else:
+                print(explanation.text)
+            print("--------------------")
+
+    def close(self):
+        self.show_explanations(wait=True)
+        self.explanations.close()
 
 def main():
     # Choose which calculator to use
@@ -95,62 +89,69 @@ def main():
     else:
         calc = Calculator()
     
-    while True:
-        print("\nAvailable operations:")
-        print("1. Add")
-        print("2. Subtract")
-        print("3. Multiply")
-        print("4. Divide")
-        print("5. Show History")
-        print("6. Exit")
+    try:
+        while True:
+            if calculator_type == '2':
+                calc.show_explanations()
+
+            print("\nAvailable operations:")
+            print("1. Add")
+            print("2. Subtract")
+            print("3. Multiply")
+            print("4. Divide")
+            print("5. Show History")
+            print("6. Exit")
         
-        choice = input("\nChoose an operation (1-6): ")
+            choice = input("\nChoose an operation (1-6): ")
         
-        if choice == '6':
-            print("Goodbye!")
-            break
-        elif choice == '5':
-            calc.show_history()
-            continue
+            if choice == '6':
+                if calculator_type == '2':
+                    calc.close()
+                print("Goodbye!")
+                break
+            elif choice == '5':
+                calc.show_history()
+                continue
             
-        if choice not in ['1', '2', '3', '4']:
-            print("Invalid choice! Please try again.")
-            continue
+            if choice not in ['1', '2', '3', '4']:
+                print("Invalid choice! Please try again.")
+                continue
             
-        numbers = get_numbers()
-        if len(numbers) < 2:
-            print("Please enter at least two numbers!")
-            continue
+            numbers = get_numbers()
+            if len(numbers) < 2:
+                print("Please enter at least two numbers!")
+                continue
             
-        try:
-            if choice == '1':
-                result = calc.add(numbers)
-                print(f"Result: {result}")
-            elif choice == '2':
-                result = calc.subtract(numbers)
-                print(f"Result: {result}")
-            elif choice == '3':
-                result = calc.multiply(numbers)
-                print(f"Result: {result}")
-            elif choice == '4':
-                result = calc.divide(numbers)
-                print(f"Result: {result}")
+            try:
+                if choice == '1':
+                    result = calc.add(numbers)
+                    print(f"Result: {result}")
+                elif choice == '2':
+                    result = calc.subtract(numbers)
+                    print(f"Result: {result}")
+                elif choice == '3':
+                    result = calc.multiply(numbers)
+                    print(f"Result: {result}")
+                elif choice == '4':
+                    result = calc.divide(numbers)
+                    print(f"Result: {result}")
 
-            if calculator_type == '2':
-                # Get AI explanation for the calculation
-                operation_symbols = {
-                    '1': '+', '2': '-', '3': '*', '4': '/'
-                }
-                explanation = calc.explain_calculation(
-                    operation_symbols[choice], 
-                    numbers, 
-                    result
-                )
-                print("\nAI Explanation:")
-                print(explanation)
-
-        except ValueError as e:
-            print(f"Error: {e}")
+                if calculator_type == '2':
+                    # Explained in the background and shown when the menu comes back
+                    operation_symbols = {
+                        '1': '+', '2': '-', '3': '*', '4': '/'
+                    }
+                    calc.request_explanation(
+                        operation_symbols[choice], 
+                        numbers, 
+                        result
+                    )
+
+            except ValueError as e:
+                print(f"Error: {e}")
+    finally:
+        # Commits the last batch of history on Exit, Ctrl-C or an unexpected error
+        calc.history.close()
 
 if __name__ == "__main__":
     main()
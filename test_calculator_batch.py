@@ -0,0 +1,86 @@
+import math
+import unittest
+from array import array
+from unittest.mock import patch
+
+import calculator_batch
+from calculator_batch import BatchSummary, compute
+from calculator_history import ADD, DIVIDE, MULTIPLY, SUBTRACT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ROWS = [
+    [1.0, 2.0, 3.0],
+    [10.0, 4.0, 1.0],
+    [8.0, 0.0, 2.0],
+    [-3.0, 0.5, 2.0],
+]
+COLUMNS = [array('d', column) for column in zip(*ROWS)]
+
+
+class BatchTests:
+    """Cases run against both implementations"""
+
+    def results(self, op, rows=COLUMNS):
+        return list(compute(op, rows).results)
+
+    def test_row_wise_operations(self):
+        """Test that each row gets the result the per-row Calculator methods give"""
+        self.assertEqual([6.0, 15.0, 10.0, -0.5], self.results(ADD))
+        self.assertEqual([-4.0, 5.0, 6.0, -5.5], self.results(SUBTRACT))
+        self.assertEqual([6.0, 40.0, 0.0, -3.0], self.results(MULTIPLY))
+
+    def test_zero_divisors_are_masked(self):
+        """Test that a zero divisor marks its row instead of stopping the batch"""
+        result = compute(DIVIDE, COLUMNS)
+        self.assertEqual([2], list(result.error_rows))
+        self.assertFalse(result.ok)
+        values = list(result.results)
+        self.assertTrue(math.isnan(values[2]))
+        for expected, actual in zip([1 / 6, 2.5, -3.0], values[:2] + values[3:]):
+            self.assertAlmostEqual(expected, actual)
+
+    def test_invalid_batches(self):
+        """Test that batches need two operands and columns of one length"""
+        with self.assertRaises(ValueError):
+            compute(ADD, [array('d', [1.0])])
+        with self.assertRaises(ValueError):
+            compute(ADD, [array('d', [1.0, 2.0]), array('d', [1.0])])
+
+    def test_summary(self):
+        """Test the batch-level history entry"""
+        summary = BatchSummary.of(DIVIDE, 3, compute(DIVIDE, COLUMNS))
+        self.assertEqual((4, 3, 1), (summary.rows, summary.operands, summary.errors))
+        self.assertAlmostEqual(1 / 6 + 2.5 - 3.0, summary.total)
+        self.assertIn("1 divide-by-zero row(s)", str(summary))
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestNumPy(BatchTests, unittest.TestCase):
+
+    def test_two_dimensional_arrays(self):
+        """Test that a 2-D array is read as one row per calculation"""
+        matrix = np.array(ROWS)
+        self.assertEqual(self.results(ADD), self.results(ADD, matrix))
+        self.assertEqual([2], list(compute(DIVIDE, matrix).error_rows))
+        with self.assertRaises(ValueError):
+            compute(ADD, np.array([1.0, 2.0]))
+
+
+class TestPurePython(BatchTests, unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(calculator_batch, 'np', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_are_arrays(self):
+        """Test that the fallback returns array('d') results"""
+        self.assertIsInstance(compute(ADD, COLUMNS).results, array)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import os
+import tempfile
+from calculator_history import (
+    ADD, DIVIDE, MULTIPLY, SUBTRACT, CalculationHistory, HistoryBuffer, HistoryLog, HistoryRecord,
+    get_history_capacity, get_history_path, pack_operands
+)
+from unittest.mock import patch
+
+
+class TestHistoryRecord(unittest.TestCase):
+
+    def test_format_matches_the_calculator(self):
+        """Test that records print the way the calculator's history strings did"""
+        self.assertEqual("1.0 + 2.0 = 3.0", str(HistoryRecord(1, ADD, pack_operands([1.0, 2.0]), 3.0)))
+        self.assertEqual("8.0 / 2.0 / 2.0 = 2.0", HistoryRecord(2, DIVIDE, pack_operands([8.0, 2.0, 2.0]), 2.0).format())
+        self.assertEqual((5.0, 1.5), HistoryRecord(3, SUBTRACT, pack_operands([5.0, 1.5]), 3.5).operands)
+
+    def test_slots(self):
+        """Test that records carry no per-instance dict"""
+        self.assertFalse(hasattr(HistoryRecord(1, ADD, b'', 0.0), '__dict__'))
+
+
+class TestHistoryBuffer(unittest.TestCase):
+
+    def test_ring_buffer_keeps_the_newest_entries(self):
+        """Test that the buffer overwrites the oldest entries once full"""
+        buffer = HistoryBuffer(capacity=3)
+        for i in range(5):
+            buffer.append(ADD, [float(i), 1.0], i + 1.0)
+
+        self.assertEqual(3, len(buffer))
+        self.assertEqual([3, 4, 5], [record.seq for record in buffer])
+        self.assertEqual("4.0 + 1.0 = 5.0", str(buffer.page(limit=1)[0]))
+        with self.assertRaises(IndexError):
+            buffer.record(2)
+
+    def test_pagination(self):
+        """Test that pages run newest first and stop at the oldest entry kept"""
+        buffer = HistoryBuffer(capacity=10)
+        for i in range(7):
+            buffer.append(MULTIPLY, [float(i), 2.0], i * 2.0)
+
+        self.assertEqual([7, 6, 5], [record.seq for record in buffer.page(limit=3)])
+        self.assertEqual([4, 3, 2], [record.seq for record in buffer.page(before=5, limit=3)])
+        self.assertEqual([1], [record.seq for record in buffer.page(before=2, limit=3)])
+        self.assertEqual([], buffer.page(before=1))
+
+    def test_long_calculations_spill_over(self):
+        """Test that operands beyond the inline ones are kept, and dropped when the slot is reused"""
+        buffer = HistoryBuffer(capacity=2)
+        buffer.append(DIVIDE, [8.0, 2.0, 2.0, 1.0], 2.0)
+        buffer.append(ADD, [1.0], 1.0)
+        self.assertEqual("8.0 / 2.0 / 2.0 / 1.0 = 2.0", str(buffer.record(1)))
+        self.assertEqual("1.0 = 1.0", str(buffer.record(2)))
+
+        buffer.append(ADD, [1.0, 2.0], 3.0)
+        self.assertEqual("1.0 + 2.0 = 3.0", str(buffer.record(3)))
+        self.assertEqual({}, buffer._overflow)
+
+    def test_invalid_capacity(self):
+        """Test that a ring buffer needs room for at least one entry"""
+        with self.assertRaises(ValueError):
+            HistoryBuffer(capacity=0)
+
+
+class TestCalculationHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'history.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_log_keeps_what_the_buffer_drops(self):
+        """Test that the on-disk log pages through entries the ring buffer no longer holds"""
+        history = CalculationHistory(capacity=5, path=self.path, batch_size=4)
+        for i in range(1, 21):
+            history.append(ADD, [float(i), float(i)], 2.0 * i)
+
+        self.assertEqual(20, len(history))
+        self.assertEqual(5, len(history.buffer))
+        self.assertEqual([20, 19, 18, 17, 16], [record.seq for record in history.recent(5)])
+        self.assertEqual("3.0 + 3.0 = 6.0", str(history.page(before=4, limit=1)[0]))
+        history.close()
+
+    def test_history_survives_a_restart(self):
+        """Test that numbering and recent entries continue from the log"""
+        history = CalculationHistory(capacity=3, path=self.path)
+        for i in range(1, 6):
+            history.append(SUBTRACT, [10.0, float(i)], 10.0 - i)
+        history.close()
+
+        reopened = CalculationHistory(capacity=3, path=self.path)
+        self.assertEqual([5, 4, 3], [record.seq for record in reopened.recent()])
+        self.assertEqual(6, reopened.append(ADD, [1.0, 1.0], 2.0))
+        self.assertEqual(6, len(reopened))
+        self.assertEqual(HistoryLog(self.path).page(limit=1), reopened.recent(1))
+        reopened.close()
+
+    def test_memory_only(self):
+        """Test that without a path the history is just the ring buffer"""
+        history = CalculationHistory(capacity=2)
+        for i in range(3):
+            history.append(ADD, [float(i)], float(i))
+        self.assertIsNone(history.log)
+        self.assertEqual(2, len(history))
+        self.assertEqual([3, 2], [record.seq for record in history.page()])
+
+    def test_environment(self):
+        """Test CALCULATOR_HISTORY_LIMIT and CALCULATOR_HISTORY_PATH, with no log unless a path is set"""
+        with patch.dict('os.environ', {'CALCULATOR_HISTORY_LIMIT': '50', 'CALCULATOR_HISTORY_PATH': ''}):
+            self.assertEqual(50, get_history_capacity())
+            self.assertIsNone(get_history_path())
+        with patch.dict('os.environ'):
+            os.environ.pop('CALCULATOR_HISTORY_PATH', None)
+            self.assertIsNone(get_history_path())
+            self.assertIsNone(CalculationHistory.from_environment().log)
+        with patch.dict('os.environ', {'CALCULATOR_HISTORY_LIMIT': 'lots', 'CALCULATOR_HISTORY_PATH': self.path}):
+            self.assertEqual(1000, get_history_capacity())
+            self.assertEqual(self.path, get_history_path())
+
+if __name__ == '__main__':
+    unittest.main()
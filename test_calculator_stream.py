@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import calculator_stream
+from calculator_stream import parse_csv, parse_jsonl, process, read_lines, shard_ranges
+
+CSV_INPUT = """op,a,b
+add,1,2,3
+/,10,0
+
+multiply,2,x
+expr,"2 * (3 + 4)"
+foo,1,2
+-,5
+"""
+
+
+def run_csv(text, expressions=False):
+    out = io.StringIO()
+    counts = process(io.StringIO(text), out, expressions=expressions)
+    return counts, [line.split(',', 2) for line in out.getvalue().splitlines()]
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_csv(self):
+        """Test operation names and symbols, the header and blank lines"""
+        jobs = list(parse_csv(io.StringIO(CSV_INPUT)))
+        self.assertEqual([2, 3, 5, 6, 7, 8], [job.line for job in jobs])
+        self.assertEqual([1.0, 2.0, 3.0], jobs[0].numbers)
+        self.assertEqual("2 * (3 + 4)", jobs[3].expression)
+        self.assertEqual("Unknown operation 'foo'", jobs[4].error)
+        self.assertEqual("Please enter at least two numbers!", jobs[5].error)
+
+    def test_jsonl(self):
+        """Test operation records, expression records and malformed lines"""
+        lines = ['{"op": "Divide", "numbers": [9, 3]}', '{"expression": "1/3"}', '[1, 2]', 'not json']
+        jobs = list(parse_jsonl(lines, first_line=10))
+        self.assertEqual([10, 11, 12, 13], [job.line for job in jobs])
+        self.assertEqual([9.0, 3.0], jobs[0].numbers)
+        self.assertEqual("1/3", jobs[1].expression)
+        self.assertEqual("Each line must be a JSON object", jobs[2].error)
+        self.assertEqual("Invalid JSON", jobs[3].error)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_errors_do_not_stop_the_stream(self):
+        """Test that every record gets a row, with bad ones reported"""
+        counts, rows = run_csv(CSV_INPUT)
+        self.assertEqual((6, 5), counts)
+        self.assertEqual(['2', '6.0', ''], rows[0])
+        self.assertEqual(['3', '', 'Cannot divide by zero!'], rows[1])
+        self.assertEqual(['6', '', 'Expressions need --expressions'], rows[3])
+
+    def test_expressions(self):
+        """Test that the local engine evaluates expr records exactly"""
+        counts, rows = run_csv('expr,"2 * (3 + 4)"\nexpr,1/3\nexpr,1/0\n', expressions=True)
+        self.assertEqual((3, 1), counts)
+        self.assertEqual(['1', '14', ''], rows[0])
+        self.assertEqual(['2', str(1 / 3), ''], rows[1])
+        self.assertEqual('3', rows[2][0])
+        self.assertTrue(rows[2][2])
+
+    def test_jsonl_output(self):
+        """Test that JSON lines output carries the line, result and error"""
+        out = io.StringIO()
+        process(io.StringIO("add,1,1\n"), out, output_format='jsonl')
+        self.assertEqual({'line': 1, 'result': 2.0, 'error': None}, json.loads(out.getvalue()))
+
+    def test_history_stays_bounded(self):
+        """Test that a stream doesn't grow the calculator's history past its cap"""
+        calculator = calculator_stream.new_calculator()
+        jobs = parse_csv(io.StringIO("add,1,1\n" * 1500))
+        self.assertEqual(1500, sum(1 for _ in calculator_stream.evaluate(jobs, calculator)))
+        self.assertEqual(1000, len(calculator.history))
+        # From calculator.py, not whatever module named "test" is first on sys.path
+        self.assertEqual('calculator', type(calculator).__module__)
+
+
+class TestSharding(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'input.csv')
+        with open(self.path, 'w') as f:
+            f.write('op,a,b\n')
+            for i in range(500):
+                f.write(f"{'/' if i % 7 == 0 else 'add'},{i},{i % 3}\n")
+
+    def test_ranges_split_on_line_boundaries(self):
+        """Test that shards cover the file exactly and start at line starts"""
+        ranges = shard_ranges(self.path, 4)
+        self.assertEqual(4, len(ranges))
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(os.path.getsize(self.path), ranges[-1][1])
+        lines = []
+        for start, end in ranges:
+            shard = list(read_lines(self.path, start, end))
+            self.assertTrue(shard[-1].endswith('\n'))
+            lines.extend(shard)
+        self.assertEqual(list(read_lines(self.path)), lines)
+
+    def test_sharded_output_matches(self):
+        """Test that --workers gives the same output as a single process"""
+        outputs = []
+        for workers in (1, 3):
+            output = os.path.join(self.directory.name, f"out-{workers}.csv")
+            calculator_stream.main([self.path, '-o', output, '--workers', str(workers)])
+            with open(output) as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(501, len(outputs[0].splitlines()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from explanation_worker import ExplanationWorker, get_max_pending, get_max_workers
+
+
+class GatedExplainer:
+    """Blocks each call until its calculation's result is released."""
+
+    def __init__(self):
+        self.gates = {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def gate(self, result):
+        return self.gates.setdefault(result, threading.Event())
+
+    def __call__(self, operation, numbers, result):
+        with self.lock:
+            self.calls.append((operation, tuple(numbers), result))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            if not self.gate(result).wait(timeout=5):
+                raise TimeoutError("gate never opened")
+            if result < 0:
+                raise RuntimeError("API error")
+            return f"explained {result}"
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestExplanationWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.explainer = GatedExplainer()
+
+    def make_worker(self, **kwargs):
+        worker = ExplanationWorker(self.explainer, **kwargs)
+        self.addCleanup(worker.close)
+        return worker
+
+    def test_submit_does_not_wait_for_the_call(self):
+        """Test that submit returns while the explanation is still running"""
+        worker = self.make_worker(max_workers=2)
+        worker.submit('+', [1.0, 2.0], 3.0)
+        self.assertEqual([], worker.ready())
+        self.assertEqual(1, worker.pending())
+
+        self.explainer.gate(3.0).set()
+        [explanation] = worker.drain(timeout=5)
+        self.assertEqual("explained 3.0", explanation.text)
+        self.assertEqual("1.0 + 2.0 = 3.0", explanation.calculation())
+
+    def test_delivers_in_submission_order(self):
+        """Test that a finished explanation waits for the ones submitted before it"""
+        worker = self.make_worker(max_workers=2)
+        worker.submit('+', [1.0, 1.0], 2.0)
+        worker.submit('*', [2.0, 2.0], 4.0)
+
+        self.explainer.gate(4.0).set()
+        worker._pending[1][1].result(timeout=5)
+        self.assertEqual([], worker.ready())
+
+        self.explainer.gate(2.0).set()
+        self.assertEqual([2.0, 4.0], [explanation.result for explanation in worker.drain(timeout=5)])
+
+    def test_caps_concurrent_calls(self):
+        """Test that no more than max_workers calls run at once"""
+        worker = self.make_worker(max_workers=2, max_pending=10)
+        for i in range(1, 6):
+            worker.submit('+', [float(i), 0.0], float(i))
+        for i in range(1, 6):
+            self.explainer.gate(float(i)).set()
+
+        self.assertEqual(5, len(worker.drain(timeout=5)))
+        self.assertLessEqual(self.explainer.max_running, 2)
+
+    def test_full_backlog_waits_for_the_oldest(self):
+        """Test that submit blocks once max_pending explanations are undelivered"""
+        worker = self.make_worker(max_workers=2, max_pending=1)
+        worker.submit('+', [1.0, 1.0], 2.0)
+
+        submitted = threading.Event()
+        thread = threading.Thread(target=lambda: (worker.submit('+', [2.0, 2.0], 4.0), submitted.set()))
+        thread.start()
+        self.assertFalse(submitted.wait(timeout=0.2))
+
+        self.explainer.gate(2.0).set()
+        self.assertTrue(submitted.wait(timeout=5))
+        thread.join()
+        self.explainer.gate(4.0).set()
+        self.assertEqual(2, len(worker.drain(timeout=5)))
+
+    def test_identical_calculations_share_a_call(self):
+        """Test that repeats are answered by the memo, in flight or finished"""
+        worker = self.make_worker()
+        self.assertFalse(worker.submit('+', [1.0, 2.0], 3.0))
+        self.assertTrue(worker.submit('+', (1.0, 2.0), 3.0))
+        self.explainer.gate(3.0).set()
+        worker.drain(timeout=5)
+        self.assertTrue(worker.submit('+', [1.0, 2.0], 3.0))
+        self.assertFalse(worker.submit('*', [1.0, 2.0], 3.0))
+        self.explainer.gate(3.0).set()
+
+        delivered = worker.drain(timeout=5)
+        self.assertEqual(["explained 3.0"] * 2, [explanation.text for explanation in delivered])
+        self.assertEqual([True, False], [explanation.cached for explanation in delivered])
+        self.assertEqual(2, worker.calls)
+        self.assertEqual(2, worker.memo_hits)
+        self.assertEqual(2, len(self.explainer.calls))
+
+    def test_failures_are_delivered_and_retried(self):
+        """Test that a failed call is reported and not memoized"""
+        worker = self.make_worker()
+        worker.submit('-', [1.0, 2.0], -1.0)
+        self.explainer.gate(-1.0).set()
+        [explanation] = worker.drain(timeout=5)
+        self.assertIsNone(explanation.text)
+        self.assertIsInstance(explanation.error, RuntimeError)
+
+        self.assertFalse(worker.submit('-', [1.0, 2.0], -1.0))
+        worker.drain(timeout=5)
+        self.assertEqual(2, len(self.explainer.calls))
+
+    def test_environment(self):
+        """Test AI_EXPLANATION_WORKERS and AI_EXPLANATION_BACKLOG"""
+        with patch.dict('os.environ', {'AI_EXPLANATION_WORKERS': '4', 'AI_EXPLANATION_BACKLOG': '0'}):
+            self.assertEqual(4, get_max_workers())
+            self.assertEqual(8, get_max_pending())
+
+
+if __name__ == '__main__':
+    unittest.main()
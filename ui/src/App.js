@@ -4,6 +4,45 @@ import './App.css';
 // Hardcoded API endpoint - replace with your actual API endpoint
 const API_ENDPOINT = 'https://40bfeqva02.execute-api.us-west-2.amazonaws.com/prod/calculate';
 
+// Ask the backend to stream explanations as server-sent events. The deployed
+// API Gateway endpoint buffers responses, so only enable this when
+// API_ENDPOINT points at lambda/stream_server.py or another streaming host
+const STREAM_RESPONSES = false;
+
+const isEventStream = (response) => {
+    const contentType = response.headers && response.headers.get ? response.headers.get('Content-Type') : '';
+    return Boolean(response.body && contentType && contentType.includes('text/event-stream'));
+};
+
+// Read server-sent events from a fetch response, calling onEvent(event, data) for each frame as it arrives
+const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach((line) => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            if (data) onEvent(event, JSON.parse(data));
+
+            boundary = buffer.indexOf('\n\n');
+        }
+    }
+};
+
 function App() {
     const [expression, setExpression] = useState('');
     const [result, setResult] = useState('');
@@ -57,13 +96,29 @@ function App() {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    expression: expression
+                    expression: expression,
+                    stream: STREAM_RESPONSES
                 }),
             });
 
-            const data = await response.json();
             setValidating(false);
 
+            // Render streamed explanations chunk by chunk as they arrive
+            if (response.ok && isEventStream(response)) {
+                let explanation = '';
+                await readEventStream(response, (event, data) => {
+                    if (event === 'chunk') {
+                        explanation += data.html;
+                        setResult(explanation);
+                    } else if (event === 'error') {
+                        setError(data.error || 'An error occurred');
+                    }
+                });
+                return;
+            }
+
+            const data = await response.json();
+
             if (response.ok) {
                 setResult(data.explanation || data.result);
             } else {
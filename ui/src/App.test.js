@@ -1,10 +1,29 @@
 import React from 'react';
 import { render, screen, fireEvent, waitFor } from '@testing-library/react';
 import '@testing-library/jest-dom';
+import { TextEncoder, TextDecoder } from 'util';
 import App from './App';
 
 // Mock fetch API
 global.fetch = jest.fn();
+global.TextDecoder = TextDecoder;
+
+// Build a fetch response whose body yields the given server-sent event frames one read at a time
+const mockEventStreamResponse = (frames) => {
+    const encoder = new TextEncoder();
+    const chunks = frames.map((frame) => encoder.encode(frame));
+    return {
+        ok: true,
+        headers: { get: () => 'text/event-stream' },
+        body: {
+            getReader: () => ({
+                read: () => Promise.resolve(
+                    chunks.length ? { done: false, value: chunks.shift() } : { done: true, value: undefined }
+                )
+            })
+        }
+    };
+};
 
 describe('Calculator App', () => {
     beforeEach(() => {
@@ -194,4 +213,31 @@ describe('Calculator App', () => {
             expect(screen.getByText(/Failed to connect to the server/i)).toBeInTheDocument();
         });
     });
-}); 
\ No newline at end of file
+
+    test('renders streamed explanation chunks', async () => {
+        // Mock a streamed API response split across several reads
+        fetch.mockImplementationOnce(() =>
+            Promise.resolve(mockEventStreamResponse([
+                'event: chunk\ndata: {"html": "<p>Two plus two "}\n\n',
+                'event: chunk\ndata: {"html": "is four</p>"}\n\nevent: done\n',
+                'data: {"success": true}\n\n'
+            ]))
+        );
+
+        render(<App />);
+
+        const input = screen.getByPlaceholderText(/Enter a mathematical expression/i);
+        fireEvent.change(input, { target: { value: '2 + 2' } });
+
+        const calculateButton = screen.getByRole('button', { name: /Calculate/i });
+        fireEvent.click(calculateButton);
+
+        // Wait for the joined chunks to be displayed
+        await waitFor(() => {
+            expect(screen.getByText(/Two plus two is four/i)).toBeInTheDocument();
+        });
+
+        // The request asks for the JSON contract by default; a streamed response is still rendered
+        expect(JSON.parse(fetch.mock.calls[0][1].body).stream).toBe(false);
+    });
+});